@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""Bundle a build's per-ontology Bloom filters for `kgbioportal contains`.
+
+Usage: build_bloom_filters.py <filters_dir> <output_db> [base_bundle] [onto_stats]
+
+Gathers every <ACRONYM>_ids.bloom under <filters_dir> -- written by this run's
+transforms -- into bloom_filters.db, over the previous release's one
+(<base_bundle>) so ontologies this run didn't rebuild carry over. With the
+merged <onto_stats>, ontologies it no longer resolves are dropped.
+
+The bundling lives in src/kg_bioportal/bloom.py and is imported from the
+checkout, as build_term_index.py does: it needs only the standard library (and
+PyYAML to read onto_stats).
+"""
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(REPO_ROOT, "src"))
+
+from kg_bioportal.bloom import build_filter_bundle  # noqa: E402
+from kg_bioportal.index import read_index  # noqa: E402
+
+
+def main():
+    filters_dir = sys.argv[1] if len(sys.argv) > 1 else "fragments"
+    output_db = sys.argv[2] if len(sys.argv) > 2 else "docs/bloom_filters.db"
+    base_path = sys.argv[3] if len(sys.argv) > 3 else ""
+    index_path = sys.argv[4] if len(sys.argv) > 4 else ""
+
+    build_filter_bundle(
+        filters_dir, output_db, base_path, index=read_index(index_path) if index_path else None
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""Build the cross-ontology term index from a build's term lists.
+
+Usage: build_term_index.py <terms_dir> <output_db> [base_term_index] [onto_stats]
+
+Folds every <ACRONYM>_terms.txt.gz (and _prefixes.tsv) under <terms_dir> --
+the by-products of this run's transforms -- into term_index.db, over the
+previous release's one (<base_term_index>) so ontologies this run didn't
+rebuild carry over. With the merged <onto_stats>, ontologies it no longer
+resolves are dropped and each kept one records its download_url.
+
+The build lives in src/kg_bioportal/term_index.py and is imported from the
+checkout, as merge_stats.py does: it needs only the standard library (and
+PyYAML to read onto_stats).
+"""
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(REPO_ROOT, "src"))
+
+from kg_bioportal.index import read_index  # noqa: E402
+from kg_bioportal.term_index import build_term_index  # noqa: E402
+
+
+def main():
+    terms_dir = sys.argv[1] if len(sys.argv) > 1 else "fragments"
+    output_db = sys.argv[2] if len(sys.argv) > 2 else "docs/term_index.db"
+    base_path = sys.argv[3] if len(sys.argv) > 3 else ""
+    index_path = sys.argv[4] if len(sys.argv) > 4 else ""
+
+    build_term_index(
+        terms_dir, output_db, base_path, index=read_index(index_path) if index_path else None
+    )
+
+
+if __name__ == "__main__":
+    main()
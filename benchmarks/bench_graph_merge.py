@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Benchmark the graph merge's throughput by number of workers.
+
+Usage: bench_graph_merge.py [--artifacts 200] [--nodes 20000] [--workers 1,2,4,8]
+
+Writes --artifacts synthetic <ACRONYM>.tar.gz artifacts of --nodes nodes and
+about twice as many edges each. A fifth of every artifact's nodes are shared
+terms (as BFO's are in real ones), so there is something to deduplicate. Then
+merges them with each of --workers processes -- 1 is the single-process merge,
+anything more partitions the rows one partition per worker -- and reports
+input records (nodes + edges) per second and the speed-up over one worker.
+Every run must merge to the same number of nodes and edges.
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import tarfile
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "src"))
+
+from kg_bioportal.graph_merge import merge_graph, select_artifacts  # noqa: E402
+
+SHARED_TERMS = 5000
+
+
+def _member(tar: tarfile.TarFile, name: str, lines: list) -> None:
+    data = ("\n".join(lines) + "\n").encode()
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def write_artifacts(directory: str, artifacts: int, nodes: int, seed: int) -> None:
+    rng = random.Random(seed)
+    for a in range(artifacts):
+        acronym = f"ONT{a:04d}"
+        ids = [f"{acronym}:{i:07d}" for i in range(nodes - nodes // 5)]
+        ids += [f"BFO:{rng.randrange(SHARED_TERMS):07d}" for _ in range(nodes // 5)]
+        node_lines = ["id\tcategory\tname\tprovided_by"]
+        node_lines += [
+            f"{i}\tbiolink:{rng.choice(['NamedThing', 'Disease', 'Gene'])}\tterm {i}\t{acronym}"
+            for i in ids
+        ]
+        edge_lines = ["id\tsubject\tpredicate\tobject\tprovided_by"]
+        edge_lines += [
+            f"urn:uuid:{acronym}-{e}\t{rng.choice(ids)}\tbiolink:subclass_of\t"
+            f"{rng.choice(ids)}\t{acronym}"
+            for e in range(2 * nodes)
+        ]
+        with tarfile.open(os.path.join(directory, f"{acronym}.tar.gz"), "w:gz") as tar:
+            _member(tar, f"{acronym}_nodes.tsv", node_lines)
+            _member(tar, f"{acronym}_edges.tsv", edge_lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--artifacts", type=int, default=200)
+    parser.add_argument("--nodes", type=int, default=20000)
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        artifact_dir = os.path.join(tmp, "artifacts")
+        os.makedirs(artifact_dir)
+        start = time.perf_counter()
+        write_artifacts(artifact_dir, args.artifacts, args.nodes, args.seed)
+        print(f"Wrote {args.artifacts} artifacts in {time.perf_counter() - start:.1f}s")
+        artifacts = select_artifacts(artifact_dir)
+
+        baseline, expected = None, None
+        for workers in (int(w) for w in args.workers.split(",")):
+            out = os.path.join(tmp, f"merged-{workers}")
+            start = time.perf_counter()
+            stats = merge_graph(artifacts, out, compress=False, workers=workers)
+            elapsed = time.perf_counter() - start
+            counts = (stats["nodes"], stats["edges"])
+            if expected is None:
+                expected = counts
+            elif counts != expected:
+                sys.exit(f"{workers} workers merged to {counts}, expected {expected}")
+            rate = (stats["input_nodes"] + stats["input_edges"]) / elapsed
+            baseline = baseline or rate
+            print(
+                f"workers {workers:>2}  {elapsed:7.1f}s  {rate:12,.0f} records/s  "
+                f"x{rate / baseline:4.2f}"
+            )
+        print(f"Merged to {expected[0]:,} nodes and {expected[1]:,} edges.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""Benchmark loading the query store and point lookups in it.
+
+Usage: bench_graph_store.py [--artifacts 200] [--nodes 20000] [--workers 0] [--lookups 20000]
+
+Writes the same synthetic artifacts as bench_graph_merge.py, loads them with
+load_store, then times --lookups random node lookups, edge lookups by subject
+and neighbour queries, and reports each one's median and 99th percentile
+latency in microseconds. The store is meant to answer each in well under a
+millisecond, however many artifacts it holds.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_graph_merge import write_artifacts  # noqa: E402
+from kg_bioportal.graph_merge import select_artifacts  # noqa: E402
+from kg_bioportal.graph_store import GraphStore, load_store  # noqa: E402
+
+
+def percentiles(samples: list) -> str:
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2] * 1e6
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6
+    return f"p50 {p50:8.1f} us  p99 {p99:8.1f} us"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--artifacts", type=int, default=200)
+    parser.add_argument("--nodes", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        artifact_dir = os.path.join(tmp, "artifacts")
+        os.makedirs(artifact_dir)
+        write_artifacts(artifact_dir, args.artifacts, args.nodes, args.seed)
+        db = os.path.join(tmp, "kg_store.db")
+
+        start = time.perf_counter()
+        stats = load_store(select_artifacts(artifact_dir), db, workers=args.workers)
+        elapsed = time.perf_counter() - start
+        rate = (stats["nodes"] + stats["edges"]) / elapsed
+        print(f"Loaded {stats['nodes']:,} nodes and {stats['edges']:,} edges in {elapsed:.1f}s "
+              f"({rate:,.0f} rows/s), {os.path.getsize(db) / 1e6:,.0f} MB")
+
+        rng = random.Random(args.seed)
+        ids = [
+            f"ONT{rng.randrange(args.artifacts):04d}:{rng.randrange(args.nodes * 4 // 5):07d}"
+            for _ in range(args.lookups)
+        ]
+        with GraphStore(db) as store:
+            for name, query in (
+                ("node", store.node),
+                ("edges by subject", lambda i: list(store.edges(subject=i))),
+                ("neighbours", store.neighbours),
+            ):
+                samples = []
+                for node_id in ids:
+                    start = time.perf_counter()
+                    query(node_id)
+                    samples.append(time.perf_counter() - start)
+                print(f"{name:<17} {percentiles(samples)}")
+
+
+if __name__ == "__main__":
+    main()
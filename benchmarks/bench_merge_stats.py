@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""Benchmark the index merge against the sequential merge it replaced.
+
+Usage: bench_merge_stats.py [--entries 100000] [--fragments 200] [--changed 0.2]
+
+Builds a synthetic previous index of --entries ontologies and --fragments
+fragments that together re-report --changed of them (plus a few new ones),
+then times:
+
+  sequential  -- what merge_stats.py used to do: yaml.safe_load each fragment
+                 in turn into one dict over the seed, sort, and yaml.dump it;
+  merge_stats -- kg_bioportal.index.merge_stats (parallel fragment parsing,
+                 k-way merge, streaming writer; also writes onto_stats.db).
+
+and checks that both wrote byte-identical onto_stats.yaml. Some entry names
+carry non-ASCII text, so the writer's slow path is exercised too.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import yaml
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "src"))
+
+from kg_bioportal.config import KNOWN_GIANTS  # noqa: E402
+from kg_bioportal.index import asset_url, merge_stats, skiplist_entry  # noqa: E402
+
+PREV_TAG = "data-2026.09"
+THIS_TAG = "data-2026.10"
+
+
+def synthetic_entry(i: int, rng: random.Random) -> dict:
+    status = rng.choices(["OK", "Failed", "Skipped"], weights=[85, 10, 5])[0]
+    ok = status == "OK"
+    name = f"Synthetic ontology {i} of things" + (" für Übungen" if i % 50 == 0 else "")
+    entry = {
+        "id": f"ONT{i:06d}",
+        "status": status,
+        "reason": "" if ok else rng.choice(["transform_error", "too_large", "too_slow"]),
+        "name": name,
+        "version": rng.choice(["1.0", "2024-01-15", "v3 (release)", "releases/2025-06-01"]),
+        "nodecount": rng.randint(10, 10**6) if ok else 0,
+        "edgecount": rng.randint(10, 3 * 10**6) if ok else 0,
+        "submission_id": str(rng.randint(1, 900)),
+        "source_bytes": rng.randint(10**3, 10**9),
+        "duration_sec": round(rng.uniform(5, 3000), 1),
+    }
+    if ok:
+        entry["download_url"] = asset_url(PREV_TAG, entry["id"])
+    return entry
+
+
+def build_inputs(root: str, entries: int, fragments: int, changed: float, seed: int) -> str:
+    rng = random.Random(seed)
+    base = os.path.join(root, "base", "onto_stats.yaml")
+    os.makedirs(os.path.dirname(base))
+    with open(base, "w") as f:
+        yaml.dump(
+            {"ontologies": [synthetic_entry(i, rng) for i in range(entries)]}, f, sort_keys=False
+        )
+    fresh = [synthetic_entry(i, rng) for i in rng.sample(range(entries), int(entries * changed))]
+    fresh += [synthetic_entry(entries + i, rng) for i in range(fragments)]
+    rng.shuffle(fresh)
+    for n in range(fragments):
+        path = os.path.join(root, "fragments", f"shard-{n}", "onto_stats.yaml")
+        os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            yaml.dump({"ontologies": fresh[n::fragments]}, f, sort_keys=False)
+    return base
+
+
+def sequential(fragments_dir: str, output_dir: str, base_path: str) -> None:
+    """The merge as merge_stats.py did it before: everything through one dict."""
+    with open(base_path) as f:
+        by_id = {e["id"]: e for e in (yaml.safe_load(f) or {}).get("ontologies", [])}
+    paths = []
+    for dirpath, _, files in os.walk(fragments_dir):
+        paths += [os.path.join(dirpath, n) for n in files if n == "onto_stats.yaml"]
+    for path in sorted(paths):
+        with open(path) as f:
+            data = yaml.safe_load(f) or {}
+        for entry in data.get("ontologies", []):
+            if entry.get("status") == "OK":
+                entry["download_url"] = asset_url(THIS_TAG, entry["id"])
+            else:
+                entry.pop("download_url", None)
+            by_id[entry["id"]] = entry
+    for acr in sorted(KNOWN_GIANTS):
+        by_id.setdefault(acr, skiplist_entry(acr))
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "onto_stats.yaml"), "w") as f:
+        yaml.dump({"ontologies": [by_id[k] for k in sorted(by_id)]}, f, sort_keys=False)
+
+
+def timed(label: str, fn, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:8.2f}s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--entries", type=int, default=100_000)
+    parser.add_argument("--fragments", type=int, default=200)
+    parser.add_argument("--changed", type=float, default=0.2)
+    parser.add_argument("--workers", type=int, default=0, help="0: one per core")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        print(f"Building {args.entries} entries, {args.fragments} fragments ...")
+        base = build_inputs(root, args.entries, args.fragments, args.changed, args.seed)
+        fragments_dir = os.path.join(root, "fragments")
+        before = timed("sequential", sequential, fragments_dir, os.path.join(root, "old"), base)
+        after = timed(
+            "merge_stats (yaml seed)", merge_stats, fragments_dir, os.path.join(root, "new"),
+            base_path=base, release_tag=THIS_TAG, report=lambda line: None, workers=args.workers,
+        )
+        # A second build seeds from the first's output, which has a companion.
+        seeded = os.path.join(root, "new", "onto_stats.yaml")
+        timed(
+            "merge_stats (db seed)", merge_stats, fragments_dir, os.path.join(root, "again"),
+            base_path=seeded, release_tag=THIS_TAG, report=lambda line: None,
+            workers=args.workers,
+        )
+        with open(os.path.join(root, "old", "onto_stats.yaml"), "rb") as f:
+            old = f.read()
+        with open(seeded, "rb") as f:
+            new = f.read()
+        print(f"speedup (yaml seed)          {before / after:8.2f}x")
+        print(f"onto_stats.yaml identical    {old == new!s:>8}")
+        if old != new:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""Load-test the query service: latency percentiles under concurrent clients.
+
+Usage: bench_query_service.py [--artifacts 50] [--nodes 20000] [--clients 8] [--requests 2000]
+
+Loads the synthetic artifacts of bench_graph_merge.py into a store, serves it
+with QueryServer on a free local port, and has --clients threads, each on one
+keep-alive connection, send --requests requests apiece: node lookups, edge
+lookups by subject and one-hop queries, in turn. Ids are drawn with a skew
+towards a few hot ones, as real traffic is, so the node cache has something
+to do. Reports each kind's p50 and p99 latency, the overall request rate, and
+the cache's hit rate.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "src"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_graph_merge import write_artifacts  # noqa: E402
+from bench_graph_store import percentiles  # noqa: E402
+from kg_bioportal.graph_merge import select_artifacts  # noqa: E402
+from kg_bioportal.graph_store import load_store  # noqa: E402
+from kg_bioportal.query_service import QueryServer  # noqa: E402
+
+
+def requests_for(node_id: str) -> list:
+    one_hop = {"message": {"query_graph": {
+        "nodes": {"n0": {"ids": [node_id]}, "n1": {"categories": ["biolink:Disease"]}},
+        "edges": {"e0": {"subject": "n0", "object": "n1"}},
+    }}}
+    return [
+        ("node", "GET", f"/nodes/{node_id}", None),
+        ("edges", "GET", f"/edges?subject={node_id}", None),
+        ("one-hop", "POST", "/query", json.dumps(one_hop)),
+    ]
+
+
+def client(address, ids, timings):
+    connection = http.client.HTTPConnection(*address, timeout=30)
+    for i, node_id in enumerate(ids):
+        kind, method, path, body = requests_for(node_id)[i % 3]
+        start = time.perf_counter()
+        connection.request(method, path, body=body)
+        response = connection.getresponse()
+        response.read()
+        timings.setdefault(kind, []).append(time.perf_counter() - start)
+    connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--artifacts", type=int, default=50)
+    parser.add_argument("--nodes", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        artifact_dir = os.path.join(tmp, "artifacts")
+        os.makedirs(artifact_dir)
+        write_artifacts(artifact_dir, args.artifacts, args.nodes, args.seed)
+        db = os.path.join(tmp, "kg_store.db")
+        load_store(select_artifacts(artifact_dir), db)
+
+        rng = random.Random(args.seed)
+        local = args.nodes * 4 // 5
+        # Pareto-distributed ranks: a few ids take most of the traffic.
+        pool = [f"ONT{rng.randrange(args.artifacts):04d}:{rng.randrange(local):07d}"
+                for _ in range(10000)]
+
+        def draw():
+            return pool[min(int(rng.paretovariate(1.2)) - 1, len(pool) - 1)]
+
+        server = QueryServer(("127.0.0.1", 0), db)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        timings = [{} for _ in range(args.clients)]
+        threads = [
+            threading.Thread(
+                target=client,
+                args=(server.server_address[:2], [draw() for _ in range(args.requests)], t),
+            )
+            for t in timings
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        server.shutdown()
+        cache = server.nodes.stats()
+        server.server_close()
+
+    total = args.clients * args.requests
+    for kind in ("node", "edges", "one-hop"):
+        print(f"{kind:<8} {percentiles([s for t in timings for s in t.get(kind, [])])}")
+    hit_rate = cache["hits"] / max(cache["hits"] + cache["misses"], 1)
+    print(f"{total:,} requests from {args.clients} clients in {elapsed:.1f}s "
+          f"({total / elapsed:,.0f}/s); node cache hit rate {hit_rate:.0%}")
+
+
+if __name__ == "__main__":
+    main()
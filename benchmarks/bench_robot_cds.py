@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Benchmark ROBOT start-up with and without the class-data-sharing archive.
+
+Usage: bench_robot_cds.py [--robot ./robot] [--runs 10]
+
+Times --runs ROBOT calls -- a convert and a relax of a tiny ontology, so the
+JVM's start-up is nearly all there is to time -- twice:
+
+  cold -- ROBOT_JAVA_ARGS as configured, every class loaded from robot.jar;
+  cds  -- the same with the archive initialize_robot dumps (dumping it first,
+          once, if this robot.jar and JVM don't have one yet).
+
+Needs Java 13 or later on the PATH. ROBOT is downloaded beside --robot if it
+isn't there.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import sh
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "src"))
+
+from kg_bioportal.config import ROBOT_JAVA_ARGS  # noqa: E402
+from kg_bioportal.robot_utils import (  # noqa: E402
+    _CDS_TRAINING_ONTOLOGY,
+    initialize_robot,
+    robot_cds_archive,
+)
+
+
+def timed_runs(robot_path: str, env: dict, source: str, out_dir: str, runs: int) -> list:
+    robot = sh.Command(robot_path)
+    times = []
+    for i in range(runs):
+        start = time.perf_counter()
+        robot(
+            "convert", "--input", source,
+            "relax", "--output", os.path.join(out_dir, f"out-{i}.owl"),
+            _env=env,
+        )
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def report(label: str, times: list) -> float:
+    median = statistics.median(times)
+    print(f"{label:<6} median {median:6.2f}s  min {min(times):6.2f}s  max {max(times):6.2f}s")
+    return median
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--robot", default=os.path.join(os.getcwd(), "robot"))
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    robot_path = os.path.abspath(args.robot)
+    _, cold_env = initialize_robot(robot_path, java_args=ROBOT_JAVA_ARGS, cds=False)
+    archive = robot_cds_archive(robot_path, cold_env)
+    if not archive:
+        sys.exit("No CDS archive: needs Java 13 or later (see the log for why).")
+    cds_env = dict(cold_env)
+    cds_env["ROBOT_JAVA_ARGS"] = f"{ROBOT_JAVA_ARGS} -XX:SharedArchiveFile={archive} -Xshare:auto"
+    print(f"Archive: {archive} ({os.path.getsize(archive) / 1024 / 1024:.0f} MB)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "tiny.owl")
+        with open(source, "w") as f:
+            f.write(_CDS_TRAINING_ONTOLOGY)
+        # One untimed run each, so the OS file cache treats them alike.
+        timed_runs(robot_path, cold_env, source, tmp, 1)
+        timed_runs(robot_path, cds_env, source, tmp, 1)
+        cold = report("cold", timed_runs(robot_path, cold_env, source, tmp, args.runs))
+        cds = report("cds", timed_runs(robot_path, cds_env, source, tmp, args.runs))
+    print(f"saved per call {cold - cds:6.2f}s ({(1 - cds / cold) * 100:.0f}%)")
+
+
+if __name__ == "__main__":
+    main()
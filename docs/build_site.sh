@@ -14,6 +14,9 @@ ONTO_STATUS_FILE="onto_stats.yaml"
 # Retrieve the most recent transform stats from the latest release.
 wget -O "$TOTAL_STATS_FILE" "$RELEASE_BASE/$TOTAL_STATS_FILE"
 wget -O "$ONTO_STATUS_FILE" "$RELEASE_BASE/$ONTO_STATUS_FILE"
+# Indexed companion of onto_stats.yaml; build_site.py reads it instead of the
+# YAML when it matches. Older releases don't have one, hence optional.
+wget -O "onto_stats.db" "$RELEASE_BASE/onto_stats.db" || rm -f onto_stats.db
 
 # Append ontology status list
 echo "Adding all lists to Jekyll config."
@@ -19,6 +19,9 @@ Usage:
     python build_site.py --fetch         # download the JSON-LD first
 """
 import json, os, sys, html, shutil, urllib.request
+import datetime
+import hashlib
+import sqlite3
 
 REGISTRY_URL = "https://kghub.org/kg-registry/registry/kgs.jsonld"
 
@@ -193,17 +196,59 @@ REASON_MSG = {
 def reason_message(reason):
     return REASON_MSG.get(reason, "This ontology has not been transformed to KGX.")
 
+# Must match INDEX_DB_FORMAT in kg_bioportal/index.py.
+INDEX_DB_FORMAT = "2"
+
+def load_ontologies_db(path):
+    """Entries from onto_stats.db, the indexed companion the transform build
+    publishes beside onto_stats.yaml, or None unless it was written from this
+    very YAML (same SHA-256) -- a stale companion must never shadow the YAML.
+    Kept in step with kg_bioportal.index, which this script can't import."""
+    db = os.path.splitext(path)[0] + ".db"
+    if not os.path.exists(db):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    try:
+        con = sqlite3.connect(f"file:{db}?mode=ro", uri=True)
+        try:
+            meta = dict(con.execute("SELECT key, value FROM meta"))
+            if (meta.get("format") != INDEX_DB_FORMAT
+                    or meta.get("yaml_sha256") != digest.hexdigest()):
+                return None
+            rows = con.execute("SELECT entry FROM ontologies ORDER BY position").fetchall()
+        finally:
+            con.close()
+    except sqlite3.Error:
+        return None
+    return [json.loads(entry, object_hook=_index_json_object) for (entry,) in rows]
+
+def _index_json_object(obj):
+    """The companion tags the dates YAML has and JSON lacks; read them back."""
+    if len(obj) == 1:
+        for tag, kind in (("$datetime", datetime.datetime), ("$date", datetime.date)):
+            if tag in obj:
+                return kind.fromisoformat(obj[tag])
+    return obj
+
 def load_ontologies(path):
-    """Load onto_stats.yaml -> list of entries. Needs PyYAML (present in the CI build)."""
+    """Load onto_stats.yaml -> list of entries. Reads the onto_stats.db companion
+    when it matches (no YAML parse at all); otherwise needs PyYAML (present in
+    the CI build), using libyaml's C loader when it is there."""
     if not path or not os.path.exists(path):
         return []
+    entries = load_ontologies_db(path)
+    if entries is not None:
+        return entries
     try:
         import yaml  # available in the Pages build (installed for make_viz.py)
     except ImportError:
         print("PyYAML not available; skipping transformed-ontology entries.")
         return []
     with open(path) as f:
-        data = yaml.safe_load(f) or {}
+        data = yaml.load(f, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)) or {}
     return data.get("ontologies", [])
 
 # --------------------------------------------------------------------------- #
@@ -0,0 +1,397 @@
+"""Fetching published artifacts into a local content cache.
+
+The cache holds each artifact once, under the SHA-256 of its bytes, beside a
+manifest of what each download_url was found to hold:
+
+    <cache_dir>/objects/<2 hex>/<sha256>    the artifacts, read-only
+    <cache_dir>/refs.json                   {download_url: {sha256, bytes, etag}}
+    <cache_dir>/partial/<url key>.part      downloads not yet complete
+
+A release's assets are not rebuilt in place: a rebuilt ontology goes into a
+new release, under a new URL. So a URL already in the manifest is never
+fetched again, and neither is one whose index entry names an
+``artifact_sha256`` the cache already holds. Every download is hashed as it
+arrives and checked against that digest where the index has one; one that
+doesn't match is discarded rather than cached.
+
+A download that breaks off keeps its ``.part``. The next attempt, in this run
+or a later one, resumes it with a Range request, made conditional (If-Range)
+on the server still having the same file.
+
+Artifacts are fetched on a thread pool over one keep-alive session, and handed
+out as hard links (copies, across file systems) named
+``<output_dir>/<ACRONYM>.tar.gz``: the layout merge and load-store read.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter, Retry
+
+from kg_bioportal.config import ARTIFACT_CACHE_DIR, FETCH_WORKERS
+from kg_bioportal.index import (
+    GRAPH_URLS_NAME,
+    LATEST_DOWNLOAD_URL,
+    file_sha256,
+    read_graph_urls,
+    read_index,
+)
+
+# The files of the latest release that map every published ontology.
+LATEST_GRAPH_URLS = f"{LATEST_DOWNLOAD_URL}/{GRAPH_URLS_NAME}"
+LATEST_INDEX = f"{LATEST_DOWNLOAD_URL}/onto_stats.yaml"
+
+REFS_NAME = "refs.json"
+
+# Bytes read from a response at a time, and so the most a broken-off download
+# loses: a chunk cut short is never written to the .part.
+_CHUNK = 64 * 1024
+
+# Tries at one artifact within a run, each resuming where the last broke off.
+# (Refused connections and 5xx responses are retried by the session itself.)
+_ATTEMPTS = 3
+
+
+def _session(workers: int) -> requests.Session:
+    session = requests.Session()
+    # A connection per worker, kept alive from one artifact to the next.
+    adapter = HTTPAdapter(
+        pool_connections=workers,
+        pool_maxsize=workers,
+        max_retries=Retry(total=5, backoff_factor=1, status_forcelist=[500, 502, 503, 504]),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _fetch_file(session: requests.Session, url: str, path: str) -> None:
+    """Fetch a small file whole, by way of ``path.part``."""
+    part = path + ".part"
+    with session.get(url, stream=True, timeout=60) as response:
+        response.raise_for_status()
+        with open(part, "wb") as f:
+            for chunk in response.iter_content(_CHUNK):
+                f.write(chunk)
+    os.replace(part, path)
+
+
+def object_path(cache_dir: str, sha256: str) -> str:
+    """Where the artifact with this digest is (or would be) cached."""
+    return os.path.join(cache_dir, "objects", sha256[:2], sha256)
+
+
+def _partial_path(cache_dir: str, url: str) -> str:
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, "partial", f"{key}.part")
+
+
+def read_refs(cache_dir: str) -> Dict[str, dict]:
+    """The cache's manifest: {download_url: {sha256, bytes, etag}}."""
+    try:
+        with open(os.path.join(cache_dir, REFS_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_refs(cache_dir: str, refs: Dict[str, dict]) -> None:
+    path = os.path.join(cache_dir, REFS_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(refs, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def _in_cache(cache_dir: str, ref: Optional[dict], expected: str, verify: bool) -> str:
+    """The digest of the cached copy of an artifact, or "" if there is none.
+
+    The index's digest, where it has one, says what the artifact must be;
+    otherwise the manifest says what its URL held when last fetched.
+    """
+    sha256 = expected or (ref or {}).get("sha256", "")
+    path = object_path(cache_dir, sha256) if sha256 else ""
+    if not path or not os.path.exists(path):
+        return ""
+    if verify and file_sha256(path) != sha256:
+        logging.warning(f"Cached {path} is corrupt; fetching it again.")
+        os.remove(path)
+        return ""
+    return sha256
+
+
+def _validator(response: requests.Response) -> str:
+    """What If-Range can name to resume from this response: a strong ETag,
+    else Last-Modified."""
+    etag = response.headers.get("ETag", "")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified", "")
+
+
+def _download(session: requests.Session, url: str, part: str) -> Tuple[str, int, str, bool]:
+    """Fetch ``url`` into ``part``, resuming what is already there.
+
+    Returns:
+        The file's SHA-256, its size, the server's validator for it, and
+        whether the fetch resumed a partial download.
+
+    Raises:
+        requests.RequestException: If the last attempt fails too.
+    """
+    validator_path = part + ".etag"
+    resumed = False
+    for attempt in range(_ATTEMPTS):
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        validator = ""
+        if offset and os.path.exists(validator_path):
+            with open(validator_path) as f:
+                validator = f.read()
+        headers = {"Range": f"bytes={offset}-", "If-Range": validator} if validator else {}
+        try:
+            with session.get(url, stream=True, timeout=60, headers=headers) as response:
+                if response.status_code == 416:
+                    # Nothing past the end of the .part: start over.
+                    os.remove(part)
+                    continue
+                response.raise_for_status()
+                with open(validator_path, "w") as f:
+                    f.write(_validator(response))
+                digest = hashlib.sha256()
+                if response.status_code == 206:
+                    resumed = True
+                    with open(part, "rb") as f:
+                        for block in iter(lambda: f.read(_CHUNK), b""):
+                            digest.update(block)
+                else:
+                    offset = 0
+                with open(part, "ab" if offset else "wb") as f:
+                    for chunk in response.iter_content(_CHUNK):
+                        f.write(chunk)
+                        digest.update(chunk)
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+            if attempt == _ATTEMPTS - 1:
+                raise
+            logging.warning(f"Fetch of {url} broke off ({e}); resuming.")
+            continue
+        with open(validator_path) as f:
+            validator = f.read()
+        os.remove(validator_path)
+        return digest.hexdigest(), os.path.getsize(part), validator, resumed
+    raise requests.ConnectionError(f"Could not fetch {url}")
+
+
+def _fetch_one(
+    session: requests.Session, cache_dir: str, url: str, expected: str
+) -> Tuple[str, int, str, bool]:
+    """Fetch one artifact into the cache; its digest, size, validator, resumed.
+
+    Raises:
+        ValueError: If it doesn't hash to ``expected``.
+    """
+    part = _partial_path(cache_dir, url)
+    sha256, size, validator, resumed = _download(session, url, part)
+    if expected and sha256 != expected:
+        os.remove(part)
+        raise ValueError(f"{url} has SHA-256 {sha256}, but the index says {expected}")
+    path = object_path(cache_dir, sha256)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Read-only: an edit to a copy handed out as a hard link would be an edit
+    # to the cache.
+    os.chmod(part, 0o444)
+    os.replace(part, path)
+    return sha256, size, validator, resumed
+
+
+def link_or_copy(cached: str, path: str) -> None:
+    """Put a cached file at ``path``: a hard link where possible, else a copy."""
+    if os.path.lexists(path):
+        os.remove(path)
+    try:
+        os.link(cached, path)
+    except OSError:
+        shutil.copyfile(cached, path)
+
+
+def fetch_artifacts(
+    urls: Dict[str, str],
+    output_dir: str,
+    cache_dir: str = ARTIFACT_CACHE_DIR,
+    workers: int = FETCH_WORKERS,
+    digests: Optional[Dict[str, str]] = None,
+    verify: bool = False,
+    session: Optional[requests.Session] = None,
+) -> Tuple[Dict[str, str], dict]:
+    """Fetch the artifacts the cache lacks, and put them all in ``output_dir``.
+
+    One artifact failing doesn't stop the others; it is reported in the
+    counts' ``failed`` and left out of ``output_dir``.
+
+    Args:
+        urls: {acronym: download_url} of the artifacts wanted.
+        output_dir: Where ``<ACRONYM>.tar.gz`` go.
+        cache_dir: The cache.
+        workers: Artifacts fetched at once.
+        digests: {acronym: artifact_sha256} from the index, where known. An
+            artifact is verified against its digest, and is not fetched if
+            the cache already has it.
+        verify: If True, re-hashes cached artifacts before trusting them.
+        session: The session to fetch with (default: a new one).
+
+    Returns:
+        {acronym: path in ``output_dir``}, and counts of artifacts fetched,
+        already cached and resumed, of the bytes fetched, and {acronym:
+        error} for those that could not be fetched.
+    """
+    workers = max(workers, 1)
+    digests = digests or {}
+    session = session or _session(workers)
+    os.makedirs(os.path.join(cache_dir, "partial"), exist_ok=True)
+    refs = read_refs(cache_dir)
+    ready, todo = {}, []
+    for acronym, url in urls.items():
+        sha256 = _in_cache(cache_dir, refs.get(url), digests.get(acronym, ""), verify)
+        if sha256:
+            ready[acronym] = sha256
+        else:
+            todo.append(acronym)
+
+    def fetch(acronym: str) -> Tuple[str, int, str, bool]:
+        logging.info(f"Fetching {acronym} from {urls[acronym]}")
+        return _fetch_one(session, cache_dir, urls[acronym], digests.get(acronym, ""))
+
+    stats: Dict[str, Any] = {
+        "fetched": 0, "cached": len(ready), "resumed": 0, "bytes": 0, "failed": {},
+    }
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {acronym: pool.submit(fetch, acronym) for acronym in todo}
+        for acronym, future in futures.items():
+            try:
+                sha256, size, validator, resumed = future.result()
+            except (requests.RequestException, OSError, ValueError) as e:
+                logging.error(f"Could not fetch {acronym}: {e}")
+                stats["failed"][acronym] = str(e)
+                continue
+            ready[acronym] = sha256
+            refs[urls[acronym]] = {"sha256": sha256, "bytes": size, "etag": validator}
+            stats["fetched"] += 1
+            stats["resumed"] += resumed
+            stats["bytes"] += size
+    for acronym, sha256 in ready.items():
+        refs.setdefault(urls[acronym], {"sha256": sha256})
+    _write_refs(cache_dir, refs)
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+    for acronym in urls:
+        if acronym in ready:
+            paths[acronym] = os.path.join(output_dir, f"{acronym}.tar.gz")
+            link_or_copy(object_path(cache_dir, ready[acronym]), paths[acronym])
+    return paths, stats
+
+
+def _resolve(source: str, cache_dir: str, session: Optional[requests.Session]) -> str:
+    """A local copy of ``source``: the path itself, or a fresh fetch of the URL.
+
+    A URL is fetched every time -- the latest release's files change with
+    every run -- into the cache, and read from there.
+    """
+    if not source.startswith(("http://", "https://")):
+        return source
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, os.path.basename(source))
+    _fetch_file(session or _session(1), source, path)
+    return path
+
+
+def resolve_graph_urls(
+    source: str = LATEST_GRAPH_URLS,
+    cache_dir: str = ARTIFACT_CACHE_DIR,
+    session: Optional[requests.Session] = None,
+) -> Dict[str, str]:
+    """{acronym: download_url} from a graph_urls.tsv, local or at a URL."""
+    return read_graph_urls(_resolve(source, cache_dir, session))
+
+
+def resolve_index(
+    source: str = LATEST_INDEX,
+    cache_dir: str = ARTIFACT_CACHE_DIR,
+    session: Optional[requests.Session] = None,
+) -> Dict[str, dict]:
+    """{acronym: entry} from an onto_stats.yaml, local or at a URL."""
+    return read_index(_resolve(source, cache_dir, session))
+
+
+def select_published(
+    index: Dict[str, dict], include_only: Sequence[str] = (), exclude: Sequence[str] = ()
+) -> Tuple[Dict[str, dict], Dict[str, str]]:
+    """The index entries with an artifact to fetch, and why those asked for
+    by ``include_only`` have none.
+
+    Args:
+        index: The onto_stats index, by acronym.
+        include_only: If given, only these acronyms.
+        exclude: Acronyms to leave out.
+    """
+    include = [a.upper() for a in include_only]
+    excluded = {a.upper() for a in exclude}
+    selected, missing = {}, {}
+    for acronym in include or sorted(index):
+        entry = index.get(acronym)
+        if acronym in excluded:
+            continue
+        if entry and entry.get("status") == "OK" and entry.get("download_url"):
+            selected[acronym] = entry
+        elif include:
+            missing[acronym] = (
+                (entry.get("reason") or entry.get("status") or "no download_url")
+                if entry
+                else "not in the index"
+            )
+    return selected, missing
+
+
+def fetch_published(
+    output_dir: str,
+    source: str = LATEST_INDEX,
+    include_only: Sequence[str] = (),
+    exclude: Sequence[str] = (),
+    cache_dir: str = ARTIFACT_CACHE_DIR,
+    workers: int = FETCH_WORKERS,
+    verify: bool = False,
+) -> dict:
+    """Fetch the published artifacts an index lists, through the cache.
+
+    Args:
+        output_dir: Where ``<ACRONYM>.tar.gz`` go.
+        source: onto_stats.yaml, as a path or URL (default: the latest
+            release's).
+        include_only: If given, only these acronyms.
+        exclude: Acronyms to leave out.
+        cache_dir: The cache.
+        workers: Artifacts fetched at once.
+        verify: If True, re-hashes cached artifacts before trusting them.
+
+    Returns:
+        The number of artifacts selected, {acronym: reason} for those asked
+        for that have none, and fetch_artifacts' counts.
+    """
+    session = _session(max(workers, 1))
+    selected, missing = select_published(
+        resolve_index(source, cache_dir, session), include_only, exclude
+    )
+    _, stats = fetch_artifacts(
+        {acronym: entry["download_url"] for acronym, entry in selected.items()},
+        output_dir,
+        cache_dir=cache_dir,
+        workers=workers,
+        digests={a: e.get("artifact_sha256", "") for a, e in selected.items()},
+        verify=verify,
+        session=session,
+    )
+    return {"selected": len(selected), "missing": missing, **stats}
@@ -0,0 +1,298 @@
+"""Per-ontology Bloom filters over node ids, for "might it have this term?".
+
+term_index.db answers exactly which ontologies have a term, but it holds every
+term and grows with the catalogue. Often a consumer only wants to rule
+ontologies out before fetching them, and a Bloom filter does that in about ten
+bits a term: it never misses a term the ontology has, and wrongly claims one
+it doesn't at the configured rate (``BLOOM_FP_RATE``).
+
+Each transform writes one beside its artifact, from the term list:
+
+    <ACRONYM>_ids.bloom   header (see ``_HEADER``), then the bit array
+
+and ``build_filter_bundle`` gathers them into bloom_filters.db, one row per
+ontology, built over the previous release's the way term_index.db is.
+``FilterBundle`` loads every filter into one array and checks a batch of terms
+against all of them at once.
+
+Positions come from double hashing (Kirsch and Mitzenmacher): the i-th of a
+filter's k bits for a key is ``(h1 + i * h2) % bits``, with h1 and h2 the two
+32-bit halves of the key's 64-bit BLAKE2b digest. A key is hashed once,
+whatever the number of filters.
+
+Building and bundling need only the standard library (the finalize job runs
+them with nothing but PyYAML installed); the batched check uses numpy.
+"""
+
+import glob
+import hashlib
+import math
+import os
+import shutil
+import sqlite3
+import struct
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from kg_bioportal.config import BLOOM_FP_RATE
+
+BLOOM_SUFFIX = "_ids.bloom"
+BLOOM_BUNDLE_NAME = "bloom_filters.db"
+
+# magic, format, k, (padding), terms, bits
+_HEADER = struct.Struct("<4sBBxxQQ")
+_MAGIC = b"KGBF"
+_FORMAT = 1
+
+_BUNDLE_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE filters (
+    acronym TEXT PRIMARY KEY, terms INTEGER NOT NULL, k INTEGER NOT NULL,
+    bits INTEGER NOT NULL, filter BLOB NOT NULL, download_url TEXT
+);
+"""
+
+
+def _hashes(key: str) -> Tuple[int, int]:
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+    # An odd step visits k distinct positions whenever bits is a power of two,
+    # and rarely repeats one otherwise.
+    return int.from_bytes(digest[:4], "little"), int.from_bytes(digest[4:], "little") | 1
+
+
+class BloomFilter:
+    """A Bloom filter over strings."""
+
+    def __init__(self, bits: int, k: int, terms: int = 0, data: Optional[bytes] = None) -> None:
+        """An empty filter, or one read back from ``data``.
+
+        Args:
+            bits: Size of the bit array.
+            k: Bits set per key.
+            terms: Keys already added.
+            data: The bit array, ``ceil(bits / 8)`` bytes.
+        """
+        if bits < 1 or k < 1:
+            raise ValueError(f"A Bloom filter needs bits and k of at least 1, not {bits}, {k}")
+        self.bits = bits
+        self.k = k
+        self.terms = terms
+        size = (bits + 7) // 8
+        self._data = bytearray(data) if data is not None else bytearray(size)
+        if len(self._data) != size:
+            raise ValueError(f"A {bits}-bit filter is {size} bytes, not {len(self._data)}")
+
+    @classmethod
+    def for_capacity(cls, terms: int, fp_rate: float = BLOOM_FP_RATE) -> "BloomFilter":
+        """A filter sized for ``terms`` keys at false-positive rate ``fp_rate``."""
+        if not 0 < fp_rate < 1:
+            raise ValueError(f"The false-positive rate must be in (0, 1), not {fp_rate}")
+        terms = max(terms, 1)
+        bits = max(8, math.ceil(-terms * math.log(fp_rate) / math.log(2) ** 2))
+        k = max(1, round(bits / terms * math.log(2)))
+        return cls(bits, k)
+
+    def _positions(self, key: str) -> Iterable[int]:
+        h1, h2 = _hashes(key)
+        return ((h1 + i * h2) % self.bits for i in range(self.k))
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self._data[position >> 3] |= 1 << (position & 7)
+        self.terms += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self._data[position >> 3] >> (position & 7) & 1 for position in self._positions(key)
+        )
+
+    @property
+    def data(self) -> bytes:
+        """The bit array."""
+        return bytes(self._data)
+
+    def to_bytes(self) -> bytes:
+        return _HEADER.pack(_MAGIC, _FORMAT, self.k, self.terms, self.bits) + self.data
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "BloomFilter":
+        if len(blob) < _HEADER.size:
+            raise ValueError("Not a Bloom filter: too short")
+        magic, version, k, terms, bits = _HEADER.unpack_from(blob)
+        if magic != _MAGIC or version != _FORMAT:
+            raise ValueError(f"Not a Bloom filter of format {_FORMAT}")
+        return cls(bits, k, terms, blob[_HEADER.size:])
+
+
+def write_id_filter(
+    terms: Iterable[str], count: int, output_dir: str, acronym: str, fp_rate: float = BLOOM_FP_RATE
+) -> str:
+    """Write ``<acronym>_ids.bloom`` over an ontology's distinct node ids.
+
+    Args:
+        terms: The ids, each once (a term list, see term_index).
+        count: How many there are, to size the filter.
+        output_dir: Where the filter goes.
+        acronym: The ontology's acronym.
+        fp_rate: The false-positive rate to size for.
+
+    Returns:
+        The path written.
+    """
+    bloom = BloomFilter.for_capacity(count, fp_rate)
+    for term in terms:
+        bloom.add(term)
+    path = os.path.join(output_dir, acronym + BLOOM_SUFFIX)
+    with open(path, "wb") as f:
+        f.write(bloom.to_bytes())
+    return path
+
+
+def _open_bundle(base_path: str, db_path: str) -> sqlite3.Connection:
+    """A writable copy of the previous bundle at ``db_path``, or a new one."""
+    if base_path and os.path.exists(base_path):
+        shutil.copyfile(base_path, db_path)
+        con = sqlite3.connect(db_path)
+        try:
+            (version,) = con.execute("SELECT value FROM meta WHERE key = 'format'").fetchone()
+        except (sqlite3.DatabaseError, TypeError):
+            version = None
+        if version == str(_FORMAT):
+            return con
+        con.close()
+        os.remove(db_path)
+    con = sqlite3.connect(db_path)
+    con.executescript(_BUNDLE_SCHEMA)
+    with con:
+        con.execute("INSERT INTO meta VALUES ('format', ?)", (str(_FORMAT),))
+    return con
+
+
+def build_filter_bundle(
+    filters_dir: str,
+    db_path: str,
+    base_path: str = "",
+    index: Optional[Dict[str, dict]] = None,
+    report: Callable[[str], None] = print,
+) -> dict:
+    """Build bloom_filters.db over the previous one from a build's filters.
+
+    Args:
+        filters_dir: Searched recursively for ``<ACRONYM>_ids.bloom`` files.
+        db_path: Where the bundle is written.
+        base_path: The previous bundle, whose other ontologies carry over.
+        index: The merged onto_stats index, by acronym. If given, ontologies
+            without an OK, resolvable entry are dropped, and each kept
+            ontology records its entry's download_url.
+        report: Called with each progress line.
+
+    Returns:
+        Counts: ontologies updated, dropped and in the bundle, and its bytes.
+    """
+    tmp_path = db_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    con = _open_bundle(base_path, tmp_path)
+
+    updated = 0
+    pattern = os.path.join(filters_dir, "**", "*" + BLOOM_SUFFIX)
+    with con:
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            acronym = os.path.basename(path)[: -len(BLOOM_SUFFIX)]
+            with open(path, "rb") as f:
+                bloom = BloomFilter.from_bytes(f.read())
+            con.execute(
+                "INSERT OR REPLACE INTO filters (acronym, terms, k, bits, filter) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (acronym, bloom.terms, bloom.k, bloom.bits, bloom.data),
+            )
+            updated += 1
+
+    dropped = 0
+    if index is not None:
+        with con:
+            for (acronym,) in con.execute("SELECT acronym FROM filters").fetchall():
+                entry = index.get(acronym) or {}
+                if entry.get("status") == "OK" and entry.get("download_url"):
+                    con.execute(
+                        "UPDATE filters SET download_url = ? WHERE acronym = ?",
+                        (entry["download_url"], acronym),
+                    )
+                else:
+                    con.execute("DELETE FROM filters WHERE acronym = ?", (acronym,))
+                    dropped += 1
+
+    (ontologies,) = con.execute("SELECT COUNT(*) FROM filters").fetchone()
+    con.execute("VACUUM")
+    con.close()
+    os.replace(tmp_path, db_path)
+
+    size = os.path.getsize(db_path)
+    report(
+        f"Bloom filters: {updated} ontologies updated, {dropped} dropped, "
+        f"{ontologies} ontologies in {size / 1e6:.1f} MB -> {db_path}"
+    )
+    return {"updated": updated, "dropped": dropped, "ontologies": ontologies, "bytes": size}
+
+
+class FilterBundle:
+    """Every ontology's filter, checked against a batch of terms at once."""
+
+    def __init__(self, path: str = BLOOM_BUNDLE_NAME) -> None:
+        """Loads the filters.
+
+        Args:
+            path: A bloom_filters.db, or a directory of ``<ACRONYM>_ids.bloom``
+                files (a local transform's output).
+        """
+        # numpy comes with kgx (by way of pandas); it is only needed here.
+        import numpy as np
+
+        if os.path.isdir(path):
+            rows = []
+            for name in sorted(glob.glob(os.path.join(path, "*" + BLOOM_SUFFIX))):
+                with open(name, "rb") as f:
+                    bloom = BloomFilter.from_bytes(f.read())
+                acronym = os.path.basename(name)[: -len(BLOOM_SUFFIX)]
+                rows.append((acronym, bloom.k, bloom.bits, bloom.data))
+        elif os.path.exists(path):
+            con = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            rows = con.execute(
+                "SELECT acronym, k, bits, filter FROM filters ORDER BY acronym"
+            ).fetchall()
+            con.close()
+        else:
+            raise FileNotFoundError(path)
+
+        self._np = np
+        self.acronyms: List[str] = [row[0] for row in rows]
+        self._k = np.array([row[1] for row in rows], dtype=np.uint64)
+        self._bits = np.array([row[2] for row in rows], dtype=np.uint64)
+        sizes = [len(row[3]) for row in rows]
+        self._start = np.cumsum([0] + sizes[:-1], dtype=np.uint64)
+        self._data = np.frombuffer(b"".join(row[3] for row in rows), dtype=np.uint8)
+        self._max_k = int(self._k.max()) if rows else 0
+
+    def __len__(self) -> int:
+        return len(self.acronyms)
+
+    def candidates(self, terms: List[str]) -> Dict[str, List[str]]:
+        """The ontologies that may have each term (and surely not the rest).
+
+        One pass per hash function, each over every (term, filter) pair.
+        """
+        np = self._np
+        if not terms or not self.acronyms:
+            return {term: [] for term in terms}
+        hashes = np.array([_hashes(term) for term in terms], dtype=np.uint64)
+        h1, h2 = hashes[:, :1], hashes[:, 1:]
+        hit = np.ones((len(terms), len(self.acronyms)), dtype=bool)
+        for i in range(self._max_k):
+            position = (h1 + np.uint64(i) * h2) % self._bits
+            byte = self._data[self._start + (position >> np.uint64(3))]
+            bit = (byte >> (position & np.uint64(7)).astype(np.uint8)) & 1
+            # Filters with fewer than i + 1 hash functions are done already.
+            hit &= (bit == 1) | (self._k <= i)
+        return {
+            term: [self.acronyms[j] for j in np.flatnonzero(row)]
+            for term, row in zip(terms, hit)
+        }
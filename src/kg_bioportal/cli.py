@@ -3,17 +3,64 @@
 import json
 import logging
 import os
+from datetime import datetime, timezone
+from typing import Optional
 
 import click
 
+from kg_bioportal.artifact_fetch import LATEST_GRAPH_URLS, LATEST_INDEX, fetch_published
+from kg_bioportal.bloom import BLOOM_BUNDLE_NAME, FilterBundle, build_filter_bundle
 from kg_bioportal.config import (
+    ARTIFACT_CACHE_DIR,
     DEFAULT_NUM_SHARDS,
+    FETCH_WORKERS,
+    HEAVY_LANE_REASONS,
+    HEAVY_MAX_SOURCE_MB,
+    HEAVY_NUM_SHARDS,
+    LANE_LIMITS,
     MAX_SOURCE_MB,
+    MERGE_RUN_ROWS,
+    MERGE_WORKERS,
+    MIN_FREE_DISK_GB,
     PER_ONTOLOGY_TIMEOUT_MIN,
+    PIPELINE_CPUS,
+    PIPELINE_QUEUE_SIZE,
+    PIPELINE_RAM_GB,
+    PROBE_WORKERS,
+    QUEUE_LEASE_SEC,
+    QUEUE_MAX_ATTEMPTS,
+    SERVE_CACHE_NODES,
+    SERVE_MAX_RESULTS,
+    SERVE_POOL_SIZE,
+    SNIPPET_KB,
+    STORE_BATCH_ROWS,
+    STORE_WORKERS,
     is_skiplisted,
 )
-from kg_bioportal.downloader import Downloader, ONTOLOGY_LIST_NAME
+from kg_bioportal.downloader import (
+    ONTOLOGY_LIST_NAME,
+    SIZE_MANIFEST_NAME,
+    Downloader,
+    read_size_manifest,
+)
+from kg_bioportal.graph_merge import DANGLING_MODES, merge_graph, select_artifacts
+from kg_bioportal.graph_store import STORE_NAME
+from kg_bioportal.graph_store import load_store as load_graph_store
+from kg_bioportal.heap import learn_multiplier
+from kg_bioportal.index import content_unchanged, read_index, retry_due
+from kg_bioportal.pipeline import (
+    pipeline_settings,
+    plan_workers,
+    run_pipeline,
+    run_queue_worker,
+)
+from kg_bioportal.pipeline import run_shard as run_shard_pipeline
+from kg_bioportal.query_service import QueryServer
+from kg_bioportal.sharding import estimate_costs, format_duration, pack_shards
+from kg_bioportal.subset import build_subset
+from kg_bioportal.term_index import TERM_INDEX_NAME, build_term_index
 from kg_bioportal.transformer import Transformer
+from kg_bioportal.work_queue import WorkQueue
 
 __all__ = [
     "main",
@@ -51,27 +98,167 @@ def _read_ontology_submissions(ontology_file: str) -> dict:
     return subs
 
 
-def _load_index_submissions(index_path: str) -> dict:
-    """Read {acronym: submission_id} from an onto_stats.yaml index.
+def _load_index_submissions(index: dict) -> dict:
+    """Read {acronym: submission_id} from onto_stats.yaml index entries.
 
     Only entries with a concrete submission_id are returned (skiplisted / no-
     submission entries use 'NA' and are excluded), so a later run always treats
     those as needing a transform.
     """
-    import yaml
-
-    if not index_path or not os.path.exists(index_path):
-        return {}
-    with open(index_path) as f:
-        data = yaml.safe_load(f) or {}
     out = {}
-    for entry in data.get("ontologies", []):
+    for acr, entry in index.items():
         sub = str(entry.get("submission_id") or "").strip()
         if sub and sub != "NA":
-            out[entry["id"]] = sub
+            out[acr] = sub
     return out
 
 
+def _version_skip(
+    acronyms: list,
+    current_subs: dict,
+    index_path: str,
+    etags: Optional[dict] = None,
+    force_retry: bool = False,
+) -> list:
+    """Drop ontologies whose BioPortal submission matches the index's.
+
+    Only new or changed submissions need (re)building; unchanged graphs carry
+    forward when the index is merged. The exception is a failure that may be
+    transient, which is retried once its backoff has run out (every run with
+    ``force_retry``; see index.retry_due). With ``etags`` ({acronym: content
+    tag}, from a probe), a changed submission whose source still has the tag
+    its published graph was built from is dropped too (see
+    index.content_unchanged). The counts skipped go to stderr.
+    """
+    index = read_index(index_path)
+    index_subs = _load_index_submissions(index)
+    if not index_subs:
+        return acronyms
+    before = len(acronyms)
+    unchanged = {a for a in acronyms if index_subs.get(a) == current_subs.get(a)}
+    due = {a for a in unchanged if retry_due(index[a], force=force_retry)}
+    held = sum(1 for a in unchanged - due if retry_due(index[a], force=True))
+    acronyms = [a for a in acronyms if a not in unchanged or a in due]
+    click.echo(
+        f"version-skip: {before - len(acronyms) - held} unchanged skipped, "
+        f"{len(acronyms)} to transform.",
+        err=True,
+    )
+    if due or held:
+        click.echo(
+            f"retry-backoff: {len(due)} failing ontologies retried, {held} held back"
+            + (" (--force_retry)." if force_retry else "."),
+            err=True,
+        )
+    if etags:
+        same = {a for a in acronyms if content_unchanged(index.get(a), etag=etags.get(a, ""))}
+        if same:
+            acronyms = [a for a in acronyms if a not in same]
+            click.echo(
+                f"content-skip: {len(same)} new submissions with an unchanged source "
+                f"skipped: {' '.join(sorted(same))}",
+                err=True,
+            )
+    return acronyms
+
+
+def _light_gave_up(entry: Optional[dict]) -> bool:
+    """True if the index says the light lane skipped this ontology as too big or slow."""
+    return (
+        entry is not None
+        and entry.get("reason") in ("too_large", "too_slow")
+        and entry.get("lane", "light") == "light"
+    )
+
+
+def _source_over(row: Optional[dict], max_source_mb: float) -> bool:
+    """True if a size-manifest row puts the source over ``max_source_mb``."""
+    length = str((row or {}).get("content_length", ""))
+    return length.isdigit() and int(length) > int(max_source_mb * 1024 * 1024)
+
+
+def _shard(
+    acronyms: list,
+    num_shards: int,
+    balance: str,
+    index_path: str,
+    sizes: dict,
+    label: str,
+) -> list:
+    """Split ``acronyms`` into at most ``num_shards`` space-separated groups.
+
+    With ``balance='cost'`` the shards are packed by predicted cost and each
+    one's load is reported on stderr, prefixed by ``label``.
+    """
+    if balance == "cost":
+        source_sizes = {
+            a: int(row["content_length"]) for a, row in sizes.items()
+            if str(row.get("content_length", "")).isdigit()
+        }
+        costs = estimate_costs(acronyms, read_index(index_path), source_sizes)
+        packed = pack_shards(costs, num_shards) if acronyms else []
+        for i, (load, members) in enumerate(packed, start=1):
+            click.echo(
+                f"{label}: shard {i}: {len(members)} ontologies, "
+                f"~{format_duration(load)} predicted",
+                err=True,
+            )
+        if packed:
+            loads = [load for load, _ in packed]
+            click.echo(
+                f"{label}: predicted max {format_duration(max(loads))}, "
+                f"mean {format_duration(sum(loads) / len(loads))}",
+                err=True,
+            )
+        buckets = [members for _, members in packed]
+    else:
+        # Round-robin: even counts per shard, blind to what each one costs.
+        n = max(1, min(num_shards, len(acronyms)))
+        buckets = [[] for _ in range(n)]
+        for i, acr in enumerate(acronyms):
+            buckets[i % n].append(acr)
+    return [" ".join(b) for b in buckets if b]
+
+
+def _collect_ontologies(ontologies, ontology_file, output_dir):
+    """Acronyms named by --ontologies / --ontology_file, or else the full list.
+
+    With neither given, the full list downloaded by get_ontology_list into
+    ``output_dir`` is used. Returns None (having logged why) if that list
+    hasn't been downloaded yet.
+    """
+    onto_list = []
+
+    # If no input args provided, use the full list of ontologies
+    # But if the full list isn't available, throw an error and remind
+    # the user to download it first
+    if not ontologies and not ontology_file:
+        try:
+            with open(f"{output_dir}/{ONTOLOGY_LIST_NAME}", "r") as f:
+                f.readline()  # Skip the header
+                for line in f:
+                    onto_list.append(line.strip().split("\t")[0])
+        except FileNotFoundError:
+            logging.error(
+                f"Ontology list file not found. Please run the 'get_ontology_list' command first."
+            )
+            return None
+
+    # Parse the ontologies argument
+    if ontologies:
+        for ontology in ontologies.split():
+            onto_list.append(ontology)
+
+    # Parse the ontology_file argument
+    if ontology_file:
+        with open(ontology_file, "r") as f:
+            f.readline()  # Skip the header
+            for line in f:
+                onto_list.append(line.strip().split("\t")[0])
+
+    return onto_list
+
+
 @click.group()
 @click.option("-v", "--verbose", count=True)
 @click.option("-q", "--quiet")
@@ -143,7 +330,15 @@ def get_ontology_list(output_dir, api_key) -> None:
     "-x",
     is_flag=True,
     default=False,
-    help="Download only the first 5 kB of each (uncompressed) source, for testing and file checks [false]",
+    help="Download only the first few kB of each source (see --snippet_kb) and store it "
+    "unpacked, for testing and file checks [false]",
+)
+@click.option(
+    "--snippet_kb",
+    default=SNIPPET_KB,
+    show_default=True,
+    type=float,
+    help="With --snippet_only, how many kB of each source to fetch.",
 )
 @click.option(
     "--ignore_cache",
@@ -177,6 +372,7 @@ def download(
     ontology_file,
     output_dir,
     snippet_only,
+    snippet_kb,
     ignore_cache,
     api_key,
     max_source_mb,
@@ -195,7 +391,11 @@ def download(
         output_dir: A string pointing to the directory to download data to.
         Defaults to data/raw.
 
-        snippet_only: (Not yet implemented) Downloads only the first 5 kB of the source, for testing and file checks.
+        snippet_only: Downloads only the first snippet_kb of each source with a ranged request,
+        and stores it as a truncated but readable sample (gzip, tar and zip are unpacked), for
+        testing and file checks. Such rows are marked in download_report.tsv's snippet column.
+
+        snippet_kb: How many kB of each source a snippet fetches.
 
         ignore_cache: (Not yet implemented) If specified, will ignore existing files and download again.
 
@@ -206,40 +406,16 @@ def download(
 
     """
 
-    onto_list = []
-
-    # If no input args provided, use the full list of ontologies
-    # But if the full list isn't available, throw an error and remind
-    # the user to download it first
-    if not ontologies and not ontology_file:
-        try:
-            with open(f"{output_dir}/{ONTOLOGY_LIST_NAME}", "r") as f:
-                f.readline()  # Skip the header
-                for line in f:
-                    onto_list.append(line.strip().split("\t")[0])
-        except FileNotFoundError:
-            logging.error(
-                f"Ontology list file not found. Please run the 'get_ontology_list' command first."
-            )
-            return None
-
-    # Parse the ontologies argument
-    if ontologies:
-        for ontology in ontologies.split():
-            onto_list.append(ontology)
-
-    # Parse the ontology_file argument
-    if ontology_file:
-        with open(ontology_file, "r") as f:
-            f.readline()  # Skip the header
-            for line in f:
-                onto_list.append(line.strip().split("\t")[0])
+    onto_list = _collect_ontologies(ontologies, ontology_file, output_dir)
+    if onto_list is None:
+        return None
 
     logging.info(f"{len(onto_list)} ontologies to retrieve.")
 
     dl = Downloader(
         output_dir=output_dir,
         snippet_only=snippet_only,
+        snippet_kb=snippet_kb,
         ignore_cache=ignore_cache,
         api_key=api_key,
         max_source_mb=max_source_mb,
@@ -304,6 +480,257 @@ def transform(input_dir, output_dir, compress, timeout_min, max_source_mb) -> No
     return None
 
 
+@main.command()
+@click.option(
+    "--ontologies",
+    "-d",
+    required=False,
+    type=str,
+)
+@click.option(
+    "--ontology_file",
+    "-f",
+    required=False,
+    type=click.Path(exists=True),
+)
+@click.option("--raw_dir", "-r", default="data/raw", show_default=True)
+@click.option("--output_dir", "-o", default="data/transformed", show_default=True)
+@click.option(
+    "--api_key",
+    "-k",
+    required=False,
+    type=str,
+    help="API key for BioPortal",
+)
+@click.option(
+    "--compress",
+    "-c",
+    is_flag=True,
+    default=True,
+    help="If true, compresses the output nodes and edges to tar.gz. Defaults to True.",
+)
+@click.option(
+    "--lane",
+    type=click.Choice(sorted(LANE_LIMITS)),
+    default="light",
+    show_default=True,
+    help="Which limits to build under (see shard-list --lanes). 'heavy' raises the "
+    "size gate, the time cap and ROBOT's heap, and ignores the skiplist.",
+)
+@click.option(
+    "--max_source_mb",
+    default=None,
+    type=float,
+    help="Skip any ontology whose source (as served, or unpacked) exceeds this many "
+    f"MB. [default: {MAX_SOURCE_MB:g}, or {HEAVY_MAX_SOURCE_MB:g} for --lane heavy]",
+)
+@click.option(
+    "--timeout_min",
+    default=None,
+    type=float,
+    help="Per-ontology wall-clock cap in minutes; slower transforms are skipped. "
+    f"[default: {PER_ONTOLOGY_TIMEOUT_MIN:g}, or {LANE_LIMITS['heavy']['timeout_min']:g} "
+    "for --lane heavy]",
+)
+@click.option(
+    "--use_skiplist/--no_skiplist",
+    default=None,
+    help="Skip ontologies on the static known-giants skiplist. "
+    "[default: on, off for --lane heavy]",
+)
+@click.option(
+    "--queue_size",
+    default=PIPELINE_QUEUE_SIZE,
+    show_default=True,
+    type=int,
+    help="Most downloaded sources allowed to wait for a transform at once.",
+)
+@click.option(
+    "--min_free_gb",
+    default=MIN_FREE_DISK_GB,
+    show_default=True,
+    type=float,
+    help="Pause downloading while free disk is below this many GB.",
+)
+@click.option(
+    "--snippet_only",
+    "-x",
+    is_flag=True,
+    default=False,
+    help="Download and transform only a sample from the start of each source, "
+    "as for download [false]",
+)
+@click.option(
+    "--snippet_kb",
+    default=SNIPPET_KB,
+    show_default=True,
+    type=float,
+    help="With --snippet_only, how many kB of each source to fetch.",
+)
+@click.option(
+    "--index",
+    "index_path",
+    required=False,
+    type=click.Path(),
+    help="Path to the current onto_stats.yaml index. A downloaded source whose SHA-256 "
+    "matches the one its published graph was built from is not transformed again; "
+    "its entry (and download_url) is carried forward under the new submission.",
+)
+def run_shard(
+    ontologies,
+    ontology_file,
+    raw_dir,
+    output_dir,
+    api_key,
+    compress,
+    lane,
+    max_source_mb,
+    timeout_min,
+    use_skiplist,
+    queue_size,
+    min_free_gb,
+    snippet_only,
+    snippet_kb,
+    index_path,
+) -> None:
+    """Downloads and transforms ontologies, overlapping the two.
+
+    Equivalent to running download and then transform, and writes the same
+    download_report.tsv, onto_stats.yaml and total_stats.yaml, but each
+    ontology is transformed as soon as its source lands while the next ones
+    download.
+
+    Args:
+
+        ontologies: Space-delimited acronyms, as for download.
+
+        ontology_file: File listing the ontologies, as for download.
+
+        raw_dir: Where sources are downloaded to (download's output_dir).
+
+        output_dir: Where KGX products and stats are written (transform's output_dir).
+
+        snippet_only: Smoke-test the whole shard on samples, as download's snippet_only.
+
+        lane: 'light' (the default limits) or 'heavy'; entries built on the heavy
+            lane are marked so in onto_stats.yaml.
+
+    Returns:
+        None.
+
+    """
+
+    onto_list = _collect_ontologies(ontologies, ontology_file, raw_dir)
+    if onto_list is None:
+        return None
+
+    limits = LANE_LIMITS[lane]
+    if max_source_mb is None:
+        max_source_mb = limits["max_source_mb"]
+    if timeout_min is None:
+        timeout_min = limits["timeout_min"]
+    if use_skiplist is None:
+        use_skiplist = lane == "light"
+
+    logging.info(f"{len(onto_list)} ontologies to retrieve and transform.")
+
+    dl = Downloader(
+        output_dir=raw_dir,
+        snippet_only=snippet_only,
+        snippet_kb=snippet_kb,
+        api_key=api_key,
+        max_source_mb=max_source_mb,
+        use_skiplist=use_skiplist,
+    )
+    index = read_index(index_path)
+    tx = Transformer(
+        input_dir=raw_dir,
+        output_dir=output_dir,
+        timeout_min=timeout_min,
+        max_source_mb=max_source_mb,
+        lane=lane,
+        heap_multiplier=learn_multiplier(index),
+    )
+
+    run_shard_pipeline(
+        dl,
+        tx,
+        onto_list,
+        compress=compress,
+        queue_size=queue_size,
+        min_free_gb=min_free_gb,
+        index=index,
+    )
+
+    return None
+
+
+@main.command()
+@click.option(
+    "--ontology_file",
+    "-f",
+    default=f"data/raw/{ONTOLOGY_LIST_NAME}",
+    show_default=True,
+    type=click.Path(exists=True),
+    help="TSV list of ontologies, as written by get-ontology-list.",
+)
+@click.option(
+    "--manifest",
+    "-m",
+    default=f"data/raw/{SIZE_MANIFEST_NAME}",
+    show_default=True,
+    type=click.Path(),
+    help="Size manifest to write. Rows already in it for the same submission are reused.",
+)
+@click.option(
+    "--api_key",
+    "-k",
+    required=False,
+    type=str,
+    help="API key for BioPortal",
+)
+@click.option(
+    "--workers",
+    "-w",
+    default=PROBE_WORKERS,
+    show_default=True,
+    type=int,
+    help="Concurrent probes (all share the BioPortal rate limit).",
+)
+@click.option(
+    "--refresh",
+    is_flag=True,
+    default=False,
+    help="Probe every source again, ignoring rows cached in the manifest.",
+)
+def probe_sizes(ontology_file, manifest, api_key, workers, refresh) -> None:
+    """Records each ontology's source size without downloading it.
+
+    Writes a TSV manifest of Content-Length, content type, filename and HTTP
+    status per acronym, for shard-list to gate and plan with.
+
+    Args:
+
+        ontology_file: The ontology list to probe.
+
+        manifest: Where to write the manifest (and read cached rows from).
+
+        api_key: BioPortal / NCBO API key.
+
+    Returns:
+        None.
+
+    """
+    submissions = _read_ontology_submissions(ontology_file)
+    manifest_dir = os.path.dirname(manifest) or "."
+    dl = Downloader(output_dir=manifest_dir, api_key=api_key)
+    rows = dl.probe_sizes(submissions, manifest_path=manifest, workers=workers, refresh=refresh)
+    failed = sum(1 for r in rows.values() if not str(r.get("http_status", "")).startswith("2"))
+    click.echo(f"Probed {len(rows)} ontologies ({failed} without a downloadable source).", err=True)
+
+    return None
+
+
 @main.command()
 @click.option(
     "--ontology_file",
@@ -342,140 +769,969 @@ def transform(input_dir, output_dir, compress, timeout_min, max_source_mb) -> No
     "only ontologies whose BioPortal submission_id differs from the index are sharded "
     "(version-skip); unchanged ones carry forward via the finalize seed.",
 )
-def shard_list(ontology_file, ontologies, num_shards, use_skiplist, index_path) -> None:
-    """Splits the ontology list into N shards and prints them as JSON.
-
-    Emits a JSON array of strings, each a space-separated group of acronyms,
-    suitable for a GitHub Actions matrix. Prints ONLY the JSON to stdout so it
-    can be captured as a job output.
-    """
-    current_subs = {}
-    if ontologies:
-        acronyms = ontologies.split()  # explicit list: never version-skipped
-    elif ontology_file:
-        current_subs = _read_ontology_submissions(ontology_file)
-        acronyms = list(current_subs)
-    else:
-        raise click.UsageError("Provide --ontologies or --ontology_file.")
-
+@click.option(
+    "--size_manifest",
+    required=False,
+    type=click.Path(),
+    help="Size manifest from probe-sizes. If given, ontologies whose source is known "
+    "to exceed --max_source_mb are dropped before sharding.",
+)
+@click.option(
+    "--content_skip",
+    is_flag=True,
+    default=False,
+    help="With --index and --size_manifest, also skip ontologies whose submission "
+    "changed but whose probed ETag matches the one their published graph was built "
+    "from. They keep their index entry and download_url.",
+)
+@click.option(
+    "--max_source_mb",
+    default=MAX_SOURCE_MB,
+    show_default=True,
+    type=float,
+    help="Size gate applied with --size_manifest.",
+)
+@click.option(
+    "--balance",
+    type=click.Choice(["round-robin", "cost"]),
+    default="round-robin",
+    show_default=True,
+    help="How to assign ontologies to shards. 'cost' packs shards by the cost "
+    "predicted from --index (durations, node/edge counts, source sizes) and "
+    "--size_manifest, so the slowest shard finishes as early as possible.",
+)
+@click.option(
+    "--force_retry",
+    is_flag=True,
+    default=False,
+    help="With --index, retry every ontology that failed for a possibly transient "
+    "reason (transform_error, too_slow, ...) now, instead of on its backoff schedule.",
+)
+@click.option(
+    "--lanes",
+    is_flag=True,
+    default=False,
+    help="Split the work into a light and a heavy lane. Skiplisted giants, sources "
+    "over --max_source_mb (up to the heavy lane's own gate) and ontologies the light "
+    "lane gave up on (too_large, too_slow) go to the heavy lane instead of being "
+    "dropped. Prints {\"light\": [...], \"heavy\": [...]}.",
+)
+@click.option(
+    "--heavy_shards",
+    default=HEAVY_NUM_SHARDS,
+    show_default=True,
+    type=int,
+    help="With --lanes, number of shards for the heavy lane.",
+)
+def shard_list(
+    ontology_file, ontologies, num_shards, use_skiplist, index_path, size_manifest,
+    content_skip, max_source_mb, balance, force_retry, lanes, heavy_shards,
+) -> None:
+    """Splits the ontology list into N shards and prints them as JSON.
+
+    Emits a JSON array of strings, each a space-separated group of acronyms,
+    suitable for a GitHub Actions matrix (with --lanes, one such array per
+    lane). Prints ONLY the JSON to stdout so it can be captured as a job
+    output; with --balance cost, the predicted load of each shard goes to
+    stderr.
+    """
+    current_subs = {}
+    if ontologies:
+        acronyms = ontologies.split()  # explicit list: never version-skipped
+    elif ontology_file:
+        current_subs = _read_ontology_submissions(ontology_file)
+        acronyms = list(current_subs)
+    else:
+        raise click.UsageError("Provide --ontologies or --ontology_file.")
+
+    sizes = read_size_manifest(size_manifest) if size_manifest else {}
+    listed = acronyms
+
     # Version-skip: only (re)transform ontologies that are new or whose BioPortal
     # submission changed vs the current index. Applies only to the full list.
     if index_path and current_subs:
-        index_subs = _load_index_submissions(index_path)
-        if index_subs:
-            before = len(acronyms)
-            acronyms = [
-                a for a in acronyms
-                if index_subs.get(a) != current_subs.get(a)
-            ]
+        # Only a tag probed for the submission now current says anything about it.
+        etags = {
+            a: row.get("etag", "") for a, row in sizes.items()
+            if row.get("submission_id") == current_subs.get(a)
+        } if content_skip else None
+        acronyms = _version_skip(acronyms, current_subs, index_path, etags, force_retry)
+
+    heavy = set()
+    if lanes:
+        index = read_index(index_path)
+        # An unchanged ontology the light lane gave up on would be version-
+        # skipped (too_large is never retried); the heavy lane hasn't had it yet.
+        kept = set(acronyms)
+        promoted = {a for a in listed if a not in kept and _light_gave_up(index.get(a))}
+        if promoted:
             click.echo(
-                f"version-skip: {before - len(acronyms)} unchanged skipped, "
-                f"{len(acronyms)} to transform.",
+                f"lanes: {len(promoted)} unchanged ontologies promoted to the heavy lane: "
+                f"{' '.join(sorted(promoted))}",
                 err=True,
             )
+        acronyms = [a for a in listed if a in kept or a in promoted]
+        heavy = {
+            a for a in acronyms
+            if is_skiplisted(a)
+            or (index.get(a) or {}).get("reason") in HEAVY_LANE_REASONS
+            or (index.get(a) or {}).get("lane") == "heavy"
+        }
+    elif use_skiplist:
+        acronyms = [a for a in acronyms if not is_skiplisted(a)]
+
+    # Size gate, ahead of time: a source the probe already knows is too big
+    # would only be downloaded far enough to be skipped. The probe sees the
+    # size as served, so gzipped giants still fall to the download-time gate.
+    # With lanes, only what is too big even for the heavy lane is dropped.
+    if size_manifest:
+        gate_mb = HEAVY_MAX_SOURCE_MB if lanes else max_source_mb
+        oversize = {a for a in acronyms if _source_over(sizes.get(a), gate_mb)}
+        if oversize:
+            acronyms = [a for a in acronyms if a not in oversize]
+            click.echo(
+                f"size-gate: {len(oversize)} over {gate_mb} MB dropped: "
+                f"{' '.join(sorted(oversize))}",
+                err=True,
+            )
+        if lanes:
+            heavy |= {a for a in acronyms if _source_over(sizes.get(a), max_source_mb)}
+
+    if not lanes:
+        shards = _shard(acronyms, num_shards, balance, index_path, sizes, "balance")
+        click.echo(json.dumps(shards))
+        return None
+
+    light = [a for a in acronyms if a not in heavy]
+    heavy_list = [a for a in acronyms if a in heavy]
+    click.echo(f"lanes: {len(light)} light, {len(heavy_list)} heavy.", err=True)
+    click.echo(json.dumps({
+        "light": _shard(light, num_shards, balance, index_path, sizes, "balance (light)"),
+        "heavy": _shard(heavy_list, heavy_shards, balance, index_path, sizes, "balance (heavy)"),
+    }))
+
+    return None
+
+
+@main.command()
+@click.option(
+    "--ontologies",
+    "-d",
+    required=False,
+    type=str,
+    help="Space-delimited acronyms to build (no version-skip). Default: the full list.",
+)
+@click.option(
+    "--ontology_file",
+    "-f",
+    required=False,
+    type=click.Path(exists=True),
+    help="TSV list of ontologies, as written by get-ontology-list. Fetched if not given.",
+)
+@click.option("--work_dir", "-w", default="data/pipeline", show_default=True)
+@click.option(
+    "--output_dir",
+    "-o",
+    default=None,
+    help="Where the merged onto_stats.yaml, total_stats.yaml and graph_urls.tsv "
+    "go. Defaults to --work_dir.",
+)
+@click.option(
+    "--index",
+    "index_path",
+    required=False,
+    type=click.Path(),
+    help="Previous onto_stats.yaml, for version-skip, cost ordering and the merge "
+    "seed. Defaults to the one in --output_dir from the last run, if any.",
+)
+@click.option(
+    "--api_key",
+    "-k",
+    required=False,
+    type=str,
+    help="API key for BioPortal",
+)
+@click.option(
+    "--workers",
+    "-p",
+    default=0,
+    show_default=True,
+    type=int,
+    help="Worker processes; 0 to fit --cpus and --ram_gb.",
+)
+@click.option(
+    "--cpus",
+    default=PIPELINE_CPUS,
+    show_default=True,
+    type=int,
+    help="CPU budget; 0 for all cores.",
+)
+@click.option(
+    "--ram_gb",
+    default=PIPELINE_RAM_GB,
+    show_default=True,
+    type=float,
+    help="Memory budget in GB; 0 for 80% of physical RAM. Each worker is charged "
+    "ROBOT's heap floor (or its -Xmx, with KGBP_HEAP_MULTIPLIER=0) plus "
+    "KGBP_WORKER_OVERHEAD_GB; the heaps in use share the rest.",
+)
+@click.option(
+    "--compress",
+    "-c",
+    is_flag=True,
+    default=True,
+    help="If true, compresses the output nodes and edges to tar.gz. Defaults to True.",
+)
+@click.option(
+    "--max_source_mb",
+    default=MAX_SOURCE_MB,
+    show_default=True,
+    type=float,
+    help="Skip any ontology whose source (as served, or unpacked) exceeds this many MB.",
+)
+@click.option(
+    "--timeout_min",
+    default=PER_ONTOLOGY_TIMEOUT_MIN,
+    show_default=True,
+    type=float,
+    help="Per-ontology wall-clock cap in minutes; slower transforms are skipped.",
+)
+@click.option(
+    "--use_skiplist/--no_skiplist",
+    default=True,
+    show_default=True,
+    help="Skip ontologies on the static known-giants skiplist.",
+)
+@click.option(
+    "--release_tag",
+    default="",
+    help="Release the artifacts will be uploaded to, for download_url in the index.",
+)
+@click.option(
+    "--snippet_only",
+    "-x",
+    is_flag=True,
+    default=False,
+    help="Build from a sample of each source only, as for download [false]",
+)
+@click.option(
+    "--snippet_kb",
+    default=SNIPPET_KB,
+    show_default=True,
+    type=float,
+    help="With --snippet_only, how many kB of each source to fetch.",
+)
+def pipeline(
+    ontologies,
+    ontology_file,
+    work_dir,
+    output_dir,
+    index_path,
+    api_key,
+    workers,
+    cpus,
+    ram_gb,
+    compress,
+    max_source_mb,
+    timeout_min,
+    use_skiplist,
+    release_tag,
+    snippet_only,
+    snippet_kb,
+) -> None:
+    """Runs the whole build on this machine: list, version-skip, build, merge.
+
+    The same stages as the GitHub Actions workflow (prepare, transform,
+    finalize), with a pool of worker processes in place of a matrix of runners.
+    Each worker downloads and transforms one ontology at a time and takes the
+    next as soon as it is done, so there are no fixed shards to balance.
+    Writes the same onto_stats.yaml, total_stats.yaml and graph_urls.tsv.
+
+    Args:
+
+        ontologies: Space-delimited acronyms to build; all are built.
+
+        ontology_file: List to build from, with version-skip against the index.
+
+        work_dir: Per-ontology sources, artifacts and stats fragments.
+
+        output_dir: Where the merged index goes.
+
+        index_path: The previous index.
+
+    Returns:
+        None.
+
+    """
+    output_dir = output_dir or work_dir
+    if index_path is None:
+        index_path = os.path.join(output_dir, "onto_stats.yaml")
+
+    if ontologies:
+        acronyms = ontologies.split()
+    else:
+        if not ontology_file:
+            list_dir = os.path.join(work_dir, "raw")
+            Downloader(output_dir=list_dir, api_key=api_key).get_ontology_list()
+            ontology_file = os.path.join(list_dir, ONTOLOGY_LIST_NAME)
+        current_subs = _read_ontology_submissions(ontology_file)
+        acronyms = _version_skip(list(current_subs), current_subs, index_path)
+
+    if use_skiplist:
+        acronyms = [a for a in acronyms if not is_skiplisted(a)]
+
+    workers = workers or plan_workers(cpus=cpus, ram_gb=ram_gb)
+    run_pipeline(
+        acronyms,
+        api_key,
+        work_dir=work_dir,
+        output_dir=output_dir,
+        index_path=index_path,
+        workers=workers,
+        compress=compress,
+        max_source_mb=max_source_mb,
+        timeout_min=timeout_min,
+        use_skiplist=use_skiplist,
+        release_tag=release_tag,
+        transform_date=datetime.now(timezone.utc).strftime("%Y-%m-%d"),
+        snippet_only=snippet_only,
+        snippet_kb=snippet_kb,
+        ram_gb=ram_gb,
+    )
+
+    return None
+
+
+@main.command()
+@click.option("--queue_dir", "-q", required=True, help="Queue directory (shared by all workers).")
+@click.option(
+    "--ontology_file",
+    "-f",
+    required=False,
+    type=click.Path(exists=True),
+    help="TSV list of ontologies (e.g. data/raw/ontologylist.tsv).",
+)
+@click.option(
+    "--ontologies",
+    "-d",
+    required=False,
+    type=str,
+    help="Space-delimited acronyms to queue instead of reading a file.",
+)
+@click.option(
+    "--index",
+    "index_path",
+    required=False,
+    type=click.Path(),
+    help="Current onto_stats.yaml, for version-skip (with --ontology_file) and to "
+    "queue the most expensive ontologies first.",
+)
+@click.option(
+    "--use_skiplist/--no_skiplist",
+    default=True,
+    show_default=True,
+    help="Leave ontologies on the static known-giants skiplist out of the queue.",
+)
+def queue_init(queue_dir, ontology_file, ontologies, index_path, use_skiplist) -> None:
+    """Fills a work queue for queue-work, in place of shard-list's static shards.
+
+    Applies the same version-skip and skiplist as shard-list, and queues the
+    ontologies most expensive first (by the cost --index predicts), so the
+    giants start early rather than holding up the end of the run.
+    """
+    current_subs = {}
+    if ontologies:
+        acronyms = ontologies.split()
+    elif ontology_file:
+        current_subs = _read_ontology_submissions(ontology_file)
+        acronyms = list(current_subs)
+    else:
+        raise click.UsageError("Provide --ontologies or --ontology_file.")
 
+    if index_path and current_subs:
+        acronyms = _version_skip(acronyms, current_subs, index_path)
     if use_skiplist:
         acronyms = [a for a in acronyms if not is_skiplisted(a)]
 
-    # Round-robin so heavy ontologies spread across shards rather than clumping.
-    n = max(1, min(num_shards, len(acronyms)))
-    buckets = [[] for _ in range(n)]
-    for i, acr in enumerate(acronyms):
-        buckets[i % n].append(acr)
+    costs = estimate_costs(acronyms, read_index(index_path))
+    ordered = sorted(acronyms, key=lambda a: (-costs[a], a))
+    work_queue = WorkQueue(queue_dir)
+    added = work_queue.add(ordered)
+    click.echo(
+        f"Queued {added} ontologies ({len(ordered) - added} already queued) in {queue_dir}.",
+        err=True,
+    )
+
+    return None
+
+
+@main.command()
+@click.option("--queue_dir", "-q", required=True, help="Queue directory (shared by all workers).")
+@click.option(
+    "--work_dir",
+    "-w",
+    default="data/pipeline",
+    show_default=True,
+    help="Per-ontology sources, artifacts and stats fragments; shared by all workers.",
+)
+@click.option(
+    "--api_key",
+    "-k",
+    required=False,
+    type=str,
+    help="API key for BioPortal",
+)
+@click.option("--worker_id", default="", help="Name recorded in leases [<host>:<pid>].")
+@click.option(
+    "--compress",
+    "-c",
+    is_flag=True,
+    default=True,
+    help="If true, compresses the output nodes and edges to tar.gz. Defaults to True.",
+)
+@click.option(
+    "--max_source_mb",
+    default=MAX_SOURCE_MB,
+    show_default=True,
+    type=float,
+    help="Skip any ontology whose source (as served, or unpacked) exceeds this many MB.",
+)
+@click.option(
+    "--timeout_min",
+    default=PER_ONTOLOGY_TIMEOUT_MIN,
+    show_default=True,
+    type=float,
+    help="Per-ontology wall-clock cap in minutes; slower transforms are skipped.",
+)
+@click.option(
+    "--lease_sec",
+    default=QUEUE_LEASE_SEC,
+    show_default=True,
+    type=float,
+    help="A claim lapses after this long without a heartbeat, and the ontology is requeued.",
+)
+@click.option(
+    "--max_attempts",
+    default=QUEUE_MAX_ATTEMPTS,
+    show_default=True,
+    type=int,
+    help="Claims an ontology gets before a lapsed one is recorded as failed.",
+)
+@click.option(
+    "--index",
+    "index_path",
+    required=False,
+    type=click.Path(),
+    help="Current onto_stats.yaml. A source whose SHA-256 matches the one its published "
+    "graph was built from carries that graph forward, and ROBOT heaps are sized from "
+    "what earlier builds needed.",
+)
+def queue_work(
+    queue_dir, work_dir, api_key, worker_id, compress, max_source_mb, timeout_min,
+    lease_sec, max_attempts, index_path,
+) -> None:
+    """Builds ontologies from a work queue until it is drained.
+
+    Run as many of these as you like, as processes on one host or on several
+    hosts sharing the queue and work directories. Each claims one ontology at a
+    time, downloads and transforms it, and writes its onto_stats.yaml fragment
+    to <work_dir>/transformed/<ACRONYM>/. A worker that dies loses its lease,
+    and the ontology goes back on the queue for another. When the queue is
+    drained, merge the fragments as finalize does:
+
+        python .github/scripts/merge_stats.py <work_dir>/transformed <output_dir>
+    """
+    work_queue = WorkQueue(queue_dir, lease_sec=lease_sec, max_attempts=max_attempts)
+    index = read_index(index_path)
+    settings = pipeline_settings(
+        api_key, compress=compress, max_source_mb=max_source_mb, timeout_min=timeout_min,
+        heap_multiplier=learn_multiplier(index),
+    )
+    run_queue_worker(work_queue, work_dir, settings, worker_id=worker_id, index=index)
+
+    return None
+
+
+@main.command()
+@click.option("--queue_dir", "-q", required=True, help="Queue directory.")
+def queue_status(queue_dir) -> None:
+    """Prints how many queued ontologies are pending, leased, done and failed."""
+    click.echo(json.dumps(WorkQueue(queue_dir).counts()))
+
+    return None
+
+
+@main.command()
+@click.option(
+    "--input_dir",
+    "-i",
+    default="data/transformed",
+    show_default=True,
+    type=click.Path(exists=True),
+    help="Directory of <ACRONYM>.tar.gz artifacts, as transform writes them.",
+)
+@click.option("--output_dir", "-o", default="data/merged", show_default=True)
+@click.option("--name", default="merged-kg", show_default=True, help="Stem of the merged files.")
+@click.option(
+    "--include_only",
+    callback=lambda _, __, x: x.split(",") if x else [],
+    help="""One or more ontologies to merge, and only these,
+                     comma-delimited and named by their short BioPortal ID, e.g., SEPIO.""",
+)
+@click.option(
+    "--exclude",
+    callback=lambda _, __, x: x.split(",") if x else [],
+    help="""One or more ontologies to exclude from merging,
+                     comma-delimited and named by their short BioPortal ID, e.g., SEPIO.
+                     Will select all other ontologies for merging.""",
+)
+@click.option(
+    "--compress/--no_compress",
+    default=True,
+    show_default=True,
+    help="Write <name>.tar.gz rather than the bare nodes and edges TSVs.",
+)
+@click.option(
+    "--run_rows",
+    default=MERGE_RUN_ROWS,
+    show_default=True,
+    type=int,
+    help="Rows sorted in memory at a time; bounds peak memory.",
+)
+@click.option("--tmp_dir", default=None, help="Where sorted runs spill (default: output_dir).")
+@click.option(
+    "--workers",
+    "-w",
+    default=MERGE_WORKERS,
+    show_default=True,
+    type=int,
+    help="Processes to merge with (0: one per CPU). Each holds up to --run_rows rows.",
+)
+@click.option(
+    "--partitions",
+    default=0,
+    type=int,
+    help="Hash partitions of the nodes and edges (default: one per worker).",
+)
+@click.option(
+    "--keep_partitions",
+    is_flag=True,
+    help="Write each partition as <name>_<kind>.part-NNN.tsv instead of one TSV per kind.",
+)
+@click.option(
+    "--segments_dir",
+    default=None,
+    help="Keep each artifact's sorted segment here between merges, and re-read only "
+    "the artifacts that changed since the last.",
+)
+@click.option(
+    "--index",
+    "index_path",
+    required=False,
+    type=click.Path(),
+    help="onto_stats.yaml the artifacts were published with. With --segments_dir, "
+    "an artifact whose download_url and submission_id are unchanged reuses its segment "
+    "(otherwise its file size and mtime decide).",
+)
+@click.option(
+    "--dangling",
+    type=click.Choice(DANGLING_MODES),
+    default="report",
+    show_default=True,
+    help="Edges whose subject or object no ontology declares: report them only, drop "
+    "them, or keep them and add a stub node for each missing end.",
+)
+def merge(
+    input_dir, output_dir, name, include_only, exclude, compress, run_rows, tmp_dir, workers,
+    partitions, keep_partitions, segments_dir, index_path, dangling,
+) -> None:
+    """Merges per-ontology artifacts into one deduplicated KGX graph.
+
+    Reads every <ACRONYM>.tar.gz in input_dir (or those chosen with
+    --include_only / --exclude) straight from its tar stream. Nodes sharing an
+    id, and edges sharing subject, predicate and object, become one, with
+    list-valued columns such as provided_by concatenated. Peak memory is set by
+    --run_rows and --workers, not by how many ontologies go in. With more than
+    one partition, the output is sorted within each partition only. With
+    --segments_dir, a monthly merge re-reads only the ontologies rebuilt since
+    the last one. Edges left dangling are counted per ontology in
+    <name>_dangling.tsv. Prints the counts as JSON.
+    """
+    artifacts = select_artifacts(
+        input_dir, include_only, exclude, skip=[f"{name}.tar.gz"]
+    )
+    if not artifacts:
+        raise click.ClickException(f"No artifacts to merge in {input_dir}.")
+    stats = merge_graph(
+        artifacts, output_dir, name=name, compress=compress, run_rows=run_rows, tmp_dir=tmp_dir,
+        workers=workers, partitions=partitions, keep_partitions=keep_partitions,
+        segments_dir=segments_dir, index=read_index(index_path), dangling=dangling,
+    )
+    click.echo(json.dumps(stats))
+
+    return None
+
+
+@main.command()
+@click.option(
+    "--input_dir",
+    "-i",
+    default="data/transformed",
+    show_default=True,
+    type=click.Path(exists=True),
+    help="Searched recursively for the <ACRONYM>_terms.txt.gz lists transform writes.",
+)
+@click.option(
+    "--output",
+    "-o",
+    default=TERM_INDEX_NAME,
+    show_default=True,
+    help="The term index to write.",
+)
+@click.option(
+    "--base",
+    default="",
+    help="The previous term_index.db; ontologies without a new term list carry over.",
+)
+@click.option(
+    "--index",
+    "index_path",
+    required=False,
+    type=click.Path(),
+    help="The merged onto_stats.yaml. Ontologies it doesn't resolve are dropped, and "
+    "each kept one records its download_url.",
+)
+@click.option(
+    "--filters",
+    default=BLOOM_BUNDLE_NAME,
+    show_default=True,
+    help="Where to bundle the <ACRONYM>_ids.bloom filters transform writes (for "
+    "`contains`). Empty to skip.",
+)
+@click.option(
+    "--base_filters",
+    default="",
+    help="The previous bloom_filters.db; ontologies without a new filter carry over.",
+)
+def build_index(input_dir, output, base, index_path, filters, base_filters) -> None:
+    """Builds the cross-ontology term index (CURIE or prefix -> ontologies).
+
+    Folds the term lists and prefix histograms that transform leaves beside
+    each artifact into an SQLite inverted index, over the previous one if
+    --base is given. Look terms up with kg_bioportal.term_index.TermIndex.
+    The per-ontology Bloom filters are bundled the same way, into --filters.
+    """
+    index = read_index(index_path) if index_path else None
+
+    def report(line):
+        click.echo(line, err=True)
+
+    stats = build_term_index(input_dir, output, base_path=base, index=index, report=report)
+    if filters:
+        stats["filters"] = build_filter_bundle(
+            input_dir, filters, base_path=base_filters, index=index, report=report
+        )
+    click.echo(json.dumps(stats))
+
+    return None
+
+
+@main.command()
+@click.argument("curies", nargs=-1, required=True)
+@click.option(
+    "--filters",
+    "-f",
+    default=BLOOM_BUNDLE_NAME,
+    show_default=True,
+    type=click.Path(exists=True),
+    help="A bloom_filters.db (published on every release), or a directory of "
+    "<ACRONYM>_ids.bloom files such as data/transformed.",
+)
+def contains(curies, filters) -> None:
+    """Lists the ontologies that may have each CURIE, without fetching any.
+
+    Checks every ontology's Bloom filter at once and prints one
+    "<CURIE><TAB><ACRONYM>" line per candidate. A filter never misses a term
+    its ontology has, but may claim one it doesn't, at KGBP_BLOOM_FP_RATE;
+    term_index.db has the exact answer.
+    """
+    bundle = FilterBundle(filters)
+    for curie, acronyms in bundle.candidates(list(curies)).items():
+        for acronym in acronyms:
+            click.echo(f"{curie}\t{acronym}")
+        click.echo(f"{curie}: {len(acronyms)} of {len(bundle)} ontologies", err=True)
+
+    return None
+
+
+@main.command()
+@click.option(
+    "--input_dir",
+    "-i",
+    default="data/transformed",
+    show_default=True,
+    type=click.Path(exists=True),
+    help="Directory of <ACRONYM>.tar.gz artifacts, as transform writes them.",
+)
+@click.option(
+    "--store",
+    "-o",
+    default=os.path.join("data", STORE_NAME),
+    show_default=True,
+    help="The store to load into, created if missing.",
+)
+@click.option(
+    "--include_only",
+    callback=lambda _, __, x: x.split(",") if x else [],
+    help="""One or more ontologies to load, and only these,
+                     comma-delimited and named by their short BioPortal ID, e.g., SEPIO.""",
+)
+@click.option(
+    "--exclude",
+    callback=lambda _, __, x: x.split(",") if x else [],
+    help="""One or more ontologies to leave out of the store,
+                     comma-delimited and named by their short BioPortal ID, e.g., SEPIO.""",
+)
+@click.option(
+    "--workers",
+    "-w",
+    default=STORE_WORKERS,
+    show_default=True,
+    type=int,
+    help="Artifacts read at once (0: one per CPU).",
+)
+@click.option(
+    "--batch_rows",
+    default=STORE_BATCH_ROWS,
+    show_default=True,
+    type=int,
+    help="Rows inserted per statement.",
+)
+@click.option(
+    "--index",
+    "index_path",
+    required=False,
+    type=click.Path(),
+    help="onto_stats.yaml the artifacts were published with. An artifact whose "
+    "download_url and submission_id are unchanged since the last load is not re-read "
+    "(otherwise its file size and mtime decide).",
+)
+def load_store(input_dir, store, include_only, exclude, workers, batch_rows, index_path) -> None:
+    """Loads artifacts into a local SQLite store for fast lookups.
+
+    The store indexes nodes by id and edges by subject, object and predicate;
+    query it with kg_bioportal.graph_store.GraphStore. Loading again re-reads
+    only the artifacts that changed, and the store ends up holding exactly
+    the artifacts selected. Prints the counts as JSON; exits non-zero if an
+    artifact couldn't be read, leaving the store with what it had of it.
+    """
+    artifacts = select_artifacts(input_dir, include_only, exclude)
+    if not artifacts:
+        raise click.ClickException(f"No artifacts to load in {input_dir}.")
+    stats = load_graph_store(
+        artifacts, store, workers=workers, batch_rows=batch_rows, index=read_index(index_path)
+    )
+    click.echo(json.dumps(stats))
+    if stats["failed"]:
+        raise click.ClickException(
+            f"Could not read {len(stats['failed'])} artifacts: {', '.join(stats['failed'])}"
+        )
+
+    return None
+
+
+@main.command()
+@click.option(
+    "--store",
+    "-s",
+    default=os.path.join("data", STORE_NAME),
+    show_default=True,
+    type=click.Path(exists=True),
+    help="The store to serve, as load-store writes it.",
+)
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", "-p", default=8080, show_default=True, type=int)
+@click.option(
+    "--pool_size",
+    default=SERVE_POOL_SIZE,
+    show_default=True,
+    type=int,
+    help="Read-only connections to the store, shared by the request threads.",
+)
+@click.option(
+    "--cache_nodes",
+    default=SERVE_CACHE_NODES,
+    show_default=True,
+    type=int,
+    help="Most recently used nodes kept in memory (0: none).",
+)
+@click.option(
+    "--max_results",
+    default=SERVE_MAX_RESULTS,
+    show_default=True,
+    type=int,
+    help="Most edges or results one query returns.",
+)
+def serve(store, host, port, pool_size, cache_nodes, max_results) -> None:
+    """Serves one-hop queries over HTTP from a local store.
+
+    Read-only. GET /nodes/<id> and /edges?subject=&predicate=&object= answer
+    lookups, the latter streamed as JSON lines; POST /query takes a
+    TRAPI-style one-hop query graph. See kg_bioportal.query_service.
+    """
+    server = QueryServer((host, port), store, pool_size, cache_nodes, max_results)
+    host, port = server.server_address[:2]
+    click.echo(f"Serving {store} on http://{host}:{port}", err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    return None
+
+
+@main.command()
+@click.option(
+    "--profile",
+    required=True,
+    type=click.Path(exists=True),
+    help="YAML listing the ontologies, e.g. notebooks/clinical_ontologies.yaml.",
+)
+@click.option(
+    "--select",
+    default="",
+    help="Only the profile's ontologies with this key set true, e.g. test_set.",
+)
+@click.option("--output_dir", "-o", default="data/subsets", show_default=True)
+@click.option(
+    "--name",
+    default="",
+    help="Stem of the subset's files (default: the profile's name, and --select).",
+)
+@click.option(
+    "--urls",
+    default=LATEST_GRAPH_URLS,
+    show_default=True,
+    help="graph_urls.tsv to resolve ontologies through, as a path or URL.",
+)
+@click.option(
+    "--index",
+    "index_path",
+    required=False,
+    type=click.Path(),
+    help="Resolve through this onto_stats.yaml instead of --urls.",
+)
+@click.option(
+    "--cache_dir",
+    default=ARTIFACT_CACHE_DIR,
+    show_default=True,
+    help="Where fetched artifacts and built subsets are kept.",
+)
+@click.option(
+    "--workers",
+    "-w",
+    default=FETCH_WORKERS,
+    show_default=True,
+    type=int,
+    help="Artifacts fetched at once.",
+)
+@click.option(
+    "--dangling",
+    type=click.Choice(DANGLING_MODES),
+    default="report",
+    show_default=True,
+    help="What the merge does with edges whose subject or object no member declares.",
+)
+@click.option("--refresh", is_flag=True, help="Rebuild the subset even if it is cached.")
+def subset(
+    profile, select, output_dir, name, urls, index_path, cache_dir, workers, dangling, refresh
+) -> None:
+    """Builds the merged graph of the ontologies a profile lists.
 
-    shards = [" ".join(b) for b in buckets if b]
-    click.echo(json.dumps(shards))
+    Resolves each ontology to its published artifact, fetches what the cache
+    lacks, and merges them into <output_dir>/<name>.tar.gz. A subset is cached
+    by its members' artifact URLs and the merge options, so rebuilding an
+    unchanged profile fetches and merges nothing. Prints the counts as JSON.
+    """
+    try:
+        stats = build_subset(
+            profile, output_dir, name=name, select=select, urls_source=urls,
+            index=read_index(index_path), cache_dir=cache_dir, fetch_workers=workers,
+            dangling=dangling, refresh=refresh,
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for acronym, reason in stats["missing"].items():
+        click.echo(f"Left out {acronym}: {reason}", err=True)
+    click.echo(json.dumps(stats))
 
     return None
 
 
-# Below functions are WIP.
-
-# @cli.command()
-# @click.option("yaml", "-y", default="merge.yaml", type=click.Path(exists=True))
-# @click.option("processes", "-p", default=1, type=int)
-# @click.option(
-#     "--merge_all",
-#     is_flag=True,
-#     help="""Update the merge config file to include *all* ontologies.""",
-# )
-# @click.option(
-#     "--include_only",
-#     callback=lambda _, __, x: x.split(",") if x else [],
-#     help="""One or more ontologies to merge, and only these,
-#                      comma-delimited and named by their short BioPortal ID, e.g., SEPIO.""",
-# )
-# @click.option(
-#     "--exclude",
-#     callback=lambda _, __, x: x.split(",") if x else [],
-#     help="""One or more ontologies to exclude from merging,
-#                      comma-delimited and named by their short BioPortal ID, e.g., SEPIO.
-#                      Will select all other ontologies for merging.""",
-# )
-# def merge(
-#     yaml: str, processes: int, merge_all=False, include_only=[], exclude=[]
-# ) -> None:
-#     """Use KGX to load subgraphs to create a merged graph.
-
-#     Args:
-#         yaml: A string pointing to a KGX compatible config YAML.
-#         processes: Number of processes to use.
-#         merge_all: Update merge config to include *all* ontologies.
-#         include_only: Update merge config to include the specified ontologies.
-#         exclude: Update merge config to include all ontologies *except* those specified.
-
-#     Returns:
-#         None.
-
-#     """
-
-#     if merge_all or len(include_only) > 0 or len(exclude) > 0:
-#         update_merge_config(yaml, merge_all, include_only, exclude)
-
-#     load_and_merge(yaml, processes)
-
-#     make_graph_stats(
-#         method="kgx",
-#         input_file="merged_graph_stats.yaml",
-#         output_file="graph_stats.yaml",
-#     )
-
-
-# @cli.command()
-# @click.option("--merge_all", is_flag=True, help="""Include *all* ontologies.""")
-# @click.option(
-#     "--include_only",
-#     callback=lambda _, __, x: x.split(",") if x else [],
-#     help="""One or more ontologies to merge, and only these,
-#                      comma-delimited and named by their short BioPortal ID, e.g., SEPIO.""",
-# )
-# @click.option(
-#     "--exclude",
-#     callback=lambda _, __, x: x.split(",") if x else [],
-#     help="""One or more ontologies to exclude from merging,
-#                      comma-delimited and named by their short BioPortal ID, e.g., SEPIO.
-#                      Will select all other ontologies for merging.""",
-# )
-# def catmerge(merge_all=False, include_only=[], exclude=[]) -> None:
-#     """Use cat-merge to create a merged graph.
-
-#     Args:
-#         merge_all: Include *all* ontologies.
-#         include_only: Include only the specified ontologies.
-#         exclude: Include all ontologies *except* those specified.
-
-#     Returns:
-#         None.
-
-#     """
-
-#     merge_with_cat_merge(merge_all, include_only, exclude)
-
-#     make_graph_stats(
-#         method="catmerge",
-#         input_file="data/merged/qc_report.yaml",
-#         output_file="graph_stats.yaml",
-#     )
+@main.command()
+@click.option(
+    "--index",
+    "-i",
+    "source",
+    default=LATEST_INDEX,
+    show_default=True,
+    help="onto_stats.yaml listing the artifacts, as a path or URL.",
+)
+@click.option("--output_dir", "-o", default="data/artifacts", show_default=True)
+@click.option(
+    "--include_only",
+    callback=lambda _, __, x: x.split(",") if x else [],
+    help="""One or more ontologies to fetch, and only these,
+                     comma-delimited and named by their short BioPortal ID, e.g., SEPIO.""",
+)
+@click.option(
+    "--exclude",
+    callback=lambda _, __, x: x.split(",") if x else [],
+    help="""One or more ontologies not to fetch,
+                     comma-delimited and named by their short BioPortal ID, e.g., SEPIO.
+                     Will fetch all other published ontologies.""",
+)
+@click.option(
+    "--cache_dir",
+    default=ARTIFACT_CACHE_DIR,
+    show_default=True,
+    help="The content cache artifacts are fetched into.",
+)
+@click.option(
+    "--workers",
+    "-w",
+    default=FETCH_WORKERS,
+    show_default=True,
+    type=int,
+    help="Artifacts fetched at once.",
+)
+@click.option("--verify", is_flag=True, help="Re-hash cached artifacts before using them.")
+def fetch(source, output_dir, include_only, exclude, cache_dir, workers, verify) -> None:
+    """Fetches published <ACRONYM>.tar.gz artifacts into <output_dir>.
+
+    Every OK ontology in the index is fetched (or only those picked with
+    --include_only / --exclude) over keep-alive connections, --workers at a
+    time, into a content-addressed cache. An artifact whose download_url or
+    artifact_sha256 is unchanged since it was last fetched comes straight from
+    the cache. Downloads are checked against the index's digest, and an
+    interrupted one is resumed. Prints the counts as JSON; exits non-zero if
+    any artifact could not be fetched.
+    """
+    stats = fetch_published(
+        output_dir, source=source, include_only=include_only, exclude=exclude,
+        cache_dir=cache_dir, workers=workers, verify=verify,
+    )
+    for acronym, reason in stats["missing"].items():
+        click.echo(f"Left out {acronym}: {reason}", err=True)
+    click.echo(json.dumps(stats))
+    if stats["failed"]:
+        raise click.ClickException(
+            f"Could not fetch {len(stats['failed'])} artifacts: {', '.join(stats['failed'])}"
+        )
+
+    return None
 
 
 if __name__ == "__main__":
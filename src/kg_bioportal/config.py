@@ -24,12 +24,182 @@ PER_ONTOLOGY_TIMEOUT_MIN: float = float(os.environ.get("KGBP_TIMEOUT_MIN", 30))
 # build. GitHub Actions allows up to 20 concurrent jobs on the free tier.
 DEFAULT_NUM_SHARDS: int = int(os.environ.get("KGBP_NUM_SHARDS", 20))
 
+# --- Lanes ----------------------------------------------------------------- #
+
+# The limits above suit a GitHub-hosted runner, and everything past them -- the
+# skiplisted giants, oversize sources, transforms that ran out of time -- would
+# otherwise never be built at all. `shard-list --lanes` sends those to a heavy
+# lane instead, meant for a high-memory self-hosted node running alongside the
+# normal (light) matrix, with these limits of its own.
+HEAVY_MAX_SOURCE_MB: float = float(os.environ.get("KGBP_HEAVY_MAX_SOURCE_MB", 4096))
+HEAVY_TIMEOUT_MIN: float = float(os.environ.get("KGBP_HEAVY_TIMEOUT_MIN", 600))
+HEAVY_ROBOT_JAVA_ARGS: str = os.environ.get(
+    "KGBP_HEAVY_ROBOT_JAVA_ARGS", "-Xmx96g -XX:+UseG1GC"
+)
+HEAVY_NUM_SHARDS: int = int(os.environ.get("KGBP_HEAVY_NUM_SHARDS", 1))
+
+# Index reasons that mean "needs the heavy lane": the light lane gave up on the
+# ontology, or never tried it.
+HEAVY_LANE_REASONS = {"skiplist", "too_large", "too_slow"}
+
+# --- Retry backoff --------------------------------------------------------- #
+
+# Failures with these reasons may be transient, so version-skip retries them
+# even while the submission is unchanged -- but on an exponential backoff: an
+# ontology that has failed N runs in a row is retried once every 2**(N-1) runs,
+# at most every KGBP_RETRY_MAX_RUNS runs. A new submission is always tried.
+# Any other non-OK reason (license_restricted, too_large, ...) is settled for
+# the submission it was recorded against.
+RETRY_BACKOFF_REASONS: frozenset = frozenset(
+    {"transform_error", "too_slow", "download_error", "download_http_error"}
+)
+RETRY_BACKOFF_MAX_RUNS: int = int(os.environ.get("KGBP_RETRY_MAX_RUNS", 12))
+
+# --- Smoke runs ------------------------------------------------------------ #
+
+# With --snippet_only, fetch only this many KB of each source (a Range request)
+# and hand the transformer at most this much of it, unpacked. Enough to exercise
+# downloading and format sniffing across the whole catalogue in minutes.
+SNIPPET_KB: float = float(os.environ.get("KGBP_SNIPPET_KB", 5))
+
+# --- Pipelined runs -------------------------------------------------------- #
+
+# run-shard overlaps downloading and transforming. At most this many downloaded
+# sources wait for a transform at once...
+PIPELINE_QUEUE_SIZE: int = int(os.environ.get("KGBP_QUEUE_SIZE", 4))
+
+# ...and downloading pauses while free disk is below this many GB, until the
+# transforms catch up.
+MIN_FREE_DISK_GB: float = float(os.environ.get("KGBP_MIN_FREE_GB", 5))
+
+# A local `pipeline` run builds one ontology per worker process, with as many
+# workers as fit both budgets: KGBP_CPUS cores (0: all of them) and KGBP_RAM_GB
+# of memory (0: 80% of physical RAM). Each worker is charged ROBOT's heap plus
+# this much for KGX and the JVM's own overhead. With per-call heaps (see ROBOT),
+# that heap is the floor, and the heaps actually in use share whatever memory the
+# workers' overhead leaves (heap.HeapBudget); otherwise it is the whole -Xmx.
+PIPELINE_CPUS: int = int(os.environ.get("KGBP_CPUS", 0))
+PIPELINE_RAM_GB: float = float(os.environ.get("KGBP_RAM_GB", 0))
+WORKER_OVERHEAD_GB: float = float(os.environ.get("KGBP_WORKER_OVERHEAD_GB", 2))
+
+# Queue mode (queue-work): a worker's claim on an ontology lapses if it goes
+# this long without a heartbeat, and the ontology goes back on the queue -- up
+# to this many claims, after which it is recorded as failed.
+QUEUE_LEASE_SEC: float = float(os.environ.get("KGBP_LEASE_SEC", 300))
+QUEUE_MAX_ATTEMPTS: int = int(os.environ.get("KGBP_MAX_ATTEMPTS", 3))
+
+# --- BioPortal API rate ---------------------------------------------------- #
+
+# Requests per second to the BioPortal API, shared by every request in the
+# process. The limiter starts at KGBP_RATE_PER_SEC, halves on each 429 (never
+# below the minimum) and creeps back up to the maximum while requests succeed.
+BIOPORTAL_RATE_PER_SEC: float = float(os.environ.get("KGBP_RATE_PER_SEC", 10))
+BIOPORTAL_MIN_RATE_PER_SEC: float = float(os.environ.get("KGBP_MIN_RATE_PER_SEC", 0.5))
+BIOPORTAL_MAX_RATE_PER_SEC: float = float(os.environ.get("KGBP_MAX_RATE_PER_SEC", 15))
+
+# Concurrent requests when probing source sizes. The rate limiter still has the
+# final say; this only keeps enough requests in flight to use the allowance.
+PROBE_WORKERS: int = int(os.environ.get("KGBP_PROBE_WORKERS", 8))
+
 # --- ROBOT ----------------------------------------------------------------- #
 
 # Java args for ROBOT. Overridable via the ROBOT_JAVA_ARGS environment variable
 # so CI can dial the heap to the runner (leave headroom below 16 GB).
 ROBOT_JAVA_ARGS: str = os.environ.get("ROBOT_JAVA_ARGS", "-Xmx12g -XX:+UseG1GC")
 
+# Per-call heap. Rather than reserve the whole -Xmx above for every ROBOT call,
+# each call gets KGBP_HEAP_MULTIPLIER times its source's (unpacked) size in heap,
+# no less than KGBP_HEAP_FLOOR_GB and no more than that -Xmx, the ceiling. A call
+# that runs out of heap anyway is retried once at the ceiling, and the index
+# records it so the multiplier can be learned (heap.learn_multiplier). Set the
+# multiplier to 0 to give every call the ceiling.
+ROBOT_HEAP_MULTIPLIER: float = float(os.environ.get("KGBP_HEAP_MULTIPLIER", 50))
+ROBOT_HEAP_FLOOR_GB: float = float(os.environ.get("KGBP_HEAP_FLOOR_GB", 1))
+
+# Class-data sharing. Every ROBOT call is a cold JVM that loads and verifies the
+# same few thousand OWL API and ROBOT classes from robot.jar. initialize_robot
+# dumps them once (per robot.jar and JVM build) into an AppCDS archive beside
+# robot.jar, from a small training run, and every call after maps it instead.
+# JVMs without dynamic archiving (before 13) run as before. 0 turns it off.
+ROBOT_CDS: bool = os.environ.get("KGBP_ROBOT_CDS", "1") not in ("0", "false", "no")
+
+# Per-lane defaults for the size gate, the time cap and ROBOT's heap (see Lanes).
+LANE_LIMITS: dict = {
+    "light": {
+        "max_source_mb": MAX_SOURCE_MB,
+        "timeout_min": PER_ONTOLOGY_TIMEOUT_MIN,
+        "java_args": ROBOT_JAVA_ARGS,
+    },
+    "heavy": {
+        "max_source_mb": HEAVY_MAX_SOURCE_MB,
+        "timeout_min": HEAVY_TIMEOUT_MIN,
+        "java_args": HEAVY_ROBOT_JAVA_ARGS,
+    },
+}
+
+# --- Graph merge ----------------------------------------------------------- #
+
+# `merge` deduplicates nodes and edges with an external sort: rows are sorted in
+# runs of at most this many, each run spilled to disk, and the runs k-way merged
+# back, at most MERGE_FAN_IN open at once. Peak memory is one run, whatever the
+# number of ontologies merged.
+MERGE_RUN_ROWS: int = int(os.environ.get("KGBP_MERGE_RUN_ROWS", 200_000))
+MERGE_FAN_IN: int = int(os.environ.get("KGBP_MERGE_FAN_IN", 64))
+
+# Processes the merge runs in (0: one per CPU). With more than one, rows are
+# hash-partitioned by key and the partitions deduplicated in parallel; each
+# process holds up to MERGE_RUN_ROWS rows, so peak memory scales with this.
+MERGE_WORKERS: int = int(os.environ.get("KGBP_MERGE_WORKERS", 0))
+
+# Columns holding "|"-delimited lists in KGX TSV. When the same node or edge
+# comes from several ontologies these are concatenated (without repeats); any
+# other column keeps the first non-empty value, in artifact order.
+MERGE_MULTIVALUED_FIELDS: frozenset = frozenset(
+    {
+        "category",
+        "provided_by",
+        "xref",
+        "synonym",
+        "same_as",
+        "subsets",
+        "knowledge_source",
+        "aggregator_knowledge_source",
+        "publications",
+    }
+)
+
+# --- Query store ----------------------------------------------------------- #
+
+# `load-store` loads artifacts into an SQLite store for lookups by node id,
+# subject, object and predicate. Artifacts are read in parallel, this many at
+# once (0: one per CPU), each into a scratch database of its own that is then
+# copied into the store in one statement; rows go in this many at a time.
+STORE_WORKERS: int = int(os.environ.get("KGBP_STORE_WORKERS", 0))
+STORE_BATCH_ROWS: int = int(os.environ.get("KGBP_STORE_BATCH_ROWS", 50_000))
+
+# `serve` answers queries from a store over HTTP, with this many read-only
+# connections to it shared by the request threads, the most recently used nodes
+# cached in memory, and at most this many results per query.
+SERVE_POOL_SIZE: int = int(os.environ.get("KGBP_SERVE_POOL_SIZE", 8))
+SERVE_CACHE_NODES: int = int(os.environ.get("KGBP_SERVE_CACHE_NODES", 65536))
+SERVE_MAX_RESULTS: int = int(os.environ.get("KGBP_SERVE_MAX_RESULTS", 1000))
+
+# --- Fetching artifacts ---------------------------------------------------- #
+
+# `fetch` and `subset` download published artifacts into a local content cache,
+# this many at once, so that an artifact already fetched is never fetched again.
+ARTIFACT_CACHE_DIR: str = os.environ.get(
+    "KGBP_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "kg-bioportal")
+)
+FETCH_WORKERS: int = int(os.environ.get("KGBP_FETCH_WORKERS", 4))
+
+# --- Term filters ---------------------------------------------------------- #
+
+# Each transform also writes a Bloom filter over the ontology's node ids, sized
+# for this false-positive rate, so `contains` can say which ontologies may have
+# a term without fetching any of them. 1% costs about 9.6 bits per term.
+BLOOM_FP_RATE: float = float(os.environ.get("KGBP_BLOOM_FP_RATE", 0.01))
+
 # --- Static skiplist ------------------------------------------------------- #
 
 # Ontologies known to be too large / slow to transform on a GitHub Action.
@@ -1,9 +1,15 @@
 """Downloader for KG-Bioportal."""
 
 import csv
+import hashlib
 import logging
 import os
-from typing import Union
+import struct
+import tarfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple, Union
 
 import requests
 from requests.adapters import HTTPAdapter, Retry
@@ -12,8 +18,11 @@ from kg_bioportal.config import (
     LICENSE_RESTRICTED_REASON,
     LICENSE_STATUSES,
     MAX_SOURCE_MB,
+    PROBE_WORKERS,
+    SNIPPET_KB,
     is_skiplisted,
 )
+from kg_bioportal.rate_limit import AdaptiveRateLimiter, parse_retry_after, shared_limiter
 
 ONTOLOGY_LIST_NAME = "ontologylist.tsv"
 
@@ -21,9 +30,281 @@ ONTOLOGY_LIST_NAME = "ontologylist.tsv"
 # finalize) can account for ontologies that were never downloaded.
 DOWNLOAD_REPORT_NAME = "download_report.tsv"
 
+# Run-level counts for the same download: outcomes, plus how the API's rate
+# limit treated us (requests, throttles, time spent waiting).
+DOWNLOAD_SUMMARY_NAME = "download_summary.yaml"
+
+# Per-ontology source sizes, probed without downloading (see probe_sizes), so
+# shards can be planned and oversize sources dropped before any runner starts.
+SIZE_MANIFEST_NAME = "size_manifest.tsv"
+SIZE_MANIFEST_FIELDS = [
+    "id", "submission_id", "http_status", "content_length", "content_type", "filename",
+    "etag", "probed_at",
+]
+
+# How many times one request is re-sent after a 429 before its response is
+# taken as final. Each attempt waits for the shared limiter first.
+_MAX_THROTTLED_ATTEMPTS = 5
+
 # Streaming chunk size (bytes).
 _CHUNK = 1024 * 1024
 
+# zlib window bits that make decompressobj expect (and check) a gzip header.
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+# The fixed part of a gzip member header; any member is longer than this.
+_GZIP_HEADER_BYTES = 10
+
+
+class _GunzipMeter:
+    """Measures what a gzip stream unpacks to, as the stream arrives.
+
+    The downloader only ever sees the compressed bytes, and for a gzipped source
+    those understate the real size by an order of magnitude (ROR is 14 MB
+    gzipped, 135 MB unpacked). Inflating alongside the download makes the real
+    size known in the same pass, so the size gate can fire before the transform
+    ever has to decompress the file. Nothing is kept: output is counted and
+    dropped, in bounded pieces, so a gzip bomb costs time and not memory.
+
+    Concatenated gzip members are followed. A stream that turns out not to be
+    gzip at all simply stops being measured; deciding what that means is the
+    transformer's job, as it always was.
+    """
+
+    def __init__(self) -> None:
+        self._inflater: Optional["zlib._Decompress"] = zlib.decompressobj(wbits=_GZIP_WBITS)
+        self._members = 0
+        self._mid_member = False
+        # Bytes taken in by the member under way.
+        self._member_bytes = 0
+        self.unpacked = 0
+        self.valid = True
+
+    def feed(self, data: bytes) -> None:
+        """Inflate one downloaded chunk, adding its output to ``unpacked``."""
+        # No inflater: the stream already ended in junk, and is done with.
+        while data and self.valid and self._inflater is not None:
+            if self._members and not self._mid_member:
+                # Zero padding between members (or after the last) is allowed;
+                # only what follows it can start another member.
+                data = data.lstrip(b"\0")
+                if not data:
+                    return
+            try:
+                out = self._inflater.decompress(data, _CHUNK)
+            except zlib.error:
+                # Trailing junk after a complete member is common and harmless;
+                # anything else means this isn't a gzip we can measure.
+                self.valid = self._members > 0
+                self._inflater = None
+                return
+            self.unpacked += len(out)
+            self._mid_member = not self._inflater.eof
+            if self._inflater.eof:
+                self._members += 1
+                self._member_bytes = 0
+                data = self._inflater.unused_data
+                self._inflater = zlib.decompressobj(wbits=_GZIP_WBITS)
+            else:
+                self._member_bytes += len(data) - len(self._inflater.unconsumed_tail)
+                data = self._inflater.unconsumed_tail
+
+    @property
+    def complete(self) -> bool:
+        """True if the stream ended on a member boundary, i.e. wasn't cut short.
+
+        After a finished member, fewer bytes than a gzip header are trailing
+        junk too (a final newline, say), only too short for zlib to reject.
+        """
+        return self.valid and self._members > 0 and (
+            not self._mid_member or self._member_bytes < _GZIP_HEADER_BYTES
+        )
+
+
+# A zip local file header: signature, version, flags, method, time, date, crc,
+# compressed size, size, name length, extra length.
+_ZIP_LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+_ZIP_LOCAL_SIGNATURE = b"PK\x03\x04"
+
+# How much more than the snippet a compressed prefix may unpack to before we
+# stop inflating it: room for the tar headers ahead of the first member.
+_SNIPPET_INFLATE_FACTOR = 8
+
+
+def _inflate_prefix(data: bytes, wbits: int, limit: int) -> Tuple[bytes, bool]:
+    """Inflate as much of a truncated deflate/gzip stream as is there.
+
+    zlib hands back everything it can decode from a prefix without complaint,
+    which is what makes a partial download usable at all. Returns the output
+    (at most ``limit`` bytes) and whether the stream actually ended in it.
+    """
+    inflater = zlib.decompressobj(wbits=wbits)
+    try:
+        out = inflater.decompress(data, limit)
+    except zlib.error:
+        return b"", False
+    return out, inflater.eof
+
+
+def _is_junk_member(name: str) -> bool:
+    """Directory entries and macOS metadata, which are never the ontology."""
+    base = os.path.basename(name.rstrip("/"))
+    return name.endswith("/") or name.startswith("__MACOSX/") or base.startswith("._")
+
+
+def _first_tar_member(buf: bytes) -> Optional[Tuple[str, bytes, bool]]:
+    """The first regular file in the start of a tarball: (name, data, complete).
+
+    Walks the 512-byte headers that fit in ``buf``, stepping over pax headers,
+    directories and macOS metadata. None if ``buf`` isn't a tarball, or no file
+    starts inside it.
+    """
+    offset = 0
+    while offset + tarfile.BLOCKSIZE <= len(buf):
+        block = buf[offset:offset + tarfile.BLOCKSIZE]
+        try:
+            info = tarfile.TarInfo.frombuf(block, tarfile.ENCODING, "surrogateescape")
+        except tarfile.HeaderError:
+            return None
+        start = offset + tarfile.BLOCKSIZE
+        if info.isfile() and not _is_junk_member(info.name):
+            data = buf[start:start + info.size]
+            return os.path.basename(info.name), data, len(data) == info.size
+        padded = -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+        offset = start + padded
+    return None
+
+
+def _first_zip_member(buf: bytes) -> Optional[Tuple[str, bytes, bool]]:
+    """The first file in the start of a zip: (name, data, complete).
+
+    A zip's directory is at its end, which a snippet never has, so this reads
+    the local file headers from the front instead. Stops at a member whose
+    compressed size is deferred to a data descriptor, since there is no telling
+    where the next one starts; its own data is still used if it is the first.
+    """
+    offset = 0
+    while buf[offset:offset + 4] == _ZIP_LOCAL_SIGNATURE:
+        header = buf[offset:offset + _ZIP_LOCAL_HEADER.size]
+        if len(header) < _ZIP_LOCAL_HEADER.size:
+            return None
+        (_, _, flags, method, _, _, _, csize, size, name_len, extra_len) = (
+            _ZIP_LOCAL_HEADER.unpack(header)
+        )
+        name_start = offset + _ZIP_LOCAL_HEADER.size
+        name = buf[name_start:name_start + name_len].decode("utf-8", "replace")
+        start = name_start + name_len + extra_len
+        deferred = bool(flags & 0x08)
+        payload = buf[start:] if deferred else buf[start:start + csize]
+        if not _is_junk_member(name):
+            if method == 0:
+                data, complete = payload, not deferred and len(payload) == size
+            elif method == 8:
+                limit = len(buf) * _SNIPPET_INFLATE_FACTOR
+                data, complete = _inflate_prefix(payload, -zlib.MAX_WBITS, limit)
+            else:
+                return None
+            return os.path.basename(name), data, complete
+        if deferred:
+            return None
+        offset = start + csize
+    return None
+
+
+def snippet_sample(data: bytes, filename: str, limit: int) -> Tuple[str, bytes]:
+    """Turn the first bytes of a source into a truncated copy of the source.
+
+    A prefix of a .gz or .zip isn't a usable archive, so rather than store it
+    as-is (and have the transformer fail to open it) the prefix is unpacked
+    here: a gzip is inflated as far as it goes, a tarball or zip yields the
+    start of its first file. The sample is cut to ``limit`` bytes and, unless
+    it is the whole file, back to its last newline, so what the transformer
+    sniffs is a run of complete lines.
+
+    Args:
+        data: The start of the source, as served.
+        filename: The source's filename, as served.
+        limit: Most bytes the sample may hold.
+
+    Returns:
+        (filename for the sample, sample bytes).
+    """
+    name = filename
+    sample, complete = data, len(data) < limit
+    lower = filename.lower()
+    if lower.endswith((".gz", ".tgz")):
+        inflated, ended = _inflate_prefix(data, _GZIP_WBITS, limit * _SNIPPET_INFLATE_FACTOR)
+        member = _first_tar_member(inflated)
+        if member is not None:
+            name, sample, complete = member
+        else:
+            name = filename[:-3] if lower.endswith(".gz") else filename[:-4] + ".tar"
+            sample, complete = inflated, ended
+    elif lower.endswith(".zip") or data.startswith(_ZIP_LOCAL_SIGNATURE):
+        member = _first_zip_member(data)
+        if member is not None:
+            name, sample, complete = member
+
+    if len(sample) > limit:
+        sample, complete = sample[:limit], False
+    if not complete and b"\n" in sample:
+        sample = sample[: sample.rindex(b"\n") + 1]
+    return name or filename, sample
+
+
+def _filename_from(response) -> str:
+    """The filename in a response's Content-Disposition, or ""."""
+    disposition = response.headers.get("Content-Disposition") or ""
+    if "filename=" not in disposition:
+        return ""
+    return disposition.split("filename=")[1].replace('"', "").strip()
+
+
+def content_tag(response) -> str:
+    """What a response's headers say about its content's identity, or "".
+
+    A strong ETag, which the server promises changes whenever the bytes do;
+    failing that a Content-MD5, prefixed ``md5:`` so the two can't be
+    confused. A weak (``W/``) ETag only promises equivalent meaning, which is
+    not enough to skip a rebuild on, so it counts as no tag at all. A ranged
+    response carries the tag of the whole resource, so a probe sees the same
+    tag as the full download.
+    """
+    etag = (response.headers.get("ETag") or "").strip()
+    if etag and not etag.startswith("W/"):
+        return etag
+    md5 = (response.headers.get("Content-MD5") or "").strip()
+    return f"md5:{md5}" if md5 else ""
+
+
+def _total_length(response) -> Optional[int]:
+    """The full size of the resource behind a (possibly ranged) response.
+
+    A 206 states it after the slash in Content-Range; a server that ignored the
+    Range header answers 200 with the whole thing, whose Content-Length is it.
+    Returns None when the server didn't say.
+    """
+    content_range = response.headers.get("Content-Range") or ""
+    if response.status_code == 206 and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1].strip()
+        return int(total) if total.isdigit() else None
+    length = response.headers.get("Content-Length")
+    return int(length) if length and str(length).isdigit() else None
+
+
+def read_size_manifest(path: str) -> dict:
+    """Read a size manifest written by ``Downloader.probe_sizes`` into {id: row}.
+
+    Values are strings, as in the TSV. A missing file is an empty manifest.
+    """
+    manifest: Dict[str, dict] = {}
+    if not path or not os.path.exists(path):
+        return manifest
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f, delimiter="\t"):
+            manifest[row["id"]] = row
+    return manifest
+
 
 class Downloader:
 
@@ -35,22 +316,29 @@ class Downloader:
         api_key: str = "",
         max_source_mb: float = MAX_SOURCE_MB,
         use_skiplist: bool = True,
+        rate_limiter: Optional[AdaptiveRateLimiter] = None,
+        snippet_kb: float = SNIPPET_KB,
     ) -> None:
         """Initializes the Downloader class.
 
         Args:
             output_dir: A string pointing to the location to download data to.
-            snippet_only: Downloads only the first 5 kB of the source, for testing and file checks.
+            snippet_only: Downloads only the first ``snippet_kb`` of each source, and
+                stores a truncated but readable sample of it, for testing and file checks.
             ignore_cache: Ignore cache and download files even if they exist.
             api_key: API key for BioPortal.
             max_source_mb: Skip any ontology whose source file exceeds this many MB.
             use_skiplist: If True, skip ontologies on the static known-giants skiplist.
+            rate_limiter: Limiter for requests to BioPortal. Defaults to the one
+                shared by the whole process, which is almost always what you want.
+            snippet_kb: With snippet_only, how many KB of each source to fetch.
 
         Returns:
             None.
         """
         self.output_dir = output_dir
         self.snippet_only = snippet_only
+        self.snippet_bytes = max(1, int(snippet_kb * 1024))
         self.ignore_cache = ignore_cache
         self.api_key = api_key
         self.max_source_mb = max_source_mb
@@ -62,9 +350,13 @@ class Downloader:
         # status is one of: downloaded, skipped, error.
         self.results: list = []
 
+        # 429s are left to the shared rate limiter (see _get): retrying them
+        # here would back off per request and ignore Retry-After.
         self.requests_session = requests.Session()
-        self.retries = Retry(total=5, backoff_factor=1, status_forcelist=[429, 504])
+        self.retries = Retry(total=5, backoff_factor=1, status_forcelist=[504])
         self.requests_session.mount("https://", HTTPAdapter(max_retries=self.retries))
+        self.rate_limiter = rate_limiter or shared_limiter()
+        self._limiter_start = self.rate_limiter.stats()
 
         # If the output directory does not exist, create it
         if not os.path.exists(self.output_dir):
@@ -78,12 +370,18 @@ class Downloader:
     def _record(
         self, acronym, submission_id, source_bytes, path, status, reason,
         name="", version="", http_status: Union[int, str] = "",
+        unpacked_bytes: Union[int, str] = "", sha256: str = "", etag: str = "",
+        snippet: bool = False,
     ):
         """Append a per-ontology outcome to the results list.
 
         ``http_status`` is the response code from BioPortal, recorded for the
         outcomes that hinge on it so the reason can be audited later without
-        re-running the download.
+        re-running the download. ``unpacked_bytes`` is only known for gzipped
+        sources, and ``sha256`` (of the file as served) only for ones that were
+        streamed in full; ``etag`` is the source's ``content_tag``, where the
+        server gave one. ``snippet`` marks a file that is only the start of
+        its source (see ``snippet_only``).
         """
         self.results.append(
             {
@@ -92,13 +390,37 @@ class Downloader:
                 "version": version,
                 "submission_id": submission_id,
                 "source_bytes": source_bytes,
+                "unpacked_bytes": unpacked_bytes,
+                "sha256": sha256,
+                "etag": etag,
                 "path": path,
                 "status": status,
                 "reason": reason,
                 "http_status": http_status,
+                "snippet": "yes" if snippet else "",
             }
         )
 
+    def _get(self, url: str, **kwargs):
+        """GET through the shared rate limiter, re-sending after a 429.
+
+        Every attempt waits its turn at the limiter, and a 429 tells the
+        limiter (and so every other request in the process) to slow down and
+        to hold off for as long as the server's ``Retry-After`` says.
+        """
+        for attempt in range(1, _MAX_THROTTLED_ATTEMPTS + 1):
+            self.rate_limiter.acquire()
+            response = self.requests_session.get(url, **kwargs)
+            if response.status_code != 429:
+                self.rate_limiter.succeeded()
+                return response
+            self.rate_limiter.throttled(parse_retry_after(response.headers.get("Retry-After")))
+            if attempt == _MAX_THROTTLED_ATTEMPTS:
+                break
+            response.close()
+        logging.warning(f"Still throttled after {_MAX_THROTTLED_ATTEMPTS} attempts: {url}")
+        return response
+
     @staticmethod
     def _body_snippet(response) -> str:
         """First line of an error response body, for the log.
@@ -127,164 +449,265 @@ class Downloader:
             The list of per-ontology result dicts (also written to
             ``download_report.tsv`` in the output directory).
         """
+        for ontology in onto_list:
+            self.download_one(ontology)
+
+        return self.finish()
+
+    def download_one(self, ontology: str) -> dict:
+        """Download (or skip, or fail to download) a single ontology.
+
+        The outcome is appended to ``results``; nothing is written to the report
+        until ``finish``. This is the unit a caller that wants to act on each
+        source as soon as it lands (see ``pipeline.run_shard``) works in.
+
+        Args:
+            ontology: BioPortal acronym, e.g. PO.
+
+        Returns:
+            The ontology's result dict.
+        """
         headers = {"Authorization": f"apikey token={self.api_key}"}
 
-        for ontology in onto_list:
-            # Fast path: skip known giants without any network calls.
-            if self.use_skiplist and is_skiplisted(ontology):
-                logging.info(f"Skipping {ontology} (on known-giants skiplist).")
-                self._record(ontology, "NA", 0, "", "skipped", "skiplist")
-                continue
+        # Fast path: skip known giants without any network calls.
+        if self.use_skiplist and is_skiplisted(ontology):
+            logging.info(f"Skipping {ontology} (on known-giants skiplist).")
+            self._record(ontology, "NA", 0, "", "skipped", "skiplist")
+            return self.results[-1]
 
-            logging.info(f"Downloading {ontology}...")
+        logging.info(f"Downloading {ontology}...")
 
-            metadata_url = f"https://data.bioontology.org/ontologies/{ontology}"
-            latest_submission_url = (
-                f"https://data.bioontology.org/ontologies/{ontology}/latest_submission"
-            )
-            download_url = (
-                f"https://data.bioontology.org/ontologies/{ontology}/download"
+        metadata_url = f"https://data.bioontology.org/ontologies/{ontology}"
+        latest_submission_url = (
+            f"https://data.bioontology.org/ontologies/{ontology}/latest_submission"
+        )
+        download_url = (
+            f"https://data.bioontology.org/ontologies/{ontology}/download"
+        )
+
+        metadata_resp = self._get(metadata_url, headers=headers)
+        if metadata_resp.status_code != 200:
+            logging.error(
+                f"Failed to fetch metadata for {ontology}: HTTP {metadata_resp.status_code}"
             )
+            self._record(ontology, "NA", 0, "", "error", "metadata_http_error",
+                         http_status=metadata_resp.status_code)
+            return self.results[-1]
+        metadata = metadata_resp.json()
+        onto_name = str(metadata.get("name") or ontology)
+        logging.info(f"Name: {onto_name}")
+        latest_submission = self._get(latest_submission_url, headers=headers).json()
+        if len(latest_submission) > 0:
+            submission_id = latest_submission["submissionId"]
+            onto_version = str(latest_submission.get("version") or "NA")
+        else:
+            logging.warning(f"No submission found for {ontology}.")
+            self._record(ontology, "NA", 0, "", "error", "no_submission", name=onto_name)
+            return self.results[-1]
+        logging.info(
+            f"Latest submission: {latest_submission['version']} - submission ID {submission_id} - released {latest_submission['released']}"
+        )
 
-            metadata_resp = self.requests_session.get(metadata_url, headers=headers)
-            if metadata_resp.status_code != 200:
-                logging.error(
-                    f"Failed to fetch metadata for {ontology}: HTTP {metadata_resp.status_code}"
-                )
-                self._record(ontology, "NA", 0, "", "error", "metadata_http_error",
-                             http_status=metadata_resp.status_code)
-                continue
-            metadata = metadata_resp.json()
-            onto_name = str(metadata.get("name") or ontology)
-            logging.info(f"Name: {onto_name}")
-            latest_submission = self.requests_session.get(
-                latest_submission_url, headers=headers
-            ).json()
-            if len(latest_submission) > 0:
-                submission_id = latest_submission["submissionId"]
-                onto_version = str(latest_submission.get("version") or "NA")
+        # Stream the download so we can enforce the size gate before pulling
+        # the whole (potentially huge) file into memory or onto disk.
+        download_headers = dict(headers)
+        if self.snippet_only:
+            download_headers["Range"] = f"bytes=0-{self.snippet_bytes - 1}"
+        try:
+            download_onto = self._get(
+                download_url, headers=download_headers, allow_redirects=True, stream=True
+            )
+        except requests.RequestException as e:
+            logging.warning(f"Could not download {ontology}: {e}")
+            self._record(ontology, submission_id, 0, "", "error", "download_error",
+                         name=onto_name, version=onto_version)
+            return self.results[-1]
+
+        # Why we didn't get a file matters, and the status code is the only
+        # thing that distinguishes the cases. Without this check every one of
+        # them looks like "not_downloadable", which lumps licensed
+        # terminologies (working as intended) in with broken records.
+        code = download_onto.status_code
+        if not download_onto.ok:
+            if code in LICENSE_STATUSES:
+                reason = LICENSE_RESTRICTED_REASON
+                note = "license does not cover this API key"
+            elif code == 404:
+                reason = "no_download_file"
+                note = "no source file attached to the submission"
             else:
-                logging.warning(f"No submission found for {ontology}.")
-                self._record(ontology, "NA", 0, "", "error", "no_submission", name=onto_name)
-                continue
-            logging.info(
-                f"Latest submission: {latest_submission['version']} - submission ID {submission_id} - released {latest_submission['released']}"
+                reason = "download_http_error"
+                note = "unexpected response"
+            logging.warning(
+                f"Not downloading {ontology}: HTTP {code} ({note}). "
+                f"{self._body_snippet(download_onto)}"
             )
+            download_onto.close()
+            self._record(ontology, submission_id, 0, "", "error", reason,
+                         name=onto_name, version=onto_version, http_status=code)
+            return self.results[-1]
 
-            # Stream the download so we can enforce the size gate before pulling
-            # the whole (potentially huge) file into memory or onto disk.
-            try:
-                download_onto = self.requests_session.get(
-                    download_url, headers=headers, allow_redirects=True, stream=True
-                )
-            except requests.RequestException as e:
-                logging.warning(f"Could not download {ontology}: {e}")
-                self._record(ontology, submission_id, 0, "", "error", "download_error",
-                             name=onto_name, version=onto_version)
-                continue
-
-            # Why we didn't get a file matters, and the status code is the only
-            # thing that distinguishes the cases. Without this check every one of
-            # them looks like "not_downloadable", which lumps licensed
-            # terminologies (working as intended) in with broken records.
-            code = download_onto.status_code
-            if not download_onto.ok:
-                if code in LICENSE_STATUSES:
-                    reason = LICENSE_RESTRICTED_REASON
-                    note = "license does not cover this API key"
-                elif code == 404:
-                    reason = "no_download_file"
-                    note = "no source file attached to the submission"
-                else:
-                    reason = "download_http_error"
-                    note = "unexpected response"
-                logging.warning(
-                    f"Not downloading {ontology}: HTTP {code} ({note}). "
-                    f"{self._body_snippet(download_onto)}"
-                )
-                download_onto.close()
-                self._record(ontology, submission_id, 0, "", "error", reason,
-                             name=onto_name, version=onto_version, http_status=code)
-                continue
+        try:
+            onto_filename = (
+                download_onto.headers["Content-Disposition"]
+                .split("filename=")[1]
+                .replace('"', "")
+            )
+        except KeyError:
+            # A 2xx with no filename: BioPortal answered, but not with a file.
+            logging.warning(
+                f"Could not download {ontology}: HTTP {code} with no Content-Disposition. "
+                f"Check if the ontology is downloadable."
+            )
+            download_onto.close()
+            self._record(ontology, submission_id, 0, "", "error", "not_downloadable",
+                         name=onto_name, version=onto_version, http_status=code)
+            return self.results[-1]
+
+        # Size gate 1: trust the stated size if present. For a ranged (snippet)
+        # request that is the total in Content-Range, not the Content-Length of
+        # the part, so a snippet run skips exactly what a full run would.
+        source_size = _total_length(download_onto)
+        if source_size is not None and source_size > self.max_source_bytes:
+            logging.warning(
+                f"Skipping {ontology}: source is {source_size/1024/1024:.1f} MB "
+                f"(> {self.max_source_mb} MB limit)."
+            )
+            download_onto.close()
+            self._record(
+                ontology, submission_id, source_size, "", "skipped", "too_large",
+                name=onto_name, version=onto_version,
+            )
+            return self.results[-1]
 
-            try:
-                onto_filename = (
-                    download_onto.headers["Content-Disposition"]
-                    .split("filename=")[1]
-                    .replace('"', "")
-                )
-            except KeyError:
-                # A 2xx with no filename: BioPortal answered, but not with a file.
-                logging.warning(
-                    f"Could not download {ontology}: HTTP {code} with no Content-Disposition. "
-                    f"Check if the ontology is downloadable."
-                )
-                download_onto.close()
-                self._record(ontology, submission_id, 0, "", "error", "not_downloadable",
-                             name=onto_name, version=onto_version, http_status=code)
-                continue
-
-            # Size gate 1: trust Content-Length if present.
-            content_length = download_onto.headers.get("Content-Length")
-            if content_length is not None and int(content_length) > self.max_source_bytes:
-                logging.warning(
-                    f"Skipping {ontology}: source is {int(content_length)/1024/1024:.1f} MB "
-                    f"(> {self.max_source_mb} MB limit)."
-                )
-                download_onto.close()
-                self._record(
-                    ontology, submission_id, int(content_length), "", "skipped", "too_large",
-                    name=onto_name, version=onto_version,
-                )
-                continue
+        outdir = f"{self.output_dir}/{ontology}/{submission_id}"
+        outpath = f"{outdir}/{onto_filename}"
+        if not os.path.exists(outdir):
+            os.makedirs(outdir)
 
-            outdir = f"{self.output_dir}/{ontology}/{submission_id}"
-            outpath = f"{outdir}/{onto_filename}"
-            if not os.path.exists(outdir):
-                os.makedirs(outdir)
+        if self.snippet_only:
+            return self._save_snippet(
+                ontology, download_onto, outdir, onto_filename, source_size,
+                submission_id, onto_name, onto_version,
+            )
 
-            # Size gate 2: enforce the cap while streaming, in case the header
-            # was missing or wrong. Abort and clean up if we blow past it.
-            bytes_written = 0
-            too_large = False
-            try:
-                with open(outpath, "wb") as outfile:
-                    for chunk in download_onto.iter_content(chunk_size=_CHUNK):
-                        if not chunk:
-                            continue
-                        bytes_written += len(chunk)
-                        if bytes_written > self.max_source_bytes:
+        # Size gate 2: enforce the cap while streaming, in case the header
+        # was missing or wrong. Abort and clean up if we blow past it.
+        # The same pass hashes the file as served and, for a gzipped
+        # source, measures what it unpacks to — so the real size is gated
+        # here rather than after the transform has decompressed it, and
+        # nothing downstream has to read the file again to learn either.
+        bytes_written = 0
+        too_large = False
+        hasher = hashlib.sha256()
+        meter = _GunzipMeter() if onto_filename.lower().endswith(".gz") else None
+        try:
+            with open(outpath, "wb") as outfile:
+                for chunk in download_onto.iter_content(chunk_size=_CHUNK):
+                    if not chunk:
+                        continue
+                    bytes_written += len(chunk)
+                    if bytes_written > self.max_source_bytes:
+                        too_large = True
+                        break
+                    if meter is not None:
+                        meter.feed(chunk)
+                        if meter.unpacked > self.max_source_bytes:
                             too_large = True
                             break
-                        outfile.write(chunk)
-            finally:
-                download_onto.close()
+                    hasher.update(chunk)
+                    outfile.write(chunk)
+        finally:
+            download_onto.close()
+
+        unpacked_bytes = meter.unpacked if meter is not None and meter.valid else ""
 
-            if too_large:
+        if too_large:
+            if meter is not None and meter.unpacked > self.max_source_bytes:
                 logging.warning(
-                    f"Skipping {ontology}: source exceeded {self.max_source_mb} MB while streaming."
+                    f"Skipping {ontology}: source unpacks to more than "
+                    f"{self.max_source_mb} MB ({bytes_written/1024/1024:.1f} MB gzipped)."
                 )
-                try:
-                    os.remove(outpath)
-                except OSError:
-                    pass
-                self._record(
-                    ontology, submission_id, bytes_written, "", "skipped", "too_large",
-                    name=onto_name, version=onto_version,
+            else:
+                logging.warning(
+                    f"Skipping {ontology}: source exceeded {self.max_source_mb} MB while streaming."
                 )
-                continue
-
-            logging.info(f"Downloaded {ontology} ({bytes_written/1024/1024:.2f} MB).")
+            try:
+                os.remove(outpath)
+            except OSError:
+                pass
             self._record(
-                ontology, submission_id, bytes_written, outpath, "downloaded", "",
-                name=onto_name, version=onto_version,
+                ontology, submission_id, bytes_written, "", "skipped", "too_large",
+                name=onto_name, version=onto_version, unpacked_bytes=unpacked_bytes,
             )
+            return self.results[-1]
+
+        if meter is not None and not meter.complete:
+            unpacked_bytes = ""
+        logging.info(f"Downloaded {ontology} ({bytes_written/1024/1024:.2f} MB).")
+        self._record(
+            ontology, submission_id, bytes_written, outpath, "downloaded", "",
+            name=onto_name, version=onto_version,
+            unpacked_bytes=unpacked_bytes, sha256=hasher.hexdigest(),
+            etag=content_tag(download_onto),
+        )
+
+        return self.results[-1]
 
+    def _save_snippet(
+        self, ontology, response, outdir, onto_filename, source_size,
+        submission_id, onto_name, onto_version,
+    ) -> dict:
+        """Store a truncated sample of a source from the start of its download.
+
+        Reads no more than ``snippet_bytes`` even from a server that ignored
+        the Range header and is sending the whole file. The sample is written
+        unpacked (see ``snippet_sample``), under the name of the file it was
+        taken from, so the transformer opens it like any plain source. Its
+        ``source_bytes`` is the full source's size where the server stated it,
+        and there is no ``sha256``: a hash of part of a file identifies nothing.
+        """
+        head = b""
+        try:
+            for chunk in response.iter_content(chunk_size=self.snippet_bytes):
+                head += chunk
+                if len(head) >= self.snippet_bytes:
+                    break
+        except requests.RequestException as e:
+            logging.warning(f"Could not download {ontology}: {e}")
+            self._record(ontology, submission_id, 0, "", "error", "download_error",
+                         name=onto_name, version=onto_version)
+            return self.results[-1]
+        finally:
+            response.close()
+        head = head[: self.snippet_bytes]
+
+        sample_name, sample = snippet_sample(head, onto_filename, self.snippet_bytes)
+        outpath = f"{outdir}/{sample_name}"
+        with open(outpath, "wb") as outfile:
+            outfile.write(sample)
+
+        logging.info(
+            f"Downloaded a {len(sample)/1024:.1f} kB snippet of {ontology} ({sample_name})."
+        )
+        self._record(
+            ontology, submission_id, source_size if source_size is not None else len(head),
+            outpath, "downloaded", "", name=onto_name, version=onto_version, snippet=True,
+        )
+        return self.results[-1]
+
+    def finish(self) -> list:
+        """Write the download report and summary, and log how the run went.
+
+        Returns:
+            The list of per-ontology result dicts.
+        """
         self._write_report()
 
         skipped = [r for r in self.results if r["status"] == "skipped"]
         errored = [r for r in self.results if r["status"] == "error"]
         licensed = [r for r in errored if r["reason"] == LICENSE_RESTRICTED_REASON]
+        self._write_summary(len(skipped), len(errored), len(licensed))
         if skipped:
             logging.warning(f"Skipped {len(skipped)} ontologies (too large / skiplist).")
         if licensed:
@@ -304,8 +727,8 @@ class Downloader:
     def _write_report(self) -> None:
         """Write per-ontology download outcomes to a TSV in the output dir."""
         report_path = os.path.join(self.output_dir, DOWNLOAD_REPORT_NAME)
-        fieldnames = ["id", "name", "version", "submission_id", "source_bytes", "status", "reason",
-                      "http_status", "path"]
+        fieldnames = ["id", "name", "version", "submission_id", "source_bytes", "unpacked_bytes",
+                      "sha256", "etag", "status", "reason", "http_status", "path", "snippet"]
         with open(report_path, "w", newline="") as f:
             writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter="\t")
             writer.writeheader()
@@ -313,6 +736,137 @@ class Downloader:
                 writer.writerow({k: r.get(k, "") for k in fieldnames})
         logging.info(f"Wrote download report to {report_path}")
 
+    def _write_summary(self, skipped: int, errored: int, licensed: int) -> None:
+        """Write run-level counts, including the rate limiter's, beside the report.
+
+        The limiter is shared by the whole process, so its counters are reported
+        as the difference over this Downloader's lifetime rather than as running
+        totals.
+        """
+        limiter_before = self._limiter_start
+        after = self.rate_limiter.stats()
+        summary = {
+            "downloaded": sum(1 for r in self.results if r["status"] == "downloaded"),
+            "skipped": skipped,
+            "errored": errored - licensed,
+            "licensed": licensed,
+            "requests": after["requests"] - limiter_before["requests"],
+            "throttles": after["throttles"] - limiter_before["throttles"],
+            "wait_seconds": round(after["wait_seconds"] - limiter_before["wait_seconds"], 3),
+            "rate_per_sec": after["rate_per_sec"],
+        }
+        summary_path = os.path.join(self.output_dir, DOWNLOAD_SUMMARY_NAME)
+        with open(summary_path, "w") as f:
+            for key, value in summary.items():
+                f.write(f"{key}: {value}\n")
+        logging.info(
+            f"{summary['requests']} API requests, {summary['throttles']} throttled, "
+            f"{summary['wait_seconds']}s waiting on the rate limit."
+        )
+
+    def probe_one(self, ontology: str) -> dict:
+        """Learn the size, name and content tag of a source without downloading it.
+
+        Asks for a single byte (``Range: bytes=0-0``) rather than using HEAD,
+        which the download endpoint doesn't reliably support, and never reads
+        the body: if the server ignores the range, closing the streamed
+        response abandons the transfer.
+
+        Args:
+            ontology: BioPortal acronym.
+
+        Returns:
+            A size manifest row (see ``SIZE_MANIFEST_FIELDS``) without
+            ``submission_id``.
+        """
+        headers = {
+            "Authorization": f"apikey token={self.api_key}",
+            "Range": "bytes=0-0",
+        }
+        url = f"https://data.bioontology.org/ontologies/{ontology}/download"
+        row: Dict[str, Union[int, str]] = {
+            "id": ontology,
+            "http_status": "",
+            "content_length": "",
+            "content_type": "",
+            "filename": "",
+            "etag": "",
+            "probed_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+        try:
+            response = self._get(url, headers=headers, allow_redirects=True, stream=True)
+        except requests.RequestException as e:
+            logging.warning(f"Could not probe {ontology}: {e}")
+            return row
+        try:
+            row["http_status"] = response.status_code
+            if response.ok:
+                length = _total_length(response)
+                row["content_length"] = "" if length is None else length
+                row["content_type"] = response.headers.get("Content-Type") or ""
+                row["filename"] = _filename_from(response)
+                row["etag"] = content_tag(response)
+        finally:
+            response.close()
+        return row
+
+    def probe_sizes(
+        self,
+        submissions: dict,
+        manifest_path: str = "",
+        workers: int = PROBE_WORKERS,
+        refresh: bool = False,
+    ) -> dict:
+        """Probe every ontology's source size concurrently into a manifest.
+
+        A row is reused from an existing manifest, without a request, when it
+        was probed for the same submission and the probe succeeded; so a
+        monthly re-probe only costs requests for what changed. ``refresh``
+        probes everything regardless. All requests go through the shared rate
+        limiter, however many workers there are.
+
+        Args:
+            submissions: {acronym: submission_id}, as read from ontologylist.tsv.
+            manifest_path: TSV to read cached rows from and write the manifest
+                to. Defaults to ``size_manifest.tsv`` in the output dir.
+            workers: Concurrent probes.
+            refresh: Ignore cached rows.
+
+        Returns:
+            The manifest, {acronym: row}.
+        """
+        manifest_path = manifest_path or os.path.join(self.output_dir, SIZE_MANIFEST_NAME)
+        cached = {} if refresh else read_size_manifest(manifest_path)
+
+        manifest = {}
+        to_probe = []
+        for acronym, submission_id in submissions.items():
+            row = cached.get(acronym)
+            if (
+                row
+                and row.get("submission_id") == str(submission_id)
+                and str(row.get("http_status", "")).startswith("2")
+            ):
+                manifest[acronym] = row
+            else:
+                to_probe.append(acronym)
+        logging.info(
+            f"Probing {len(to_probe)} sources ({len(manifest)} unchanged since the last probe)."
+        )
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for row in pool.map(self.probe_one, to_probe):
+                row["submission_id"] = submissions[row["id"]]
+                manifest[row["id"]] = row
+
+        with open(manifest_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=SIZE_MANIFEST_FIELDS, delimiter="\t")
+            writer.writeheader()
+            for acronym in sorted(manifest):
+                writer.writerow({k: manifest[acronym].get(k, "") for k in SIZE_MANIFEST_FIELDS})
+        logging.info(f"Wrote size manifest to {manifest_path}")
+        return manifest
+
     def get_ontology_list(self) -> None:
         """Get the list of ontologies from BioPortal.
 
@@ -333,18 +887,14 @@ class Downloader:
 
         analytics_url = "https://data.bioontology.org/analytics"
 
-        ontologies = self.requests_session.get(
-            analytics_url, headers=headers, allow_redirects=True
-        ).json()
+        ontologies = self._get(analytics_url, headers=headers, allow_redirects=True).json()
 
         logging.info("Retrieving metadata for each...")
         with open(f"{self.output_dir}/{ONTOLOGY_LIST_NAME}", "w") as outfile:
             outfile.write(f"id\tname\tcurrent_version\tsubmission_id\n")
             for acronym in ontologies:
                 latest_submission_url = f"https://data.bioontology.org/ontologies/{acronym}/latest_submission"
-                latest_submission = self.requests_session.get(
-                    latest_submission_url, headers=headers
-                ).json()
+                latest_submission = self._get(latest_submission_url, headers=headers).json()
 
                 if len(latest_submission) > 0:
                     name = (
@@ -0,0 +1,793 @@
+"""Merging per-ontology KGX artifacts into one graph, in bounded memory.
+
+Each transformed ontology is published as ``<ACRONYM>.tar.gz`` holding
+``<ACRONYM>_nodes.tsv`` and ``<ACRONYM>_edges.tsv``. The same node turns up in
+many of them -- every ontology that imports or references BFO declares its
+classes -- so merging is mostly deduplication. KGX does that by loading every
+graph into memory, which stops working long before all of BioPortal fits.
+
+Here the TSVs are read straight from the tar streams, never unpacked, and
+deduplicated with an external sort: rows are sorted by key in runs of at most
+``MERGE_RUN_ROWS``, each run spilled to a temporary file, and the runs are
+k-way merged back so that all copies of a node (by ``id``) or an edge (by
+subject, predicate and object) arrive together. Those are folded into one row:
+list-valued columns (``MERGE_MULTIVALUED_FIELDS``, ``provided_by`` among them)
+are concatenated, anything else keeps its first non-empty value in artifact
+order. Peak memory is one run plus one group of copies, however many
+ontologies go in.
+
+That alone is single-core, so with more than one partition the work is
+spread over processes: each artifact is read by a worker that routes every
+row, by a hash of its key, to one of N partitions, spilling sorted runs into
+each partition's directory; then each partition's runs are merged and
+deduplicated by a worker of its own. Copies of a node or
+edge always land in the same partition, so the partitions' outputs are simply
+concatenated (or kept apart, if asked). Each worker holds at most one run.
+
+Releases are incremental, and so can the merge be. Given a segments
+directory, each artifact's sorted runs -- its segment -- are kept there with
+a manifest of the artifact version (``download_url`` and ``submission_id``
+from onto_stats.yaml) each was built from. The next merge re-reads only the
+artifacts whose version changed and reruns the final k-way merge over all
+the segments, which is a fraction of the work of decompressing and sorting
+every artifact again.
+
+Each ontology is transformed on its own with its imports stripped, so its
+edges may point at terms only another ontology declares -- or none does.
+Once the nodes are merged their ids are indexed on disk (see node_index),
+every edge's subject and object are looked up, and the dangling ones are
+reported per ontology and, if asked, dropped or given stub nodes.
+"""
+
+import hashlib
+import heapq
+import json
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import zlib
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import lru_cache
+from itertools import groupby, repeat
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from kg_bioportal.config import (
+    MERGE_FAN_IN,
+    MERGE_MULTIVALUED_FIELDS,
+    MERGE_RUN_ROWS,
+    MERGE_WORKERS,
+)
+from kg_bioportal.node_index import NodeIdWriter, PartitionedIdIndex
+
+# KGX TSV's list delimiter.
+LIST_DELIMITER = "|"
+
+_ARTIFACT_SUFFIX = ".tar.gz"
+
+# Lists each kept segment and the artifact version it was built from.
+SEGMENT_MANIFEST_NAME = "manifest.json"
+
+# What the merge may do with an edge whose subject or object isn't a node.
+DANGLING_MODES = ("report", "drop", "stub")
+DANGLING_SUMMARY_FIELDS = ["ontology", "dangling_edges", "missing_subjects", "missing_objects"]
+# The summary's ontology for a dangling edge with no provided_by.
+DANGLING_UNKNOWN_SOURCE = "unknown"
+
+# Stub nodes say no more about a term than that it exists.
+STUB_CATEGORY = "biolink:NamedThing"
+
+# Node-id lookups remembered per process; edges point at the same few terms.
+_ID_CACHE_SIZE = 1 << 16
+
+
+def node_key(row: Dict[str, str]) -> str:
+    """Nodes are the same node if they have the same id."""
+    return row.get("id", "")
+
+
+def edge_key(row: Dict[str, str]) -> str:
+    """Edges are the same edge if they join the same nodes the same way.
+
+    Edge ids are minted per artifact, so they say nothing about duplicates.
+    TSV values can't hold a tab, so joining on one is unambiguous.
+    """
+    return "\t".join((row.get("subject", ""), row.get("predicate", ""), row.get("object", "")))
+
+
+_KEYS = {"nodes": node_key, "edges": edge_key}
+
+
+def select_artifacts(
+    artifact_dir: str,
+    include_only: Sequence[str] = (),
+    exclude: Sequence[str] = (),
+    skip: Sequence[str] = (),
+) -> List[str]:
+    """The ``<ACRONYM>.tar.gz`` artifacts in ``artifact_dir`` to merge, by acronym.
+
+    Args:
+        artifact_dir: Directory holding the artifacts, as transform writes them.
+        include_only: If given, only these acronyms.
+        exclude: Acronyms to leave out.
+        skip: File names to leave out (the merged graph itself, say).
+
+    Returns:
+        Paths of the selected artifacts, sorted by acronym.
+    """
+    include = {a.upper() for a in include_only}
+    excluded = {a.upper() for a in exclude}
+    paths = []
+    for name in sorted(os.listdir(artifact_dir)):
+        if not name.endswith(_ARTIFACT_SUFFIX) or name in skip:
+            continue
+        acronym = name[: -len(_ARTIFACT_SUFFIX)].upper()
+        if (include and acronym not in include) or acronym in excluded:
+            continue
+        paths.append(os.path.join(artifact_dir, name))
+    missing = include - {os.path.basename(p)[: -len(_ARTIFACT_SUFFIX)].upper() for p in paths}
+    if missing:
+        logging.warning(f"No artifact to merge for: {', '.join(sorted(missing))}")
+    return paths
+
+
+def _read_tsv(stream) -> Iterator[Dict[str, str]]:
+    """Rows of a KGX TSV as dicts, without the empty values.
+
+    Decoded line by line: io.TextIOWrapper wants a seekable stream, and a
+    member of a tar read as a stream is not one.
+    """
+    header = stream.readline().decode("utf-8").rstrip("\r\n").split("\t")
+    for raw in stream:
+        line = raw.decode("utf-8").rstrip("\r\n")
+        if line:
+            yield {k: v for k, v in zip(header, line.split("\t")) if v}
+
+
+def iter_artifact(path: str) -> Iterator[tuple]:
+    """``("nodes" | "edges", row)`` for every row of an artifact, in file order.
+
+    The tarball is read as a stream (``r|gz``): members are decompressed as
+    they are read, and nothing is extracted to disk.
+    """
+    with tarfile.open(path, mode="r|gz") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            for kind in ("nodes", "edges"):
+                if member.name.endswith(f"_{kind}.tsv"):
+                    for row in _read_tsv(tar.extractfile(member)):
+                        yield kind, row
+
+
+def merge_rows(rows: Iterable[Dict[str, str]], multivalued=MERGE_MULTIVALUED_FIELDS) -> dict:
+    """Fold copies of one node or edge into a single row.
+
+    Multivalued columns are concatenated without repeats, in order; any other
+    column keeps its first non-empty value.
+    """
+    merged: Dict[str, str] = {}
+    for row in rows:
+        for field, value in row.items():
+            if field not in merged:
+                merged[field] = value
+            elif field in multivalued:
+                values = merged[field].split(LIST_DELIMITER)
+                values += [v for v in value.split(LIST_DELIMITER) if v not in values]
+                merged[field] = LIST_DELIMITER.join(values)
+    return merged
+
+
+class _SortedRuns:
+    """Rows spilled to disk in sorted runs of bounded size."""
+
+    def __init__(self, key: Callable[[dict], str], tmp_dir: str, run_rows: int) -> None:
+        self.key = key
+        self.tmp_dir = tmp_dir
+        self.run_rows = run_rows
+        self.runs: List[str] = []
+        self.columns: Dict[str, None] = {}
+        self.rows = 0
+        self._buffer: List[dict] = []
+
+    def add(self, row: dict) -> None:
+        self._buffer.append(row)
+        self.rows += 1
+        for column in row:
+            if column not in self.columns:
+                self.columns[column] = None
+        if len(self._buffer) >= self.run_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        # list.sort is stable, so copies keep their artifact order.
+        self._buffer.sort(key=self.key)
+        self.runs.append(self._write(self._buffer))
+        self._buffer = []
+
+    def _write(self, rows: Iterable[dict]) -> str:
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(suffix=".run", dir=self.tmp_dir)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False, separators=(",", ":")))
+                f.write("\n")
+        return path
+
+    @staticmethod
+    def _read(f) -> Iterator[dict]:
+        for line in f:
+            yield json.loads(line)
+
+    def _merge(self, runs: List[str], stack: ExitStack) -> Iterator[dict]:
+        files = [stack.enter_context(open(run, encoding="utf-8")) for run in runs]
+        return heapq.merge(*(self._read(f) for f in files), key=self.key)
+
+    def sorted(self, fan_in: int) -> Iterator[dict]:
+        """Every row, sorted by key, copies in the order of ``runs``.
+
+        More than ``fan_in`` runs are first merged ``fan_in`` at a time into
+        longer runs in ``tmp_dir``, so no more than that many files are ever
+        open at once. heapq.merge is stable and neighbouring runs are merged
+        together, so copies stay in artifact order through every pass. Only
+        those intermediate runs are removed; ``runs`` are left as they are.
+        """
+        self.flush()
+        runs, fan_in = self.runs, max(2, fan_in)
+        while len(runs) > fan_in:
+            merged = []
+            for i in range(0, len(runs), fan_in):
+                with ExitStack() as stack:
+                    merged.append(self._write(self._merge(runs[i : i + fan_in], stack)))
+                for run in runs[i : i + fan_in]:
+                    if run not in self.runs:
+                        os.remove(run)
+            runs = merged
+        with ExitStack() as stack:
+            yield from self._merge(runs, stack)
+
+
+def _write_tsv(path: str, columns: List[str], rows: Iterable[dict]) -> int:
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("\t".join(columns) + "\n")
+        for row in rows:
+            f.write("\t".join(row.get(c, "") for c in columns) + "\n")
+            count += 1
+    return count
+
+
+def _deduplicated(runs: _SortedRuns, fan_in: int) -> Iterator[dict]:
+    for _, copies in groupby(runs.sorted(fan_in), key=runs.key):
+        yield merge_rows(copies)
+
+
+def _columns(kind: str, seen: Iterable[str]) -> List[str]:
+    # KGX writes id (and subject, predicate, object) first; the union of
+    # columns, by first appearance, keeps them there.
+    return list(seen) or (["id"] if kind == "nodes" else ["subject", "predicate", "object"])
+
+
+def partition_of(key: str, partitions: int) -> int:
+    """The partition a node or edge key belongs to.
+
+    crc32 rather than hash(): str hashes are salted per process, and every
+    process has to send a key to the same partition.
+    """
+    return zlib.crc32(key.encode("utf-8")) % partitions
+
+
+def _scatter(path: str, spill_dir: str, partitions: int, run_rows: int) -> Tuple[dict, str]:
+    """Sort the rows of one artifact into runs, partition by partition.
+
+    Runs go to ``<spill_dir>/<kind>-NNN/``. At most ``run_rows`` rows, across
+    all partitions, are held at once.
+
+    Returns:
+        The artifact's segment: per kind, the ``columns`` seen, the number of
+        ``rows`` and, per partition, the paths of its ``runs`` in order. And
+        why the artifact could not be read through, or "" if it could; the
+        segment then holds only what was read before it failed.
+    """
+    logging.info(f"Reading {path}.")
+    runs = {
+        kind: [
+            _SortedRuns(key, os.path.join(spill_dir, f"{kind}-{p:03d}"), run_rows)
+            for p in range(partitions)
+        ]
+        for kind, key in _KEYS.items()
+    }
+    buffered = 0
+    error = ""
+
+    def flush_all():
+        for by_partition in runs.values():
+            for sorted_runs in by_partition:
+                sorted_runs.flush()
+
+    try:
+        for kind, row in iter_artifact(path):
+            runs[kind][partition_of(_KEYS[kind](row), partitions)].add(row)
+            buffered += 1
+            if buffered >= run_rows:
+                flush_all()
+                buffered = 0
+    except (tarfile.TarError, EOFError, OSError) as e:
+        # Whatever the broken artifact gave before failing stays in.
+        logging.error(f"Could not read {path}: {e}")
+        error = str(e) or type(e).__name__
+    flush_all()
+
+    segment = {
+        kind: {
+            "columns": list(dict.fromkeys(c for r in by_partition for c in r.columns)),
+            "rows": sum(r.rows for r in by_partition),
+            "runs": [r.runs for r in by_partition],
+        }
+        for kind, by_partition in runs.items()
+    }
+    return segment, error
+
+
+def _submit(pool: Optional[ProcessPoolExecutor], fn, *args) -> Future:
+    """``pool.submit``, or without a pool, run ``fn`` here and now."""
+    if pool is not None:
+        return pool.submit(fn, *args)
+    future: Future = Future()
+    future.set_result(fn(*args))
+    return future
+
+
+def _runs(kind: str, runs: List[str], tmp: str) -> _SortedRuns:
+    sorted_runs = _SortedRuns(_KEYS[kind], tmp, 0)
+    sorted_runs.runs = runs
+    return sorted_runs
+
+
+def _reduce_nodes(runs: List[str], tmp: str, out_path: str, columns: List[str], fan_in: int,
+                  ids_stem: str) -> int:
+    """Merge and deduplicate one partition's node runs into ``out_path``.
+
+    The ids written are indexed, as they go, at ``ids_stem`` (see node_index).
+    Returns the rows written.
+    """
+    with NodeIdWriter(ids_stem) as ids:
+        def indexed(rows):
+            for row in rows:
+                ids.add(row.get("id", ""))
+                yield row
+
+        rows = _deduplicated(_runs("nodes", runs, tmp), fan_in)
+        return _write_tsv(out_path, columns, indexed(rows))
+
+
+def _reduce_edges(runs: List[str], tmp: str, out_path: str, columns: List[str], fan_in: int,
+                  ids_stems: List[str], dangling: str, run_rows: int
+                  ) -> Tuple[int, int, dict, List[str]]:
+    """Merge and deduplicate one partition's edge runs into ``out_path``.
+
+    Each edge's subject and object are looked up among the merged nodes. An
+    edge missing either is dangling: it is counted against every ontology in
+    its provided_by (``DANGLING_UNKNOWN_SOURCE`` if that is empty), and
+    dropped, or kept with a stub node for each missing end, as ``dangling``
+    says.
+
+    Returns:
+        The rows written; the dangling edges; ``{ontology: [dangling edges,
+        missing subjects, missing objects]}``; and the sorted runs of stub
+        nodes.
+    """
+    index = PartitionedIdIndex(ids_stems, partition_of)
+    # The same few upper-level terms are the object of edge after edge.
+    known = lru_cache(maxsize=_ID_CACHE_SIZE)(index.__contains__)
+    report: Dict[str, List[int]] = {}
+    dangling_edges = 0
+    stubs = _SortedRuns(node_key, os.path.join(tmp, "stubs"), run_rows)
+
+    def resolved(rows):
+        nonlocal dangling_edges
+        for row in rows:
+            missing = [end for end in ("subject", "object") if not known(row.get(end, ""))]
+            if missing:
+                dangling_edges += 1
+                sources = [s for s in row.get("provided_by", "").split(LIST_DELIMITER) if s]
+                for source in sources or [DANGLING_UNKNOWN_SOURCE]:
+                    counts = report.setdefault(source, [0, 0, 0])
+                    counts[0] += 1
+                    counts[1] += "subject" in missing
+                    counts[2] += "object" in missing
+                if dangling == "drop":
+                    continue
+                if dangling == "stub":
+                    for end in missing:
+                        if row.get(end):
+                            stubs.add({
+                                "id": row[end],
+                                "category": STUB_CATEGORY,
+                                "provided_by": row.get("provided_by", ""),
+                            })
+            yield row
+
+    try:
+        rows = _deduplicated(_runs("edges", runs, tmp), fan_in)
+        count = _write_tsv(out_path, columns, resolved(rows))
+    finally:
+        index.close()
+    stubs.flush()
+    return count, dangling_edges, report, stubs.runs
+
+
+def _concatenate(parts: List[str], path: str) -> None:
+    """Join partition TSVs, which share a header, into one TSV."""
+    with open(path, "wb") as out:
+        for i, part in enumerate(parts):
+            with open(part, "rb") as f:
+                header = f.readline()
+                if i == 0:
+                    out.write(header)
+                shutil.copyfileobj(f, out)
+            os.remove(part)
+
+
+def _read_serial(artifacts: Sequence[str], tmp: str, run_rows: int) -> Tuple[dict, List[str]]:
+    """Sort every artifact's rows into runs in this process, as one segment.
+
+    Returns:
+        The segment, and the acronyms of the artifacts that could not be read
+        through.
+    """
+    runs = {kind: _SortedRuns(key, tmp, run_rows) for kind, key in _KEYS.items()}
+    unreadable = []
+    for path in artifacts:
+        logging.info(f"Reading {path}.")
+        try:
+            for kind, row in iter_artifact(path):
+                runs[kind].add(row)
+        except (tarfile.TarError, EOFError, OSError) as e:
+            # Whatever the broken artifact gave before failing stays in.
+            logging.error(f"Could not read {path}: {e}")
+            unreadable.append(_acronym(path))
+    for sorted_runs in runs.values():
+        sorted_runs.flush()
+    segment = {
+        kind: {"columns": list(r.columns), "rows": r.rows, "runs": [r.runs]}
+        for kind, r in runs.items()
+    }
+    return segment, unreadable
+
+
+def _write_dangling(path: str, reports: Iterable[dict]) -> None:
+    """Write the per-ontology dangling summary, summing the partitions'."""
+    totals: Dict[str, List[int]] = {}
+    for report in reports:
+        for source, counts in report.items():
+            total = totals.setdefault(source, [0, 0, 0])
+            for i, n in enumerate(counts):
+                total[i] += n
+    with open(path, "w") as f:
+        f.write("\t".join(DANGLING_SUMMARY_FIELDS) + "\n")
+        for source in sorted(totals):
+            f.write("\t".join([source] + [str(n) for n in totals[source]]) + "\n")
+
+
+def _merge_segments(
+    pool: Optional[ProcessPoolExecutor], segments: List[dict], output_dir: str, name: str,
+    fan_in: int, run_rows: int, tmp: str, stats: dict, partitions: int, keep_partitions: bool,
+    dangling: str,
+) -> List[str]:
+    """Merge the segments, in order, partition by partition in ``pool``.
+
+    Nodes first, so the edges can be checked against them; stub nodes for
+    dangling edges are added to the nodes' partitions before those are
+    concatenated.
+    """
+    columns = {
+        kind: _columns(kind, dict.fromkeys(c for seg in segments for c in seg[kind]["columns"]))
+        for kind in _KEYS
+    }
+    parts = {
+        kind: [
+            os.path.join(output_dir, f"{name}_{kind}.part-{p:03d}.tsv") for p in range(partitions)
+        ]
+        for kind in _KEYS
+    }
+    if partitions == 1 and not keep_partitions:
+        parts = {kind: [os.path.join(output_dir, f"{name}_{kind}.tsv")] for kind in _KEYS}
+    ids_stems = [os.path.join(tmp, f"ids-{p:03d}") for p in range(partitions)]
+
+    def runs(kind, p):
+        return [run for seg in segments for run in seg[kind]["runs"][p]]
+
+    futures = [
+        _submit(pool, _reduce_nodes, runs("nodes", p), tmp, parts["nodes"][p], columns["nodes"],
+                fan_in, ids_stems[p])
+        for p in range(partitions)
+    ]
+    stats["nodes"] = sum(future.result() for future in futures)
+    futures = [
+        _submit(pool, _reduce_edges, runs("edges", p), os.path.join(tmp, f"edges-{p:03d}"),
+                parts["edges"][p], columns["edges"], fan_in, ids_stems, dangling, run_rows)
+        for p in range(partitions)
+    ]
+    edges = [future.result() for future in futures]
+    stats["edges"] = sum(count for count, _, _, _ in edges)
+    for kind in _KEYS:
+        stats[f"input_{kind}"] = sum(seg[kind]["rows"] for seg in segments)
+        logging.info(
+            f"Merged {stats[f'input_{kind}']} {kind} into {stats[kind]} "
+            f"({partitions} partitions)."
+        )
+
+    stats["dangling_edges"] = sum(n for _, n, _, _ in edges)
+    _write_dangling(
+        os.path.join(output_dir, f"{name}_dangling.tsv"), (report for _, _, report, _ in edges)
+    )
+    logging.info(f"{stats['dangling_edges']} edges dangle ({dangling}).")
+    if dangling == "stub":
+        stats["stub_nodes"] = _add_stubs(
+            [run for _, _, _, stubs in edges for run in stubs], tmp, fan_in, parts["nodes"],
+            columns["nodes"],
+        )
+        stats["nodes"] += stats["stub_nodes"]
+
+    if keep_partitions or partitions == 1:
+        return parts["nodes"] + parts["edges"]
+    paths = []
+    for kind in _KEYS:
+        path = os.path.join(output_dir, f"{name}_{kind}.tsv")
+        _concatenate(parts[kind], path)
+        paths.append(path)
+    return paths
+
+
+def _add_stubs(runs: List[str], tmp: str, fan_in: int, node_parts: List[str],
+               columns: List[str]) -> int:
+    """Add one stub node per missing id to the partition the id belongs to.
+
+    The same id dangles from many edges; its stubs are merged into one, with
+    every provided_by. No stub's id is among the nodes, so each partition that
+    gets any is rewritten with them merged in, still sorted by id. Returns the
+    stubs added.
+    """
+    stub_parts = [os.path.join(tmp, f"stubs-{p:03d}.tsv") for p in range(len(node_parts))]
+    added = [0] * len(node_parts)
+    with ExitStack() as stack:
+        outs = [
+            stack.enter_context(open(path, "w", encoding="utf-8", newline=""))
+            for path in stub_parts
+        ]
+        for out in outs:
+            out.write("\t".join(columns) + "\n")
+        for stub in _deduplicated(_runs("nodes", runs, tmp), fan_in):
+            p = partition_of(stub["id"], len(outs))
+            outs[p].write("\t".join(stub.get(c, "") for c in columns) + "\n")
+            added[p] += 1
+    for part, stubs, n in zip(node_parts, stub_parts, added):
+        if n:
+            with ExitStack() as stack:
+                files = [stack.enter_context(open(path, "rb")) for path in (part, stubs)]
+                rows = heapq.merge(*map(_read_tsv, files), key=node_key)
+                _write_tsv(part + ".tmp", columns, rows)
+            os.replace(part + ".tmp", part)
+        os.remove(stubs)
+    return sum(added)
+
+
+def artifact_version(path: str, entry: Optional[dict] = None) -> dict:
+    """What identifies the build of an artifact, for reusing its segment.
+
+    The index entry's ``download_url`` and ``submission_id`` where there is
+    one -- a rebuilt ontology gets a new release, hence a new URL -- and
+    otherwise the file's size and modification time.
+    """
+    if entry and entry.get("download_url"):
+        return {
+            "download_url": entry["download_url"],
+            "submission_id": str(entry.get("submission_id", "")),
+        }
+    info = os.stat(path)
+    return {"size": info.st_size, "mtime_ns": info.st_mtime_ns}
+
+
+def _acronym(path: str) -> str:
+    return os.path.basename(path)[: -len(_ARTIFACT_SUFFIX)]
+
+
+def _load_manifest(segments_dir: str) -> dict:
+    try:
+        with open(os.path.join(segments_dir, SEGMENT_MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(segments_dir: str, manifest: dict) -> None:
+    # Written whole and renamed into place: a merge killed part-way leaves the
+    # previous manifest, whose segments are all still there.
+    path = os.path.join(segments_dir, SEGMENT_MANIFEST_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def _segment_runs(segment: dict, root: str) -> dict:
+    """``segment`` with its run paths made absolute under ``root``."""
+    return {
+        kind: dict(seg, runs=[[os.path.join(root, r) for r in runs] for runs in seg["runs"]])
+        for kind, seg in segment.items()
+    }
+
+
+def _update_segments(
+    pool: Optional[ProcessPoolExecutor], artifacts: Sequence[str], segments_dir: str,
+    index: Optional[Dict[str, dict]], partitions: int, run_rows: int, stats: dict,
+) -> List[dict]:
+    """Bring the segments in ``segments_dir`` up to date with ``artifacts``.
+
+    Each artifact's segment -- its rows sorted into runs, partition by
+    partition -- is kept in ``<segments_dir>/<ACRONYM>-<version>/`` and listed
+    in the manifest with the artifact version it came from. Only artifacts
+    whose version changed (or whose segment is missing, or was cut into a
+    different number of partitions) are read again. Segments of ontologies no
+    longer merged are removed. An artifact that could not be read through
+    still gives this merge what it had, but its segment is left out of the
+    manifest, so the next merge reads it again.
+
+    Returns:
+        The segments of ``artifacts``, in their order, with absolute paths.
+    """
+    os.makedirs(segments_dir, exist_ok=True)
+    manifest = _load_manifest(segments_dir)
+    if manifest.get("partitions") != partitions:
+        manifest = {}
+    kept = manifest.get("segments", {})
+    index = index or {}
+
+    wanted, stale = {}, {}
+    for path in artifacts:
+        acronym = _acronym(path)
+        version = artifact_version(path, index.get(acronym))
+        wanted[acronym] = version
+        segment = kept.get(acronym)
+        if not (segment and segment["version"] == version
+                and os.path.isdir(os.path.join(segments_dir, segment["dir"]))):
+            stale[acronym] = path
+
+    rebuilt: Dict[str, dict] = {}
+    unreadable: List[str] = []
+    futures = {}
+    for acronym, path in stale.items():
+        token = hashlib.sha256(json.dumps(wanted[acronym], sort_keys=True).encode()).hexdigest()
+        seg_dir = f"{acronym}-{token[:12]}"
+        shutil.rmtree(os.path.join(segments_dir, seg_dir), ignore_errors=True)
+        futures[acronym] = (seg_dir, _submit(
+            pool, _scatter, path, os.path.join(segments_dir, seg_dir), partitions, run_rows
+        ))
+    for acronym, (seg_dir, future) in futures.items():
+        root = os.path.join(segments_dir, seg_dir)
+        segment, error = future.result()
+        if error:
+            unreadable.append(acronym)
+        for seg in segment.values():
+            seg["runs"] = [[os.path.relpath(r, root) for r in runs] for runs in seg["runs"]]
+        rebuilt[acronym] = {"version": wanted[acronym], "dir": seg_dir, "kinds": segment}
+
+    segments = {a: rebuilt.get(a) or kept[a] for a in wanted}
+    saved = {a: seg for a, seg in segments.items() if a not in unreadable}
+    _save_manifest(segments_dir, {"partitions": partitions, "segments": saved})
+    in_use = {seg["dir"] for seg in segments.values()}
+    for name in os.listdir(segments_dir):
+        if name != SEGMENT_MANIFEST_NAME and name not in in_use:
+            shutil.rmtree(os.path.join(segments_dir, name), ignore_errors=True)
+
+    stats["unreadable"] = sorted(unreadable)
+    stats["segments_rebuilt"] = len(rebuilt)
+    stats["segments_reused"] = len(wanted) - len(rebuilt)
+    logging.info(f"Segments: {len(rebuilt)} rebuilt, {len(wanted) - len(rebuilt)} reused.")
+    return [
+        _segment_runs(segments[_acronym(path)]["kinds"],
+                      os.path.join(segments_dir, segments[_acronym(path)]["dir"]))
+        for path in artifacts
+    ]
+
+
+def merge_graph(
+    artifacts: Sequence[str],
+    output_dir: str,
+    name: str = "merged-kg",
+    compress: bool = True,
+    run_rows: int = MERGE_RUN_ROWS,
+    fan_in: int = MERGE_FAN_IN,
+    tmp_dir: Optional[str] = None,
+    workers: int = MERGE_WORKERS,
+    partitions: int = 0,
+    keep_partitions: bool = False,
+    segments_dir: Optional[str] = None,
+    index: Optional[Dict[str, dict]] = None,
+    dangling: str = "report",
+) -> dict:
+    """Merge per-ontology artifacts into one deduplicated graph.
+
+    With one partition, everything is merged in this process and the output is
+    sorted by id (edges by subject, predicate and object). With more, rows are
+    hash-partitioned by key, the partitions deduplicated in parallel, and the
+    output is sorted within each partition only.
+
+    With ``segments_dir``, each artifact's sorted runs are kept there between
+    merges, and a merge reads only the artifacts that changed since the last
+    (see ``_update_segments``) before the final k-way merge.
+
+    Every edge's subject and object are checked against the merged nodes, and
+    the edges missing either are counted, per ontology, in
+    ``<name>_dangling.tsv``.
+
+    Args:
+        artifacts: Paths of ``<ACRONYM>.tar.gz`` artifacts, in the order their
+            values should be preferred.
+        output_dir: Where the merged graph is written.
+        name: Stem of the merged files: ``<name>_nodes.tsv`` and
+            ``<name>_edges.tsv``, or ``<name>.tar.gz`` holding both.
+        compress: If True, tars and gzips the merged nodes and edges.
+        run_rows: Rows per sorted run, which bounds each process's memory.
+        fan_in: Most runs merged (and files open) at once.
+        tmp_dir: Where sorted runs are spilled (default: ``output_dir``).
+        workers: Processes to merge with (0: one per CPU).
+        partitions: Partitions to split the rows into (0: one per worker).
+        keep_partitions: If True, writes each partition as its own
+            ``<name>_<kind>.part-NNN.tsv`` rather than concatenating them.
+        segments_dir: Where per-artifact segments are kept between merges.
+        index: The onto_stats index, by acronym, for artifact versions.
+        dangling: What to do with a dangling edge: ``report`` it only, ``drop``
+            it, or keep it and add a ``stub`` node for each missing end.
+
+    Returns:
+        Counts: artifacts merged, the acronyms of any that could not be read
+        through (``unreadable``), input and output nodes and edges, dangling
+        edges and stub nodes, and with ``segments_dir`` the segments rebuilt
+        and reused.
+    """
+    if dangling not in DANGLING_MODES:
+        raise ValueError(f"dangling must be one of {', '.join(DANGLING_MODES)}, not {dangling!r}")
+    workers = workers or os.cpu_count() or 1
+    partitions = partitions or workers
+    os.makedirs(output_dir, exist_ok=True)
+    stats: Dict[str, Any] = {"artifacts": len(artifacts), "partitions": partitions}
+    with tempfile.TemporaryDirectory(prefix="merge-", dir=tmp_dir or output_dir) as tmp:
+        with ExitStack() as stack:
+            pool = None
+            if partitions > 1 or segments_dir:
+                pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            if segments_dir:
+                segments = _update_segments(
+                    pool, artifacts, segments_dir, index, partitions, run_rows, stats
+                )
+            elif pool is None:
+                segment, stats["unreadable"] = _read_serial(artifacts, tmp, run_rows)
+                segments = [segment]
+            else:
+                scattered = list(pool.map(
+                    _scatter, artifacts,
+                    [os.path.join(tmp, f"{i:06d}") for i in range(len(artifacts))],
+                    repeat(partitions), repeat(run_rows),
+                ))
+                segments = [segment for segment, _ in scattered]
+                stats["unreadable"] = [
+                    _acronym(path) for path, (_, error) in zip(artifacts, scattered) if error
+                ]
+            paths = _merge_segments(
+                pool, segments, output_dir, name, fan_in, run_rows, tmp, stats, partitions,
+                keep_partitions, dangling,
+            )
+
+    if compress:
+        with tarfile.open(os.path.join(output_dir, f"{name}.tar.gz"), "w:gz") as tar:
+            for path in paths:
+                tar.add(path, arcname=os.path.basename(path))
+        for path in paths:
+            os.remove(path)
+
+    return stats
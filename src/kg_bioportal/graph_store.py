@@ -0,0 +1,393 @@
+"""A local SQLite store of transformed artifacts, for lookups without a scan.
+
+Answering "what is MONDO:0005015 called?" or "what is it a subclass of?" from
+the artifacts means unpacking a tarball and reading a TSV top to bottom.
+``load_store`` loads them once into an SQLite database instead:
+
+    nodes   (id, ontology) -> name, category and the other columns, as JSON
+    edges   subject, predicate, object, ontology, id and the other columns
+
+indexed by node id, by subject, by object and by predicate, so a lookup is a
+B-tree descent or two. Every ontology keeps its own copy of a node, as its
+artifact has it; ``GraphStore.node`` folds them together the way the merge does
+(see graph_merge.merge_rows).
+
+Loading is parallel per artifact: each worker streams an artifact's rows into
+a scratch database of its own, in batches, and the store copies it in with a
+single INSERT ... SELECT, which SQLite runs without any Python in the loop. A
+new store is filled before its indexes are built. The store remembers each
+artifact's version, as the merge's segments do, so loading again reads only
+the artifacts that changed and drops the ones no longer selected. An artifact
+that can't be read is reported and skipped, keeping whatever the store
+already had of it.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import tarfile
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+
+from kg_bioportal.config import STORE_BATCH_ROWS, STORE_WORKERS
+from kg_bioportal.graph_merge import artifact_version, iter_artifact, merge_rows
+
+STORE_NAME = "kg_store.db"
+
+# Bumped if the schema changes; a store of another format is rebuilt.
+STORE_FORMAT = "1"
+
+# Columns stored as columns; any others go in props, as JSON.
+NODE_COLUMNS = ("id", "name", "category")
+EDGE_COLUMNS = ("subject", "predicate", "object", "id")
+
+DIRECTIONS = ("out", "in", "both")
+
+# Read-only stores are memory-mapped up to this many bytes, which saves a copy
+# per page read.
+_MMAP_BYTES = 1 << 30
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE ontologies (
+    id INTEGER PRIMARY KEY, acronym TEXT UNIQUE NOT NULL, version TEXT,
+    nodes INTEGER, edges INTEGER
+);
+CREATE TABLE nodes (
+    id TEXT NOT NULL, ontology INTEGER NOT NULL, name TEXT, category TEXT, props TEXT,
+    PRIMARY KEY (id, ontology)
+) WITHOUT ROWID;
+CREATE TABLE edges (
+    subject TEXT NOT NULL, predicate TEXT NOT NULL, object TEXT NOT NULL,
+    ontology INTEGER NOT NULL, id TEXT, props TEXT
+);
+"""
+
+_INDEXES = {
+    "nodes_by_ontology": "nodes (ontology)",
+    "edges_by_subject": "edges (subject, predicate)",
+    "edges_by_object": "edges (object, predicate)",
+    "edges_by_predicate": "edges (predicate)",
+    "edges_by_ontology": "edges (ontology)",
+}
+
+_SCRATCH_SCHEMA = """
+CREATE TABLE nodes (id TEXT, name TEXT, category TEXT, props TEXT);
+CREATE TABLE edges (subject TEXT, predicate TEXT, object TEXT, id TEXT, props TEXT);
+"""
+
+_SCRATCH_INSERT = {
+    "nodes": "INSERT INTO nodes VALUES (?, ?, ?, ?)",
+    "edges": "INSERT INTO edges VALUES (?, ?, ?, ?, ?)",
+}
+
+
+def _acronym(path: str) -> str:
+    return os.path.basename(path)[: -len(".tar.gz")]
+
+
+def _split(row: Dict[str, str], columns: Sequence[str]) -> tuple:
+    """A row's stored columns, then the rest of it as JSON (or None)."""
+    values = [row.pop(column, None) for column in columns]
+    return (*values, json.dumps(row, separators=(",", ":")) if row else None)
+
+
+def _read_artifact(path: str, scratch: str, batch_rows: int) -> Dict[str, int]:
+    """Stream an artifact's rows into a new scratch database; count them.
+
+    Rows with no id (nodes) or without all of subject, predicate and object
+    (edges) are left out.
+    """
+    con = sqlite3.connect(scratch)
+    con.execute("PRAGMA journal_mode = OFF")
+    con.execute("PRAGMA synchronous = OFF")
+    con.executescript(_SCRATCH_SCHEMA)
+    counts = {"nodes": 0, "edges": 0}
+    batches: Dict[str, list] = {"nodes": [], "edges": []}
+    for kind, row in iter_artifact(path):
+        if kind == "nodes":
+            if not row.get("id"):
+                continue
+            batches[kind].append(_split(row, NODE_COLUMNS))
+        else:
+            if not (row.get("subject") and row.get("predicate") and row.get("object")):
+                continue
+            batches[kind].append(_split(row, EDGE_COLUMNS))
+        if len(batches[kind]) >= batch_rows:
+            con.executemany(_SCRATCH_INSERT[kind], batches[kind])
+            counts[kind] += len(batches[kind])
+            batches[kind] = []
+    for kind, batch in batches.items():
+        con.executemany(_SCRATCH_INSERT[kind], batch)
+        counts[kind] += len(batch)
+    con.commit()
+    con.close()
+    return counts
+
+
+def _open_store(path: str) -> sqlite3.Connection:
+    """The store at ``path``, or a new one if it is missing or of another format."""
+    if os.path.exists(path):
+        con = sqlite3.connect(path)
+        try:
+            (version,) = con.execute("SELECT value FROM meta WHERE key = 'format'").fetchone()
+        except (sqlite3.DatabaseError, TypeError):
+            version = None
+        if version == STORE_FORMAT:
+            return con
+        con.close()
+        os.remove(path)
+    con = sqlite3.connect(path)
+    con.executescript(_SCHEMA)
+    with con:
+        con.execute("INSERT INTO meta VALUES ('format', ?)", (STORE_FORMAT,))
+    return con
+
+
+def _forget(con: sqlite3.Connection, ontology: int) -> None:
+    con.execute("DELETE FROM nodes WHERE ontology = ?", (ontology,))
+    con.execute("DELETE FROM edges WHERE ontology = ?", (ontology,))
+
+
+def _copy_in(
+    con: sqlite3.Connection, acronym: str, version: str, scratch: str, counts: Dict[str, int]
+) -> None:
+    """Replace an ontology's rows in the store with a scratch database's."""
+    con.execute("ATTACH DATABASE ? AS scratch", (scratch,))
+    with con:
+        con.execute("INSERT OR IGNORE INTO ontologies (acronym) VALUES (?)", (acronym,))
+        (ontology,) = con.execute(
+            "SELECT id FROM ontologies WHERE acronym = ?", (acronym,)
+        ).fetchone()
+        _forget(con, ontology)
+        # A repeated node id keeps its first row, as the transform wrote it.
+        con.execute(
+            "INSERT OR IGNORE INTO nodes SELECT id, ?, name, category, props FROM scratch.nodes",
+            (ontology,),
+        )
+        con.execute(
+            "INSERT INTO edges SELECT subject, predicate, object, ?, id, props FROM scratch.edges",
+            (ontology,),
+        )
+        con.execute(
+            "UPDATE ontologies SET version = ?, nodes = ?, edges = ? WHERE id = ?",
+            (version, counts["nodes"], counts["edges"], ontology),
+        )
+    con.execute("DETACH DATABASE scratch")
+
+
+def load_store(
+    artifacts: Sequence[str],
+    store_path: str = STORE_NAME,
+    workers: int = STORE_WORKERS,
+    batch_rows: int = STORE_BATCH_ROWS,
+    index: Optional[Dict[str, dict]] = None,
+) -> dict:
+    """Load artifacts into the store, reading only those that changed.
+
+    Args:
+        artifacts: Paths of ``<ACRONYM>.tar.gz`` artifacts. The store ends up
+            holding exactly these; ontologies it held that are not among them
+            are dropped.
+        store_path: The store, created if missing.
+        workers: Artifacts read at once, in processes of their own (0: one
+            per CPU).
+        batch_rows: Rows inserted per statement while reading an artifact.
+        index: The onto_stats index, by acronym, for artifact versions (see
+            graph_merge.artifact_version).
+
+    Returns:
+        Counts: artifacts selected, loaded, reused and removed, the acronyms
+        of those that could not be read (``failed``; the store keeps their
+        previous rows and version, so the next load tries them again), and the
+        nodes and edges in the store.
+    """
+    index = index or {}
+    workers = workers or os.cpu_count() or 1
+    directory = os.path.dirname(os.path.abspath(store_path))
+    os.makedirs(directory, exist_ok=True)
+    con = _open_store(store_path)
+
+    known = {
+        acronym: (ontology, version)
+        for ontology, acronym, version in con.execute("SELECT id, acronym, version FROM ontologies")
+    }
+    todo, wanted = [], set()
+    for path in artifacts:
+        acronym = _acronym(path)
+        wanted.add(acronym)
+        version = json.dumps(artifact_version(path, index.get(acronym)), sort_keys=True)
+        if acronym not in known or known[acronym][1] != version:
+            todo.append((path, acronym, version))
+    removed = sorted(set(known) - wanted)
+    with con:
+        for acronym in removed:
+            _forget(con, known[acronym][0])
+            con.execute("DELETE FROM ontologies WHERE id = ?", (known[acronym][0],))
+
+    # Filling an empty store, it is quicker to build the indexes once at the
+    # end than to keep them up to date row by row.
+    if not known:
+        for name in _INDEXES:
+            con.execute(f"DROP INDEX IF EXISTS {name}")
+
+    failed = []
+
+    def copy_in(i: int, read) -> None:
+        path, acronym, version = todo[i]
+        try:
+            counts = read()
+        except (tarfile.TarError, EOFError, OSError) as e:
+            # Left as it was, as the merge leaves a segment it can't rebuild.
+            logging.error(f"Could not read {path}: {e}")
+            failed.append(acronym)
+            return
+        _copy_in(con, acronym, version, scratch[i], counts)
+        os.remove(scratch[i])
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="store-", dir=directory) as tmp:
+            scratch = [os.path.join(tmp, f"{i:06d}.db") for i in range(len(todo))]
+            if workers > 1 and len(todo) > 1:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    futures = {
+                        pool.submit(_read_artifact, path, scratch[i], batch_rows): i
+                        for i, (path, _, _) in enumerate(todo)
+                    }
+                    # Copied in as each is read, while the others are still going.
+                    for future in as_completed(futures):
+                        copy_in(futures[future], future.result)
+            else:
+                for i, (path, _, _) in enumerate(todo):
+                    copy_in(i, lambda: _read_artifact(path, scratch[i], batch_rows))
+    finally:
+        # Whatever happened above, the store is left indexed.
+        for name, columns in _INDEXES.items():
+            con.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {columns}")
+        # Statistics for the query planner, so it picks the narrowest index.
+        con.execute("ANALYZE")
+        con.commit()
+        (nodes, edges) = con.execute(
+            "SELECT COALESCE(SUM(nodes), 0), COALESCE(SUM(edges), 0) FROM ontologies"
+        ).fetchone()
+        con.close()
+
+    return {
+        "artifacts": len(artifacts),
+        "loaded": len(todo) - len(failed),
+        "reused": len(artifacts) - len(todo),
+        "removed": len(removed),
+        "failed": sorted(failed),
+        "nodes": nodes,
+        "edges": edges,
+    }
+
+
+class GraphStore:
+    """Lookups in a store written by ``load_store``."""
+
+    def __init__(self, path: str = STORE_NAME, check_same_thread: bool = True) -> None:
+        """Opens the store read-only.
+
+        Args:
+            path: The store to read.
+            check_same_thread: As for sqlite3.connect; False lets a pool hand
+                the connection from thread to thread, one at a time.
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self._con = sqlite3.connect(
+            f"file:{path}?mode=ro", uri=True, check_same_thread=check_same_thread
+        )
+        self._con.execute(f"PRAGMA mmap_size = {_MMAP_BYTES}")
+
+    def node(self, node_id: str) -> Optional[dict]:
+        """A node, its copies from every ontology folded into one; None if absent."""
+        rows = [
+            _row(NODE_COLUMNS, (node_id, name, category), props)
+            for name, category, props in self._con.execute(
+                "SELECT n.name, n.category, n.props FROM nodes n "
+                "JOIN ontologies o ON o.id = n.ontology WHERE n.id = ? ORDER BY o.acronym",
+                (node_id,),
+            )
+        ]
+        return merge_rows(rows) if rows else None
+
+    def edges(
+        self,
+        subject: Optional[str] = None,
+        predicate: Optional[str] = None,
+        object: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[dict]:
+        """Edges matching every one of subject, predicate and object given.
+
+        One copy per ontology that has the edge. At least one of the three
+        must be given.
+        """
+        given = (("subject", subject), ("predicate", predicate), ("object", object))
+        where = [(column, value) for column, value in given if value is not None]
+        if not where:
+            raise ValueError("Give at least one of subject, predicate and object")
+        sql = "SELECT subject, predicate, object, id, props FROM edges WHERE " + " AND ".join(
+            f"{column} = ?" for column, _ in where
+        )
+        parameters: List[Union[str, int]] = [value for _, value in where]
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+        for *values, props in self._con.execute(sql, parameters):
+            yield _row(EDGE_COLUMNS, values, props)
+
+    def neighbours(
+        self, node_id: str, predicate: Optional[str] = None, direction: str = "both"
+    ) -> List[str]:
+        """Ids of the nodes an edge joins to ``node_id``, sorted.
+
+        Args:
+            node_id: The node.
+            predicate: Only edges with this predicate.
+            direction: ``out`` (node_id is the subject), ``in`` (the object)
+                or ``both``.
+        """
+        if direction not in DIRECTIONS:
+            raise ValueError(f"direction must be one of {', '.join(DIRECTIONS)}, not {direction!r}")
+        queries, parameters = [], []
+        for near, far, wanted in (("subject", "object", "out"), ("object", "subject", "in")):
+            if direction in (wanted, "both"):
+                sql = f"SELECT {far} FROM edges WHERE {near} = ?"
+                parameters.append(node_id)
+                if predicate is not None:
+                    sql += " AND predicate = ?"
+                    parameters.append(predicate)
+                queries.append(sql)
+        sql = " UNION ".join(queries) + " ORDER BY 1"
+        return [neighbour for (neighbour,) in self._con.execute(sql, parameters)]
+
+    def ontologies(self) -> Dict[str, dict]:
+        """Node and edge counts of each ontology in the store, by acronym."""
+        return {
+            acronym: {"nodes": nodes, "edges": edges}
+            for acronym, nodes, edges in self._con.execute(
+                "SELECT acronym, nodes, edges FROM ontologies ORDER BY acronym"
+            )
+        }
+
+    def close(self) -> None:
+        self._con.close()
+
+    def __enter__(self) -> "GraphStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _row(columns: Sequence[str], values: Sequence[Optional[str]], props: Optional[str]) -> dict:
+    """A stored row back as a KGX row, without the empty values."""
+    row = {column: value for column, value in zip(columns, values) if value}
+    if props:
+        row.update(json.loads(props))
+    return row
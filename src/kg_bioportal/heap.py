@@ -0,0 +1,129 @@
+"""Sizing ROBOT's Java heap per call, and sharing memory among concurrent calls.
+
+ROBOT reserves its whole -Xmx whether the ontology needs it or not, so one
+global -Xmx12g makes a 50 KB ontology cost as much memory as a 90 MB one, and
+a machine fits only as many ROBOT runs as it has twelves of gigabytes. Heap
+needs scale roughly with the source, so each call is given a heap in
+proportion to it, between a floor and the configured -Xmx as the ceiling.
+
+The proportion starts at ``ROBOT_HEAP_MULTIPLIER``. A call that runs out of
+heap is retried at the ceiling and the index records what it ran out at, so
+later runs can raise the multiplier to fit (``learn_multiplier``). Across the
+worker processes of a local pipeline, a ``HeapBudget`` keeps the heaps in use
+at once within the machine's memory: several small ontologies run side by
+side while a big one waits for room.
+"""
+
+import math
+import multiprocessing
+import re
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from kg_bioportal.config import ROBOT_HEAP_FLOOR_GB, ROBOT_HEAP_MULTIPLIER
+
+_XMX = re.compile(r"-Xmx(\d+(?:\.\d+)?)([kKmMgGtT]?)")
+
+# A learned multiplier leaves this much headroom over what ran out.
+_LEARNED_HEADROOM = 1.5
+
+
+def xmx_gb(java_args: str) -> float:
+    """The -Xmx in a JVM argument string, in GB (0 if it sets none)."""
+    match = _XMX.search(java_args)
+    if not match:
+        return 0.0
+    scale = {"": 1 / 1024 ** 3, "k": 1 / 1024 ** 2, "m": 1 / 1024, "g": 1, "t": 1024}
+    return float(match.group(1)) * scale[match.group(2).lower()]
+
+
+def with_heap(java_args: str, heap_gb: float) -> str:
+    """``java_args`` with its -Xmx (added if it has none) set to ``heap_gb``."""
+    xmx = f"-Xmx{max(1, int(round(heap_gb * 1024)))}m"
+    if _XMX.search(java_args):
+        return _XMX.sub(xmx, java_args, count=1)
+    return f"{xmx} {java_args}".strip()
+
+
+def heap_for_source(
+    source_bytes: int,
+    ceiling_gb: float,
+    multiplier: float = ROBOT_HEAP_MULTIPLIER,
+    floor_gb: float = ROBOT_HEAP_FLOOR_GB,
+) -> float:
+    """The heap, in GB, for a ROBOT call on a source of ``source_bytes``.
+
+    ``multiplier`` times the source, rounded up to a quarter GB and kept
+    between ``floor_gb`` and ``ceiling_gb``. A multiplier of 0 means no sizing:
+    the ceiling.
+    """
+    if not multiplier:
+        return ceiling_gb
+    wanted = math.ceil(multiplier * source_bytes / 1024 ** 3 * 4) / 4
+    return min(ceiling_gb, max(floor_gb, wanted))
+
+
+def learn_multiplier(
+    index: Optional[Dict[str, dict]], default: float = ROBOT_HEAP_MULTIPLIER
+) -> float:
+    """The heap multiplier, raised to fit the index's out-of-heap records.
+
+    Each entry with ``oom_heap_gb`` and ``oom_source_mb`` ran out of heap at
+    that size for that source, so the multiplier should have been larger than
+    their ratio. The median ratio, with headroom, is taken over all of them --
+    the median so one odd ontology can't inflate every other's heap. The
+    multiplier is never learned below ``default``, and 0 stays off.
+    """
+    if not default:
+        return default
+    ratios = sorted(
+        e["oom_heap_gb"] * 1024 / e["oom_source_mb"]
+        for e in (index or {}).values()
+        if e.get("oom_heap_gb") and e.get("oom_source_mb")
+    )
+    if not ratios:
+        return default
+    return max(default, round(_LEARNED_HEADROOM * ratios[len(ratios) // 2], 1))
+
+
+class HeapBudget:
+    """Gigabytes of heap shared among ROBOT calls in any number of processes.
+
+    Create it before the worker processes (it is inherited, like a lock) and
+    hold a reservation for as long as a call's heap may be in use.
+    """
+
+    def __init__(self, total_gb: float, context=None) -> None:
+        """Initializes the budget.
+
+        Args:
+            total_gb: Heap the calls may hold between them.
+            context: The multiprocessing context the workers are started in.
+        """
+        context = context or multiprocessing.get_context()
+        self.total_gb = total_gb
+        self._used = context.Value("d", 0.0, lock=False)
+        self._changed = context.Condition()
+
+    @property
+    def used_gb(self) -> float:
+        """Heap reserved right now."""
+        return self._used.value
+
+    @contextmanager
+    def reserve(self, gb: float) -> Iterator[None]:
+        """Hold ``gb`` of the budget, waiting until it is free.
+
+        A reservation bigger than the whole budget waits only for everyone
+        else to finish, then runs alone -- room for it would never come.
+        """
+        with self._changed:
+            while self._used.value and self._used.value + gb > self.total_gb:
+                self._changed.wait()
+            self._used.value += gb
+        try:
+            yield
+        finally:
+            with self._changed:
+                self._used.value -= gb
+                self._changed.notify_all()
@@ -0,0 +1,630 @@
+"""The cross-release index: onto_stats.yaml, graph_urls.tsv and total_stats.yaml.
+
+A build transforms some subset of the ontologies and leaves an onto_stats.yaml
+fragment per shard (or per ontology, for a local ``pipeline`` run). Merging
+them over the previous index gives the new one. Each OK entry's download_url
+points at whichever release holds that ontology's most recent artifact. There
+is no release that holds them all -- GitHub caps a release at 1000 assets and
+there are more transformed ontologies than that -- so resolving through the
+index is the only way to find an artifact. graph_urls.tsv is that same mapping
+in a form a shell can read without a YAML parser.
+
+The YAML is the published, human-readable form, and parsing all 1100+ entries
+of it is slow. So an SQLite companion, onto_stats.db, is written beside it:
+one row per ontology, keyed by acronym, holding the entry as JSON (with the
+dates YAML has and JSON lacks tagged, so they read back as dates). It records
+the SHA-256 of the YAML it was written with, and readers use it only while
+that still matches -- an edited or replaced YAML is never shadowed by a stale
+companion. A process hashes a YAML once and again only when its size or
+modification time changes, so repeated lookups cost a stat and a keyed read.
+Without a valid companion, readers fall back to the YAML, through libyaml's C
+loader where it is available.
+
+The merge is a k-way merge of streams sorted by acronym -- the skiplisted
+giants, the previous index, then each fragment, later streams winning a tie --
+so it never builds a second copy of the index to sort. Fragments are parsed in
+parallel, each one whole, since it has to be sorted; the merged entries then
+stream through the YAML, its companion, graph_urls.tsv and the totals in a
+single pass, and none of them is kept once written.
+
+The merge also keeps each failing ontology's retry history: ``failed_attempts``
+(runs in a row it has failed for a retryable reason, under the same
+submission) and ``runs_since_attempt`` (merges since it was last tried). Its
+``reason`` and ``duration_sec`` are those of the last attempt. version-skip
+uses them to back off from ontologies that keep failing (see ``retry_due``).
+
+Depends only on PyYAML and config, so .github/scripts/merge_stats.py can run it
+from a checkout without the package's heavy dependencies installed.
+"""
+
+import datetime
+import glob
+import hashlib
+import heapq
+import json
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby, islice, repeat
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import yaml
+
+from kg_bioportal.config import (
+    KNOWN_GIANTS,
+    LICENSE_RESTRICTED_REASON,
+    RETRY_BACKOFF_MAX_RUNS,
+    RETRY_BACKOFF_REASONS,
+)
+
+RELEASE_DOWNLOAD_URL = "https://github.com/ncbo/kg-bioportal/releases/download"
+
+# Where the files published on every release can always be found (see README).
+LATEST_DOWNLOAD_URL = "https://github.com/ncbo/kg-bioportal/releases/latest/download"
+GRAPH_URLS_NAME = "graph_urls.tsv"
+
+# libyaml's loader is an order of magnitude faster than the pure-Python one and
+# accepts the same documents; PyYAML only has it when built against libyaml.
+_YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# libyaml's emitter writes the same bytes as the pure-Python one for any entry
+# whose strings are all printable ASCII, and several times faster. It folds
+# long double-quoted scalars (escapes, non-ASCII) at different points, though,
+# so entries with anything else in them still go through the Python emitter --
+# onto_stats.yaml must not churn just because of which emitter wrote it.
+_YamlCDumper = getattr(yaml, "CSafeDumper", None)
+_PLAIN_ASCII = re.compile(r"[\x20-\x7e]*\Z")
+
+# Entries per yaml.dump call (and per companion insert) when writing the index.
+_WRITE_BATCH = 1000
+
+# Fewer fragments than this are parsed in-process: forking a pool costs more
+# than it saves on a handful of shard fragments.
+_PARALLEL_MIN_FRAGMENTS = 8
+
+# Bumped if the companion's schema changes; a mismatch means "not valid".
+INDEX_DB_FORMAT = "2"
+
+# How the companion's JSON tags the dates an entry can hold; datetime first,
+# as it is also a date.
+_JSON_DATES = (("$datetime", datetime.datetime), ("$date", datetime.date))
+
+# Absolute YAML path -> ((mtime_ns, size), SHA-256) for this process.
+_yaml_digests: Dict[str, Tuple[Tuple[int, int], str]] = {}
+
+
+def asset_url(tag: str, onto_id: str) -> str:
+    """URL of an ontology's artifact in the release tagged ``tag``."""
+    return f"{RELEASE_DOWNLOAD_URL}/{tag}/{onto_id}.tar.gz"
+
+
+def load_yaml(path: str):
+    """Parse a YAML file with the fastest safe loader available."""
+    with open(path) as f:
+        return yaml.load(f, Loader=_YamlLoader)
+
+
+def index_db_path(yaml_path: str) -> str:
+    """The companion of an index YAML: onto_stats.yaml -> onto_stats.db."""
+    return os.path.splitext(yaml_path)[0] + ".db"
+
+
+def file_sha256(path: str) -> str:
+    """The SHA-256 of a file's contents, as hex."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _yaml_sha256(path: str) -> str:
+    """``file_sha256`` of an index YAML, remembered while it looks unchanged.
+
+    An edit that kept both the size and the modification time would go
+    unnoticed, which is what it takes to hash each YAML once per process.
+    """
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    key = os.path.abspath(path)
+    cached = _yaml_digests.get(key)
+    if cached is None or cached[0] != stamp:
+        cached = _yaml_digests[key] = (stamp, file_sha256(path))
+    return cached[1]
+
+
+def _json_default(value):
+    for tag, kind in _JSON_DATES:
+        if isinstance(value, kind):
+            return {tag: value.isoformat()}
+    raise TypeError(f"Can't store a {type(value).__name__} in the index companion")
+
+
+def _json_object(obj: dict):
+    if len(obj) == 1:
+        for tag, kind in _JSON_DATES:
+            if tag in obj:
+                return kind.fromisoformat(obj[tag])
+    return obj
+
+
+def _entry_json(entry: dict) -> str:
+    """An entry as the companion stores it."""
+    return json.dumps(entry, default=_json_default)
+
+
+def _entry_from_json(text: str) -> dict:
+    """An entry from the companion, with the types the YAML gives it."""
+    return json.loads(text, object_hook=_json_object)
+
+
+def _by_id(entry: dict) -> str:
+    return entry["id"]
+
+
+def _c_dumpable(entry: dict) -> bool:
+    """True if libyaml would emit this (flat) entry exactly as PyYAML does."""
+    for key, value in entry.items():
+        if isinstance(value, (dict, list, tuple)):
+            return False
+        for text in (key, value):
+            if isinstance(text, str) and not _PLAIN_ASCII.match(text):
+                return False
+    return True
+
+
+def _dump_entries(entries: List[dict]) -> str:
+    """Entries as the items of a block sequence, exactly as yaml.dump writes
+    them under ``ontologies:`` (PyYAML does not indent a sequence in a map)."""
+    if _YamlCDumper is None:
+        return yaml.dump(entries, sort_keys=False)
+    parts = []
+    for fast, run in groupby(entries, key=_c_dumpable):
+        parts.append(yaml.dump(list(run), Dumper=_YamlCDumper if fast else yaml.Dumper,
+                               sort_keys=False))
+    return "".join(parts)
+
+
+def write_index(entries: Iterable[dict], yaml_path: str) -> int:
+    """Write an index YAML and its SQLite companion in one pass.
+
+    The YAML is byte-for-byte what ``yaml.dump({"ontologies": [...]},
+    sort_keys=False)`` would write, but is emitted in batches as ``entries``
+    is consumed, hashing it on the way for the companion's ``yaml_sha256``. The
+    companion is built under a temporary name and renamed into place once that
+    hash is in it, so a reader never opens a half-written database.
+
+    Args:
+        entries: The entries, in the order the YAML should list them; may be
+            a generator.
+        yaml_path: Where to write the YAML. The companion goes beside it.
+
+    Returns:
+        How many entries were written.
+    """
+    db_path = index_db_path(yaml_path)
+    tmp_path = db_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    written = 0
+    digest = hashlib.sha256()
+    con = sqlite3.connect(tmp_path)
+    try:
+        con.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        con.execute(
+            "CREATE TABLE ontologies (id TEXT PRIMARY KEY, position INTEGER NOT NULL, "
+            "entry TEXT NOT NULL)"
+        )
+        with open(yaml_path, "wb") as f:
+
+            def emit(text: str) -> None:
+                data = text.encode("utf-8")
+                f.write(data)
+                digest.update(data)
+
+            entries = iter(entries)
+            while True:
+                batch = list(islice(entries, _WRITE_BATCH))
+                if not batch:
+                    break
+                emit(("" if written else "ontologies:\n") + _dump_entries(batch))
+                con.executemany(
+                    "INSERT INTO ontologies VALUES (?, ?, ?)",
+                    (
+                        (entry["id"], position, _entry_json(entry))
+                        for position, entry in enumerate(batch, start=written)
+                    ),
+                )
+                written += len(batch)
+            if not written:
+                emit("ontologies: []\n")
+        con.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            [("format", INDEX_DB_FORMAT), ("yaml_sha256", digest.hexdigest())],
+        )
+        con.commit()
+    finally:
+        con.close()
+    os.replace(tmp_path, db_path)
+    stat = os.stat(yaml_path)
+    _yaml_digests[os.path.abspath(yaml_path)] = (
+        (stat.st_mtime_ns, stat.st_size), digest.hexdigest()
+    )
+    return written
+
+
+def _open_index_db(yaml_path: str) -> Optional[sqlite3.Connection]:
+    """A read-only connection to a YAML's companion, if it has a valid one."""
+    db_path = index_db_path(yaml_path)
+    if not os.path.exists(db_path):
+        return None
+    try:
+        con = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        meta = dict(con.execute("SELECT key, value FROM meta"))
+    except sqlite3.Error:
+        return None
+    if meta.get("format") != INDEX_DB_FORMAT or meta.get("yaml_sha256") != _yaml_sha256(yaml_path):
+        con.close()
+        return None
+    return con
+
+
+def read_index(path: str) -> Dict[str, dict]:
+    """Read {acronym: entry} from an onto_stats.yaml ({} if there is none).
+
+    Reads the SQLite companion instead when it is valid for this YAML.
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    con = _open_index_db(path)
+    if con is not None:
+        try:
+            rows = con.execute("SELECT id, entry FROM ontologies ORDER BY position").fetchall()
+        finally:
+            con.close()
+        return {onto_id: _entry_from_json(entry) for onto_id, entry in rows}
+    data = load_yaml(path) or {}
+    return {entry["id"]: entry for entry in data.get("ontologies", [])}
+
+
+def read_graph_urls(path: str) -> Dict[str, str]:
+    """Read {acronym: download_url} from a graph_urls.tsv."""
+    urls = {}
+    with open(path) as f:
+        f.readline()
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) >= 2 and fields[0] and fields[1]:
+                urls[fields[0]] = fields[1]
+    return urls
+
+
+def _index_stream(path: str) -> Tuple[int, Iterator[dict]]:
+    """An index's entry count, and its entries in acronym order.
+
+    Straight off the companion's primary key when it is valid, so the previous
+    index is never held in memory twice; otherwise the parsed YAML, sorted.
+    """
+    con = _open_index_db(path)
+    if con is None:
+        entries = sorted(read_index(path).values(), key=_by_id)
+        return len(entries), iter(entries)
+    (count,) = con.execute("SELECT COUNT(*) FROM ontologies").fetchone()
+
+    def stream():
+        try:
+            for (entry,) in con.execute("SELECT entry FROM ontologies ORDER BY id"):
+                yield _entry_from_json(entry)
+        finally:
+            con.close()
+
+    return count, stream()
+
+
+def lookup(path: str, acronym: str) -> Optional[dict]:
+    """One ontology's entry in an index, or None.
+
+    A single keyed read when the companion is valid; otherwise the whole YAML
+    has to be parsed to find it. Checking the companion is valid hashes the
+    YAML the first time this process sees it (or sees it changed) and costs a
+    stat after that.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    con = _open_index_db(path)
+    if con is None:
+        return read_index(path).get(acronym)
+    try:
+        row = con.execute("SELECT entry FROM ontologies WHERE id = ?", (acronym,)).fetchone()
+    finally:
+        con.close()
+    return _entry_from_json(row[0]) if row else None
+
+
+def content_unchanged(entry: Optional[dict], sha256: str = "", etag: str = "") -> bool:
+    """True if ``entry``'s published graph was built from this very source.
+
+    BioPortal often issues a new submission with the same file behind it, and
+    rebuilding that would only spend a runner and a release asset on the same
+    graph. The index records each OK graph's source digest (``source_sha256``)
+    and, where the server sent one, its ``source_etag``; either matching is
+    enough. Only a real, published graph qualifies: a failed or snippet
+    entry, or one without a download_url, has nothing to carry forward.
+    """
+    if not entry or entry.get("status") != "OK" or entry.get("snippet"):
+        return False
+    if not entry.get("download_url"):
+        return False
+    return bool(
+        (sha256 and entry.get("source_sha256") == sha256)
+        or (etag and entry.get("source_etag") == etag)
+    )
+
+
+def carry_forward(entry: dict, report_row: dict) -> dict:
+    """The entry for a new submission whose source is the one already built.
+
+    Everything about the graph -- counts, digests, download_url -- stays; what
+    BioPortal says about the submission is updated, so the next version-skip
+    compares against the new one. ``carried_forward`` tells the merge to keep
+    the download_url rather than point it at this run's release, which holds
+    no artifact for it; the merge drops the flag once it has done so.
+    """
+    carried = {k: v for k, v in entry.items() if k != "id"}
+    for field in ("name", "version", "submission_id"):
+        if report_row.get(field):
+            carried[field] = report_row[field]
+    carried["carried_forward"] = True
+    return carried
+
+
+def backoff_runs(failed_attempts: int) -> int:
+    """Runs to wait between retries after ``failed_attempts`` failures in a row."""
+    return min(2 ** max(failed_attempts - 1, 0), RETRY_BACKOFF_MAX_RUNS)
+
+
+def retry_due(entry: dict, force: bool = False) -> bool:
+    """True if a failed entry is due another try under its current submission.
+
+    Only failures that may be transient (``RETRY_BACKOFF_REASONS``) are ever
+    retried without a new submission. An entry written before the history was
+    kept counts as one failure, last tried one run ago.
+
+    Args:
+        entry: The ontology's index entry.
+        force: Ignore the backoff (but not the reason).
+    """
+    if entry.get("status") == "OK" or entry.get("reason") not in RETRY_BACKOFF_REASONS:
+        return False
+    if force:
+        return True
+    waited = int(entry.get("runs_since_attempt", 0)) + 1
+    return waited >= backoff_runs(int(entry.get("failed_attempts", 1)))
+
+
+def _with_history(entry: dict, previous: Optional[dict], fresh: bool) -> dict:
+    """Bring an entry's retry history up to date for this merge.
+
+    Args:
+        entry: The entry the merge settled on.
+        previous: The ontology's entry in the previous index, if any.
+        fresh: Whether ``entry`` comes from this build rather than the seed.
+    """
+    if not fresh:
+        # Not attempted this run: one more run waited.
+        if "failed_attempts" in entry:
+            entry["runs_since_attempt"] = int(entry.get("runs_since_attempt", 0)) + 1
+        return entry
+    entry.pop("failed_attempts", None)
+    entry.pop("runs_since_attempt", None)
+    if entry.get("status") == "OK" or entry.get("reason") not in RETRY_BACKOFF_REASONS:
+        return entry
+    attempts = 1
+    if (
+        previous
+        and previous.get("status") != "OK"
+        and str(previous.get("submission_id")) == str(entry.get("submission_id"))
+    ):
+        attempts = int(previous.get("failed_attempts", 1)) + 1
+    entry["failed_attempts"] = attempts
+    entry["runs_since_attempt"] = 0
+    return entry
+
+
+def skiplist_entry(acronym: str) -> dict:
+    """The entry for a known giant, which no shard ever reports."""
+    return {
+        "id": acronym,
+        "status": "Skipped",
+        "reason": "skiplist",
+        "name": "",
+        "version": "",
+        "nodecount": 0,
+        "edgecount": 0,
+        "submission_id": "NA",
+        "source_bytes": 0,
+    }
+
+
+def _load_fragment(path: str, release_tag: str) -> List[dict]:
+    """One fragment's entries with their download_url set, sorted by acronym."""
+    data = load_yaml(path) or {}
+    entries = data.get("ontologies", [])
+    for entry in entries:
+        # An unchanged source's graph stays in whichever release it was built in.
+        if entry.pop("carried_forward", False) and entry.get("download_url"):
+            continue
+        # This run's OK graphs live in this run's release; record where.
+        if entry.get("status") == "OK" and release_tag:
+            entry["download_url"] = asset_url(release_tag, entry["id"])
+        else:
+            entry.pop("download_url", None)  # no artifact for non-OK
+    # Stable, so a fragment that lists an acronym twice keeps the later one last.
+    return sorted(entries, key=_by_id)
+
+
+def _load_fragments(paths: List[str], release_tag: str, workers: int) -> List[List[dict]]:
+    """Parse fragments, in parallel if there are enough to be worth it."""
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    if workers < 2 or len(paths) < _PARALLEL_MIN_FRAGMENTS:
+        return [_load_fragment(path, release_tag) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunksize = max(1, len(paths) // (workers * 4))
+        return list(pool.map(_load_fragment, paths, repeat(release_tag), chunksize=chunksize))
+
+
+def _drain(entries: List[dict]) -> Iterator[dict]:
+    """A list's items in order, each let go of as soon as it is taken."""
+    entries.reverse()
+    while entries:
+        yield entries.pop()
+
+
+def _tagged(entries: Iterable[dict], fresh: bool) -> Iterator[Tuple[dict, bool]]:
+    return ((entry, fresh) for entry in entries)
+
+
+def _tag_id(tagged: Tuple[dict, bool]) -> str:
+    return tagged[0]["id"]
+
+
+def _last_per_id(
+    seed: List[Iterable[dict]], fresh: List[Iterable[dict]]
+) -> Iterator[dict]:
+    """k-way merge of acronym-sorted streams, keeping each acronym's last entry.
+
+    heapq.merge is stable, so among entries with the same acronym the ones
+    from later streams come out later -- and the last one is kept, with its
+    retry history updated from the last of the ``seed`` streams' entries.
+    """
+    streams = [_tagged(s, False) for s in seed] + [_tagged(s, True) for s in fresh]
+    for _, group in groupby(heapq.merge(*streams, key=_tag_id), key=_tag_id):
+        previous = None
+        for entry, is_fresh in group:
+            if not is_fresh:
+                previous = entry
+        yield _with_history(entry, previous, is_fresh)
+
+
+def _count_into(totals: dict, entry: dict) -> None:
+    """Add one merged entry to counts like those ``index_totals`` returns."""
+    licensed = entry.get("reason") == LICENSE_RESTRICTED_REASON
+    status = entry.get("status")
+    totals["totalcount"] += status == "OK"
+    totals["skippedcount"] += status == "Skipped"
+    totals["failedcount"] += (status == "Failed") - licensed
+    totals["licensedcount"] += licensed
+    totals["totalnodecount"] += entry.get("nodecount", 0)
+    totals["totaledgecount"] += entry.get("edgecount", 0)
+
+
+def index_totals(ontologies: Iterable[dict]) -> dict:
+    """The counts in total_stats.yaml, over merged index entries, in one pass.
+
+    License-restricted entries stay status Failed (no artifact exists) but are
+    counted separately and excluded from failedcount -- see
+    ``transformer.summarize``.
+    """
+    totals = dict.fromkeys(
+        ("totalcount", "skippedcount", "failedcount", "licensedcount",
+         "totalnodecount", "totaledgecount"),
+        0,
+    )
+    for entry in ontologies:
+        _count_into(totals, entry)
+    return totals
+
+
+def merge_stats(
+    fragments_dir: str,
+    output_dir: str,
+    transform_date: str = "",
+    base_path: str = "",
+    release_tag: str = "",
+    report: Callable[[str], None] = print,
+    fragments: Optional[List[str]] = None,
+    workers: int = 0,
+) -> dict:
+    """Merge a build's onto_stats.yaml fragments into the index, and write it out.
+
+    Each merged entry goes into onto_stats.yaml, its companion, graph_urls.tsv
+    and the totals as it comes out of the merge, so the merged index is never
+    held in memory; read it back with ``read_index``.
+
+    Args:
+        fragments_dir: Searched recursively for onto_stats.yaml fragments.
+        output_dir: Where onto_stats.yaml (and its onto_stats.db companion),
+            graph_urls.tsv and total_stats.yaml go.
+        transform_date: Site-wide transform date, written to total_stats.yaml.
+        base_path: The previous index to seed from, so entries this build
+            didn't touch (and the download_urls of their artifacts) carry over.
+        release_tag: This build's release. Its OK entries get a download_url
+            pointing there; its other entries lose any they had.
+        report: Called with each progress line.
+        fragments: The fragment files to merge, instead of every one found
+            under ``fragments_dir``.
+        workers: Processes to parse fragments with (0: one per core).
+
+    Returns:
+        The counts written to total_stats.yaml.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Lowest precedence first: the skiplisted giants (removed before sharding,
+    # so no shard reports them) only fill a gap; the existing stats
+    # (incremental / targeted re-runs) are overridden by this run's fragments.
+    streams: List[Iterable[dict]] = [[skiplist_entry(acr) for acr in sorted(KNOWN_GIANTS)]]
+    if base_path and os.path.exists(base_path):
+        seeded, seed = _index_stream(base_path)
+        streams.append(seed)
+        report(f"Seeded {seeded} entries from existing {base_path}.")
+
+    if fragments is None:
+        fragments = glob.glob(os.path.join(fragments_dir, "**", "onto_stats.yaml"), recursive=True)
+    fragment_files = sorted(fragments)
+    parsed = _load_fragments(fragment_files, release_tag, workers)
+    fragment_entries = sum(map(len, parsed))
+
+    totals = index_totals(())
+    resolvable = 0
+    missing = []
+    # Shell-readable resolver: acronym -> the release that actually holds its
+    # artifact. Published on every release so `latest/download/graph_urls.tsv`
+    # is a stable entry point even though `latest/download/<ACRONYM>.tar.gz`
+    # cannot be (no single release can hold every artifact).
+    with open(os.path.join(output_dir, GRAPH_URLS_NAME), "w") as urls:
+        urls.write("id\tdownload_url\n")
+
+        def tee(entries: Iterator[dict]) -> Iterator[dict]:
+            nonlocal resolvable
+            for o in entries:
+                _count_into(totals, o)
+                if o.get("status") == "OK" and o.get("download_url"):
+                    urls.write(f"{o['id']}\t{o['download_url']}\n")
+                    resolvable += 1
+                elif o.get("status") == "OK":
+                    missing.append(o["id"])
+                yield o
+
+        merged = _last_per_id(streams, [_drain(entries) for entries in parsed])
+        count = write_index(tee(merged), os.path.join(output_dir, "onto_stats.yaml"))
+    report(
+        f"Merged {len(fragment_files)} fragments ({fragment_entries} entries) -> "
+        f"{count} ontologies total."
+    )
+    if missing:
+        report(f"WARNING: {len(missing)} OK ontologies have no download_url: {missing[:10]}")
+
+    with open(os.path.join(output_dir, "total_stats.yaml"), "w") as f:
+        for key, value in totals.items():
+            f.write(f"{key}: {value}\n")
+        if transform_date:
+            f.write(f"transform_date: {transform_date}\n")
+
+    report(
+        f"OK={totals['totalcount']} Skipped={totals['skippedcount']} "
+        f"Failed={totals['failedcount']} Licensed={totals['licensedcount']} "
+        f"resolvable={resolvable} -> {output_dir}/"
+    )
+    return totals
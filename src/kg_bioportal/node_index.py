@@ -0,0 +1,137 @@
+"""A compact on-disk index of node ids, for membership tests in bounded memory.
+
+The merge has to know, for every edge, whether its subject and object are
+nodes of the merged graph. Across all of BioPortal there are far too many node
+ids to hold in a set, but the merge writes them out in sorted order anyway,
+so they can be written once more, to disk, in a form that binary search can
+use without loading it:
+
+    <stem>.ids   the ids, UTF-8, back to back
+    <stem>.off   little-endian uint64 offsets into .ids, one per id plus one
+
+Both are memory-mapped by ``NodeIdIndex``, so a lookup touches a handful of
+pages and the operating system decides how much of the index stays cached.
+UTF-8 byte order is code-point order, which is the order Python sorts str in,
+so the ids the merge sorted as str are sorted as bytes too.
+
+A partitioned merge writes one index per partition (each sorted on its own);
+``PartitionedIdIndex`` sends each lookup to the partition the id belongs to.
+"""
+
+import mmap
+import os
+import struct
+from typing import Callable, List, Optional
+
+_OFFSET = struct.Struct("<Q")
+_SPAN = struct.Struct("<2Q")
+
+
+class NodeIdWriter:
+    """Writes a ``NodeIdIndex`` from ids given in ascending order."""
+
+    def __init__(self, stem: str) -> None:
+        """Opens ``<stem>.ids`` and ``<stem>.off`` for writing.
+
+        Args:
+            stem: Path of the index without its suffixes.
+        """
+        self._ids = open(stem + ".ids", "wb")
+        self._offsets = open(stem + ".off", "wb")
+        self._offsets.write(_OFFSET.pack(0))
+        self._end = 0
+        self._last: Optional[bytes] = None
+
+    def add(self, node_id: str) -> None:
+        """Append an id; empty ids and repeats of the last one are ignored."""
+        key = node_id.encode("utf-8")
+        if not key or key == self._last:
+            return
+        if self._last is not None and key < self._last:
+            raise ValueError(f"Node ids out of order: {node_id!r} after {self._last!r}")
+        self._ids.write(key)
+        self._end += len(key)
+        self._offsets.write(_OFFSET.pack(self._end))
+        self._last = key
+
+    def close(self) -> None:
+        self._ids.close()
+        self._offsets.close()
+
+    def __enter__(self) -> "NodeIdWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class NodeIdIndex:
+    """Membership tests against the ids written by ``NodeIdWriter``."""
+
+    def __init__(self, stem: str) -> None:
+        """Maps ``<stem>.ids`` and ``<stem>.off``.
+
+        Args:
+            stem: Path of the index without its suffixes.
+        """
+        self._maps: List[mmap.mmap] = []
+        self._ids = self._map(stem + ".ids")
+        self._offsets = self._map(stem + ".off")
+        self._len = max(0, len(self._offsets) // _OFFSET.size - 1)
+
+    def _map(self, path: str):
+        with open(path, "rb") as f:
+            if not os.fstat(f.fileno()).st_size:
+                # mmap refuses an empty file, and there is nothing to map.
+                return b""
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return mapped
+
+    def __len__(self) -> int:
+        return self._len
+
+    def _id(self, i: int) -> bytes:
+        start, end = _SPAN.unpack_from(self._offsets, i * _OFFSET.size)
+        return self._ids[start:end]
+
+    def __contains__(self, node_id: str) -> bool:
+        key = node_id.encode("utf-8")
+        lo, hi = 0, self._len
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._id(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo < self._len and self._id(lo) == key
+
+    def close(self) -> None:
+        for mapped in self._maps:
+            mapped.close()
+        self._maps = []
+
+
+class PartitionedIdIndex:
+    """One ``NodeIdIndex`` per partition, looked up by the id's partition."""
+
+    def __init__(self, stems: List[str], partition_of: Callable[[str, int], int]) -> None:
+        """Maps each partition's index.
+
+        Args:
+            stems: The partitions' index stems, in partition order.
+            partition_of: Maps an id and the number of partitions to its
+                partition, as the merge partitioned the nodes.
+        """
+        self._indexes = [NodeIdIndex(stem) for stem in stems]
+        self._partition_of = partition_of
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self._indexes[self._partition_of(node_id, len(self._indexes))]
+
+    def __len__(self) -> int:
+        return sum(len(index) for index in self._indexes)
+
+    def close(self) -> None:
+        for index in self._indexes:
+            index.close()
@@ -0,0 +1,503 @@
+"""Run download and transform as one pipeline instead of two back-to-back steps.
+
+Run separately, the download step holds the network busy while the CPU idles,
+and then the transform holds the CPU busy while the network idles. Here the
+Downloader runs in a background thread as a producer, handing each source over
+a bounded queue as soon as it lands, and the Transformer consumes them in the
+calling thread -- which must be the main thread, because the per-ontology
+deadline is a SIGALRM. The outputs are the same files the two steps write.
+
+``run_pipeline`` is the whole build on one machine -- what the GitHub Actions
+workflow spreads across a matrix of runners -- with worker processes in place
+of runners, each pulling the next ontology as it frees up. ``run_queue_worker``
+does the same from a ``WorkQueue`` that any number of processes, on any number
+of hosts sharing a filesystem, can drain together.
+"""
+
+import logging
+import os
+import queue
+import shutil
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+import yaml
+
+from kg_bioportal.config import (
+    BIOPORTAL_MAX_RATE_PER_SEC,
+    BIOPORTAL_MIN_RATE_PER_SEC,
+    BIOPORTAL_RATE_PER_SEC,
+    MAX_SOURCE_MB,
+    MIN_FREE_DISK_GB,
+    PER_ONTOLOGY_TIMEOUT_MIN,
+    PIPELINE_CPUS,
+    PIPELINE_QUEUE_SIZE,
+    PIPELINE_RAM_GB,
+    ROBOT_HEAP_FLOOR_GB,
+    ROBOT_HEAP_MULTIPLIER,
+    ROBOT_JAVA_ARGS,
+    SNIPPET_KB,
+    WORKER_OVERHEAD_GB,
+)
+from kg_bioportal.downloader import Downloader
+from kg_bioportal.heap import HeapBudget, learn_multiplier, with_heap, xmx_gb
+from kg_bioportal.index import carry_forward, content_unchanged, merge_stats, read_index
+from kg_bioportal.rate_limit import AdaptiveRateLimiter
+from kg_bioportal.robot_utils import initialize_robot
+from kg_bioportal.sharding import estimate_costs
+from kg_bioportal.transformer import Transformer
+from kg_bioportal.work_queue import WorkQueue
+
+# Marks the end of the producer's output on the queue.
+_DONE = object()
+
+
+def _as_report_row(result: dict) -> dict:
+    """A Downloader result as it reads back from download_report.tsv.
+
+    The transformer builds its entries from report rows, which are strings;
+    handing it the in-memory result instead would put ints where the two-step
+    build puts strings, and the onto_stats would differ.
+    """
+    return {k: "" if v is None else str(v) for k, v in result.items()}
+
+
+def _wait_for_disk(path: str, min_free_bytes: int, pending: queue.Queue, poll_sec: float) -> None:
+    """Hold the producer while the disk is short and the consumer has work.
+
+    Once the consumer has nothing left to transform, waiting would never end
+    (transforming is what frees space), so the download goes ahead regardless.
+    """
+    warned = False
+    while shutil.disk_usage(path).free < min_free_bytes and pending.unfinished_tasks:
+        if not warned:
+            logging.info(
+                f"Less than {min_free_bytes / 1024 ** 3:.1f} GB free; "
+                "waiting for transforms to catch up before downloading more."
+            )
+            warned = True
+        time.sleep(poll_sec)
+
+
+def run_shard(
+    downloader: Downloader,
+    transformer: Transformer,
+    onto_list: list,
+    compress: bool = True,
+    queue_size: int = PIPELINE_QUEUE_SIZE,
+    min_free_gb: float = MIN_FREE_DISK_GB,
+    poll_sec: float = 5.0,
+    index: Optional[Dict[str, dict]] = None,
+) -> dict:
+    """Download and transform a list of ontologies with the two stages overlapped.
+
+    Writes exactly what ``Downloader.download`` followed by
+    ``Transformer.transform_all`` would: download_report.tsv (and the summary)
+    in the downloader's output dir, and onto_stats.yaml / total_stats.yaml in
+    the transformer's.
+
+    Args:
+        downloader: Writes into the directory ``transformer`` reads from.
+        transformer: Must be called from the main thread (see module docstring).
+        onto_list: Acronyms to download and transform.
+        compress: If True, compresses the output nodes and edges to tar.gz.
+        queue_size: Most downloaded sources allowed to wait for a transform.
+        min_free_gb: Hold further downloads while free disk is below this.
+        poll_sec: How often to re-check free disk while holding.
+        index: The previous index's entries, {acronym: entry}. A source whose
+            SHA-256 matches the one its published graph was built from is not
+            transformed again; its entry is carried forward instead.
+
+    Returns:
+        The per-ontology log written to onto_stats.yaml, {acronym: entry}.
+    """
+    pending: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+    min_free_bytes = int(min_free_gb * 1024 ** 3)
+    failure = []
+
+    def produce():
+        try:
+            for ontology in onto_list:
+                _wait_for_disk(downloader.output_dir, min_free_bytes, pending, poll_sec)
+                result = downloader.download_one(ontology)
+                if result["status"] == "downloaded":
+                    pending.put(result)
+            downloader.finish()
+        except BaseException as e:  # noqa: BLE001 - re-raised in the consumer
+            failure.append(e)
+        finally:
+            pending.put(_DONE)
+
+    producer = threading.Thread(target=produce, name="downloader", daemon=True)
+    producer.start()
+
+    transformed = {}
+    while True:
+        result = pending.get()
+        if result is _DONE:
+            pending.task_done()
+            break
+        try:
+            previous = (index or {}).get(result["id"])
+            if previous and content_unchanged(previous, sha256=result.get("sha256", "")):
+                logging.info(
+                    f"{result['id']}: submission {result['submission_id']} has the same "
+                    "source as its published graph; carrying that forward."
+                )
+                transformed[result["id"]] = carry_forward(previous, _as_report_row(result))
+            else:
+                transformed[result["id"]] = transformer.transform_source(
+                    result["path"], compress, _as_report_row(result)
+                )
+        finally:
+            pending.task_done()
+    producer.join()
+    if failure:
+        raise failure[0]
+
+    # Build the log the way transform_all does -- from the report as written,
+    # then this run's transforms on top -- so the stats come out identical.
+    onto_log = transformer._seed_log(transformer._load_download_report())
+    onto_log.update(transformed)
+    if not onto_log:
+        logging.error(f"No ontologies were downloaded into {downloader.output_dir}.")
+        return onto_log
+    transformer.write_stats(onto_log)
+    return onto_log
+
+
+# The rate limiter of the worker process this module is running in, if any.
+# Set once per worker by _init_worker, so its adaptation outlives one ontology.
+_worker_limiter: Optional[AdaptiveRateLimiter] = None
+
+# The heap budget this worker's ROBOT calls share with the other workers', if any.
+_worker_budget: Optional[HeapBudget] = None
+
+
+def _physical_ram_gb() -> float:
+    """Physical memory in GB, or 0 where the platform won't say."""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 ** 3
+    except (AttributeError, OSError, ValueError):
+        return 0.0
+
+
+def _ram_gb(ram_gb: float = PIPELINE_RAM_GB) -> float:
+    """Memory to use: ``ram_gb``, or 80% of physical RAM if that is 0."""
+    return ram_gb or 0.8 * _physical_ram_gb()
+
+
+def plan_workers(
+    cpus: int = PIPELINE_CPUS,
+    ram_gb: float = PIPELINE_RAM_GB,
+    java_args: Optional[str] = None,
+    overhead_gb: float = WORKER_OVERHEAD_GB,
+) -> int:
+    """How many ontologies can be built at once within the CPU and RAM budgets.
+
+    Every worker runs ROBOT, which reserves its whole -Xmx, so memory is what
+    usually binds: a 64-core box with 256 GB fits 18 workers at -Xmx12g, not 64.
+    With per-call heaps (the default), a worker is charged only the floor, and
+    a HeapBudget (see heap_budget) keeps the heaps in use within the rest.
+
+    Args:
+        cpus: Cores to use; 0 for all of them.
+        ram_gb: Memory to use; 0 for 80% of physical RAM.
+        java_args: ROBOT's JVM arguments, for its -Xmx. Defaults to
+            ROBOT_JAVA_ARGS at the heap floor, or as is without per-call heaps.
+        overhead_gb: Memory charged to each worker on top of ROBOT's heap.
+
+    Returns:
+        At least 1.
+    """
+    if java_args is None:
+        java_args = ROBOT_JAVA_ARGS
+        if ROBOT_HEAP_MULTIPLIER:
+            java_args = with_heap(java_args, min(ROBOT_HEAP_FLOOR_GB, xmx_gb(java_args)))
+    cpus = cpus or os.cpu_count() or 1
+    ram_gb = _ram_gb(ram_gb)
+    per_worker = xmx_gb(java_args) + overhead_gb
+    by_ram = int(ram_gb // per_worker) if ram_gb and per_worker else cpus
+    return max(1, min(cpus, by_ram))
+
+
+def heap_budget(
+    workers: int,
+    ram_gb: float = PIPELINE_RAM_GB,
+    overhead_gb: float = WORKER_OVERHEAD_GB,
+) -> Optional[HeapBudget]:
+    """The budget ``workers`` workers' ROBOT heaps share, or None if unneeded.
+
+    Whatever memory their overhead leaves. None without per-call heaps (each
+    worker's whole -Xmx was charged in plan_workers) or when the machine's
+    memory is unknown.
+    """
+    ram_gb = _ram_gb(ram_gb)
+    if not ROBOT_HEAP_MULTIPLIER or not ram_gb:
+        return None
+    return HeapBudget(max(ROBOT_HEAP_FLOOR_GB, ram_gb - workers * overhead_gb))
+
+
+def _init_worker(workers: int, budget: Optional[HeapBudget] = None) -> None:
+    """Give this worker its share of the BioPortal rate limit, and the heap budget.
+
+    The limiter only coordinates threads within a process, so each of the
+    ``workers`` processes gets 1/workers of the allowance; together they ask
+    no faster than one process would. The heap budget is one for all of them.
+    """
+    global _worker_limiter, _worker_budget
+    _worker_budget = budget
+    _worker_limiter = AdaptiveRateLimiter(
+        rate=BIOPORTAL_RATE_PER_SEC / workers,
+        min_rate=BIOPORTAL_MIN_RATE_PER_SEC / workers,
+        max_rate=BIOPORTAL_MAX_RATE_PER_SEC / workers,
+    )
+
+
+def _ontology_dirs(work_dir: str, acronym: str):
+    """(raw dir, transformed dir) of one ontology in a pipeline's work dir."""
+    return (
+        os.path.join(work_dir, "raw", acronym),
+        os.path.join(work_dir, "transformed", acronym),
+    )
+
+
+def _build_one(
+    acronym: str, work_dir: str, settings: dict, previous: Optional[dict] = None
+) -> dict:
+    """Download and transform one ontology, in a worker process.
+
+    Each ontology gets its own raw and transformed directories, so its
+    download_report.tsv and onto_stats.yaml are a fragment of the build like
+    a shard's are, and the final merge treats them the same way. ``previous``
+    is its entry in the previous index, if any, for run_shard's content check.
+    """
+    raw_dir, out_dir = _ontology_dirs(work_dir, acronym)
+    for stale in (raw_dir, out_dir):
+        shutil.rmtree(stale, ignore_errors=True)
+    dl = Downloader(
+        output_dir=raw_dir,
+        api_key=settings["api_key"],
+        max_source_mb=settings["max_source_mb"],
+        use_skiplist=settings["use_skiplist"],
+        rate_limiter=_worker_limiter,
+        snippet_only=settings["snippet_only"],
+        snippet_kb=settings["snippet_kb"],
+    )
+    tx = Transformer(
+        input_dir=raw_dir,
+        output_dir=out_dir,
+        timeout_min=settings["timeout_min"],
+        max_source_mb=settings["max_source_mb"],
+        heap_multiplier=settings["heap_multiplier"],
+        heap_budget=_worker_budget,
+    )
+    return run_shard(
+        dl, tx, [acronym], compress=settings["compress"], queue_size=1, min_free_gb=0,
+        index={acronym: previous} if previous else None,
+    )
+
+
+def _write_failed_fragment(out_dir: str, acronym: str) -> str:
+    """Record a worker that died, so the ontology isn't silently left out."""
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, "onto_stats.yaml")
+    entry = {
+        "id": acronym,
+        "status": "Failed",
+        "reason": "transform_error",
+        "name": "",
+        "version": "",
+        "nodecount": 0,
+        "edgecount": 0,
+        "submission_id": "NA",
+        "source_bytes": 0,
+    }
+    with open(path, "w") as f:
+        yaml.dump({"ontologies": [entry]}, f, sort_keys=False)
+    return path
+
+
+def pipeline_settings(
+    api_key: str,
+    compress: bool = True,
+    max_source_mb: float = MAX_SOURCE_MB,
+    timeout_min: float = PER_ONTOLOGY_TIMEOUT_MIN,
+    use_skiplist: bool = True,
+    snippet_only: bool = False,
+    snippet_kb: float = SNIPPET_KB,
+    heap_multiplier: float = ROBOT_HEAP_MULTIPLIER,
+) -> dict:
+    """How each ontology is to be built, as handed to every worker."""
+    return {
+        "heap_multiplier": heap_multiplier,
+        "api_key": api_key,
+        "compress": compress,
+        "max_source_mb": max_source_mb,
+        "timeout_min": timeout_min,
+        "use_skiplist": use_skiplist,
+        "snippet_only": snippet_only,
+        "snippet_kb": snippet_kb,
+    }
+
+
+def run_pipeline(
+    onto_list: List[str],
+    api_key: str,
+    work_dir: str = "data/pipeline",
+    output_dir: str = "",
+    index_path: str = "",
+    workers: int = 0,
+    compress: bool = True,
+    max_source_mb: float = MAX_SOURCE_MB,
+    timeout_min: float = PER_ONTOLOGY_TIMEOUT_MIN,
+    use_skiplist: bool = True,
+    release_tag: str = "",
+    transform_date: str = "",
+    snippet_only: bool = False,
+    snippet_kb: float = SNIPPET_KB,
+    ram_gb: float = PIPELINE_RAM_GB,
+) -> dict:
+    """Build a list of ontologies with a pool of worker processes, then merge.
+
+    The local counterpart of the transform and finalize jobs: instead of fixed
+    shards, every ontology is its own task, taken by whichever worker frees up
+    first, in order of the cost the previous index predicts for it -- longest
+    first, so the run doesn't end waiting on one giant picked up last.
+
+    Args:
+        onto_list: Acronyms to build (after any version-skip and skiplist).
+        api_key: BioPortal API key.
+        work_dir: Holds ``raw/<ACRONYM>`` and ``transformed/<ACRONYM>`` (the
+            artifact and its onto_stats.yaml fragment) for each ontology.
+        output_dir: Where the merged onto_stats.yaml, total_stats.yaml and
+            graph_urls.tsv go. Defaults to ``work_dir``.
+        index_path: The previous index: seeds the merge, prices the tasks, and
+            lets a source that hasn't changed carry its graph forward.
+        workers: Worker processes; 0 to fit the CPU/RAM budget (plan_workers).
+        compress: If True, compresses the output nodes and edges to tar.gz.
+        max_source_mb: Size gate, as for download and transform.
+        timeout_min: Per-ontology wall-clock cap, as for transform.
+        use_skiplist: Skip ontologies on the known-giants skiplist.
+        release_tag: Release the artifacts will be published in, for the
+            download_urls in the index; empty if they won't be.
+        transform_date: Written to total_stats.yaml, as by finalize.
+        snippet_only: Build from samples of each source (see Downloader).
+        snippet_kb: With snippet_only, how many KB of each source to fetch.
+        ram_gb: Memory the workers may use between them; 0 for 80% of
+            physical RAM. Sizes the pool, and the heap budget its ROBOT
+            calls share.
+
+    Returns:
+        The counts written to total_stats.yaml (see ``index.merge_stats``).
+    """
+    output_dir = output_dir or work_dir
+    workers = workers or plan_workers(ram_gb=ram_gb)
+    budget = heap_budget(workers, ram_gb)
+    index = read_index(index_path)
+    settings = pipeline_settings(
+        api_key, compress, max_source_mb, timeout_min, use_skiplist, snippet_only, snippet_kb,
+        heap_multiplier=learn_multiplier(index),
+    )
+
+    # Once, up front: otherwise the first few workers would all find ROBOT
+    # missing and download it over each other.
+    initialize_robot(os.path.join(os.getcwd(), "robot"))
+
+    costs = estimate_costs(onto_list, index)
+    order = sorted(onto_list, key=lambda a: (-costs[a], a))
+    logging.info(
+        f"Building {len(order)} ontologies with {workers} workers"
+        + (f", sharing {budget.total_gb:g} GB of ROBOT heap." if budget else ".")
+    )
+
+    fragments = []
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(workers, budget)
+    ) as pool:
+        futures = {
+            pool.submit(_build_one, acr, work_dir, settings, index.get(acr)): acr for acr in order
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            acronym = futures[future]
+            _, out_dir = _ontology_dirs(work_dir, acronym)
+            try:
+                entry = future.result().get(acronym, {})
+                logging.info(
+                    f"[{done}/{len(order)}] {acronym}: {entry.get('status', '?')} "
+                    f"{entry.get('reason', '')}".rstrip()
+                )
+                fragments.append(os.path.join(out_dir, "onto_stats.yaml"))
+            except Exception as e:  # noqa: BLE001 - one ontology's crash is its own
+                logging.error(f"[{done}/{len(order)}] {acronym}: worker failed: {e!r}")
+                fragments.append(_write_failed_fragment(out_dir, acronym))
+
+    fragments = [f for f in fragments if os.path.exists(f)]
+    return merge_stats(
+        os.path.join(work_dir, "transformed"),
+        output_dir,
+        transform_date=transform_date,
+        base_path=index_path,
+        release_tag=release_tag,
+        report=logging.info,
+        fragments=fragments,
+    )
+
+
+def run_queue_worker(
+    work_queue: WorkQueue,
+    work_dir: str,
+    settings: dict,
+    worker_id: str = "",
+    poll_sec: float = 30.0,
+    index: Optional[Dict[str, dict]] = None,
+) -> int:
+    """Build ontologies from a shared queue, one at a time, until it is drained.
+
+    Each is built exactly as ``run_pipeline`` builds it, into
+    ``<work_dir>/transformed/<ACRONYM>``, so merging the fragments under
+    ``<work_dir>/transformed`` (merge_stats.py, or kg_bioportal.index) gives
+    the index. While other workers still hold leases this one keeps polling
+    rather than exiting, so it can pick up any whose worker died.
+
+    Args:
+        work_queue: The queue to drain.
+        work_dir: Shared by all the queue's workers.
+        settings: From ``pipeline_settings``.
+        worker_id: Recorded in leases; defaults to ``<host>:<pid>``.
+        poll_sec: How long to wait between looks while others hold leases.
+        index: The previous index's entries, {acronym: entry}, so that a source
+            that hasn't changed carries its graph forward, as in run_pipeline.
+
+    Returns:
+        How many ontologies this worker built.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    initialize_robot(os.path.join(os.getcwd(), "robot"))
+    built = 0
+    while True:
+        for acronym in work_queue.reclaim_expired():
+            _write_failed_fragment(_ontology_dirs(work_dir, acronym)[1], acronym)
+
+        lease = work_queue.claim(worker_id)
+        if lease is None:
+            if not work_queue.outstanding():
+                break
+            time.sleep(poll_sec)
+            continue
+
+        logging.info(f"{worker_id}: building {lease.acronym} (attempt {lease.attempts}).")
+        with lease.keep_alive():
+            try:
+                _build_one(lease.acronym, work_dir, settings, (index or {}).get(lease.acronym))
+            except Exception as e:  # noqa: BLE001 - one ontology's crash is its own
+                logging.error(f"{worker_id}: {lease.acronym} failed: {e!r}")
+                _write_failed_fragment(_ontology_dirs(work_dir, lease.acronym)[1], lease.acronym)
+        lease.complete()
+        built += 1
+
+    logging.info(f"{worker_id}: queue drained after building {built} ontologies.")
+    return built
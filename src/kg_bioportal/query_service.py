@@ -0,0 +1,351 @@
+"""A read-only HTTP service answering one-hop queries from a graph store.
+
+notebooks/trapi_setup.ipynb stands up a query endpoint by loading a merged
+graph into Neo4j and running Plater and Automat in front of it. For one-hop
+lookups a store written by ``load-store`` (see graph_store) is enough, so
+``kgbioportal serve`` answers them straight from it, with nothing but the
+standard library:
+
+    GET  /health                     {"status": "ok"}
+    GET  /meta                       the ontologies in the store; cache counts
+    GET  /nodes/<id>                 a node, folded across ontologies
+    GET  /edges?subject=&predicate=&object=&limit=
+                                     matching edges, one JSON object a line,
+                                     streamed as they are read
+    POST /query                      a TRAPI-style one-hop query graph
+
+A POST /query body is a TRAPI message whose query graph has one edge, with
+``ids`` on at least one of its two nodes and optionally ``categories`` on
+either node and ``predicates`` on the edge. The response fills in the
+message's ``knowledge_graph`` and ``results``, in TRAPI's shape; it is not a
+full TRAPI implementation (no workflows, no attribute constraints, no
+knowledge-level qualifiers).
+
+Requests are served on threads that share a small pool of read-only
+connections (``SERVE_POOL_SIZE``), and the most recently used nodes are kept
+in an LRU cache (``SERVE_CACHE_NODES``), since a query's far ends are
+looked up once per edge and the same few thousand upper-level terms come up
+again and again.
+"""
+
+import json
+import logging
+import queue
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from kg_bioportal.config import SERVE_CACHE_NODES, SERVE_MAX_RESULTS, SERVE_POOL_SIZE
+from kg_bioportal.graph_merge import merge_rows
+from kg_bioportal.graph_store import GraphStore
+
+# The analyses' resource_id in /query results.
+RESOURCE_ID = "infores:kg-bioportal"
+
+# Node and edge columns that are TRAPI fields of their own, not attributes.
+_NODE_FIELDS = {"id", "name", "category"}
+_EDGE_FIELDS = {"subject", "predicate", "object", "id"}
+
+
+class QueryError(ValueError):
+    """A query the service can't answer, reported to the client as a 400."""
+
+
+class StorePool:
+    """Read-only connections to a store, lent to one thread at a time."""
+
+    def __init__(self, path: str, size: int = SERVE_POOL_SIZE) -> None:
+        """Opens ``size`` connections to the store at ``path``."""
+        self._free: "queue.LifoQueue[GraphStore]" = queue.LifoQueue()
+        self._stores = [GraphStore(path, check_same_thread=False) for _ in range(max(size, 1))]
+        for store in self._stores:
+            self._free.put(store)
+
+    @contextmanager
+    def connection(self) -> Iterator[GraphStore]:
+        """A connection of one's own for the duration, waiting for one if need be."""
+        store = self._free.get()
+        try:
+            yield store
+        finally:
+            self._free.put(store)
+
+    def close(self) -> None:
+        for store in self._stores:
+            store.close()
+
+
+class NodeCache:
+    """A thread-safe LRU cache of nodes by id, misses included."""
+
+    def __init__(self, size: int = SERVE_CACHE_NODES) -> None:
+        self._size = size
+        self._nodes: "OrderedDict[str, Optional[dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, node_id: str, load: Callable[[str], Optional[dict]]) -> Optional[dict]:
+        """The cached node, or ``load(node_id)``, cached."""
+        with self._lock:
+            # A node that isn't there is cached too, as None: test membership.
+            if node_id in self._nodes:
+                self._nodes.move_to_end(node_id)
+                self.hits += 1
+                return self._nodes[node_id]
+            self.misses += 1
+        # Loaded outside the lock: two threads may both load a cold node,
+        # which is cheaper than making every other lookup wait.
+        node = load(node_id)
+        if self._size > 0:
+            with self._lock:
+                self._nodes[node_id] = node
+                self._nodes.move_to_end(node_id)
+                while len(self._nodes) > self._size:
+                    self._nodes.popitem(last=False)
+        return node
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._nodes), "hits": self.hits, "misses": self.misses}
+
+
+def _attributes(row: dict, fields: set) -> List[dict]:
+    return [
+        {"attribute_type_id": f"biolink:{key}", "value": value}
+        for key, value in row.items()
+        if key not in fields
+    ]
+
+
+def _trapi_node(node: dict) -> dict:
+    return {
+        "name": node.get("name"),
+        "categories": node["category"].split("|") if node.get("category") else [],
+        "attributes": _attributes(node, _NODE_FIELDS),
+    }
+
+
+def _trapi_edge(edge: dict) -> dict:
+    return {
+        "subject": edge["subject"],
+        "predicate": edge["predicate"],
+        "object": edge["object"],
+        "attributes": _attributes(edge, _EDGE_FIELDS),
+    }
+
+
+def _categories(node: Optional[dict]) -> set:
+    return set(node["category"].split("|")) if node and node.get("category") else set()
+
+
+def one_hop(
+    store: GraphStore, nodes: NodeCache, message: dict, max_results: int = SERVE_MAX_RESULTS
+) -> dict:
+    """Answer a TRAPI-style one-hop query from a store.
+
+    Args:
+        store: The store to read.
+        nodes: The node cache to look nodes up through.
+        message: The ``message`` of the request, holding its ``query_graph``.
+        max_results: Most results returned.
+
+    Returns:
+        The message with its ``knowledge_graph`` and ``results`` filled in.
+
+    Raises:
+        QueryError: If the query graph is not a one-hop graph with ids on at
+            least one end.
+    """
+    graph = message.get("query_graph") or {}
+    qnodes, qedges = graph.get("nodes") or {}, graph.get("edges") or {}
+    if len(qedges) != 1:
+        raise QueryError("The query graph must have exactly one edge")
+    ((edge_key, qedge),) = qedges.items()
+    ends = (qedge.get("subject"), qedge.get("object"))
+    if not all(end in qnodes for end in ends):
+        raise QueryError("The edge's subject and object must be nodes of the query graph")
+    ids = [set(qnodes[end].get("ids") or ()) for end in ends]
+    categories = [set(qnodes[end].get("categories") or ()) for end in ends]
+    if not any(ids):
+        raise QueryError("At least one node of the query graph needs ids")
+    predicates = qedge.get("predicates") or [None]
+
+    # Walk out from whichever end is pinned down by fewer ids.
+    side = 0 if ids[0] and (not ids[1] or len(ids[0]) <= len(ids[1])) else 1
+    column = ("subject", "object")[side]
+
+    def matches(node_id: str, end: int) -> bool:
+        if ids[end] and node_id not in ids[end]:
+            return False
+        if categories[end]:
+            return bool(categories[end] & _categories(nodes.get(node_id, store.node)))
+        return True
+
+    def candidates() -> Iterator[dict]:
+        for start in sorted(ids[side]):
+            if categories[side] and not matches(start, side):
+                continue
+            for predicate in predicates:
+                yield from store.edges(**{column: start}, predicate=predicate)
+
+    edges: "OrderedDict[Tuple[str, str, str], List[dict]]" = OrderedDict()
+    full = False
+    for edge in candidates():
+        key = (edge["subject"], edge["predicate"], edge["object"])
+        if key in edges:
+            edges[key].append(edge)
+        elif len(edges) < max_results and matches(key[2 if side == 0 else 0], 1 - side):
+            edges[key] = [edge]
+            full = len(edges) == max_results
+            if full:
+                break
+    if full:
+        # Full, so stop reading; the copies of the edges kept that weren't
+        # reached yet are picked up by looking each edge up.
+        for subject, predicate, object_ in edges:
+            edges[subject, predicate, object_] = list(
+                store.edges(subject=subject, predicate=predicate, object=object_)
+            )
+
+    kg_nodes: Dict[str, dict] = {}
+    kg_edges: Dict[str, dict] = {}
+    results = []
+    for n, ((subject, _, object_), copies) in enumerate(edges.items()):
+        kg_key = f"e{n}"
+        kg_edges[kg_key] = _trapi_edge(merge_rows(copies))
+        for node_id in (subject, object_):
+            if node_id not in kg_nodes:
+                kg_nodes[node_id] = _trapi_node(nodes.get(node_id, store.node) or {"id": node_id})
+        analysis = {"resource_id": RESOURCE_ID, "edge_bindings": {edge_key: [{"id": kg_key}]}}
+        results.append({
+            "node_bindings": {ends[0]: [{"id": subject}], ends[1]: [{"id": object_}]},
+            "analyses": [analysis],
+        })
+    return {
+        **message,
+        "knowledge_graph": {"nodes": kg_nodes, "edges": kg_edges},
+        "results": results,
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive, so a client can reuse one connection for many queries...
+    protocol_version = "HTTP/1.1"
+    # ...without each response's headers and body, written separately, waiting
+    # out the client's delayed ACK (some 40 ms a request) under Nagle.
+    disable_nagle_algorithm = True
+    server: "QueryServer"
+
+    def log_message(self, format, *args) -> None:
+        logging.debug(f"{self.address_string()} {format % args}")
+
+    def _send_json(self, status: int, body) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, lines: Iterable[dict]) -> None:
+        """Send each row as a line of JSON, in a chunk of its own, as read."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for line in lines:
+            data = json.dumps(line).encode("utf-8") + b"\n"
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        server = self.server
+        try:
+            if url.path == "/health":
+                self._send_json(200, {"status": "ok"})
+            elif url.path == "/meta":
+                with server.pool.connection() as store:
+                    ontologies = store.ontologies()
+                self._send_json(200, {"ontologies": ontologies, "cache": server.nodes.stats()})
+            elif url.path.startswith("/nodes/"):
+                node_id = unquote(url.path[len("/nodes/"):])
+                with server.pool.connection() as store:
+                    node = server.nodes.get(node_id, store.node)
+                if node is None:
+                    self._send_json(404, {"error": f"No node {node_id}"})
+                else:
+                    self._send_json(200, node)
+            elif url.path == "/edges":
+                query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                where = {k: query[k] for k in ("subject", "predicate", "object") if query.get(k)}
+                if not where:
+                    raise QueryError("Give at least one of subject, predicate and object")
+                limit = min(int(query.get("limit", server.max_results)), server.max_results)
+                if limit < 0:
+                    # SQLite reads a negative LIMIT as no limit at all.
+                    raise QueryError(f"limit can't be negative, not {limit}")
+                with server.pool.connection() as store:
+                    self._stream(store.edges(**where, limit=limit))
+            else:
+                self._send_json(404, {"error": f"No such path: {url.path}"})
+        except (QueryError, ValueError) as e:
+            self._send_json(400, {"error": str(e)})
+
+    def do_POST(self) -> None:
+        if urlsplit(self.path).path != "/query":
+            self._send_json(404, {"error": f"No such path: {self.path}"})
+            return
+        server = self.server
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            message = body.get("message") if isinstance(body, dict) else None
+            if not isinstance(message, dict):
+                raise QueryError("The request needs a message")
+            with server.pool.connection() as store:
+                answer = one_hop(store, server.nodes, message, server.max_results)
+        except (QueryError, ValueError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except (AttributeError, TypeError):
+            # A query graph of the wrong shape: a list for a node, say.
+            self._send_json(400, {"error": "Not a TRAPI-style query graph"})
+            return
+        self._send_json(200, {"message": answer})
+
+
+class QueryServer(ThreadingHTTPServer):
+    """The query service, one thread per connection."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        store_path: str,
+        pool_size: int = SERVE_POOL_SIZE,
+        cache_nodes: int = SERVE_CACHE_NODES,
+        max_results: int = SERVE_MAX_RESULTS,
+    ) -> None:
+        """Opens the store and binds ``address``; port 0 picks a free port.
+
+        Args:
+            address: The (host, port) to listen on.
+            store_path: The store written by load-store.
+            pool_size: Connections to the store, shared by request threads.
+            cache_nodes: Nodes kept in the LRU cache (0: none).
+            max_results: Most edges or results a query returns.
+        """
+        self.pool = StorePool(store_path, pool_size)
+        self.nodes = NodeCache(cache_nodes)
+        self.max_results = max_results
+        super().__init__(address, _Handler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.pool.close()
@@ -0,0 +1,179 @@
+"""Adaptive rate limiting for requests to the BioPortal API.
+
+BioPortal throttles per API key, not per connection, so every request made with
+our key -- from any thread of any Downloader in the process -- draws on the same
+allowance. A per-request retry policy can't see that: each throttled request
+backs off on its own, ignores how long the server asked it to wait, and twenty
+workers that were throttled together retry together. One limiter per process,
+shared by all of them, fixes both.
+
+The rate adapts AIMD-style, as TCP does: a 429 halves it (down to a floor)
+and pauses everyone until the server's ``Retry-After`` has passed; every
+success nudges it back up towards the ceiling. The 429s that arrive during a
+pause answer requests that went out together before it, so they extend the
+pause but don't cut the rate again -- twenty of them halve it once, not
+twenty times. It settles just under whatever
+the API is actually allowing today.
+"""
+
+import email.utils
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+from kg_bioportal.config import (
+    BIOPORTAL_MAX_RATE_PER_SEC,
+    BIOPORTAL_MIN_RATE_PER_SEC,
+    BIOPORTAL_RATE_PER_SEC,
+)
+
+# Used when a 429 arrives without a usable Retry-After.
+_DEFAULT_RETRY_AFTER_SEC = 1.0
+
+# Never honour a Retry-After longer than this; a misconfigured proxy asking for
+# an hour shouldn't stall a whole shard.
+_MAX_RETRY_AFTER_SEC = 120.0
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Seconds to wait according to a ``Retry-After`` header, or None.
+
+    The header is either a number of seconds or an HTTP date.
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - (time.time() if now is None else now))
+
+
+class AdaptiveRateLimiter:
+    """A thread-safe token bucket whose rate follows the server's throttling."""
+
+    def __init__(
+        self,
+        rate: float = BIOPORTAL_RATE_PER_SEC,
+        min_rate: float = BIOPORTAL_MIN_RATE_PER_SEC,
+        max_rate: float = BIOPORTAL_MAX_RATE_PER_SEC,
+        burst: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        """Initializes the limiter.
+
+        Args:
+            rate: Starting rate, in requests per second.
+            min_rate: The rate is never cut below this, however often we're throttled.
+            max_rate: The rate never climbs above this, however long things go well.
+            burst: Bucket capacity. Defaults to one second's worth at ``rate``.
+            clock: Monotonic clock, injectable for tests.
+            sleep: Sleep function, injectable for tests.
+
+        Returns:
+            None.
+        """
+        self.min_rate = min_rate
+        self.max_rate = max(max_rate, min_rate)
+        self.rate = min(max(rate, self.min_rate), self.max_rate)
+        self.burst = burst if burst is not None else max(1.0, self.rate)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._last = clock()
+        self._paused_until = 0.0
+
+        # Exported to the download summary.
+        self.requests = 0
+        self.throttles = 0
+        self.wait_seconds = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self) -> float:
+        """Block until this request may go out. Returns the seconds waited.
+
+        The token is reserved under the lock and the wait happens outside it,
+        so concurrent callers queue up behind each other instead of all waking
+        at the same instant.
+        """
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self._tokens -= 1
+            wait = max(
+                self._paused_until - now,
+                -self._tokens / self.rate if self._tokens < 0 else 0.0,
+            )
+            self.requests += 1
+            self.wait_seconds += wait
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def throttled(self, retry_after: Optional[float] = None) -> None:
+        """Record a 429: pause everyone for ``retry_after``, halving the rate
+        unless we're already paused for an earlier one."""
+        if retry_after is None:
+            retry_after = _DEFAULT_RETRY_AFTER_SEC
+        retry_after = min(retry_after, _MAX_RETRY_AFTER_SEC)
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self.throttles += 1
+            if now >= self._paused_until:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.burst = max(1.0, self.rate)
+            # Whatever tokens we thought we had were evidently not ours to spend.
+            self._tokens = min(self._tokens, 0.0)
+            self._paused_until = max(self._paused_until, now + retry_after)
+        logging.info(
+            f"BioPortal throttled us; pausing {retry_after:.1f}s, rate now {self.rate:.2f}/s."
+        )
+
+    def succeeded(self) -> None:
+        """Record an unthrottled response: creep the rate back up."""
+        with self._lock:
+            if self.rate < self.max_rate:
+                # Additive increase, scaled so recovery from the floor to the
+                # ceiling takes on the order of a hundred requests.
+                step = max(0.01, (self.max_rate - self.min_rate) / 100)
+                self.rate = min(self.max_rate, self.rate + step)
+                self.burst = max(1.0, self.rate)
+
+    def stats(self) -> dict:
+        """Counters for the download summary."""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "throttles": self.throttles,
+                "wait_seconds": round(self.wait_seconds, 3),
+                "rate_per_sec": round(self.rate, 3),
+            }
+
+
+_shared: Optional[AdaptiveRateLimiter] = None
+_shared_lock = threading.Lock()
+
+
+def shared_limiter() -> AdaptiveRateLimiter:
+    """The process-wide limiter every Downloader uses unless handed another."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = AdaptiveRateLimiter()
+        return _shared
@@ -1,18 +1,156 @@
 """Functions for working with ROBOT."""
 
+import hashlib
 import os
 import logging
+import re
+import shutil
+import subprocess
+import tempfile
 import requests
 import sh  # type: ignore
 from sh import chmod  # type: ignore
 
-from kg_bioportal.config import ROBOT_JAVA_ARGS
+from kg_bioportal.config import ROBOT_CDS, ROBOT_JAVA_ARGS
+from kg_bioportal.heap import with_heap
 
 # Note that sh module can take environment variables, see
 # https://amoffat.github.io/sh/sections/special_arguments.html#env
 
 
-def initialize_robot(robot_path: str) -> list:
+class RobotOutOfMemory(Exception):
+    """Raised when ROBOT, run with a heap the caller chose, runs out of it."""
+
+
+def _heap_env(robot_env: dict, heap_gb: float) -> dict:
+    """``robot_env`` with ROBOT's -Xmx set to ``heap_gb`` (unchanged if 0)."""
+    if not heap_gb:
+        return robot_env
+    env = dict(robot_env)
+    env["ROBOT_JAVA_ARGS"] = with_heap(env.get("ROBOT_JAVA_ARGS", ""), heap_gb)
+    return env
+
+
+def _out_of_memory(e: sh.ErrorReturnCode) -> bool:
+    """True if a failed ROBOT run died of Java heap exhaustion."""
+    return b"java.lang.OutOfMemoryError" in (e.stderr or b"") + (e.stdout or b"")
+
+
+# Dynamic AppCDS archives (-XX:ArchiveClassesAtExit) arrived in JDK 13.
+_CDS_MIN_JAVA = 13
+
+# Enough of an ontology for a convert and a relax to load the parser, renderer
+# and relax classes every real call loads; archived from a run on it.
+_CDS_TRAINING_ONTOLOGY = """<?xml version="1.0"?>
+<rdf:RDF xmlns:owl="http://www.w3.org/2002/07/owl#"
+         xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+         xmlns:rdfs="http://www.w3.org/2000/01/rdf-schema#">
+    <owl:Ontology rdf:about="http://example.org/cds"/>
+    <owl:ObjectProperty rdf:about="http://example.org/cds#part_of"/>
+    <owl:Class rdf:about="http://example.org/cds#A">
+        <rdfs:label xml:lang="en">a</rdfs:label>
+    </owl:Class>
+    <owl:Class rdf:about="http://example.org/cds#B">
+        <rdfs:subClassOf rdf:resource="http://example.org/cds#A"/>
+        <owl:equivalentClass>
+            <owl:Restriction>
+                <owl:onProperty rdf:resource="http://example.org/cds#part_of"/>
+                <owl:someValuesFrom rdf:resource="http://example.org/cds#A"/>
+            </owl:Restriction>
+        </owl:equivalentClass>
+    </owl:Class>
+</rdf:RDF>
+"""
+
+# {(robot.jar, its mtime, PATH): archive path or ""}, so a process checks once.
+_cds_archives: dict = {}
+
+
+def java_feature_version(version_text: str) -> int:
+    """The feature release in ``java -version`` output (8 for 1.8, 17 for 17.0.2); 0 if none."""
+    match = re.search(r'version "(\d+)(?:\.(\d+))?', version_text)
+    if not match:
+        return 0
+    major = int(match.group(1))
+    return int(match.group(2) or 0) if major == 1 else major
+
+
+def _java_version(robot_env: dict) -> str:
+    """``java -version`` for the java the ROBOT script runs, or "" if there is none."""
+    java = shutil.which("java", path=robot_env.get("PATH"))
+    if not java:
+        return ""
+    try:
+        result = subprocess.run(
+            [java, "-version"], capture_output=True, text=True, env=robot_env, timeout=60
+        )
+    except (OSError, subprocess.SubprocessError):
+        return ""
+    return result.stderr.strip()
+
+
+def robot_cds_archive(robot_path: str, robot_env: dict) -> str:
+    """
+    Path to an AppCDS archive of ROBOT's classes, dumping it first if need be.
+
+    An archive only works for the robot.jar and JVM build it was dumped from,
+    so both go into its name, and it lives beside robot.jar. It is dumped by
+    a convert + relax of a tiny ontology with -XX:ArchiveClassesAtExit, to a
+    temporary name first so concurrent workers never map a partial one.
+    :param robot_path: Path to the ROBOT script (robot.jar is beside it).
+    :param robot_env: ROBOT's environment, for PATH and ROBOT_JAVA_ARGS.
+    :return: The archive's path, or "" where the JVM can't have one (or the
+    dump failed), in which case ROBOT runs as it always has.
+    """
+    jar = os.path.join(os.path.dirname(os.path.abspath(robot_path)), "robot.jar")
+    try:
+        key = (jar, os.stat(jar).st_mtime_ns, robot_env.get("PATH"))
+    except OSError:
+        return ""
+    if key in _cds_archives:
+        return _cds_archives[key]
+
+    _cds_archives[key] = ""
+    version = _java_version(robot_env)
+    if java_feature_version(version) < _CDS_MIN_JAVA:
+        logging.info("No class-data sharing for ROBOT: needs Java 13 or later.")
+        return ""
+    digest = hashlib.sha256(version.encode())
+    with open(jar, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    archive = os.path.join(os.path.dirname(jar), f"robot-{digest.hexdigest()[:12]}.jsa")
+
+    if not os.path.exists(archive):
+        partial = f"{archive}.{os.getpid()}.tmp"
+        env = dict(robot_env)
+        env["ROBOT_JAVA_ARGS"] = (
+            f"{env.get('ROBOT_JAVA_ARGS', '')} -XX:ArchiveClassesAtExit={partial}".strip()
+        )
+        logging.info(f"Dumping ROBOT's classes to {archive}...")
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "cds.owl")
+            with open(source, "w") as f:
+                f.write(_CDS_TRAINING_ONTOLOGY)
+            try:
+                sh.Command(robot_path)(
+                    "convert", "--input", source,
+                    "relax", "--output", os.path.join(tmp, "relaxed.owl"),
+                    _env=env, _timeout=600,
+                )
+            except (sh.ErrorReturnCode, sh.TimeoutException, sh.CommandNotFound, OSError) as e:
+                logging.info(f"No class-data sharing for ROBOT: the training run failed: {e}")
+        if not os.path.exists(partial):
+            return ""
+        os.replace(partial, archive)
+
+    _cds_archives[key] = archive
+    return archive
+
+
+def initialize_robot(
+    robot_path: str, java_args: str = ROBOT_JAVA_ARGS, cds: bool = ROBOT_CDS
+) -> list:
     """
     Initialize ROBOT with necessary configuration.
 
@@ -20,6 +158,9 @@ def initialize_robot(robot_path: str) -> list:
     and the path variable used here is only necessary if it varies from
     the project location.
     :param path: Path to ROBOT files.
+    :param java_args: JVM arguments for ROBOT (ROBOT_JAVA_ARGS).
+    :param cds: If True, ROBOT maps an AppCDS archive of its classes where
+    the JVM supports one (see robot_cds_archive).
     :return: A list consisting an instance of Command and
     dict of all environment variables.
     """
@@ -43,13 +184,19 @@ def initialize_robot(robot_path: str) -> list:
     # the ROBOT_JAVA_ARGS environment variable if set (so CI can size the heap
     # to the runner) and otherwise falls back to a sane default.
     env = os.environ.copy()
-    env["ROBOT_JAVA_ARGS"] = ROBOT_JAVA_ARGS  # For JDK 10 and over
+    env["ROBOT_JAVA_ARGS"] = java_args  # For JDK 10 and over
 
     try:
         robot_command = sh.Command(robot_path)
     except sh.CommandNotFound:  # If for whatever reason ROBOT isn't available
         robot_command = None
 
+    # -Xshare:auto (the default, spelled out) means a JVM that can't map the
+    # archive after all just loads the classes itself.
+    archive = robot_cds_archive(robot_path, env) if cds and robot_command else ""
+    if archive:
+        env["ROBOT_JAVA_ARGS"] = f"{java_args} -XX:SharedArchiveFile={archive} -Xshare:auto"
+
     return [robot_command, env]
 
 
@@ -59,6 +206,7 @@ def robot_relax(
     output_path: str,
     robot_env: dict,
     timeout: int = 10800,
+    heap_gb: float = 0,
 ) -> bool:
     """
     Run the ROBOT relax command on a single ontology.
@@ -68,6 +216,9 @@ def robot_relax(
     :param output_owl: Ontology file to be created (needs valid ROBOT suffix)
     :param robot_env: dict of environment variables, including ROBOT_JAVA_ARGS
     :param timeout: Wall-clock limit in seconds; the process is killed if exceeded.
+    :param heap_gb: Java heap for this call, in place of ROBOT_JAVA_ARGS' -Xmx.
+        If given and ROBOT runs out of it, RobotOutOfMemory is raised, so the
+        caller can decide whether to try a bigger one.
     :return: True if completed without errors, False if errors
     """
     success = False
@@ -84,12 +235,14 @@ def robot_relax(
             "--output",
             output_path,
             "-vvv",
-            _env=robot_env,
+            _env=_heap_env(robot_env, heap_gb),
             _timeout=timeout,
         )
         print("Complete.")
         success = True
     except sh.ErrorReturnCode_1 as e:  # If ROBOT runs but returns an error
+        if heap_gb and _out_of_memory(e):
+            raise RobotOutOfMemory(f"ROBOT ran out of its {heap_gb:g} GB heap") from e
         print(f"ROBOT encountered an error: {e}")
         success = False
     except sh.SignalException_SIGKILL as e:  # If ROBOT encounters severe error
@@ -108,6 +261,7 @@ def robot_convert(
     output_path: str,
     robot_env: dict,
     timeout: int = 10800,
+    heap_gb: float = 0,
 ) -> bool:
     """
     Run a ROBOT convert command on a single ontology.
@@ -117,6 +271,9 @@ def robot_convert(
     :param output_path: Ontology file to be created (needs valid ROBOT suffix)
     :param robot_env: dict of environment variables, including ROBOT_JAVA_ARGS
     :param timeout: Wall-clock limit in seconds; the process is killed if exceeded.
+    :param heap_gb: Java heap for this call, in place of ROBOT_JAVA_ARGS' -Xmx.
+        If given and ROBOT runs out of it, RobotOutOfMemory is raised, so the
+        caller can decide whether to try a bigger one.
     :return: True if completed without errors, False if errors
     """
     success = False
@@ -133,12 +290,14 @@ def robot_convert(
             "--output",
             output_path,
             "-vvv",
-            _env=robot_env,
+            _env=_heap_env(robot_env, heap_gb),
             _timeout=timeout,
         )
         print("Complete.")
         success = True
     except sh.ErrorReturnCode_1 as e:  # If ROBOT runs but returns an error
+        if heap_gb and _out_of_memory(e):
+            raise RobotOutOfMemory(f"ROBOT ran out of its {heap_gb:g} GB heap") from e
         print(f"ROBOT encountered an error: {e}")
         success = False
     except sh.SignalException_SIGKILL as e:  # If ROBOT encounters severe error
@@ -0,0 +1,134 @@
+"""Plan the shards of a build by predicted cost rather than by position.
+
+Round-robin over an alphabetical list spreads ontologies evenly by count, but
+count is not what limits a shard: a handful of slow ontologies landing together
+runs one job into the 6 h cap while its neighbours finish in minutes. Here each
+ontology's cost is estimated from what the previous index recorded about it,
+and shards are packed so the slowest one finishes as early as possible.
+"""
+
+import heapq
+import statistics
+from typing import Dict, List, Optional, Tuple
+
+# Fixed cost of any ontology we have to estimate: the download, the JVM start
+# for each ROBOT call, and the KGX setup. Recorded durations already include it.
+PER_ONTOLOGY_OVERHEAD_SEC = 20.0
+
+# Rates used when the index has no durations to learn them from. Rough, but
+# only their ratio to each other matters until durations are recorded.
+DEFAULT_SEC_PER_RECORD = 1e-4
+DEFAULT_SEC_PER_BYTE = 2e-6
+
+
+def _number(value) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _records(entry: dict) -> float:
+    return _number(entry.get("nodecount")) + _number(entry.get("edgecount"))
+
+
+def _rate(pairs: List[Tuple[float, float]], default: float) -> float:
+    """Seconds per unit over (seconds, units) pairs, or ``default`` if none.
+
+    A ratio of sums rather than a mean of ratios, so the big ontologies -- the
+    ones that decide how long a shard takes -- decide the rate too.
+    """
+    seconds = sum(s for s, u in pairs if u > 0)
+    units = sum(u for s, u in pairs if u > 0)
+    return seconds / units if units else default
+
+
+def estimate_costs(
+    acronyms: List[str], index: Dict[str, dict], source_sizes: Optional[Dict[str, int]] = None
+) -> Dict[str, float]:
+    """Predict how many seconds each ontology will take to build.
+
+    In order of preference, an ontology's cost is:
+
+    1. its ``duration_sec`` from the index, as recorded by its last transform;
+    2. its last node + edge count, at the rate the index's timed entries show;
+    3. its source size (from the index, or from ``source_sizes`` for one the
+       index hasn't seen), at the rate the index's timed entries show;
+    4. the median of the other estimates, when nothing is known about it.
+
+    Args:
+        acronyms: The ontologies to estimate.
+        index: {acronym: onto_stats entry} from the previous build's index.
+        source_sizes: {acronym: bytes}, e.g. from a probe-sizes manifest.
+
+    Returns:
+        {acronym: predicted seconds}.
+    """
+    source_sizes = source_sizes or {}
+    # What the timed, successful transforms spent beyond the fixed overhead.
+    timed = []
+    for entry in index.values():
+        duration = _number(entry.get("duration_sec"))
+        if duration > 0 and entry.get("status") == "OK":
+            timed.append((max(duration - PER_ONTOLOGY_OVERHEAD_SEC, 0.0), entry))
+    sec_per_record = _rate([(s, _records(e)) for s, e in timed], DEFAULT_SEC_PER_RECORD)
+    sec_per_byte = _rate(
+        [(s, _number(e.get("source_bytes"))) for s, e in timed], DEFAULT_SEC_PER_BYTE
+    )
+
+    costs: Dict[str, float] = {}
+    unknown = []
+    for acr in acronyms:
+        entry = index.get(acr, {})
+        duration = _number(entry.get("duration_sec"))
+        records = _records(entry)
+        size = _number(entry.get("source_bytes")) or _number(source_sizes.get(acr))
+        if duration > 0:
+            costs[acr] = duration
+        elif records > 0:
+            costs[acr] = PER_ONTOLOGY_OVERHEAD_SEC + records * sec_per_record
+        elif size > 0:
+            costs[acr] = PER_ONTOLOGY_OVERHEAD_SEC + size * sec_per_byte
+        else:
+            unknown.append(acr)
+
+    fallback = statistics.median(costs.values()) if costs else PER_ONTOLOGY_OVERHEAD_SEC
+    for acr in unknown:
+        costs[acr] = fallback
+    return costs
+
+
+def pack_shards(costs: Dict[str, float], num_shards: int) -> List[Tuple[float, List[str]]]:
+    """Split ontologies into at most ``num_shards`` shards of even predicted load.
+
+    Longest processing time first: take ontologies from the most to the least
+    expensive and give each to the shard with the least load so far. The
+    slowest shard then finishes within 4/3 of the best possible split, and the
+    giants -- the ones that cause overruns -- are the ones placed with the most
+    room to spare. Ties are broken by acronym so the plan is reproducible.
+
+    Args:
+        costs: {acronym: predicted seconds}.
+        num_shards: Most shards to produce.
+
+    Returns:
+        [(predicted seconds, [acronyms])], one per non-empty shard, acronyms in
+        alphabetical order.
+    """
+    n = max(1, min(num_shards, len(costs)))
+    heap = [(0.0, i) for i in range(n)]
+    shards: List[List[str]] = [[] for _ in range(n)]
+    loads = [0.0] * n
+    for acr in sorted(costs, key=lambda a: (-costs[a], a)):
+        load, i = heapq.heappop(heap)
+        shards[i].append(acr)
+        loads[i] = load + costs[acr]
+        heapq.heappush(heap, (loads[i], i))
+    return [(loads[i], sorted(shards[i])) for i in range(n) if shards[i]]
+
+
+def format_duration(seconds: float) -> str:
+    """Seconds as e.g. ``1h05m`` or ``12m``, for load reports."""
+    minutes = int(round(seconds / 60))
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m"
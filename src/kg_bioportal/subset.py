@@ -0,0 +1,195 @@
+"""Named subset graphs, built from ontology profiles.
+
+A profile is a YAML list of ontologies, as notebooks/clinical_ontologies.yaml
+is::
+
+    ontologies:
+      - name: "ATC"
+        test_set: true
+      - name: "HL7"
+
+``build_subset`` resolves each member (optionally only those with a flag set,
+such as ``test_set``) to its published artifact through graph_urls.tsv or
+onto_stats.yaml, fetches the artifacts into the local cache concurrently (see
+artifact_fetch), and merges them with the streaming merge (see graph_merge).
+
+Every artifact is named by its download_url, which changes whenever the
+ontology is rebuilt, so the subset built from a profile is fixed by the
+members it resolved to, their URLs and the merge options. Their hash keys a
+cache of built subsets:
+
+    <cache_dir>/subsets/<key>/<name>.tar.gz, <name>_dangling.tsv, subset.json
+
+Rebuilding an unchanged profile copies the cached subset out without fetching
+or merging anything. Members that can't be resolved are reported and left out.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+from kg_bioportal.artifact_fetch import (
+    LATEST_GRAPH_URLS,
+    fetch_artifacts,
+    link_or_copy,
+    resolve_graph_urls,
+)
+from kg_bioportal.config import ARTIFACT_CACHE_DIR, FETCH_WORKERS, MERGE_WORKERS
+from kg_bioportal.graph_merge import merge_graph
+from kg_bioportal.index import load_yaml
+
+SUBSET_SUMMARY_NAME = "subset.json"
+
+
+def load_profile(path: str, select: str = "") -> List[str]:
+    """The acronyms a profile lists, in order.
+
+    Args:
+        path: The profile YAML: ``ontologies``, a list of ``{name: ...}``
+            mappings (or of bare acronyms).
+        select: If given, only the members with this key set true.
+    """
+    data = load_yaml(path) or {}
+    members = []
+    for member in data.get("ontologies") or []:
+        if isinstance(member, str):
+            member = {"name": member}
+        if not member.get("name") or (select and not member.get(select)):
+            continue
+        if member["name"] not in members:
+            members.append(member["name"])
+    return members
+
+
+def resolve_members(
+    members: List[str], urls: Dict[str, str], index: Optional[Dict[str, dict]] = None
+) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """Each member's download_url, and why the others have none.
+
+    With an index, its entries decide: an ontology resolves only if its entry
+    is OK with a download_url. Otherwise graph_urls.tsv's mapping does.
+    """
+    resolved, missing = {}, {}
+    for acronym in members:
+        if index:
+            entry = index.get(acronym)
+            if not entry:
+                missing[acronym] = "not in the index"
+            elif entry.get("status") != "OK" or not entry.get("download_url"):
+                missing[acronym] = entry.get("reason") or entry.get("status") or "no download_url"
+            else:
+                resolved[acronym] = entry["download_url"]
+        elif acronym in urls:
+            resolved[acronym] = urls[acronym]
+        else:
+            missing[acronym] = "not in graph_urls.tsv"
+    return resolved, missing
+
+
+def subset_key(resolved: Dict[str, str], options: dict) -> str:
+    """What a built subset is cached under: its members' artifacts and options.
+
+    Member order is kept, as it decides which ontology's values a merged node
+    keeps.
+    """
+    blob = json.dumps({"artifacts": list(resolved.items()), "options": options}, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+
+def build_subset(
+    profile_path: str,
+    output_dir: str,
+    name: str = "",
+    select: str = "",
+    urls_source: str = LATEST_GRAPH_URLS,
+    index: Optional[Dict[str, dict]] = None,
+    cache_dir: str = ARTIFACT_CACHE_DIR,
+    fetch_workers: int = FETCH_WORKERS,
+    merge_workers: int = MERGE_WORKERS,
+    dangling: str = "report",
+    refresh: bool = False,
+) -> dict:
+    """Build (or copy out of the cache) the subset graph of a profile.
+
+    Args:
+        profile_path: The profile YAML.
+        output_dir: Where ``<name>.tar.gz`` and ``<name>_dangling.tsv`` go.
+        name: Stem of the subset's files (default: the profile's file name,
+            and the ``select`` key if given).
+        select: If given, only the profile's members with this key set true.
+        urls_source: graph_urls.tsv, as a path or URL. Not read if ``index``
+            is given.
+        index: The onto_stats index, by acronym, to resolve members through.
+        cache_dir: The artifact and subset cache.
+        fetch_workers: Artifacts fetched at once.
+        merge_workers: Processes to merge with (0: one per CPU).
+        dangling: What the merge does with dangling edges (see graph_merge).
+        refresh: If True, rebuilds the subset even if it is cached.
+
+    Returns:
+        The members resolved and missing, the subset's key, whether it came
+        from the cache, where it was written, and the merge's counts.
+
+    Raises:
+        ValueError: If none of the profile's members resolve, or one of their
+            artifacts could not be fetched.
+    """
+    stem = os.path.splitext(os.path.basename(profile_path))[0]
+    name = name or (f"{stem}-{select}" if select else stem)
+    members = load_profile(profile_path, select)
+    urls = {} if index else resolve_graph_urls(urls_source, cache_dir)
+    resolved, missing = resolve_members(members, urls, index)
+    if not resolved:
+        raise ValueError(f"None of the {len(members)} ontologies in {profile_path} resolve")
+
+    key = subset_key(resolved, {"name": name, "dangling": dangling})
+    built = os.path.join(cache_dir, "subsets", key)
+    cached = os.path.exists(os.path.join(built, SUBSET_SUMMARY_NAME)) and not refresh
+    if not cached:
+        os.makedirs(os.path.dirname(built), exist_ok=True)
+        # Built beside its place in the cache and moved in whole, so a cache
+        # entry is always a complete subset.
+        staging = tempfile.mkdtemp(prefix=f"{key}-", dir=os.path.dirname(built))
+        try:
+            # The artifacts are linked in from the artifact cache for the
+            # merge, and dropped once it is done.
+            artifacts_dir = os.path.join(staging, "artifacts")
+            digests = {a: index[a].get("artifact_sha256", "") for a in resolved} if index else {}
+            paths, fetch_stats = fetch_artifacts(
+                resolved, artifacts_dir, cache_dir, fetch_workers, digests=digests
+            )
+            if fetch_stats["failed"]:
+                failed = "; ".join(f"{a}: {e}" for a, e in fetch_stats["failed"].items())
+                raise ValueError(f"Could not fetch {failed}")
+            merge_stats = merge_graph(
+                [paths[acronym] for acronym in resolved], staging, name=name,
+                workers=merge_workers, dangling=dangling,
+            )
+            shutil.rmtree(artifacts_dir)
+            with open(os.path.join(staging, SUBSET_SUMMARY_NAME), "w") as f:
+                json.dump({"merge": merge_stats, "fetch": fetch_stats}, f)
+            shutil.rmtree(built, ignore_errors=True)
+            os.replace(staging, built)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    with open(os.path.join(built, SUBSET_SUMMARY_NAME)) as f:
+        summary = json.load(f)
+    os.makedirs(output_dir, exist_ok=True)
+    for file_name in sorted(os.listdir(built)):
+        if file_name != SUBSET_SUMMARY_NAME:
+            link_or_copy(os.path.join(built, file_name), os.path.join(output_dir, file_name))
+
+    return {
+        "profile": profile_path,
+        "members": len(members),
+        "resolved": list(resolved),
+        "missing": missing,
+        "key": key,
+        "cached": cached,
+        "path": os.path.join(output_dir, f"{name}.tar.gz"),
+        **summary["merge"],
+    }
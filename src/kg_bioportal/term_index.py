@@ -0,0 +1,283 @@
+"""The cross-ontology term index: which ontologies mention a CURIE or a prefix.
+
+Answering "which BioPortal ontologies have GO:0008150?" used to mean fetching
+and grepping every artifact. Instead, each transform leaves two small
+by-products beside its artifact:
+
+    <ACRONYM>_terms.txt.gz   the ontology's node ids, sorted and unique
+    <ACRONYM>_prefixes.tsv   how many of them have each prefix
+
+and ``build_term_index`` folds them into term_index.db, an SQLite inverted
+index from term to ontologies, published beside graph_urls.tsv. A lookup is a
+single primary-key range read.
+
+Releases are incremental, so the index is too: it is built over the previous
+one, replacing the rows of only those ontologies that have a new term list and
+dropping the ones the index (onto_stats.yaml) no longer resolves.
+
+Depends only on the standard library, so .github/scripts/build_term_index.py
+can run it from a checkout without the package's heavy dependencies.
+"""
+
+import glob
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+from collections import Counter
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Optional
+
+TERM_INDEX_NAME = "term_index.db"
+TERMS_SUFFIX = "_terms.txt.gz"
+PREFIXES_SUFFIX = "_prefixes.tsv"
+
+# Bumped if the schema changes; an index of another format is rebuilt.
+TERM_INDEX_FORMAT = "1"
+
+# Rows per executemany call when loading a term list.
+_INSERT_BATCH = 10000
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE ontologies (
+    id INTEGER PRIMARY KEY, acronym TEXT UNIQUE NOT NULL, terms INTEGER, download_url TEXT
+);
+CREATE TABLE terms (
+    curie TEXT NOT NULL, ontology INTEGER NOT NULL, PRIMARY KEY (curie, ontology)
+) WITHOUT ROWID;
+CREATE INDEX terms_by_ontology ON terms (ontology);
+CREATE TABLE prefixes (
+    prefix TEXT NOT NULL, ontology INTEGER NOT NULL, count INTEGER NOT NULL,
+    PRIMARY KEY (prefix, ontology)
+) WITHOUT ROWID;
+CREATE INDEX prefixes_by_ontology ON prefixes (ontology);
+"""
+
+
+def curie_prefix(node_id: str) -> str:
+    """The prefix of a CURIE (``GO`` for ``GO:0008150``), or an IRI's namespace.
+
+    An IRI's namespace runs to its last ``#`` or ``/``, inclusive. Anything
+    else has no prefix.
+    """
+    if node_id.startswith(("http://", "https://")):
+        cut = max(node_id.rfind("#"), node_id.rfind("/"))
+        return node_id[: cut + 1]
+    if ":" in node_id:
+        return node_id.split(":", 1)[0]
+    return ""
+
+
+def _node_ids(nodes_tsv: str) -> Iterator[str]:
+    with open(nodes_tsv, encoding="utf-8") as f:
+        header = f.readline().rstrip("\r\n").split("\t")
+        column = header.index("id") if "id" in header else 0
+        for line in f:
+            fields = line.rstrip("\r\n").split("\t")
+            if len(fields) > column and fields[column]:
+                yield fields[column]
+
+
+def write_term_list(nodes_tsv: str, output_dir: str, acronym: str) -> int:
+    """Write an ontology's term list and prefix histogram from its nodes TSV.
+
+    Args:
+        nodes_tsv: The KGX nodes file the transform wrote.
+        output_dir: Where ``<acronym>_terms.txt.gz`` and
+            ``<acronym>_prefixes.tsv`` go.
+        acronym: The ontology's acronym.
+
+    Returns:
+        The number of distinct terms.
+    """
+    terms = sorted(set(_node_ids(nodes_tsv)))
+    # mtime=0 so an unchanged ontology gives a byte-identical file.
+    with open(os.path.join(output_dir, acronym + TERMS_SUFFIX), "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as f:
+            for term in terms:
+                f.write(term.encode("utf-8") + b"\n")
+    prefixes = Counter(curie_prefix(term) for term in terms)
+    with open(os.path.join(output_dir, acronym + PREFIXES_SUFFIX), "w", encoding="utf-8") as f:
+        f.write("prefix\tcount\n")
+        for prefix, count in sorted(prefixes.items(), key=lambda item: (-item[1], item[0])):
+            f.write(f"{prefix}\t{count}\n")
+    return len(terms)
+
+
+def read_term_list(path: str) -> Iterator[str]:
+    """The terms in a ``<ACRONYM>_terms.txt.gz``, in order."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            term = line.rstrip("\n")
+            if term:
+                yield term
+
+
+def _read_prefixes(path: str, terms_path: str) -> Dict[str, int]:
+    """The prefix histogram beside a term list, or counted from the list."""
+    if not os.path.exists(path):
+        return Counter(curie_prefix(term) for term in read_term_list(terms_path))
+    with open(path, encoding="utf-8") as f:
+        f.readline()
+        return {prefix: int(count) for prefix, count in (
+            line.rstrip("\n").split("\t") for line in f if line.strip()
+        )}
+
+
+def _open_base(base_path: str, db_path: str) -> sqlite3.Connection:
+    """A writable copy of the previous index at ``db_path``, or a new one."""
+    if base_path and os.path.exists(base_path):
+        shutil.copyfile(base_path, db_path)
+        con = sqlite3.connect(db_path)
+        try:
+            (version,) = con.execute("SELECT value FROM meta WHERE key = 'format'").fetchone()
+        except (sqlite3.DatabaseError, TypeError):
+            version = None
+        if version == TERM_INDEX_FORMAT:
+            return con
+        con.close()
+        logging.warning(f"{base_path} is not a term index of format {TERM_INDEX_FORMAT}; "
+                        "starting a new one.")
+        os.remove(db_path)
+    con = sqlite3.connect(db_path)
+    con.executescript(_SCHEMA)
+    with con:
+        con.execute("INSERT INTO meta VALUES ('format', ?)", (TERM_INDEX_FORMAT,))
+    return con
+
+
+def _forget(con: sqlite3.Connection, ontology: int) -> None:
+    con.execute("DELETE FROM terms WHERE ontology = ?", (ontology,))
+    con.execute("DELETE FROM prefixes WHERE ontology = ?", (ontology,))
+
+
+def build_term_index(
+    terms_dir: str,
+    db_path: str,
+    base_path: str = "",
+    index: Optional[Dict[str, dict]] = None,
+    report: Callable[[str], None] = print,
+) -> dict:
+    """Build term_index.db over the previous one from a build's term lists.
+
+    Args:
+        terms_dir: Searched recursively for ``<ACRONYM>_terms.txt.gz`` files
+            (and the ``_prefixes.tsv`` beside each).
+        db_path: Where the index is written.
+        base_path: The previous index, whose other ontologies carry over.
+        index: The merged onto_stats index, by acronym. If given, ontologies
+            without an OK, resolvable entry are dropped, and each kept
+            ontology records its entry's download_url.
+        report: Called with each progress line.
+
+    Returns:
+        Counts: ontologies updated, dropped and in the index, and terms.
+    """
+    tmp_path = db_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    con = _open_base(base_path, tmp_path)
+    con.execute("PRAGMA journal_mode = OFF")
+    con.execute("PRAGMA synchronous = OFF")
+
+    pattern = os.path.join(terms_dir, "**", "*" + TERMS_SUFFIX)
+    term_lists = sorted(glob.glob(pattern, recursive=True))
+    updated = 0
+    for path in term_lists:
+        acronym = os.path.basename(path)[: -len(TERMS_SUFFIX)]
+        with con:
+            con.execute("INSERT OR IGNORE INTO ontologies (acronym) VALUES (?)", (acronym,))
+            (ontology,) = con.execute(
+                "SELECT id FROM ontologies WHERE acronym = ?", (acronym,)
+            ).fetchone()
+            _forget(con, ontology)
+            terms = read_term_list(path)
+            count = 0
+            while True:
+                batch = [(term, ontology) for term in islice(terms, _INSERT_BATCH)]
+                if not batch:
+                    break
+                con.executemany("INSERT OR IGNORE INTO terms VALUES (?, ?)", batch)
+                count += len(batch)
+            prefixes = _read_prefixes(path[: -len(TERMS_SUFFIX)] + PREFIXES_SUFFIX, path)
+            con.executemany(
+                "INSERT INTO prefixes VALUES (?, ?, ?)",
+                [(prefix, ontology, n) for prefix, n in prefixes.items()],
+            )
+            con.execute("UPDATE ontologies SET terms = ? WHERE id = ?", (count, ontology))
+        updated += 1
+
+    dropped = 0
+    if index is not None:
+        with con:
+            for ontology, acronym in con.execute("SELECT id, acronym FROM ontologies").fetchall():
+                entry = index.get(acronym) or {}
+                if entry.get("status") == "OK" and entry.get("download_url"):
+                    con.execute(
+                        "UPDATE ontologies SET download_url = ? WHERE id = ?",
+                        (entry["download_url"], ontology),
+                    )
+                else:
+                    _forget(con, ontology)
+                    con.execute("DELETE FROM ontologies WHERE id = ?", (ontology,))
+                    dropped += 1
+
+    (ontologies,) = con.execute("SELECT COUNT(*) FROM ontologies").fetchone()
+    (terms,) = con.execute("SELECT COALESCE(SUM(terms), 0) FROM ontologies").fetchone()
+    con.execute("VACUUM")
+    con.close()
+    os.replace(tmp_path, db_path)
+
+    report(
+        f"Term index: {updated} ontologies updated, {dropped} dropped, "
+        f"{ontologies} ontologies and {terms} terms -> {db_path}"
+    )
+    return {"updated": updated, "dropped": dropped, "ontologies": ontologies, "terms": terms}
+
+
+class TermIndex:
+    """Lookups in a term_index.db."""
+
+    def __init__(self, path: str = TERM_INDEX_NAME) -> None:
+        """Opens the index read-only.
+
+        Args:
+            path: The term_index.db to read.
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self._con = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+    def ontologies(self, curie: str) -> List[str]:
+        """Acronyms of the ontologies with a node ``curie``, sorted."""
+        return [acronym for (acronym,) in self._con.execute(
+            "SELECT o.acronym FROM terms t JOIN ontologies o ON o.id = t.ontology "
+            "WHERE t.curie = ? ORDER BY o.acronym",
+            (curie,),
+        )]
+
+    def prefix(self, prefix: str) -> Dict[str, int]:
+        """How many nodes with ``prefix`` each ontology has, most first."""
+        return dict(self._con.execute(
+            "SELECT o.acronym, p.count FROM prefixes p JOIN ontologies o ON o.id = p.ontology "
+            "WHERE p.prefix = ? ORDER BY p.count DESC, o.acronym",
+            (prefix,),
+        ).fetchall())
+
+    def download_url(self, acronym: str) -> Optional[str]:
+        """The artifact URL recorded for an ontology, if any."""
+        row = self._con.execute(
+            "SELECT download_url FROM ontologies WHERE acronym = ?", (acronym,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def close(self) -> None:
+        self._con.close()
+
+    def __enter__(self) -> "TermIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
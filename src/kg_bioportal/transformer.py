@@ -9,21 +9,32 @@ import shutil
 import signal
 import sys
 import tarfile
+import time
 import zipfile
-from contextlib import contextmanager
+from contextlib import ExitStack, contextmanager, nullcontext
 from typing import List, Optional, Tuple
 
 import yaml
 from kgx.transformer import Transformer as KGXTransformer
 
-from kg_bioportal.config import (
-    LICENSE_RESTRICTED_REASON,
-    MAX_SOURCE_MB,
-    PER_ONTOLOGY_TIMEOUT_MIN,
+from kg_bioportal.bloom import write_id_filter
+from kg_bioportal.config import LANE_LIMITS, LICENSE_RESTRICTED_REASON, ROBOT_HEAP_MULTIPLIER
+from kg_bioportal.downloader import (
+    DOWNLOAD_REPORT_NAME,
+    DOWNLOAD_SUMMARY_NAME,
+    ONTOLOGY_LIST_NAME,
+    SIZE_MANIFEST_NAME,
 )
-from kg_bioportal.downloader import DOWNLOAD_REPORT_NAME, ONTOLOGY_LIST_NAME
+from kg_bioportal.heap import HeapBudget, heap_for_source, xmx_gb
+from kg_bioportal.index import file_sha256
 from kg_bioportal.kgx_patches import patch_mixed_type_sorting
-from kg_bioportal.robot_utils import initialize_robot, robot_convert, robot_relax
+from kg_bioportal.robot_utils import (
+    RobotOutOfMemory,
+    initialize_robot,
+    robot_convert,
+    robot_relax,
+)
+from kg_bioportal.term_index import TERMS_SUFFIX, read_term_list, write_term_list
 
 # Applied at import so it is in place for any use of the KGX transform, not just
 # the ones that go through Transformer. See kgx_patches for what and why.
@@ -36,7 +47,12 @@ patch_mixed_type_sorting()
 # TODO: Assign IDs to edges when they lack them
 
 # Files in the input dir that are not ontologies to transform.
-_NON_ONTOLOGY_FILES = {ONTOLOGY_LIST_NAME, DOWNLOAD_REPORT_NAME}
+_NON_ONTOLOGY_FILES = {
+    ONTOLOGY_LIST_NAME,
+    DOWNLOAD_REPORT_NAME,
+    DOWNLOAD_SUMMARY_NAME,
+    SIZE_MANIFEST_NAME,
+}
 
 # Patterns for ontology import declarations in the two XML serializations
 # BioPortal serves most often: RDF/XML (<owl:imports .../>) and OWL/XML (<Import>...</Import>).
@@ -55,7 +71,7 @@ def strip_imports(path: str) -> str:
     runner the whole convert/relax fails (UnloadableImportException). This is the
     dominant KG-Bioportal transform failure. Each ontology is transformed on its
     own, so imports are not needed — references to imported terms just become
-    dangling edges, resolved later at merge time.
+    dangling edges, resolved later at merge time (see graph_merge).
 
     Only XML serializations (RDF/XML, OWL/XML) are handled. Returns the path to a
     cleaned sibling file, or the original path if nothing was removed / the file
@@ -309,6 +325,15 @@ class SourceTooLarge(Exception):
     """
 
 
+class HeapTooSmall(Exception):
+    """Raised when ROBOT runs out of a heap below the ceiling.
+
+    The source is then transformed again from the start at the ceiling, by
+    transform_source, which can give up its reservation before asking for the
+    bigger one.
+    """
+
+
 @contextmanager
 def deadline(seconds: int):
     """Enforce a wall-clock deadline on a block of code.
@@ -336,12 +361,24 @@ def deadline(seconds: int):
 
 class Transformer:
 
+    # Until __init__ says otherwise: light lane, and every ROBOT call gets the
+    # heap ROBOT_JAVA_ARGS gives it.
+    lane = "light"
+    heap_multiplier = 0.0
+    heap_budget: Optional[HeapBudget] = None
+    heap_gb = 0.0
+    oom_heap_gb = 0.0
+
     def __init__(
         self,
         input_dir: str = "data/raw",
         output_dir: str = "data/transformed",
-        timeout_min: float = PER_ONTOLOGY_TIMEOUT_MIN,
-        max_source_mb: float = MAX_SOURCE_MB,
+        timeout_min: Optional[float] = None,
+        max_source_mb: Optional[float] = None,
+        lane: str = "light",
+        java_args: Optional[str] = None,
+        heap_multiplier: float = ROBOT_HEAP_MULTIPLIER,
+        heap_budget: Optional[HeapBudget] = None,
     ) -> None:
         """Initializes the Transformer class.
 
@@ -355,16 +392,34 @@ class Transformer:
             max_source_mb: Size gate re-applied to a *decompressed* source, which
                 the downloader's gate could not weigh. Over this, the ontology is
                 recorded as skipped (too_large) instead of being handed to ROBOT.
+            lane: "light" or "heavy" (see config.LANE_LIMITS). Supplies the
+                limits not given explicitly, and heavy-lane entries are marked
+                with ``lane: heavy``.
+            java_args: ROBOT_JAVA_ARGS for ROBOT. Its -Xmx is the most heap any
+                one ROBOT call is given.
+            heap_multiplier: Heap per byte of source for each ROBOT call (see
+                heap.heap_for_source); 0 gives every call the whole -Xmx.
+            heap_budget: Shared with other processes' Transformers, to keep the
+                heaps of their concurrent ROBOT calls within the machine's RAM.
 
         Returns:
             None.
         """
+        limits = LANE_LIMITS[lane]
+        timeout_min = limits["timeout_min"] if timeout_min is None else timeout_min
+        max_source_mb = limits["max_source_mb"] if max_source_mb is None else max_source_mb
+        self.lane = lane
+        self.java_args = java_args or limits["java_args"]
         self.input_dir = input_dir
         self.output_dir = output_dir
         self.timeout_min = timeout_min
         self.timeout_sec = int(timeout_min * 60)
         self.max_source_mb = max_source_mb
         self.max_source_bytes = int(max_source_mb * 1024 * 1024)
+        self.heap_ceiling_gb = xmx_gb(self.java_args)
+        # Without an -Xmx there is no ceiling to size beneath.
+        self.heap_multiplier = heap_multiplier if self.heap_ceiling_gb else 0.0
+        self.heap_budget = heap_budget
 
         # If the output directory does not exist, create it
         if not os.path.exists(self.output_dir):
@@ -373,7 +428,7 @@ class Transformer:
         # Do ROBOT setup
         logging.info("Setting up ROBOT...")
         self.robot_path = os.path.join(os.getcwd(), "robot")
-        self.robot_params = initialize_robot(self.robot_path)
+        self.robot_params = initialize_robot(self.robot_path, java_args=self.java_args)
         logging.info(f"ROBOT path: {self.robot_path}")
         self.robot_env = self.robot_params[1]
         logging.info(f"ROBOT evironment variables: {self.robot_env['ROBOT_JAVA_ARGS']}")
@@ -395,6 +450,34 @@ class Transformer:
                 report[row["id"]] = row
         return report
 
+    @staticmethod
+    def _seed_log(download_report: dict) -> dict:
+        """Start the per-ontology log from the download report.
+
+        Ontologies that were skipped or errored at download time have no file
+        on disk to walk, so this is the only place they get an entry.
+        """
+        onto_log = {}
+        for onto_id, row in download_report.items():
+            if row.get("status") in ("skipped", "error"):
+                entry = {
+                    "status": "Skipped" if row["status"] == "skipped" else "Failed",
+                    "reason": row.get("reason", ""),
+                    "name": row.get("name", ""),
+                    "version": row.get("version", ""),
+                    "nodecount": 0,
+                    "edgecount": 0,
+                    "submission_id": row.get("submission_id", "NA"),
+                    "source_bytes": int(row.get("source_bytes") or 0),
+                }
+                # Only download outcomes have a status code; don't clutter the
+                # other entries with an empty field.
+                http_status = row.get("http_status") or ""
+                if http_status:
+                    entry["http_status"] = int(http_status)
+                onto_log[onto_id] = entry
+        return onto_log
+
     def transform_all(self, compress: bool) -> None:
         """Transforms all ontologies in the input directory to KGX nodes and edges.
 
@@ -419,28 +502,7 @@ class Transformer:
         # This keeps track of the status of each transform.
         # Ontology acronym IDs are keys. Values carry status, counts, reason,
         # submission id, and source size.
-        onto_log = {}
-
-        # Seed the log with ontologies that were skipped or errored at download
-        # time (they have no file on disk to walk).
-        for onto_id, row in download_report.items():
-            if row.get("status") in ("skipped", "error"):
-                entry = {
-                    "status": "Skipped" if row["status"] == "skipped" else "Failed",
-                    "reason": row.get("reason", ""),
-                    "name": row.get("name", ""),
-                    "version": row.get("version", ""),
-                    "nodecount": 0,
-                    "edgecount": 0,
-                    "submission_id": row.get("submission_id", "NA"),
-                    "source_bytes": int(row.get("source_bytes") or 0),
-                }
-                # Only download outcomes have a status code; don't clutter the
-                # other entries with an empty field.
-                http_status = row.get("http_status") or ""
-                if http_status:
-                    entry["http_status"] = int(http_status)
-                onto_log[onto_id] = entry
+        onto_log = self._seed_log(download_report)
 
         filepaths = []
         for root, _dirs, files in os.walk(self.input_dir):
@@ -456,11 +518,47 @@ class Transformer:
 
         for filepath in filepaths:
             ontology_name = (os.path.relpath(filepath, self.input_dir)).split(os.sep)[0]
-            report_row = download_report.get(ontology_name, {})
-            reason = ""
+            onto_log[ontology_name] = self.transform_source(
+                filepath, compress, download_report.get(ontology_name, {})
+            )
+
+        self.write_stats(onto_log)
+
+        return None
+
+    def transform_source(self, filepath: str, compress: bool, report_row: dict) -> dict:
+        """Transform one downloaded source under the deadline and size gate.
+
+        Never raises for a problem with the ontology itself: a timeout, an
+        oversized source or a failed transform all come back as an entry saying
+        so, which is what lets one bad ontology cost only itself.
+
+        Args:
+            filepath: Path to the source, ``<input_dir>/<ACRONYM>/<submission>/<file>``.
+            compress: If True, compresses the output nodes and edges to tar.gz.
+            report_row: The ontology's download_report.tsv row, as strings
+                (empty if it has none).
+
+        Returns:
+            The ontology's onto_stats entry, without its ``id``.
+        """
+        ontology_name = (os.path.relpath(filepath, self.input_dir)).split(os.sep)[0]
+        reason = ""
+        started = time.monotonic()
+        with ExitStack() as self._heap_held:
+            self._size_heap(filepath, report_row)
             try:
-                with deadline(self.timeout_sec):
-                    success, nodecount, edgecount = self.transform(filepath, compress)
+                try:
+                    with deadline(self.timeout_sec):
+                        success, nodecount, edgecount = self.transform(filepath, compress)
+                except HeapTooSmall as e:
+                    spent = time.monotonic() - started
+                    self._grow_heap(e)
+                    # The retry has what is left of the deadline; the wait
+                    # for room at the ceiling is not counted.
+                    left = max(1, int(self.timeout_sec - spent)) if self.timeout_sec else 0
+                    with deadline(left):
+                        success, nodecount, edgecount = self.transform(filepath, compress)
             except TransformTimeout:
                 logging.error(
                     f"Transform of {ontology_name} exceeded {self.timeout_min} min; skipping."
@@ -472,33 +570,131 @@ class Transformer:
                 success, nodecount, edgecount = False, 0, 0
                 reason = "too_large"
 
-            if not success:
-                strstatus = "Skipped" if reason in ("too_slow", "too_large") else "Failed"
-                # A deliberate skip is not an error; saying so in the log made
-                # the two indistinguishable when reading a run afterwards.
-                if strstatus == "Failed":
-                    logging.error(f"Error transforming {filepath}.")
-                else:
-                    logging.info(f"Skipped {filepath} ({reason}).")
-                nodecount = 0
-                edgecount = 0
-                if not reason:
-                    reason = "transform_error"
+        if not success:
+            strstatus = "Skipped" if reason in ("too_slow", "too_large") else "Failed"
+            # A deliberate skip is not an error; saying so in the log made
+            # the two indistinguishable when reading a run afterwards.
+            if strstatus == "Failed":
+                logging.error(f"Error transforming {filepath}.")
             else:
-                logging.info(f"Transformed {filepath}.")
-                strstatus = "OK"
-
-            onto_log[ontology_name] = {
-                "status": strstatus,
-                "reason": reason,
-                "name": report_row.get("name", ""),
-                "version": report_row.get("version", ""),
-                "nodecount": nodecount,
-                "edgecount": edgecount,
-                "submission_id": report_row.get("submission_id", "NA"),
-                "source_bytes": int(report_row.get("source_bytes") or 0),
-            }
+                logging.info(f"Skipped {filepath} ({reason}).")
+            nodecount = 0
+            edgecount = 0
+            if not reason:
+                reason = "transform_error"
+        else:
+            logging.info(f"Transformed {filepath}.")
+            strstatus = "OK"
+
+        entry = {
+            "status": strstatus,
+            "reason": reason,
+            "name": report_row.get("name", ""),
+            "version": report_row.get("version", ""),
+            "nodecount": nodecount,
+            "edgecount": edgecount,
+            "submission_id": report_row.get("submission_id", "NA"),
+            "source_bytes": int(report_row.get("source_bytes") or 0),
+            # What this ontology cost, for shard planning (see sharding.py).
+            "duration_sec": round(time.monotonic() - started, 1),
+        }
+        # The heap it ran out of, for heap.learn_multiplier.
+        if self.oom_heap_gb:
+            entry["oom_heap_gb"] = self.oom_heap_gb
+            entry["oom_source_mb"] = round(self.heap_source_bytes / 1024 / 1024, 1)
+        # Counts from a snippet are of a sample, not the ontology; keep them
+        # from being read as the real thing.
+        if report_row.get("snippet"):
+            entry["snippet"] = True
+        elif strstatus == "OK":
+            # What the graph was built from, so an identical source under a
+            # new submission can be recognised (see index.content_unchanged).
+            if report_row.get("sha256"):
+                entry["source_sha256"] = report_row["sha256"]
+            if report_row.get("etag"):
+                entry["source_etag"] = report_row["etag"]
+            # What the published artifact should hash to, so a fetch can
+            # verify it (see artifact_fetch).
+            artifact = os.path.join(self.output_dir, f"{ontology_name}.tar.gz")
+            if os.path.exists(artifact):
+                entry["artifact_sha256"] = file_sha256(artifact)
+        return entry
+
+    def _size_heap(self, filepath: str, report_row: dict) -> None:
+        """Choose the ROBOT heap for one source and reserve it from the budget.
+
+        Sized from the unpacked size the downloader recorded for a .gz, else
+        the file as it is; a zip's contents are only seen in transform(), but
+        a heap that proves too small is retried at the ceiling anyway. The
+        reservation is held (in ``_heap_held``) until transform_source ends,
+        outside the deadline, so time spent waiting for room is not counted
+        against the ontology.
+        """
+        self.oom_heap_gb = 0.0
+        if not self.heap_multiplier:
+            self.heap_gb = 0.0
+            return
+        self.heap_source_bytes = int(report_row.get("unpacked_bytes") or 0) or os.path.getsize(
+            filepath
+        )
+        self.heap_gb = heap_for_source(
+            self.heap_source_bytes, self.heap_ceiling_gb, self.heap_multiplier
+        )
+        self._heap_held.enter_context(self._reserve_heap(self.heap_gb))
 
+    def _grow_heap(self, e: HeapTooSmall) -> None:
+        """Trade this source's reservation for one at the ceiling.
+
+        The hold is given up before the new one is asked for. Topping it up
+        instead would hold part of the budget while waiting for more, and two
+        workers doing that at once would each wait for the other forever.
+        """
+        logging.warning(f"{e}; retrying with {self.heap_ceiling_gb:g} GB.")
+        self._heap_held.close()
+        # Later steps for this source start from the ceiling too.
+        self.oom_heap_gb = self.heap_gb
+        self.heap_gb = self.heap_ceiling_gb
+        self._heap_held.enter_context(self._reserve_heap(self.heap_gb))
+
+    def _reserve_heap(self, gb: float):
+        """A hold on ``gb`` of the heap budget, if there is one."""
+        return self.heap_budget.reserve(gb) if self.heap_budget else nullcontext()
+
+    def _robot(self, step, **kwargs) -> bool:
+        """Run a ROBOT step at this source's heap.
+
+        Args:
+            step: robot_convert or robot_relax.
+            **kwargs: The step's input_path and output_path.
+
+        Returns:
+            The step's success.
+
+        Raises:
+            HeapTooSmall: If it ran out of a heap below the ceiling.
+        """
+        kwargs.update(
+            robot_path=self.robot_path, robot_env=self.robot_env, timeout=self.timeout_sec
+        )
+        if not self.heap_gb:
+            return step(**kwargs)
+        try:
+            return step(heap_gb=self.heap_gb, **kwargs)
+        except RobotOutOfMemory as e:
+            if self.heap_gb < self.heap_ceiling_gb:
+                raise HeapTooSmall(str(e)) from e
+            logging.error(f"{e}, the most it may have.")
+            return False
+
+    def write_stats(self, onto_log: dict) -> None:
+        """Write total_stats.yaml and onto_stats.yaml for a finished log.
+
+        Args:
+            onto_log: {acronym: entry}, as built by ``transform_all``.
+
+        Returns:
+            None.
+        """
         # Write total stats to a yaml
         logging.info("Writing total stats to total_stats.yaml.")
         totals = summarize(onto_log)
@@ -512,12 +708,14 @@ class Transformer:
         for onto in sorted(onto_log):
             entry = {"id": onto}
             entry.update(onto_log[onto])
+            # Which limits it met, so a light-lane give-up (too_large, too_slow)
+            # can be told from one the heavy lane couldn't manage either.
+            if self.lane != "light":
+                entry["lane"] = self.lane
             onto_stats_list.append(entry)
         with open(os.path.join(self.output_dir, "onto_stats.yaml"), "w") as of:
             yaml.dump({"ontologies": onto_stats_list}, of, sort_keys=False)
 
-        return None
-
     def transform(self, ontology_path: str, compress: bool) -> Tuple[bool, int, int]:
         """Transforms a single ontology to KGX nodes and edges.
 
@@ -582,24 +780,12 @@ class Transformer:
         ontology_path = strip_imports(ontology_path)
 
         # Convert
-        if not robot_convert(
-            robot_path=self.robot_path,
-            input_path=ontology_path,
-            output_path=owl_output_path,
-            robot_env=self.robot_env,
-            timeout=self.timeout_sec,
-        ):
+        if not self._robot(robot_convert, input_path=ontology_path, output_path=owl_output_path):
             return False, nodecount, edgecount
 
         # Relax
         relaxed_outpath = os.path.join(workdir, f"{ontology_name}_relaxed.owl")
-        if not robot_relax(
-            robot_path=self.robot_path,
-            input_path=owl_output_path,
-            output_path=relaxed_outpath,
-            robot_env=self.robot_env,
-            timeout=self.timeout_sec,
-        ):
+        if not self._robot(robot_relax, input_path=owl_output_path, output_path=relaxed_outpath):
             return False, nodecount, edgecount
 
         # Strip imports again, this time from ROBOT's output. ROBOT keeps the
@@ -650,6 +836,23 @@ class Transformer:
             with open(edgefilename, "r") as f:
                 edgecount = len(f.readlines()) - 1
 
+            # By-products for the cross-ontology term index (term_index.py):
+            # the sorted node ids and their prefixes, beside the artifact, and
+            # a Bloom filter over the ids (bloom.py), built from that list.
+            # Losing them costs a lookup, not the ontology.
+            try:
+                terms = write_term_list(nodefilename, self.output_dir, ontology_name)
+                write_id_filter(
+                    read_term_list(
+                        os.path.join(self.output_dir, ontology_name + TERMS_SUFFIX)
+                    ),
+                    terms,
+                    self.output_dir,
+                    ontology_name,
+                )
+            except (OSError, ValueError) as e:
+                logging.warning(f"No term list for {ontology_name}: {e}")
+
             # Compress if requested. Product is written flat at the top of the
             # output dir as <ACRONYM>.tar.gz for direct release upload.
             if compress:
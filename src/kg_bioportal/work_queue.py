@@ -0,0 +1,239 @@
+"""A work queue on a shared filesystem, for builds that rebalance themselves.
+
+Static shards are fixed before anything runs, so a runner stuck on one
+pathological ontology holds its whole shard hostage while the rest finish and
+idle. With a queue, every worker takes one acronym at a time, and whoever is
+free takes the next.
+
+The queue is a directory, and each item a file that moves between
+subdirectories as it is worked on::
+
+    pending/000012_AGRO  ->  leased/000012_AGRO  ->  done/000012_AGRO
+                                    |
+                                    +-> (lease expired) pending/ or failed/
+
+A rename is atomic on a local filesystem and a single request on NFS, so only
+one of any number of workers -- processes or hosts -- can move a given file out
+of ``pending/``: the claim is the rename. A lease is kept alive by touching the
+file, and one whose mtime is older than the lease is taken back by whichever
+worker next looks, so a killed worker or a lost host costs only its lease.
+Ages are measured against the filesystem's own clock rather than the local
+one, so hosts whose clocks disagree still agree on which leases have expired.
+
+The numeric prefix is the item's rank: pending items are claimed in order, so
+a queue filled most-expensive-first hands out the giants first.
+"""
+
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from kg_bioportal.config import QUEUE_LEASE_SEC, QUEUE_MAX_ATTEMPTS
+
+_STATES = ("pending", "leased", "done", "failed")
+
+# Touched to read the filesystem's idea of the current time (see _fs_now).
+_CLOCK_NAME = ".clock"
+
+
+def _acronym(item: str) -> str:
+    """The acronym in an item's file name, ``<rank>_<ACRONYM>``."""
+    return item.split("_", 1)[1]
+
+
+class Lease:
+    """One worker's claim on one queue item."""
+
+    def __init__(self, work_queue: "WorkQueue", item: str, attempts: int) -> None:
+        self.queue = work_queue
+        self.item = item
+        self.acronym = _acronym(item)
+        self.attempts = attempts
+
+    @property
+    def path(self) -> str:
+        return self.queue._path("leased", self.item)
+
+    def heartbeat(self) -> bool:
+        """Renew the lease. False if it was lost (expired and taken back)."""
+        try:
+            os.utime(self.path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    @contextmanager
+    def keep_alive(self):
+        """Renew the lease in the background for as long as the block runs."""
+        stop = threading.Event()
+        interval = max(self.queue.lease_sec / 3, 0.01)
+
+        def beat():
+            while not stop.wait(interval):
+                if not self.heartbeat():
+                    logging.warning(f"Lost the lease on {self.acronym}; it may be built twice.")
+                    return
+
+        thread = threading.Thread(target=beat, name=f"lease-{self.acronym}", daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self) -> None:
+        """Mark the item done.
+
+        If the lease had already expired, the item is pulled back from wherever
+        it went, so that no one else starts on it; someone who already has
+        will build it again, harmlessly, since a fragment is just overwritten.
+        """
+        done = self.queue._path("done", self.item)
+        for state in ("leased", "pending", "failed"):
+            try:
+                os.rename(self.queue._path(state, self.item), done)
+                return
+            except FileNotFoundError:
+                continue
+
+
+class WorkQueue:
+    """A directory-backed queue of acronyms, safe across processes and hosts.
+
+    Args:
+        queue_dir: The queue's directory; on a shared filesystem for a build
+            spread over hosts.
+        lease_sec: How long a claim lasts without a heartbeat.
+        max_attempts: Claims an item gets before a lost lease fails it for
+            good, so one ontology that kills every worker that tries it can't
+            go round forever.
+    """
+
+    def __init__(
+        self,
+        queue_dir: str,
+        lease_sec: float = QUEUE_LEASE_SEC,
+        max_attempts: int = QUEUE_MAX_ATTEMPTS,
+    ) -> None:
+        self.queue_dir = queue_dir
+        self.lease_sec = lease_sec
+        self.max_attempts = max_attempts
+        for state in _STATES:
+            os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+
+    def _path(self, state: str, item: str = "") -> str:
+        return os.path.join(self.queue_dir, state, item)
+
+    def _items(self, state: str) -> List[str]:
+        return sorted(n for n in os.listdir(self._path(state)) if "_" in n)
+
+    @staticmethod
+    def _read(path: str) -> dict:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _write(path: str, info: dict) -> None:
+        with open(path, "w") as f:
+            json.dump(info, f)
+
+    def _fs_now(self) -> float:
+        """The current time by the filesystem's clock, which all hosts share."""
+        clock = os.path.join(self.queue_dir, _CLOCK_NAME)
+        with open(clock, "a"):
+            pass
+        os.utime(clock)
+        return os.stat(clock).st_mtime
+
+    def add(self, acronyms: List[str]) -> int:
+        """Queue acronyms, in the order they should be handed out.
+
+        Acronyms already in the queue, in any state, are left alone, so adding
+        the same list twice is harmless.
+
+        Returns:
+            How many were added.
+        """
+        present = {_acronym(item) for state in _STATES for item in self._items(state)}
+        rank = sum(len(self._items(state)) for state in _STATES)
+        added = 0
+        for acronym in acronyms:
+            if acronym in present:
+                continue
+            present.add(acronym)
+            self._write(self._path("pending", f"{rank:06d}_{acronym}"), {"attempts": 0})
+            rank += 1
+            added += 1
+        return added
+
+    def claim(self, worker: str) -> Optional[Lease]:
+        """Take the first pending item, or None if there are none.
+
+        Args:
+            worker: Who is claiming it, recorded in the lease for diagnosis.
+        """
+        for item in self._items("pending"):
+            src, dst = self._path("pending", item), self._path("leased", item)
+            try:
+                # Fresh mtime first: the rename keeps it, and a lease must not
+                # look expired the moment it exists.
+                os.utime(src)
+                os.rename(src, dst)
+            except FileNotFoundError:
+                continue  # another worker got there first
+            info = self._read(dst)
+            attempts = int(info.get("attempts", 0)) + 1
+            self._write(dst, {"attempts": attempts, "worker": worker})
+            return Lease(self, item, attempts)
+        return None
+
+    def reclaim_expired(self) -> List[str]:
+        """Take back leases that have gone without a heartbeat for too long.
+
+        Each goes back to ``pending/``, or to ``failed/`` once it has used up
+        ``max_attempts``.
+
+        Returns:
+            Acronyms given up on (moved to ``failed/``) by this call.
+        """
+        now = self._fs_now()
+        abandoned = []
+        for item in self._items("leased"):
+            path = self._path("leased", item)
+            try:
+                age = now - os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+            if age <= self.lease_sec:
+                continue
+            info = self._read(path)
+            attempts = int(info.get("attempts", 0))
+            target = "failed" if attempts >= self.max_attempts else "pending"
+            try:
+                os.rename(path, self._path(target, item))
+            except FileNotFoundError:
+                continue  # completed or reclaimed by someone else meanwhile
+            logging.warning(
+                f"Lease on {_acronym(item)} held by {info.get('worker', '?')} expired "
+                f"after {age:.0f}s (attempt {attempts}); "
+                + ("giving up." if target == "failed" else "requeued.")
+            )
+            if target == "failed":
+                abandoned.append(_acronym(item))
+        return abandoned
+
+    def counts(self) -> Dict[str, int]:
+        """How many items are in each state."""
+        return {state: len(self._items(state)) for state in _STATES}
+
+    def outstanding(self) -> bool:
+        """True while anything is pending or leased."""
+        counts = self.counts()
+        return bool(counts["pending"] or counts["leased"])
@@ -1,11 +1,17 @@
-"""Shared helpers for loading the repo's non-packaged scripts.
+"""Shared test helpers.
 
 ``merge_stats.py`` and ``build_site.py`` are standalone scripts rather than
-part of the installed package, so tests import them by path.
+part of the installed package, so tests import them by path. Code that fetches
+published artifacts is tested against a local HTTP server standing in for
+GitHub's release downloads.
 """
 
 import importlib.util
 import os
+import re
+import threading
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 
 REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 MERGE_STATS = os.path.join(REPO_ROOT, ".github", "scripts", "merge_stats.py")
@@ -18,3 +24,64 @@ def load_script(path, name):
     module = importlib.util.module_from_spec(spec)
     spec.loader.exec_module(module)
     return module
+
+
+class _ReleaseHandler(SimpleHTTPRequestHandler):
+    """Serves files as GitHub's release CDN does: with a strong ETag, and
+    honouring Range requests conditional on it (If-Range)."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        self.server.ranges.append(self.headers.get("Range", ""))
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        info = os.stat(path)
+        etag = '"%x-%x"' % (info.st_mtime_ns, info.st_size)
+        start = 0
+        match = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if match and self.headers.get("If-Range", etag) == etag:
+            start = int(match.group(1))
+            if start >= info.st_size:
+                self.send_error(416)
+                return
+        with open(path, "rb") as f:
+            f.seek(start)
+            body = f.read()
+        self.send_response(206 if start else 200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        if start:
+            self.send_header("Content-Range", f"bytes {start}-{info.st_size - 1}/{info.st_size}")
+        self.end_headers()
+        if self.server.cut_off.get(self.path):
+            # Break the response off halfway, as a dropped connection would.
+            self.server.cut_off[self.path] -= 1
+            self.wfile.write(body[: len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+def serve_directory(directory):
+    """Serve ``directory`` over HTTP on a free local port, in a daemon thread.
+
+    Returns the server, with ``url`` (its root, no trailing slash), and the
+    ``requests`` (paths) and ``ranges`` (Range headers) seen so far. Setting
+    ``cut_off[path] = n`` breaks the next ``n`` responses for ``path`` off
+    halfway. Call ``shutdown()`` and ``server_close()`` when done.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(_ReleaseHandler, directory=directory))
+    server.daemon_threads = True
+    server.requests = []
+    server.ranges = []
+    server.cut_off = {}
+    server.url = "http://%s:%d" % server.server_address[:2]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
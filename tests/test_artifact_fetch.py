@@ -0,0 +1,247 @@
+"""Tests for fetching published artifacts through the local content cache."""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import yaml
+from click.testing import CliRunner
+
+from kg_bioportal.artifact_fetch import (
+    fetch_artifacts,
+    fetch_published,
+    object_path,
+    read_refs,
+    select_published,
+)
+from kg_bioportal.cli import main
+from tests.helpers import serve_directory
+from tests.test_graph_merge import write_artifact
+
+
+def sha256_text(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def sha256_of(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class TestSelectPublished(TestCase):
+    INDEX = {
+        "AAA": {"id": "AAA", "status": "OK", "download_url": "u/AAA"},
+        "BBB": {"id": "BBB", "status": "OK", "download_url": "u/BBB"},
+        "CCC": {"id": "CCC", "status": "Failed", "reason": "transform_error"},
+    }
+
+    def test_all_published(self):
+        selected, missing = select_published(self.INDEX)
+        self.assertEqual(list(selected), ["AAA", "BBB"])
+        self.assertEqual(missing, {})
+
+    def test_include_only_and_exclude(self):
+        selected, missing = select_published(self.INDEX, ["aaa", "CCC", "ZZZ"])
+        self.assertEqual(list(selected), ["AAA"])
+        self.assertEqual(missing, {"CCC": "transform_error", "ZZZ": "not in the index"})
+        self.assertEqual(list(select_published(self.INDEX, exclude=["AAA"])[0]), ["BBB"])
+
+
+class FetchCase(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.dir = self._tmp.name
+        self.release = os.path.join(self.dir, "release")
+        os.makedirs(os.path.join(self.release, "v1"))
+        for acronym in ("AAA", "BBB"):
+            write_artifact(
+                os.path.join(self.release, "v1"), acronym,
+                # Hashes don't compress, so each artifact is a few chunks long.
+                [
+                    [f"{acronym}:{i}", "biolink:NamedThing", sha256_text(f"{acronym}{i}"), acronym]
+                    for i in range(4000)
+                ],
+                [],
+            )
+        self.server = serve_directory(self.release)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.cache = os.path.join(self.dir, "cache")
+        self.out = os.path.join(self.dir, "out")
+        self.index = {
+            acronym: {
+                "id": acronym,
+                "status": "OK",
+                "download_url": f"{self.server.url}/v1/{acronym}.tar.gz",
+                "artifact_sha256": self.digest("v1", acronym),
+            }
+            for acronym in ("AAA", "BBB")
+        }
+        self.index["CCC"] = {"id": "CCC", "status": "Failed", "reason": "transform_error"}
+        self.index_path = os.path.join(self.dir, "onto_stats.yaml")
+        self.write_index()
+
+    def digest(self, tag, acronym):
+        return sha256_of(os.path.join(self.release, tag, f"{acronym}.tar.gz"))
+
+    def write_index(self):
+        with open(self.index_path, "w") as f:
+            yaml.safe_dump({"ontologies": list(self.index.values())}, f, sort_keys=False)
+
+    def fetch(self, **kwargs):
+        return fetch_published(
+            self.out, source=self.index_path, cache_dir=self.cache, workers=2, **kwargs
+        )
+
+    def assertFetched(self, acronym, tag="v1"):
+        path = os.path.join(self.out, f"{acronym}.tar.gz")
+        self.assertEqual(sha256_of(path), self.digest(tag, acronym))
+
+
+class TestFetch(FetchCase):
+    def test_fetch(self):
+        stats = self.fetch()
+        self.assertEqual(
+            stats,
+            {
+                "selected": 2, "missing": {}, "fetched": 2, "cached": 0, "resumed": 0,
+                "bytes": stats["bytes"], "failed": {},
+            },
+        )
+        self.assertFetched("AAA")
+        self.assertFetched("BBB")
+        refs = read_refs(self.cache)
+        url = self.index["AAA"]["download_url"]
+        self.assertEqual(refs[url]["sha256"], self.index["AAA"]["artifact_sha256"])
+        self.assertTrue(refs[url]["etag"])
+        self.assertTrue(os.path.exists(object_path(self.cache, refs[url]["sha256"])))
+
+    def test_unchanged_artifacts_come_from_the_cache(self):
+        self.fetch()
+        requested = len(self.server.requests)
+        shutil.rmtree(self.out)
+        stats = self.fetch()
+        self.assertEqual((stats["fetched"], stats["cached"]), (0, 2))
+        self.assertEqual(len(self.server.requests), requested)
+        self.assertFetched("AAA")
+
+    def test_a_known_digest_under_a_new_url_is_not_fetched(self):
+        self.fetch()
+        requested = len(self.server.requests)
+        os.makedirs(os.path.join(self.release, "v2"))
+        shutil.copy(
+            os.path.join(self.release, "v1", "AAA.tar.gz"), os.path.join(self.release, "v2")
+        )
+        self.index["AAA"]["download_url"] = f"{self.server.url}/v2/AAA.tar.gz"
+        self.write_index()
+        self.assertEqual(self.fetch()["cached"], 2)
+        self.assertEqual(len(self.server.requests), requested)
+
+    def test_a_new_url_without_a_digest_is_fetched(self):
+        self.fetch()
+        write_artifact(
+            os.path.join(self.release, "v1"), "AAA",
+            [["AAA:new", "biolink:NamedThing", "new", "AAA"]], [],
+        )
+        os.makedirs(os.path.join(self.release, "v2"))
+        os.rename(
+            os.path.join(self.release, "v1", "AAA.tar.gz"),
+            os.path.join(self.release, "v2", "AAA.tar.gz"),
+        )
+        self.index["AAA"]["download_url"] = f"{self.server.url}/v2/AAA.tar.gz"
+        del self.index["AAA"]["artifact_sha256"]
+        self.write_index()
+        stats = self.fetch()
+        self.assertEqual((stats["fetched"], stats["cached"]), (1, 1))
+        self.assertFetched("AAA", "v2")
+
+    def test_a_mismatched_digest_is_not_cached(self):
+        self.index["AAA"]["artifact_sha256"] = "0" * 64
+        self.write_index()
+        stats = self.fetch()
+        self.assertEqual(list(stats["failed"]), ["AAA"])
+        self.assertIn("SHA-256", stats["failed"]["AAA"])
+        self.assertEqual(stats["fetched"], 1)
+        self.assertFalse(os.path.exists(os.path.join(self.out, "AAA.tar.gz")))
+        self.assertFetched("BBB")
+        self.assertNotIn(self.index["AAA"]["download_url"], read_refs(self.cache))
+
+    def test_verify_replaces_a_corrupt_copy(self):
+        self.fetch()
+        cached = object_path(self.cache, self.index["AAA"]["artifact_sha256"])
+        os.chmod(cached, 0o644)
+        with open(cached, "ab") as f:
+            f.write(b"junk")
+        self.assertEqual(self.fetch()["fetched"], 0)
+        stats = self.fetch(verify=True)
+        self.assertEqual((stats["fetched"], stats["cached"]), (1, 1))
+        self.assertFetched("AAA")
+
+    def test_urls_without_an_index(self):
+        urls = {"AAA": self.index["AAA"]["download_url"]}
+        paths, stats = fetch_artifacts(urls, self.out, self.cache, workers=1)
+        self.assertEqual(paths, {"AAA": os.path.join(self.out, "AAA.tar.gz")})
+        self.assertEqual(stats["fetched"], 1)
+        self.assertEqual(fetch_artifacts(urls, self.out, self.cache)[1]["cached"], 1)
+
+
+class TestResume(FetchCase):
+    def test_a_broken_download_is_resumed(self):
+        self.server.cut_off["/v1/AAA.tar.gz"] = 1
+        stats = self.fetch(include_only=["AAA"])
+        self.assertEqual((stats["fetched"], stats["resumed"]), (1, 1))
+        self.assertFetched("AAA")
+        self.assertEqual(self.server.requests, ["/v1/AAA.tar.gz", "/v1/AAA.tar.gz"])
+        self.assertEqual(self.server.ranges[0], "")
+        self.assertRegex(self.server.ranges[1], r"^bytes=\d+-$")
+
+    def test_a_later_run_resumes(self):
+        self.server.cut_off["/v1/AAA.tar.gz"] = 3
+        stats = self.fetch(include_only=["AAA"])
+        self.assertEqual(list(stats["failed"]), ["AAA"])
+        stats = self.fetch(include_only=["AAA"])
+        self.assertEqual((stats["fetched"], stats["resumed"]), (1, 1))
+        self.assertRegex(self.server.ranges[-1], r"^bytes=\d+-$")
+        self.assertFetched("AAA")
+
+    def test_a_changed_file_starts_over(self):
+        del self.index["AAA"]["artifact_sha256"]
+        self.write_index()
+        self.server.cut_off["/v1/AAA.tar.gz"] = 3
+        self.fetch(include_only=["AAA"])
+        # Rebuilt in place, so If-Range no longer matches and it comes whole.
+        write_artifact(
+            os.path.join(self.release, "v1"), "AAA",
+            [["AAA:new", "biolink:NamedThing", "new", "AAA"]], [],
+        )
+        stats = self.fetch(include_only=["AAA"])
+        self.assertEqual((stats["fetched"], stats["resumed"]), (1, 0))
+        self.assertFetched("AAA")
+
+
+class TestFetchCli(FetchCase):
+    def invoke(self, *args):
+        return CliRunner().invoke(main, [
+            "fetch", "-i", self.index_path, "-o", self.out, "--cache_dir", self.cache, *args,
+        ])
+
+    def test_cli(self):
+        result = self.invoke("--include_only", "AAA,CCC")
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Left out CCC: transform_error", result.stderr)
+        self.assertEqual(json.loads(result.stdout)["fetched"], 1)
+        self.assertFetched("AAA")
+        self.assertFalse(os.path.exists(os.path.join(self.out, "BBB.tar.gz")))
+
+    def test_failures_exit_non_zero(self):
+        self.index["BBB"]["download_url"] = f"{self.server.url}/v1/gone.tar.gz"
+        self.write_index()
+        result = self.invoke()
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertEqual(json.loads(result.stdout)["fetched"], 1)
+        self.assertIn("BBB", result.stderr)
+        self.assertFetched("AAA")
@@ -0,0 +1,125 @@
+"""Tests for the per-ontology Bloom filters and `contains`."""
+
+import os
+import random
+import tempfile
+from unittest import TestCase
+
+from click.testing import CliRunner
+
+from kg_bioportal.bloom import (
+    BloomFilter,
+    FilterBundle,
+    build_filter_bundle,
+    write_id_filter,
+)
+from kg_bioportal.cli import contains
+
+
+class TestBloomFilter(TestCase):
+    def test_no_false_negatives(self):
+        terms = [f"GO:{i:07d}" for i in range(5000)]
+        bloom = BloomFilter.for_capacity(len(terms), 0.01)
+        for term in terms:
+            bloom.add(term)
+        self.assertTrue(all(term in bloom for term in terms))
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter.for_capacity(5000, 0.01)
+        for i in range(5000):
+            bloom.add(f"GO:{i:07d}")
+        others = sum(f"MONDO:{i:07d}" in bloom for i in range(20000))
+        # 1% of 20000 is 200; allow for chance.
+        self.assertLess(others, 400)
+
+    def test_round_trip(self):
+        bloom = BloomFilter.for_capacity(100, 0.05)
+        bloom.add("GO:1")
+        copy = BloomFilter.from_bytes(bloom.to_bytes())
+        self.assertEqual((copy.bits, copy.k, copy.terms), (bloom.bits, bloom.k, 1))
+        self.assertIn("GO:1", copy)
+        with self.assertRaises(ValueError):
+            BloomFilter.from_bytes(b"nope" + bloom.to_bytes()[4:])
+        with self.assertRaises(ValueError):
+            BloomFilter.for_capacity(10, 1.5)
+
+    def test_empty_ontology(self):
+        bloom = BloomFilter.for_capacity(0)
+        self.assertNotIn("GO:1", bloom)
+
+
+class TestFilterBundle(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.dir = self._tmp.name
+        rng = random.Random(0)
+        self.ontologies = {
+            "AGRO": ["AGRO:1", "AGRO:2", "GO:0008150"],
+            "GO": [f"GO:{i:07d}" for i in range(8000, 9000)] + ["GO:0008150"],
+            # A different false-positive rate, so a different k per filter.
+            "MONDO": [f"MONDO:{rng.randrange(10**7):07d}" for _ in range(300)],
+        }
+        self.filters = os.path.join(self.dir, "run1")
+        os.makedirs(self.filters)
+        for acronym, terms in self.ontologies.items():
+            fp_rate = 0.001 if acronym == "MONDO" else 0.01
+            write_id_filter(terms, len(terms), self.filters, acronym, fp_rate)
+
+    def check(self, bundle):
+        found = bundle.candidates(["GO:0008150", "AGRO:2", "MONDO:0000001", "NOPE:1"])
+        self.assertEqual(found["GO:0008150"], ["AGRO", "GO"])
+        self.assertIn("AGRO", found["AGRO:2"])
+        for term in ("MONDO:0000001", "NOPE:1"):
+            self.assertEqual(
+                set(found[term]),
+                {a for a in self.ontologies if term in self.single(a)},
+            )
+
+    def single(self, acronym):
+        with open(os.path.join(self.filters, acronym + "_ids.bloom"), "rb") as f:
+            return BloomFilter.from_bytes(f.read())
+
+    def test_batched_check_matches_single_filters(self):
+        bundle = FilterBundle(self.filters)
+        self.assertEqual(len(bundle), 3)
+        self.check(bundle)
+        terms = [f"GO:{i:07d}" for i in range(8900, 9100)]
+        found = bundle.candidates(terms)
+        for term in terms:
+            expected = [a for a in sorted(self.ontologies) if term in self.single(a)]
+            self.assertEqual(found[term], expected)
+
+    def test_bundle_is_incremental(self):
+        base = os.path.join(self.dir, "base.db")
+        stats = build_filter_bundle(self.filters, base, report=lambda line: None)
+        self.assertEqual(stats["ontologies"], 3)
+        self.check(FilterBundle(base))
+
+        # The next run rebuilt only AGRO, which lost GO:0008150; MONDO is gone.
+        run2 = os.path.join(self.dir, "run2")
+        os.makedirs(run2)
+        write_id_filter(["AGRO:1"], 1, run2, "AGRO")
+        index = {
+            "AGRO": {"status": "OK", "download_url": "https://example.org/AGRO.tar.gz"},
+            "GO": {"status": "OK", "download_url": "https://example.org/GO.tar.gz"},
+        }
+        db = os.path.join(self.dir, "bloom_filters.db")
+        stats = build_filter_bundle(run2, db, base_path=base, index=index, report=lambda l: None)
+        self.assertEqual((stats["updated"], stats["dropped"], stats["ontologies"]), (1, 1, 2))
+        bundle = FilterBundle(db)
+        self.assertEqual(bundle.acronyms, ["AGRO", "GO"])
+        self.assertEqual(bundle.candidates(["GO:0008150"])["GO:0008150"], ["GO"])
+
+    def test_contains_command(self):
+        result = CliRunner().invoke(contains, ["GO:0008150", "NOPE:1", "-f", self.filters])
+        self.assertEqual(result.exit_code, 0, result.output)
+        lines = result.stdout.splitlines()
+        self.assertIn("GO:0008150\tAGRO", lines)
+        self.assertIn("GO:0008150\tGO", lines)
+        self.assertIn("GO:0008150: 2 of 3 ontologies", result.stderr)
+
+    def test_empty_bundle(self):
+        empty = os.path.join(self.dir, "empty")
+        os.makedirs(empty)
+        self.assertEqual(FilterBundle(empty).candidates(["GO:1"]), {"GO:1": []})
@@ -0,0 +1,154 @@
+"""Tests for carrying a graph forward when only the submission changed.
+
+BioPortal often files a new submission with the same source behind it. A graph
+rebuilt from identical bytes costs a runner and a release asset and changes
+nothing, so the index remembers what each graph was built from and both
+shard-list (by probed ETag) and run-shard (by the downloaded file's SHA-256)
+use that to skip the rebuild -- without losing track of where the graph lives.
+"""
+
+import csv
+import hashlib
+import json
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import yaml
+from click.testing import CliRunner
+
+from kg_bioportal.cli import main
+from kg_bioportal.downloader import SIZE_MANIFEST_FIELDS, content_tag
+from kg_bioportal.index import merge_stats, read_index
+from kg_bioportal.pipeline import run_shard
+from kg_bioportal.transformer import Transformer
+from tests.test_download_outcomes import FakeResponse
+from tests.test_run_shard import CATALOGUE, RunShardTestCase, fake_transform
+
+PREV_URL = "https://github.com/ncbo/kg-bioportal/releases/download/data-2026.09/AAA.tar.gz"
+
+
+def built_from(data, **kw):
+    """An index entry for a graph published from source bytes ``data``."""
+    entry = {
+        "id": "AAA", "status": "OK", "reason": "", "name": "AAA ontology", "version": "1.0",
+        "nodecount": 10, "edgecount": 20, "submission_id": "6", "source_bytes": len(data),
+        "source_sha256": hashlib.sha256(data).hexdigest(), "download_url": PREV_URL,
+    }
+    entry.update(kw)
+    return entry
+
+
+class TestContentTag(TestCase):
+    def test_strong_etag(self):
+        self.assertEqual(content_tag(FakeResponse(headers={"ETag": '"abc"'})), '"abc"')
+
+    def test_weak_etag_is_no_tag(self):
+        self.assertEqual(content_tag(FakeResponse(headers={"ETag": 'W/"abc"'})), "")
+
+    def test_content_md5_is_the_fallback(self):
+        self.assertEqual(content_tag(FakeResponse(headers={"Content-MD5": "q1w2"})), "md5:q1w2")
+
+
+class TestRunShardCarriesForward(RunShardTestCase):
+    def build(self, index):
+        events = []
+        with mock.patch.object(Transformer, "transform", fake_transform(events)):
+            dl, tx = self.make("shard", events)
+            log = run_shard(dl, tx, ["AAA", "BBB"], compress=False, min_free_gb=0, index=index)
+        return log, [name for kind, name in events if kind == "transform"]
+
+    def test_unchanged_source_is_not_transformed(self):
+        log, transformed = self.build({"AAA": built_from(CATALOGUE["AAA"][1])})
+        self.assertEqual(transformed, ["BBB"])
+        self.assertEqual(log["AAA"]["nodecount"], 10)
+        self.assertEqual(log["AAA"]["download_url"], PREV_URL)
+
+    def test_carried_entry_takes_the_new_submission(self):
+        log, _ = self.build({"AAA": built_from(CATALOGUE["AAA"][1])})
+        self.assertEqual(log["AAA"]["submission_id"], "7")
+        self.assertEqual(log["AAA"]["version"], "2.0")
+
+    def test_changed_source_is_transformed(self):
+        log, transformed = self.build({"AAA": built_from(b"<rdf:RDF>older</rdf:RDF>")})
+        self.assertEqual(transformed, ["AAA", "BBB"])
+        self.assertNotIn("carried_forward", log["AAA"])
+
+    def test_a_graph_that_failed_last_time_is_rebuilt(self):
+        previous = built_from(CATALOGUE["AAA"][1], status="Failed", reason="transform_error")
+        _, transformed = self.build({"AAA": previous})
+        self.assertIn("AAA", transformed)
+
+    def test_built_graphs_record_their_source(self):
+        log, _ = self.build(None)
+        digest = hashlib.sha256(CATALOGUE["BBB"][1]).hexdigest()
+        self.assertEqual(log["BBB"]["source_sha256"], digest)
+
+    def test_built_graphs_record_their_artifact(self):
+        def transform(txr, ontology_path, compress):
+            name = os.path.relpath(ontology_path, txr.input_dir).split(os.sep)[0]
+            with open(os.path.join(txr.output_dir, f"{name}.tar.gz"), "wb") as f:
+                f.write(name.encode())
+            return True, 1, 2
+
+        with mock.patch.object(Transformer, "transform", transform):
+            dl, tx = self.make("shard", [])
+            log = run_shard(dl, tx, ["BBB"], compress=True, min_free_gb=0)
+        self.assertEqual(log["BBB"]["artifact_sha256"], hashlib.sha256(b"BBB").hexdigest())
+
+    def test_merge_keeps_the_carried_graph_where_it_is(self):
+        self.build({"AAA": built_from(CATALOGUE["AAA"][1])})
+        merge_stats(
+            os.path.join(self._tmp.name, "shard", "transformed"),
+            os.path.join(self._tmp.name, "out"),
+            release_tag="data-2026.10", report=lambda line: None,
+        )
+        entries = read_index(os.path.join(self._tmp.name, "out", "onto_stats.yaml"))
+        self.assertEqual(entries["AAA"]["download_url"], PREV_URL)
+        self.assertEqual(entries["AAA"]["submission_id"], "7")
+        self.assertNotIn("carried_forward", entries["AAA"])
+        self.assertIn("data-2026.10", entries["BBB"]["download_url"])
+
+
+class TestShardListContentSkip(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.dir = self._tmp.name
+        self.index = os.path.join(self.dir, "onto_stats.yaml")
+        with open(self.index, "w") as f:
+            yaml.dump({"ontologies": [
+                built_from(b"x", id="SAME", source_etag='"e1"'),
+                built_from(b"x", id="MOVED", source_etag='"e1"'),
+                built_from(b"x", id="STALE", source_etag='"e1"'),
+            ]}, f)
+        self.ontologies = os.path.join(self.dir, "ontologylist.tsv")
+        with open(self.ontologies, "w") as f:
+            f.write("id\tname\tcurrent_version\tsubmission_id\n")
+            for acr in ("SAME", "MOVED", "STALE"):
+                f.write(f"{acr}\t{acr}\t2\t7\n")
+        self.manifest = os.path.join(self.dir, "size_manifest.tsv")
+        with open(self.manifest, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=SIZE_MANIFEST_FIELDS, delimiter="\t")
+            writer.writeheader()
+            writer.writerow({"id": "SAME", "submission_id": "7", "etag": '"e1"'})
+            writer.writerow({"id": "MOVED", "submission_id": "7", "etag": '"e2"'})
+            # Probed for the old submission: says nothing about the new one.
+            writer.writerow({"id": "STALE", "submission_id": "6", "etag": '"e1"'})
+
+    def shard(self, *args):
+        result = CliRunner().invoke(main, [
+            "shard-list", "-f", self.ontologies, "-n", "1", "--index", self.index,
+            "--size_manifest", self.manifest, *args,
+        ])
+        self.assertEqual(result.exit_code, 0, result.output)
+        return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+    def test_same_etag_under_a_new_submission_is_skipped(self):
+        shards, err = self.shard("--content_skip")
+        self.assertEqual(shards, ["MOVED STALE"])
+        self.assertIn("content-skip: 1", err)
+
+    def test_off_by_default(self):
+        shards, _ = self.shard()
+        self.assertEqual(shards, ["SAME MOVED STALE"])
@@ -6,11 +6,14 @@ license-restricted ontologies.
 """
 
 import csv
+import gzip
+import hashlib
 import os
 import tempfile
 from unittest import TestCase
 
 from kg_bioportal.downloader import DOWNLOAD_REPORT_NAME, Downloader
+from kg_bioportal.rate_limit import AdaptiveRateLimiter
 from kg_bioportal.transformer import summarize
 
 METADATA = {"name": "Test Ontology"}
@@ -58,10 +61,16 @@ class FakeSession:
         return self.metadata_response
 
 
-def run_download(download_response, **session_kwargs):
+def unlimited():
+    """A rate limiter that never makes a test wait."""
+    return AdaptiveRateLimiter(rate=1e6, max_rate=1e6)
+
+
+def run_download(download_response, downloader_kwargs=None, **session_kwargs):
     """Run one ontology through Downloader.download with a faked session."""
+    downloader_kwargs = {"rate_limiter": unlimited(), **(downloader_kwargs or {})}
     with tempfile.TemporaryDirectory() as tmpdir:
-        dl = Downloader(output_dir=tmpdir, api_key="fake-key")
+        dl = Downloader(output_dir=tmpdir, api_key="fake-key", **downloader_kwargs)
         dl.requests_session = FakeSession(download_response, **session_kwargs)
         results = dl.download(["TESTONTO"])
         with open(os.path.join(tmpdir, DOWNLOAD_REPORT_NAME), newline="") as f:
@@ -131,7 +140,7 @@ class TestDownloadReport(TestCase):
     def test_report_leaves_http_status_blank_when_irrelevant(self):
         # Skiplisted ontologies never hit the network, so there is no code.
         with tempfile.TemporaryDirectory() as tmpdir:
-            dl = Downloader(output_dir=tmpdir, api_key="fake-key")
+            dl = Downloader(output_dir=tmpdir, api_key="fake-key", rate_limiter=unlimited())
             dl.requests_session = FakeSession(FakeResponse())
             dl.download(["NCBITAXON"])
             with open(os.path.join(tmpdir, DOWNLOAD_REPORT_NAME), newline="") as f:
@@ -140,6 +149,96 @@ class TestDownloadReport(TestCase):
         self.assertEqual(row["http_status"], "")
 
 
+def file_response(filename, data, chunk=64 * 1024):
+    """A 200 serving ``data`` as ``filename``, in several chunks."""
+    return FakeResponse(
+        status_code=200,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        chunks=[data[i:i + chunk] for i in range(0, len(data), chunk)],
+    )
+
+
+class TestInlineDigestAndSize(TestCase):
+    """The download pass also hashes the source and measures what a .gz unpacks to."""
+
+    def test_digest_is_of_the_file_as_served(self):
+        data = b"<rdf:RDF/>" * 1000
+        result, row = run_download(file_response("testonto.owl", data))
+        self.assertEqual(result["sha256"], hashlib.sha256(data).hexdigest())
+        self.assertEqual(row["sha256"], result["sha256"])
+
+    def test_plain_source_has_no_unpacked_size(self):
+        result, row = run_download(file_response("testonto.owl", b"<rdf:RDF/>"))
+        self.assertEqual(result["unpacked_bytes"], "")
+        self.assertEqual(row["unpacked_bytes"], "")
+
+    def test_gzip_source_records_both_sizes(self):
+        raw = b"<rdf:RDF/>\n" * 50_000
+        packed = gzip.compress(raw)
+        result, row = run_download(file_response("testonto.owl.gz", packed))
+        self.assertEqual(result["status"], "downloaded")
+        self.assertEqual(result["source_bytes"], len(packed))
+        self.assertEqual(result["unpacked_bytes"], len(raw))
+        self.assertEqual(row["unpacked_bytes"], str(len(raw)))
+
+    def test_concatenated_gzip_members_are_all_counted(self):
+        raw = b"x" * 10_000
+        packed = gzip.compress(raw) + gzip.compress(raw)
+        result, _ = run_download(file_response("testonto.owl.gz", packed))
+        self.assertEqual(result["unpacked_bytes"], 2 * len(raw))
+
+    def test_trailing_junk_across_chunks_is_ignored(self):
+        raw = b"x" * 10_000
+        packed = gzip.compress(raw) + b"JUNKJUNK"
+        # The junk straddles a chunk boundary, so it arrives in two feeds.
+        result, _ = run_download(file_response("testonto.owl.gz", packed, chunk=len(packed) - 4))
+        self.assertEqual(result["status"], "downloaded")
+        self.assertEqual(result["unpacked_bytes"], len(raw))
+
+    def test_a_short_tail_is_ignored(self):
+        # Too short for zlib to reject as a header, unlike longer junk.
+        raw = b"x" * 10_000
+        for tail in (b"\n", b"\x1f", b"\n\n"):
+            with self.subTest(tail=tail):
+                packed = gzip.compress(raw) + tail
+                result, _ = run_download(file_response("testonto.owl.gz", packed))
+                self.assertEqual(result["status"], "downloaded")
+                self.assertEqual(result["unpacked_bytes"], len(raw))
+
+    def test_members_after_zero_padding_are_counted(self):
+        raw = b"x" * 10_000
+        packed = gzip.compress(raw) + b"\0" * 512 + gzip.compress(raw)
+        for chunk in (64 * 1024, len(raw) // 100, 7):
+            with self.subTest(chunk=chunk):
+                result, _ = run_download(file_response("testonto.owl.gz", packed, chunk=chunk))
+                self.assertEqual(result["unpacked_bytes"], 2 * len(raw))
+
+    def test_gzip_that_unpacks_past_the_limit_is_skipped_at_download(self):
+        # ROR's shape: small as served, far over the limit once unpacked. The
+        # gate used to be blind to this until the transform decompressed it.
+        packed = gzip.compress(b"\0" * (3 * 1024 * 1024))
+        self.assertLess(len(packed), 1024 * 1024)
+        result, _ = run_download(
+            file_response("testonto.owl.gz", packed), downloader_kwargs={"max_source_mb": 1}
+        )
+        self.assertEqual(result["status"], "skipped")
+        self.assertEqual(result["reason"], "too_large")
+        self.assertEqual(result["path"], "")
+        self.assertGreater(result["unpacked_bytes"], 1024 * 1024)
+
+    def test_truncated_gzip_is_downloaded_without_an_unpacked_size(self):
+        # Whether a broken archive is usable is the transformer's call, as before.
+        packed = gzip.compress(os.urandom(100_000))[:5_000]
+        result, _ = run_download(file_response("testonto.owl.gz", packed))
+        self.assertEqual(result["status"], "downloaded")
+        self.assertEqual(result["unpacked_bytes"], "")
+
+    def test_mislabelled_gzip_is_not_measured(self):
+        result, _ = run_download(file_response("testonto.owl.gz", b"not gzip at all"))
+        self.assertEqual(result["status"], "downloaded")
+        self.assertEqual(result["unpacked_bytes"], "")
+
+
 def entry(status, reason="", nodes=0, edges=0):
     return {"status": status, "reason": reason, "nodecount": nodes, "edgecount": edges}
 
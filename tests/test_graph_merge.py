@@ -0,0 +1,344 @@
+"""Tests for the streaming graph merge.
+
+The merge must give the same graph however small its sorted runs are, so the
+tests merge with runs of a row or two -- many runs, several merge passes -- as
+well as with everything in one run, and in one partition or several.
+"""
+
+import io
+import json
+import os
+import tarfile
+import tempfile
+from unittest import TestCase
+
+from click.testing import CliRunner
+
+from kg_bioportal.cli import main
+from kg_bioportal.graph_merge import merge_graph, merge_rows, select_artifacts
+
+NODE_HEADER = ["id", "category", "name", "provided_by"]
+EDGE_HEADER = ["id", "subject", "predicate", "object", "provided_by"]
+MERGED = ["merged-kg.tar.gz", "merged-kg_dangling.tsv"]
+
+
+def write_artifact(directory, acronym, nodes, edges):
+    """Write <acronym>.tar.gz as transform does, from lists of row lists."""
+    path = os.path.join(directory, f"{acronym}.tar.gz")
+    with tarfile.open(path, "w:gz") as tar:
+        for kind, header, rows in (("nodes", NODE_HEADER, nodes), ("edges", EDGE_HEADER, edges)):
+            data = "\n".join("\t".join(r) for r in [header] + rows).encode() + b"\n"
+            info = tarfile.TarInfo(f"{acronym}_{kind}.tsv")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return path
+
+
+def read_merged(path, name="merged-kg"):
+    graph = {}
+    with tarfile.open(path) as tar:
+        for kind in ("nodes", "edges"):
+            lines = tar.extractfile(f"{name}_{kind}.tsv").read().decode().splitlines()
+            header = lines[0].split("\t")
+            graph[kind] = [dict(zip(header, line.split("\t"))) for line in lines[1:]]
+    return graph
+
+
+class TestMergeRows(TestCase):
+    def test_multivalued_are_concatenated_without_repeats(self):
+        merged = merge_rows([
+            {"id": "X:1", "category": "biolink:NamedThing", "provided_by": "A"},
+            {"id": "X:1", "category": "biolink:NamedThing|biolink:Disease", "provided_by": "B"},
+        ])
+        self.assertEqual(merged["category"], "biolink:NamedThing|biolink:Disease")
+        self.assertEqual(merged["provided_by"], "A|B")
+
+    def test_single_values_keep_the_first(self):
+        merged = merge_rows([{"id": "X:1"}, {"id": "X:1", "name": "one"}, {"name": "uno"}])
+        self.assertEqual(merged["name"], "one")
+
+
+class MergeCase(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.dir = self._tmp.name
+        self.out = os.path.join(self.dir, "merged")
+        write_artifact(
+            self.dir, "AAA",
+            [
+                ["BFO:1", "biolink:NamedThing", "entity", "AAA"],
+                ["AAA:1", "biolink:Disease", "", "AAA"],
+                ["AAA:2", "biolink:Disease", "two", "AAA"],
+            ],
+            [
+                ["e1", "AAA:1", "biolink:subclass_of", "BFO:1", "AAA"],
+                ["e2", "AAA:2", "biolink:subclass_of", "AAA:1", "AAA"],
+            ],
+        )
+        write_artifact(
+            self.dir, "BBB",
+            [
+                ["BFO:1", "biolink:NamedThing", "", "BBB"],
+                ["AAA:1", "biolink:PhenotypicFeature", "one", "BBB"],
+                ["BBB:1", "biolink:NamedThing", "b", "BBB"],
+            ],
+            [["f1", "AAA:1", "biolink:subclass_of", "BFO:1", "BBB"]],
+        )
+
+    def merge(self, **kw):
+        kw.setdefault("partitions", 1)
+        artifacts = select_artifacts(self.dir)
+        stats = merge_graph(artifacts, self.out, **kw)
+        return stats, read_merged(os.path.join(self.out, "merged-kg.tar.gz"))
+
+
+class TestMergeGraph(MergeCase):
+    def test_nodes_are_deduplicated_by_id(self):
+        stats, graph = self.merge()
+        nodes = {n["id"]: n for n in graph["nodes"]}
+        self.assertEqual(sorted(nodes), ["AAA:1", "AAA:2", "BBB:1", "BFO:1"])
+        self.assertEqual(nodes["BFO:1"]["provided_by"], "AAA|BBB")
+        self.assertEqual(nodes["BFO:1"]["name"], "entity")
+        self.assertEqual(nodes["AAA:1"]["category"], "biolink:Disease|biolink:PhenotypicFeature")
+        self.assertEqual(nodes["AAA:1"]["name"], "one")
+        self.assertEqual((stats["input_nodes"], stats["nodes"]), (6, 4))
+
+    def test_edges_are_deduplicated_by_triple(self):
+        stats, graph = self.merge()
+        edges = {(e["subject"], e["object"]): e for e in graph["edges"]}
+        self.assertEqual(len(edges), 2)
+        self.assertEqual(edges[("AAA:1", "BFO:1")]["provided_by"], "AAA|BBB")
+        self.assertEqual(edges[("AAA:1", "BFO:1")]["id"], "e1")
+        self.assertEqual((stats["input_edges"], stats["edges"]), (3, 2))
+
+    def test_tiny_runs_give_the_same_graph(self):
+        _, whole = self.merge()
+        _, spilled = self.merge(run_rows=1, fan_in=2)
+        self.assertEqual(spilled, whole)
+
+    def test_runs_are_cleaned_up(self):
+        self.merge(run_rows=1)
+        self.assertEqual(sorted(os.listdir(self.out)), MERGED)
+
+    def test_partitions_give_the_same_graph(self):
+        stats, whole = self.merge()
+        for workers, partitions in ((1, 3), (2, 2), (2, 5)):
+            pstats, parted = self.merge(workers=workers, partitions=partitions, run_rows=1)
+            self.assertEqual(pstats["partitions"], partitions)
+            for kind in ("nodes", "edges"):
+                self.assertEqual(pstats[kind], stats[kind])
+                # Sorted within each partition only.
+                self.assertCountEqual(parted[kind], whole[kind])
+        self.assertEqual(sorted(os.listdir(self.out)), MERGED)
+
+    def test_kept_partitions(self):
+        merge_graph(
+            select_artifacts(self.dir), self.out, compress=False, workers=2, partitions=2,
+            keep_partitions=True,
+        )
+        self.assertEqual(sorted(os.listdir(self.out)), [
+            "merged-kg_dangling.tsv", "merged-kg_edges.part-000.tsv", "merged-kg_edges.part-001.tsv",
+            "merged-kg_nodes.part-000.tsv", "merged-kg_nodes.part-001.tsv",
+        ])
+        with open(os.path.join(self.out, "merged-kg_nodes.part-001.tsv")) as f:
+            self.assertEqual(f.readline().split("\t")[0], "id")
+
+    def test_uncompressed(self):
+        merge_graph(
+            select_artifacts(self.dir), self.out, compress=False, partitions=1
+        )
+        self.assertEqual(sorted(os.listdir(self.out)), [
+            "merged-kg_dangling.tsv", "merged-kg_edges.tsv", "merged-kg_nodes.tsv",
+        ])
+
+
+class TestDangling(MergeCase):
+    """AAA:2 -> AAA:1 -> BFO:1 resolve; the CCC edges point at terms nobody declares."""
+
+    def setUp(self):
+        super().setUp()
+        write_artifact(
+            self.dir, "CCC",
+            [["CCC:1", "biolink:NamedThing", "c", "CCC"]],
+            [
+                ["g1", "CCC:1", "biolink:subclass_of", "IMPORTED:1", "CCC"],
+                ["g2", "GONE:1", "biolink:related_to", "IMPORTED:1", "CCC"],
+                ["g3", "CCC:1", "biolink:subclass_of", "BFO:1", "CCC"],
+            ],
+        )
+
+    def summary(self):
+        with open(os.path.join(self.out, "merged-kg_dangling.tsv")) as f:
+            return [line.rstrip("\n").split("\t") for line in f][1:]
+
+    def test_dangling_edges_are_reported_per_ontology(self):
+        stats, graph = self.merge()
+        self.assertEqual(stats["dangling_edges"], 2)
+        self.assertEqual(self.summary(), [["CCC", "2", "1", "2"]])
+        self.assertEqual(len(graph["edges"]), 5)
+
+    def test_dropped(self):
+        stats, graph = self.merge(dangling="drop")
+        self.assertEqual(stats["edges"], 3)
+        self.assertNotIn("IMPORTED:1", {e["object"] for e in graph["edges"]})
+
+    def test_stubbed(self):
+        for partitions in (1, 3):
+            stats, graph = self.merge(dangling="stub", partitions=partitions, workers=2)
+            nodes = {n["id"]: n for n in graph["nodes"]}
+            self.assertEqual(stats["stub_nodes"], 2)
+            self.assertEqual(len(nodes), 7)
+            self.assertEqual(nodes["IMPORTED:1"]["category"], "biolink:NamedThing")
+            self.assertEqual(nodes["IMPORTED:1"]["provided_by"], "CCC")
+
+    def test_stubs_keep_each_partition_sorted(self):
+        # "A:0" sorts ahead of every node; appended, it would end the file.
+        write_artifact(
+            self.dir, "DDD",
+            [["ZZZ:1", "biolink:NamedThing", "z", "DDD"]],
+            [["h1", "ZZZ:1", "biolink:related_to", "A:0", "DDD"]],
+        )
+        _, graph = self.merge(dangling="stub")
+        ids = [n["id"] for n in graph["nodes"]]
+        self.assertEqual(ids, sorted(ids))
+        self.assertIn("A:0", ids)
+
+        merge_graph(
+            select_artifacts(self.dir), self.out, compress=False, workers=2, partitions=3,
+            keep_partitions=True, dangling="stub",
+        )
+        for p in range(3):
+            with open(os.path.join(self.out, f"merged-kg_nodes.part-{p:03d}.tsv")) as f:
+                ids = [line.split("\t")[0] for line in f][1:]
+            self.assertEqual(ids, sorted(ids))
+
+    def test_an_edge_without_provided_by_counts_as_unknown(self):
+        write_artifact(
+            self.dir, "DDD",
+            [["DDD:1", "biolink:NamedThing", "d", "DDD"]],
+            [["h1", "DDD:1", "biolink:related_to", "GONE:2", ""]],
+        )
+        stats, _ = self.merge()
+        self.assertEqual(stats["dangling_edges"], 3)
+        self.assertEqual(self.summary(), [["CCC", "2", "1", "2"], ["unknown", "1", "0", "1"]])
+
+    def test_the_same_counts_in_partitions(self):
+        stats, _ = self.merge(partitions=4, workers=2)
+        self.assertEqual(stats["dangling_edges"], 2)
+        self.assertEqual(self.summary(), [["CCC", "2", "1", "2"]])
+
+
+class TestUnreadableArtifacts(MergeCase):
+    def test_unreadable_artifacts_are_reported(self):
+        path = os.path.join(self.dir, "BBB.tar.gz")
+        with open(path, "rb") as f:
+            whole = f.read()
+        with open(path, "wb") as f:
+            f.write(whole[: len(whole) // 2])
+        for kw in ({}, {"partitions": 2, "workers": 2}):
+            with self.subTest(**kw):
+                stats, _ = self.merge(**kw)
+                self.assertEqual(stats["unreadable"], ["BBB"])
+
+
+class TestIncrementalMerge(TestMergeGraph):
+    def setUp(self):
+        super().setUp()
+        self.segments = os.path.join(self._tmp.name, "segments")
+        self.index = {}
+
+    def merge(self, **kw):
+        kw.setdefault("workers", 1)
+        return super().merge(segments_dir=self.segments, index=self.index, **kw)
+
+    def published(self, acronym, tag):
+        self.index[acronym] = {
+            "id": acronym, "submission_id": "1",
+            "download_url": f"https://example.org/{tag}/{acronym}.tar.gz",
+        }
+
+    def test_first_merge_builds_every_segment(self):
+        stats, _ = self.merge()
+        self.assertEqual((stats["segments_rebuilt"], stats["segments_reused"]), (2, 0))
+
+    def test_unchanged_artifacts_are_not_read_again(self):
+        self.published("AAA", "data-1")
+        self.published("BBB", "data-1")
+        _, before = self.merge()
+        self.published("BBB", "data-2")
+        write_artifact(
+            self.dir, "BBB", [["BFO:1", "biolink:NamedThing", "bfo", "BBB"]], [],
+        )
+        stats, after = self.merge()
+        self.assertEqual((stats["segments_rebuilt"], stats["segments_reused"]), (1, 1))
+        nodes = {n["id"]: n for n in after["nodes"]}
+        self.assertEqual(sorted(nodes), ["AAA:1", "AAA:2", "BFO:1"])
+        self.assertEqual(nodes["BFO:1"]["name"], "entity")
+        self.assertEqual(len(after["edges"]), 2)
+        # Only the current segments are kept.
+        self.assertEqual(len(os.listdir(self.segments)), 3)
+
+    def test_same_graph_as_a_full_merge(self):
+        self.merge()
+        os.remove(os.path.join(self.dir, "BBB.tar.gz"))
+        write_artifact(self.dir, "CCC", [["AAA:1", "biolink:Gene", "", "CCC"]], [])
+        _, incremental = self.merge()
+        _, full = MergeCase.merge(self)
+        self.assertEqual(incremental, full)
+
+    def test_an_unreadable_artifact_is_read_again_next_time(self):
+        self.published("AAA", "data-1")
+        self.published("BBB", "data-1")
+        path = os.path.join(self.dir, "AAA.tar.gz")
+        with open(path, "rb") as f:
+            whole = f.read()
+        with open(path, "wb") as f:
+            f.write(whole[: len(whole) // 2])
+        stats, _ = self.merge()
+        self.assertEqual(stats["unreadable"], ["AAA"])
+
+        # Repaired under the same version: its partial segment isn't reused.
+        with open(path, "wb") as f:
+            f.write(whole)
+        stats, repaired = self.merge()
+        self.assertEqual(stats["unreadable"], [])
+        self.assertEqual((stats["segments_rebuilt"], stats["segments_reused"]), (1, 1))
+        self.assertEqual(repaired, MergeCase.merge(self)[1])
+
+    def test_a_new_partition_count_rebuilds(self):
+        self.merge()
+        stats, _ = self.merge(partitions=3)
+        self.assertEqual(stats["segments_rebuilt"], 2)
+
+
+class TestSelectArtifacts(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        for name in ("AAA.tar.gz", "BBB.tar.gz", "merged-kg.tar.gz", "onto_stats.yaml"):
+            open(os.path.join(self._tmp.name, name), "w").close()
+
+    def names(self, **kw):
+        return [os.path.basename(p) for p in select_artifacts(self._tmp.name, **kw)]
+
+    def test_selection(self):
+        self.assertEqual(self.names(skip=["merged-kg.tar.gz"]), ["AAA.tar.gz", "BBB.tar.gz"])
+        self.assertEqual(self.names(include_only=["bbb"]), ["BBB.tar.gz"])
+        self.assertEqual(self.names(exclude=["AAA", "MERGED-KG"]), ["BBB.tar.gz"])
+
+
+class TestMergeCommand(TestCase):
+    def test_merge(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            write_artifact(tmp, "AAA", [["AAA:1", "biolink:NamedThing", "a", "AAA"]], [])
+            write_artifact(tmp, "BBB", [["AAA:1", "biolink:NamedThing", "", "BBB"]], [])
+            result = CliRunner().invoke(
+                main, ["merge", "-i", tmp, "-o", tmp, "--exclude", "BBB", "-w", "1"]
+            )
+            self.assertEqual(result.exit_code, 0, result.output)
+            stats = json.loads(result.stdout.strip().splitlines()[-1])
+            self.assertEqual((stats["artifacts"], stats["nodes"]), (1, 1))
+            # Merging into the artifact directory again doesn't read its own output.
+            result = CliRunner().invoke(main, ["merge", "-i", tmp, "-o", tmp, "-w", "2"])
+            self.assertEqual(json.loads(result.stdout.strip().splitlines()[-1])["artifacts"], 2)
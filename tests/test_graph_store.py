@@ -0,0 +1,208 @@
+"""Tests for the local query store over transformed artifacts."""
+
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from click.testing import CliRunner
+
+from kg_bioportal.cli import main
+from kg_bioportal.graph_merge import select_artifacts
+from kg_bioportal.graph_store import GraphStore, load_store
+from tests.test_graph_merge import write_artifact
+
+SUBCLASS = "biolink:subclass_of"
+PART_OF = "BFO:0000050"
+
+
+class StoreCase(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.dir = self._tmp.name
+        self.db = os.path.join(self.dir, "store", "kg_store.db")
+        write_artifact(
+            self.dir, "AAA",
+            [
+                ["BFO:1", "biolink:NamedThing", "entity", "AAA"],
+                ["AAA:1", "biolink:Disease", "a disease", "AAA"],
+                ["AAA:2", "biolink:Disease", "", "AAA"],
+            ],
+            [
+                ["e1", "AAA:1", SUBCLASS, "BFO:1", "AAA"],
+                ["e2", "AAA:2", SUBCLASS, "AAA:1", "AAA"],
+                ["e3", "AAA:2", PART_OF, "BFO:1", "AAA"],
+            ],
+        )
+        write_artifact(
+            self.dir, "BBB",
+            [
+                ["BFO:1", "biolink:NamedThing|biolink:Entity", "entity (BBB)", "BBB"],
+                ["BBB:1", "biolink:Gene", "a gene", "BBB"],
+            ],
+            [["e1", "BBB:1", SUBCLASS, "BFO:1", "BBB"]],
+        )
+
+    def load(self, **kwargs):
+        kwargs.setdefault("workers", 1)
+        return load_store(select_artifacts(self.dir), self.db, **kwargs)
+
+    def store(self):
+        store = GraphStore(self.db)
+        self.addCleanup(store.close)
+        return store
+
+
+class TestGraphStore(StoreCase):
+    def setUp(self):
+        super().setUp()
+        self.stats = self.load(batch_rows=2)
+
+    def test_counts(self):
+        self.assertEqual(
+            self.stats,
+            {
+                "artifacts": 2, "loaded": 2, "reused": 0, "removed": 0, "failed": [],
+                "nodes": 5, "edges": 4,
+            },
+        )
+        self.assertEqual(
+            self.store().ontologies(),
+            {"AAA": {"nodes": 3, "edges": 3}, "BBB": {"nodes": 2, "edges": 1}},
+        )
+
+    def test_node(self):
+        store = self.store()
+        self.assertEqual(
+            store.node("AAA:1"),
+            {"id": "AAA:1", "name": "a disease", "category": "biolink:Disease", "provided_by": "AAA"},
+        )
+        # Copies from each ontology are folded together, as the merge does.
+        shared = store.node("BFO:1")
+        self.assertEqual(shared["name"], "entity")
+        self.assertEqual(shared["category"], "biolink:NamedThing|biolink:Entity")
+        self.assertEqual(shared["provided_by"], "AAA|BBB")
+        self.assertNotIn("name", store.node("AAA:2"))
+        self.assertIsNone(store.node("ZZZ:1"))
+
+    def test_edges(self):
+        store = self.store()
+        into = list(store.edges(object="BFO:1"))
+        self.assertEqual(
+            sorted((e["subject"], e["predicate"]) for e in into),
+            [("AAA:1", SUBCLASS), ("AAA:2", PART_OF), ("BBB:1", SUBCLASS)],
+        )
+        self.assertEqual(
+            [e["id"] for e in store.edges(subject="AAA:2", predicate=PART_OF)], ["e3"]
+        )
+        self.assertEqual(len(list(store.edges(predicate=SUBCLASS))), 3)
+        self.assertEqual(len(list(store.edges(predicate=SUBCLASS, limit=1))), 1)
+        self.assertEqual(list(store.edges(subject="AAA:1", object="AAA:2")), [])
+        with self.assertRaises(ValueError):
+            list(store.edges())
+
+    def test_neighbours(self):
+        store = self.store()
+        self.assertEqual(store.neighbours("AAA:1"), ["AAA:2", "BFO:1"])
+        self.assertEqual(store.neighbours("AAA:1", direction="out"), ["BFO:1"])
+        self.assertEqual(store.neighbours("BFO:1", PART_OF, direction="in"), ["AAA:2"])
+        self.assertEqual(store.neighbours("ZZZ:1"), [])
+        with self.assertRaises(ValueError):
+            store.neighbours("AAA:1", direction="sideways")
+
+    def test_missing_store(self):
+        with self.assertRaises(FileNotFoundError):
+            GraphStore(os.path.join(self.dir, "absent.db"))
+
+
+class TestIncrementalLoad(StoreCase):
+    def test_parallel_load_matches_serial(self):
+        serial = self.load()
+        serial_edges = sorted(e["id"] + e["subject"] for e in self.store().edges(object="BFO:1"))
+        os.remove(self.db)
+        self.assertEqual(self.load(workers=2), serial)
+        self.assertEqual(
+            sorted(e["id"] + e["subject"] for e in self.store().edges(object="BFO:1")),
+            serial_edges,
+        )
+
+    def test_only_changed_artifacts_are_reloaded(self):
+        self.load()
+        self.assertEqual(self.load()["reused"], 2)
+
+        write_artifact(self.dir, "BBB", [["BBB:2", "biolink:Gene", "another gene", "BBB"]], [])
+        os.remove(os.path.join(self.dir, "AAA.tar.gz"))
+        stats = self.load()
+        self.assertEqual((stats["loaded"], stats["reused"], stats["removed"]), (1, 0, 1))
+        self.assertEqual((stats["nodes"], stats["edges"]), (1, 0))
+        store = self.store()
+        self.assertIsNone(store.node("BBB:1"))
+        self.assertIsNone(store.node("AAA:1"))
+        self.assertEqual(store.node("BBB:2")["name"], "another gene")
+
+    def test_index_versions(self):
+        index = {a: {"download_url": f"https://example.org/v1/{a}.tar.gz"} for a in ("AAA", "BBB")}
+        self.load(index=index)
+        index["AAA"]["download_url"] = "https://example.org/v2/AAA.tar.gz"
+        stats = self.load(index=index)
+        self.assertEqual((stats["loaded"], stats["reused"]), (1, 1))
+
+    def truncate(self, acronym):
+        path = os.path.join(self.dir, f"{acronym}.tar.gz")
+        with open(path, "rb") as f:
+            whole = f.read()
+        with open(path, "wb") as f:
+            f.write(whole[: len(whole) // 2])
+        return path, whole
+
+    def test_an_unreadable_artifact_does_not_stop_the_load(self):
+        self.truncate("BBB")
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                if os.path.exists(self.db):
+                    os.remove(self.db)
+                stats = self.load(workers=workers)
+                self.assertEqual((stats["loaded"], stats["failed"]), (1, ["BBB"]))
+                store = self.store()
+                self.assertEqual(store.node("AAA:1")["name"], "a disease")
+                self.assertEqual(set(store.ontologies()), {"AAA"})
+                indexes = {
+                    name for (name,) in store._con.execute(
+                        "SELECT name FROM sqlite_master WHERE type = 'index'"
+                    )
+                }
+                self.assertIn("edges_by_subject", indexes)
+
+    def test_an_unreadable_update_keeps_the_previous_rows(self):
+        index = {a: {"download_url": f"https://example.org/v1/{a}.tar.gz"} for a in ("AAA", "BBB")}
+        self.load(index=index)
+        index["BBB"]["download_url"] = "https://example.org/v2/BBB.tar.gz"
+        path, whole = self.truncate("BBB")
+        stats = self.load(index=index)
+        self.assertEqual(stats["failed"], ["BBB"])
+        self.assertEqual(self.store().node("BBB:1")["name"], "a gene")
+
+        # Still at its old version, so it is read again once it's readable.
+        with open(path, "wb") as f:
+            f.write(whole)
+        stats = self.load(index=index)
+        self.assertEqual((stats["loaded"], stats["reused"], stats["failed"]), (1, 1, []))
+
+    def test_cli(self):
+        result = CliRunner().invoke(main, ["load-store", "-i", self.dir, "-o", self.db, "-w", "1"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(json.loads(result.output)["nodes"], 5)
+        self.assertEqual(self.store().neighbours("BBB:1"), ["BFO:1"])
+
+        empty = os.path.join(self.dir, "empty")
+        os.makedirs(empty)
+        result = CliRunner().invoke(main, ["load-store", "-i", empty, "-o", self.db])
+        self.assertNotEqual(result.exit_code, 0)
+
+        self.truncate("BBB")
+        os.remove(self.db)
+        result = CliRunner().invoke(main, ["load-store", "-i", self.dir, "-o", self.db, "-w", "1"])
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertEqual(json.loads(result.stdout)["failed"], ["BBB"])
+        self.assertIn("BBB", result.stderr)
@@ -0,0 +1,220 @@
+"""Tests for per-call ROBOT heap sizing and the heap budget shared by workers.
+
+A heap sized to the source is only safe if running out of it costs a retry,
+not the ontology, and only useful if the memory it frees lets more calls run
+at once without letting them, together, overrun the machine.
+"""
+
+import multiprocessing
+import os
+import tempfile
+import threading
+from unittest import TestCase, mock
+
+import sh
+
+from kg_bioportal.heap import HeapBudget, heap_for_source, learn_multiplier, with_heap
+from kg_bioportal.robot_utils import RobotOutOfMemory, robot_convert
+from kg_bioportal.transformer import Transformer
+
+MB = 1024 * 1024
+
+
+class TestSizing(TestCase):
+    def test_heap_follows_the_source(self):
+        self.assertEqual(heap_for_source(100 * MB, ceiling_gb=12, multiplier=50, floor_gb=1), 5)
+
+    def test_small_sources_get_the_floor(self):
+        self.assertEqual(heap_for_source(50 * 1024, ceiling_gb=12, multiplier=50, floor_gb=1), 1)
+
+    def test_large_sources_get_the_ceiling(self):
+        self.assertEqual(heap_for_source(900 * MB, ceiling_gb=12, multiplier=50, floor_gb=1), 12)
+
+    def test_no_multiplier_means_the_ceiling(self):
+        self.assertEqual(heap_for_source(50 * 1024, ceiling_gb=12, multiplier=0), 12)
+
+    def test_with_heap(self):
+        self.assertEqual(with_heap("-Xmx12g -XX:+UseG1GC", 2.5), "-Xmx2560m -XX:+UseG1GC")
+        self.assertEqual(with_heap("-XX:+UseG1GC", 1), "-Xmx1024m -XX:+UseG1GC")
+
+
+class TestLearnMultiplier(TestCase):
+    def oom(self, heap_gb, source_mb):
+        return {"oom_heap_gb": heap_gb, "oom_source_mb": source_mb}
+
+    def test_no_records_keeps_the_default(self):
+        self.assertEqual(learn_multiplier({"A": {"status": "OK"}}, default=50), 50)
+
+    def test_raised_to_the_median_record_with_headroom(self):
+        index = {"A": self.oom(2, 20), "B": self.oom(4, 40), "C": self.oom(1, 1)}
+        # Ratios 102.4, 102.4 and 1024: the one odd ontology doesn't set it.
+        self.assertEqual(learn_multiplier(index, default=50), 153.6)
+
+    def test_never_below_the_default(self):
+        self.assertEqual(learn_multiplier({"A": self.oom(1, 1000)}, default=50), 50)
+
+    def test_off_stays_off(self):
+        self.assertEqual(learn_multiplier({"A": self.oom(2, 20)}, default=0), 0)
+
+
+def _hold(budget, gb, held, release):
+    with budget.reserve(gb):
+        held.set()
+        release.wait(10)
+
+
+class TestHeapBudget(TestCase):
+    def test_waits_for_room(self):
+        budget = HeapBudget(4)
+        got = threading.Event()
+
+        def second():
+            with budget.reserve(3):
+                got.set()
+
+        with budget.reserve(3):
+            waiter = threading.Thread(target=second)
+            waiter.start()
+            self.assertFalse(got.wait(0.2))
+        waiter.join(5)
+        self.assertTrue(got.is_set())
+        self.assertEqual(budget.used_gb, 0)
+
+    def test_small_ones_share(self):
+        budget = HeapBudget(4)
+        with budget.reserve(1), budget.reserve(1), budget.reserve(2):
+            self.assertEqual(budget.used_gb, 4)
+
+    def test_oversize_runs_alone(self):
+        with HeapBudget(4).reserve(12) as held:
+            self.assertIsNone(held)
+
+    def test_shared_across_processes(self):
+        context = multiprocessing.get_context("fork")
+        budget = HeapBudget(4, context)
+        held, release = context.Event(), context.Event()
+        child = context.Process(target=_hold, args=(budget, 3, held, release))
+        child.start()
+        try:
+            self.assertTrue(held.wait(10))
+            self.assertEqual(budget.used_gb, 3)
+        finally:
+            release.set()
+            child.join(10)
+        self.assertEqual(budget.used_gb, 0)
+
+
+class TestRobotOutOfMemory(TestCase):
+    def run_convert(self, error, heap_gb):
+        seen = {}
+
+        def command(*args, _env, _timeout):
+            seen["java_args"] = _env["ROBOT_JAVA_ARGS"]
+            raise error
+
+        with mock.patch("kg_bioportal.robot_utils.sh.Command", return_value=command):
+            result = robot_convert("robot", "in.owl", "out.owl", {"ROBOT_JAVA_ARGS": "-Xmx12g"},
+                                   heap_gb=heap_gb)
+        return result, seen
+
+    def test_out_of_heap_is_raised_when_the_caller_chose_the_heap(self):
+        error = sh.ErrorReturnCode_1("robot", b"", b"java.lang.OutOfMemoryError: Java heap space")
+        with self.assertRaises(RobotOutOfMemory):
+            self.run_convert(error, heap_gb=2)
+
+    def test_heap_is_passed_to_robot(self):
+        result, seen = self.run_convert(sh.ErrorReturnCode_1("robot", b"", b"bad input"), 2)
+        self.assertFalse(result)
+        self.assertEqual(seen["java_args"], "-Xmx2048m")
+
+    def test_without_a_chosen_heap_it_is_just_a_failure(self):
+        error = sh.ErrorReturnCode_1("robot", b"", b"java.lang.OutOfMemoryError: Java heap space")
+        result, seen = self.run_convert(error, heap_gb=0)
+        self.assertFalse(result)
+        self.assertEqual(seen["java_args"], "-Xmx12g")
+
+
+class TestTransformerRetry(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.source = os.path.join(self._tmp.name, "ONTO", "1", "onto.owl")
+        os.makedirs(os.path.dirname(self.source))
+        with open(self.source, "wb") as f:
+            f.write(b"x" * 1024)
+        self.tx = Transformer.__new__(Transformer)
+        self.tx.input_dir = self.tx.output_dir = self._tmp.name
+        self.tx.timeout_min = self.tx.timeout_sec = 0
+        self.tx.robot_path, self.tx.robot_env = "robot", {}
+        self.tx.heap_multiplier, self.tx.heap_ceiling_gb = 50, 12
+        self.tx.heap_budget = HeapBudget(16)
+        self.heaps = []
+
+    def build(self, needs_gb):
+        def step(heap_gb, **kwargs):
+            self.heaps.append((heap_gb, self.tx.heap_budget.used_gb))
+            if heap_gb < needs_gb:
+                raise RobotOutOfMemory(f"ROBOT ran out of its {heap_gb:g} GB heap")
+            return True
+
+        def transform(tx, path, compress):
+            ok = tx._robot(step, input_path=path, output_path="")
+            return ok and tx._robot(step, input_path=path, output_path=""), 1, 1
+
+        with mock.patch.object(Transformer, "transform", transform):
+            return self.tx.transform_source(self.source, False, {"unpacked_bytes": str(200 * MB)})
+
+    def test_small_heap_is_enough(self):
+        entry = self.build(needs_gb=1)
+        self.assertEqual(self.heaps, [(10, 10), (10, 10)])
+        self.assertNotIn("oom_heap_gb", entry)
+        self.assertEqual(self.tx.heap_budget.used_gb, 0)
+
+    def test_out_of_heap_is_retried_at_the_ceiling(self):
+        entry = self.build(needs_gb=11)
+        self.assertEqual(entry["status"], "OK")
+        # The relax step starts from the ceiling, and the budget holds it.
+        self.assertEqual(self.heaps, [(10, 10), (12, 12), (12, 12)])
+        self.assertEqual((entry["oom_heap_gb"], entry["oom_source_mb"]), (10, 200))
+        self.assertEqual(self.tx.heap_budget.used_gb, 0)
+
+    def test_workers_growing_at_once_do_not_deadlock(self):
+        # Each holds 6 of 16 when it runs out; neither can top up to 12 while
+        # the other still holds its 6.
+        both_ran_out = threading.Barrier(2)
+        workers = []
+        for _ in range(2):
+            tx = Transformer.__new__(Transformer)
+            tx.__dict__.update(self.tx.__dict__)
+            workers.append(tx)
+
+        def step(heap_gb, **kwargs):
+            if heap_gb < 12:
+                both_ran_out.wait(timeout=5)
+                raise RobotOutOfMemory(f"ROBOT ran out of its {heap_gb:g} GB heap")
+            return True
+
+        def transform(tx, path, compress):
+            return tx._robot(step, input_path=path, output_path=""), 1, 1
+
+        entries = []
+
+        def work(tx):
+            row = {"unpacked_bytes": str(120 * MB)}
+            entries.append(tx.transform_source(self.source, False, row))
+
+        with mock.patch.object(Transformer, "transform", transform):
+            threads = [threading.Thread(target=work, args=(tx,), daemon=True) for tx in workers]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=10)
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+        self.assertEqual([e["status"] for e in entries], ["OK", "OK"])
+        self.assertEqual([e["oom_heap_gb"] for e in entries], [6, 6])
+        self.assertEqual(self.tx.heap_budget.used_gb, 0)
+
+    def test_out_of_heap_at_the_ceiling_fails(self):
+        entry = self.build(needs_gb=20)
+        self.assertEqual((entry["status"], entry["reason"]), ("Failed", "transform_error"))
+        self.assertEqual(self.tx.heap_budget.used_gb, 0)
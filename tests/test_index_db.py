@@ -0,0 +1,106 @@
+"""Tests for onto_stats.db, the indexed companion of onto_stats.yaml.
+
+The companion is only an accelerator: whatever reads it must see exactly what
+the YAML says, and must go back to the YAML the moment the two could disagree.
+"""
+
+import datetime
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+import yaml
+
+from kg_bioportal import index
+from kg_bioportal.index import index_db_path, lookup, merge_stats, read_index
+from tests.helpers import BUILD_SITE, load_script
+from tests.test_merge_stats import entry
+
+bs = load_script(BUILD_SITE, "build_site_index_db")
+
+
+class IndexDbTestCase(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        fragments = os.path.join(self._tmp.name, "fragments", "shard-1")
+        os.makedirs(fragments)
+        with open(os.path.join(fragments, "onto_stats.yaml"), "w") as f:
+            yaml.dump({"ontologies": [
+                entry("AGRO"), entry("ZZZ", "Failed", "transform_error"),
+                # Unquoted, so YAML reads it back as a date.
+                entry("DATED", version=datetime.date(2024, 1, 15)),
+            ]}, f)
+        self.out = os.path.join(self._tmp.name, "out")
+        merge_stats(os.path.dirname(fragments), self.out, release_tag="data-2026.10",
+                    report=lambda line: None)
+        self.index = os.path.join(self.out, "onto_stats.yaml")
+
+    def from_yaml(self):
+        with open(self.index) as f:
+            return {e["id"]: e for e in yaml.safe_load(f)["ontologies"]}
+
+    def rewrite_yaml(self, entries):
+        with open(self.index, "w") as f:
+            yaml.dump({"ontologies": entries}, f, sort_keys=False)
+
+
+class TestCompanion(IndexDbTestCase):
+    def test_merge_writes_a_companion(self):
+        self.assertTrue(os.path.exists(index_db_path(self.index)))
+
+    def test_companion_reads_back_what_the_yaml_says(self):
+        self.assertEqual(read_index(self.index), self.from_yaml())
+        self.assertEqual(list(read_index(self.index)), list(self.from_yaml()))
+
+    def test_lookup_is_one_entry(self):
+        self.assertEqual(lookup(self.index, "AGRO"), self.from_yaml()["AGRO"])
+        self.assertIsNone(lookup(self.index, "NOPE"))
+
+    def test_dates_read_back_as_dates(self):
+        self.assertEqual(self.from_yaml()["DATED"]["version"], datetime.date(2024, 1, 15))
+        self.assertEqual(lookup(self.index, "DATED"), self.from_yaml()["DATED"])
+        # Seeding the next merge from the companion or the YAML alone is the same.
+        bare = os.path.join(self._tmp.name, "bare.yaml")
+        shutil.copy(self.index, bare)
+        written = []
+        for base in (self.index, bare):
+            out = os.path.join(self._tmp.name, f"from_{len(written)}")
+            merge_stats(os.path.join(self._tmp.name, "nothing"), out, base_path=base,
+                        report=lambda line: None)
+            with open(os.path.join(out, "onto_stats.yaml")) as f:
+                written.append(f.read())
+        self.assertEqual(written[0], written[1])
+
+    def test_the_yaml_is_hashed_once_while_unchanged(self):
+        with mock.patch.object(index, "file_sha256", wraps=index.file_sha256) as hashed:
+            for _ in range(3):
+                lookup(self.index, "AGRO")
+            # write_index already knew the hash of what it wrote.
+            self.assertEqual(hashed.call_count, 0)
+            self.rewrite_yaml([entry("AGRO", version="2")])
+            for _ in range(3):
+                lookup(self.index, "AGRO")
+            self.assertEqual(hashed.call_count, 1)
+
+    def test_edited_yaml_is_not_shadowed_by_a_stale_companion(self):
+        self.rewrite_yaml([entry("AGRO", version="2")])
+        self.assertEqual(read_index(self.index)["AGRO"]["version"], "2")
+        self.assertNotIn("ZZZ", read_index(self.index))
+        self.assertEqual(lookup(self.index, "AGRO")["version"], "2")
+
+    def test_corrupt_companion_falls_back_to_the_yaml(self):
+        with open(index_db_path(self.index), "wb") as f:
+            f.write(b"not a database")
+        self.assertEqual(read_index(self.index), self.from_yaml())
+
+
+class TestSiteBuild(IndexDbTestCase):
+    def test_site_reads_the_companion(self):
+        self.assertEqual(bs.load_ontologies_db(self.index), list(self.from_yaml().values()))
+
+    def test_site_ignores_a_stale_companion(self):
+        self.rewrite_yaml([entry("AGRO", version="2")])
+        self.assertIsNone(bs.load_ontologies_db(self.index))
+        self.assertEqual([e["version"] for e in bs.load_ontologies(self.index)], ["2"])
@@ -0,0 +1,114 @@
+"""Tests for the heavy lane.
+
+Whatever a hosted runner can't build -- skiplisted giants, oversize sources,
+transforms that ran out of time -- is sent to a second, heavy lane rather than
+dropped, and built there under that lane's own limits.
+"""
+
+import csv
+import json
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import yaml
+from click.testing import CliRunner
+
+from kg_bioportal.cli import main
+from kg_bioportal.config import HEAVY_ROBOT_JAVA_ARGS, HEAVY_TIMEOUT_MIN, MAX_SOURCE_MB
+from kg_bioportal.downloader import SIZE_MANIFEST_FIELDS
+from kg_bioportal.transformer import Transformer
+from tests.test_merge_stats import entry
+
+MB = 1024 * 1024
+
+
+def fake_robot(robot_path, java_args=""):
+    return [None, {"ROBOT_JAVA_ARGS": java_args}]
+
+
+class TestTransformerLane(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        patcher = mock.patch("kg_bioportal.transformer.initialize_robot", fake_robot)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make(self, **kw):
+        return Transformer(input_dir=self._tmp.name, output_dir=self._tmp.name, **kw)
+
+    def test_light_lane_keeps_the_usual_limits(self):
+        tx = self.make()
+        self.assertEqual(tx.max_source_mb, MAX_SOURCE_MB)
+        self.assertEqual(tx.lane, "light")
+
+    def test_heavy_lane_has_its_own_limits(self):
+        tx = self.make(lane="heavy")
+        self.assertEqual(tx.timeout_min, HEAVY_TIMEOUT_MIN)
+        self.assertEqual(tx.robot_env["ROBOT_JAVA_ARGS"], HEAVY_ROBOT_JAVA_ARGS)
+
+    def test_explicit_limits_win(self):
+        tx = self.make(lane="heavy", timeout_min=5, java_args="-Xmx2g")
+        self.assertEqual(tx.timeout_min, 5)
+        self.assertEqual(tx.robot_env["ROBOT_JAVA_ARGS"], "-Xmx2g")
+
+    def test_heavy_entries_are_marked(self):
+        for lane in ("light", "heavy"):
+            log = {"AAA": {k: v for k, v in entry("AAA").items() if k != "id"}}
+            self.make(lane=lane).write_stats(log)
+            with open(os.path.join(self._tmp.name, "onto_stats.yaml")) as f:
+                written = yaml.safe_load(f)["ontologies"][0]
+            self.assertEqual(written.get("lane"), "heavy" if lane == "heavy" else None)
+
+
+class TestShardListLanes(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.index = os.path.join(self._tmp.name, "onto_stats.yaml")
+        with open(self.index, "w") as f:
+            yaml.dump({"ontologies": [
+                entry("DONE"),
+                # Unchanged, and the light lane gave up on it: promoted.
+                entry("BIG", "Skipped", "too_large"),
+                # Unchanged, and the heavy lane couldn't manage it either.
+                entry("BIGGER", "Skipped", "too_large", lane="heavy"),
+            ]}, f)
+        self.list = os.path.join(self._tmp.name, "ontologylist.tsv")
+        with open(self.list, "w") as f:
+            f.write("id\tname\tcurrent_version\tsubmission_id\n")
+            for acr in ("DONE", "BIG", "BIGGER"):
+                f.write(f"{acr}\t{acr}\t1\t1\n")
+            for acr in ("NEW", "NCBITAXON", "HUGE", "MONSTER"):
+                f.write(f"{acr}\t{acr}\t1\t1\n")
+        self.manifest = os.path.join(self._tmp.name, "size_manifest.tsv")
+        with open(self.manifest, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=SIZE_MANIFEST_FIELDS, delimiter="\t")
+            writer.writeheader()
+            writer.writerow({"id": "HUGE", "submission_id": "1", "content_length": 500 * MB})
+            writer.writerow({"id": "MONSTER", "submission_id": "1",
+                             "content_length": 10 ** 5 * MB})
+
+    def shard(self, *args):
+        result = CliRunner().invoke(main, [
+            "shard-list", "-f", self.list, "-n", "2", "--index", self.index,
+            "--size_manifest", self.manifest, *args,
+        ])
+        self.assertEqual(result.exit_code, 0, result.output)
+        return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+    def test_without_lanes_the_heavy_work_is_dropped(self):
+        shards, _ = self.shard()
+        self.assertEqual(shards, ["NEW"])
+
+    def test_lanes_split_the_work(self):
+        lanes, err = self.shard("--lanes")
+        self.assertEqual(lanes["light"], ["NEW"])
+        self.assertEqual(lanes["heavy"], ["BIG NCBITAXON HUGE"])
+        self.assertIn("lanes: 1 unchanged ontologies promoted to the heavy lane: BIG", err)
+        self.assertIn("size-gate: 1 over", err)
+
+    def test_heavy_shard_count(self):
+        lanes, _ = self.shard("--lanes", "--heavy_shards", "3")
+        self.assertEqual(lanes["heavy"], ["BIG", "NCBITAXON", "HUGE"])
@@ -15,6 +15,8 @@ from unittest import TestCase
 
 import yaml
 
+from kg_bioportal.config import LICENSE_RESTRICTED_REASON
+from kg_bioportal.index import index_totals, merge_stats, read_index
 from tests.helpers import MERGE_STATS
 
 PREV_TAG = "data-2026.07"
@@ -255,3 +257,62 @@ class TestTotals(MergeStatsTestCase):
     def test_transform_date_is_recorded(self):
         _, totals = self.run_merge(date="2026-08-10")
         self.assertEqual(str(totals["transform_date"]), "2026-08-10")
+
+
+class TestStreamingMerge(MergeStatsTestCase):
+    """The k-way merge and streaming writer must change nothing but speed."""
+
+    def merge(self, base_path="", **kwargs):
+        merge_stats(self.fragments, self.out, base_path=base_path, release_tag=THIS_TAG,
+                    report=lambda line: None, **kwargs)
+        return list(read_index(os.path.join(self.out, "onto_stats.yaml")).values())
+
+    def test_a_later_shard_wins_a_tie(self):
+        self.write_fragment([entry("X", reason="first")], shard="shard-1")
+        self.write_fragment([entry("X", reason="second")], shard="shard-2")
+        index, _ = self.run_merge()
+        self.assertEqual(index["X"]["reason"], "second")
+
+    def test_a_reported_giant_is_not_replaced_by_its_skiplist_row(self):
+        self.write_fragment([entry("NCBITAXON")])
+        index, _ = self.run_merge()
+        self.assertEqual(index["NCBITAXON"]["status"], "OK")
+
+    def test_yaml_is_exactly_what_yaml_dump_writes(self):
+        # Long, escaped and non-ASCII strings are where libyaml's emitter
+        # would otherwise disagree with PyYAML's.
+        odd = [
+            entry("ASCII", name="A plain name: with a colon and # hash " * 4),
+            entry("UMLAUT", name="Ontologie für Übungen und Prüfungen " * 5),
+            entry("ESCAPE", name="tab\there\nnewline " * 8, version="2024-01-15"),
+            entry("EMPTY", status="Failed", reason="transform_error", name="", version="yes"),
+        ]
+        base = self.write_base([entry("OLD", download_url=asset(PREV_TAG, "OLD"))])
+        self.write_fragment(odd)
+        ontologies = self.merge(base)
+        with open(os.path.join(self.out, "onto_stats.yaml")) as f:
+            self.assertEqual(f.read(), yaml.dump({"ontologies": ontologies}, sort_keys=False))
+
+    def test_returns_what_total_stats_records(self):
+        self.write_fragment([
+            entry("A"),
+            entry("B", status="Failed", reason="transform_error"),
+            entry("C", status="Failed", reason=LICENSE_RESTRICTED_REASON),
+        ])
+        totals = merge_stats(self.fragments, self.out, release_tag=THIS_TAG,
+                             report=lambda line: None)
+        with open(os.path.join(self.out, "total_stats.yaml")) as f:
+            self.assertEqual(totals, yaml.safe_load(f))
+        self.assertEqual(
+            (totals["totalcount"], totals["failedcount"], totals["licensedcount"]), (1, 1, 1)
+        )
+        self.assertEqual(totals, index_totals(self.merge()))
+
+    def test_parallel_parsing_merges_the_same(self):
+        for n in range(12):
+            self.write_fragment([entry(f"O{n}", reason=f"shard {n}"),
+                                 entry(f"O{n + 1}", reason=f"shard {n}")],
+                                shard=f"shard-{n:02d}")
+        serial = self.merge(workers=1)
+        self.assertEqual(self.merge(workers=4), serial)
+        self.assertEqual({o["id"]: o["reason"] for o in serial}["O5"], "shard 5")
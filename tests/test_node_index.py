@@ -0,0 +1,56 @@
+"""Tests for the on-disk node-id index the merge checks edges against."""
+
+import os
+import tempfile
+from unittest import TestCase
+
+from kg_bioportal.graph_merge import partition_of
+from kg_bioportal.node_index import NodeIdIndex, NodeIdWriter, PartitionedIdIndex
+
+IDS = ["BFO:0000001", "GO:0008150", "MONDO:0000001", "ÉCO:1", "名:1"]
+
+
+class TestNodeIdIndex(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+
+    def write(self, ids, stem="ids"):
+        stem = os.path.join(self._tmp.name, stem)
+        with NodeIdWriter(stem) as writer:
+            for node_id in ids:
+                writer.add(node_id)
+        return stem
+
+    def test_members(self):
+        index = NodeIdIndex(self.write(sorted(IDS)))
+        self.addCleanup(index.close)
+        self.assertEqual(len(index), len(IDS))
+        for node_id in IDS:
+            self.assertIn(node_id, index)
+        for node_id in ("", "AAA:1", "BFO:000000", "GO:0008150 ", "ZZZ:1", "名:2"):
+            self.assertNotIn(node_id, index)
+
+    def test_empty(self):
+        index = NodeIdIndex(self.write([]))
+        self.assertEqual(len(index), 0)
+        self.assertNotIn("GO:0008150", index)
+
+    def test_repeats_and_blanks_are_ignored(self):
+        index = NodeIdIndex(self.write(["", "A:1", "A:1", "B:1"]))
+        self.assertEqual(len(index), 2)
+
+    def test_out_of_order_is_refused(self):
+        with self.assertRaises(ValueError):
+            self.write(["B:1", "A:1"])
+
+    def test_partitioned(self):
+        stems = [
+            self.write(sorted(i for i in IDS if partition_of(i, 3) == p), f"ids-{p}")
+            for p in range(3)
+        ]
+        index = PartitionedIdIndex(stems, partition_of)
+        self.addCleanup(index.close)
+        self.assertEqual(len(index), len(IDS))
+        self.assertTrue(all(i in index for i in IDS))
+        self.assertNotIn("GO:0008151", index)
@@ -0,0 +1,155 @@
+"""Tests for the local multi-worker pipeline.
+
+It has to write what the GitHub Actions build writes -- the same merged
+onto_stats.yaml, total_stats.yaml and graph_urls.tsv -- or the two builds'
+indexes couldn't seed each other.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase, mock
+
+import yaml
+
+from kg_bioportal.downloader import Downloader
+from kg_bioportal.heap import xmx_gb
+from kg_bioportal.index import read_index
+from kg_bioportal.pipeline import plan_workers, run_pipeline, run_shard
+from kg_bioportal.transformer import Transformer
+from tests.helpers import MERGE_STATS
+from tests.test_download_outcomes import unlimited
+from tests.test_run_shard import CATALOGUE, ONTOLOGIES, CatalogueSession, fake_transform
+
+TAG = "data-2026.10"
+DATE = "2026-10-01"
+
+
+def fake_robot(robot_path, java_args=""):
+    return [None, {"ROBOT_JAVA_ARGS": java_args}]
+
+
+class Session(CatalogueSession):
+    """CatalogueSession in place of requests.Session, which Downloader mounts on."""
+
+    def __init__(self):
+        super().__init__(CATALOGUE)
+
+    def mount(self, prefix, adapter):
+        pass
+
+
+class PipelineTestCase(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.root = self._tmp.name
+        # Worker processes are forked, so they inherit these patches.
+        for target, value in [
+            ("kg_bioportal.transformer.initialize_robot", fake_robot),
+            ("kg_bioportal.pipeline.initialize_robot", fake_robot),
+            ("kg_bioportal.downloader.requests.Session", Session),
+            ("kg_bioportal.downloader.shared_limiter", unlimited),
+            ("kg_bioportal.pipeline.BIOPORTAL_RATE_PER_SEC", 1e6),
+            ("kg_bioportal.pipeline.BIOPORTAL_MAX_RATE_PER_SEC", 1e6),
+        ]:
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def read(self, *parts):
+        with open(self.path(*parts)) as f:
+            return f.read()
+
+    def build_like_actions(self):
+        """One shard through run-shard, then merge_stats.py, as the workflow does."""
+        raw, out = self.path("actions", "raw"), self.path("actions", "fragments", "shard-1")
+        dl = Downloader(output_dir=raw, api_key="k")
+        tx = Transformer(input_dir=raw, output_dir=out, timeout_min=1)
+        with mock.patch.object(Transformer, "transform", fake_transform([])):
+            run_shard(dl, tx, ONTOLOGIES, compress=False, min_free_gb=0)
+        subprocess.run(
+            [sys.executable, MERGE_STATS, self.path("actions", "fragments"),
+             self.path("actions", "out"), DATE, "", TAG],
+            check=True, capture_output=True,
+        )
+
+    def build_locally(self, transform=None, **kwargs):
+        with mock.patch.object(Transformer, "transform", transform or fake_transform([])):
+            return run_pipeline(
+                ONTOLOGIES, "k", work_dir=self.path("local"), workers=2, compress=False,
+                timeout_min=1, release_tag=TAG, transform_date=DATE, **kwargs,
+            )
+
+
+class TestSameOutputsAsTheWorkflow(PipelineTestCase):
+    def setUp(self):
+        super().setUp()
+        self.build_like_actions()
+        self.build_locally()
+
+    def test_onto_stats_match(self):
+        self.assertEqual(
+            self.read("actions", "out", "onto_stats.yaml"), self.read("local", "onto_stats.yaml")
+        )
+
+    def test_total_stats_match(self):
+        self.assertEqual(
+            self.read("actions", "out", "total_stats.yaml"), self.read("local", "total_stats.yaml")
+        )
+
+    def test_graph_urls_match(self):
+        urls = self.read("local", "graph_urls.tsv")
+        self.assertEqual(self.read("actions", "out", "graph_urls.tsv"), urls)
+        self.assertIn(f"AAA\thttps://github.com/ncbo/kg-bioportal/releases/download/{TAG}/", urls)
+
+    def test_each_ontology_has_its_own_fragment(self):
+        for acronym in ONTOLOGIES:
+            self.assertTrue(
+                os.path.exists(self.path("local", "transformed", acronym, "onto_stats.yaml"))
+            )
+
+
+class TestPipelineRuns(PipelineTestCase):
+    def test_a_crashing_worker_costs_only_its_ontology(self):
+        def transform(self, ontology_path, compress):
+            if "BROKEN" in ontology_path:
+                raise RuntimeError("JVM fell over")
+            return True, 1, 1
+
+        self.build_locally(transform=transform)
+        entries = read_index(self.path("local", "onto_stats.yaml"))
+        self.assertEqual(entries["BROKEN"]["status"], "Failed")
+        self.assertEqual(entries["BROKEN"]["reason"], "transform_error")
+        self.assertEqual(entries["CCC"]["status"], "OK")
+
+    def test_previous_index_seeds_the_merge(self):
+        index = self.path("prev.yaml")
+        kept = {"id": "KEPT", "status": "OK", "nodecount": 1, "edgecount": 1,
+                "download_url": "https://example.org/KEPT.tar.gz"}
+        with open(index, "w") as f:
+            yaml.dump({"ontologies": [kept]}, f)
+        self.build_locally(index_path=index)
+        entries = read_index(self.path("local", "onto_stats.yaml"))
+        self.assertEqual(entries["KEPT"]["download_url"], kept["download_url"])
+        self.assertIn("AAA", entries)
+
+
+class TestPlanWorkers(TestCase):
+    def test_memory_binds_before_cores(self):
+        self.assertEqual(plan_workers(cpus=64, ram_gb=256, java_args="-Xmx12g", overhead_gb=2), 18)
+
+    def test_cores_bind_before_memory(self):
+        self.assertEqual(plan_workers(cpus=4, ram_gb=256, java_args="-Xmx12g", overhead_gb=2), 4)
+
+    def test_always_at_least_one(self):
+        self.assertEqual(plan_workers(cpus=8, ram_gb=4, java_args="-Xmx12g", overhead_gb=2), 1)
+
+    def test_heap_units(self):
+        self.assertEqual(xmx_gb("-Xmx12g -XX:+UseG1GC"), 12)
+        self.assertEqual(xmx_gb("-Xms1g -Xmx512M"), 0.5)
+        self.assertEqual(xmx_gb("-XX:+UseG1GC"), 0)
@@ -0,0 +1,141 @@
+"""Tests for probe-sizes and the ahead-of-time size gate in shard-list.
+
+Knowing each source's size before anything is scheduled lets shard-list drop
+the oversize ones up front instead of a runner downloading them only to skip.
+"""
+
+import json
+import os
+import tempfile
+import threading
+from unittest import TestCase
+
+from click.testing import CliRunner
+
+from kg_bioportal.cli import main
+from kg_bioportal.downloader import Downloader, read_size_manifest
+from tests.test_download_outcomes import FakeResponse, unlimited
+
+
+class ProbeSession:
+    """Answers ranged GETs on the download endpoint from a table of responses."""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requested = []
+        self.range_headers = []
+        self._lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        acronym = url.split("/ontologies/")[1].split("/")[0]
+        with self._lock:
+            self.requested.append(acronym)
+            self.range_headers.append(kwargs.get("headers", {}).get("Range"))
+        return self.responses[acronym]
+
+
+def ranged(total, filename="x.owl", content_type="application/rdf+xml"):
+    return FakeResponse(
+        status_code=206,
+        headers={
+            "Content-Range": f"bytes 0-0/{total}",
+            "Content-Length": "1",
+            "Content-Type": content_type,
+            "Content-Disposition": f'attachment; filename="{filename}"',
+        },
+    )
+
+
+class ProbeTestCase(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.dir = self._tmp.name
+        self.manifest = os.path.join(self.dir, "size_manifest.tsv")
+
+    def probe(self, responses, submissions, **kw):
+        dl = Downloader(output_dir=self.dir, api_key="k", rate_limiter=unlimited())
+        session = ProbeSession(responses)
+        dl.requests_session = session
+        return dl.probe_sizes(submissions, manifest_path=self.manifest, **kw), session
+
+
+class TestProbe(ProbeTestCase):
+    def test_total_size_comes_from_content_range(self):
+        rows, session = self.probe({"AGRO": ranged(123456, "agro.owl")}, {"AGRO": "9"})
+        row = rows["AGRO"]
+        self.assertEqual(row["content_length"], 123456)
+        self.assertEqual(row["filename"], "agro.owl")
+        self.assertEqual(row["content_type"], "application/rdf+xml")
+        self.assertEqual(row["http_status"], 206)
+        self.assertEqual(session.range_headers, ["bytes=0-0"])
+
+    def test_server_ignoring_the_range_still_gives_a_size(self):
+        full = FakeResponse(status_code=200, headers={"Content-Length": "77"})
+        rows, _ = self.probe({"X": full}, {"X": "1"})
+        self.assertEqual(rows["X"]["content_length"], 77)
+        self.assertTrue(full.closed, "the body must never be read")
+
+    def test_refusals_are_recorded_with_their_status(self):
+        rows, _ = self.probe({"LIC": FakeResponse(status_code=403)}, {"LIC": "1"})
+        self.assertEqual(rows["LIC"]["http_status"], 403)
+        self.assertEqual(rows["LIC"]["content_length"], "")
+
+    def test_manifest_is_written_sorted(self):
+        self.probe({"B": ranged(1), "A": ranged(2)}, {"B": "1", "A": "1"})
+        manifest = read_size_manifest(self.manifest)
+        self.assertEqual(list(manifest), ["A", "B"])
+        self.assertEqual(manifest["A"]["content_length"], "2")
+        self.assertEqual(manifest["B"]["submission_id"], "1")
+
+    def test_many_probes_run_concurrently(self):
+        responses = {f"O{i}": ranged(i) for i in range(50)}
+        rows, session = self.probe(responses, {a: "1" for a in responses}, workers=8)
+        self.assertEqual(len(rows), 50)
+        self.assertEqual(sorted(session.requested), sorted(responses))
+
+
+class TestCaching(ProbeTestCase):
+    def test_unchanged_submissions_are_not_probed_again(self):
+        self.probe({"A": ranged(1), "B": ranged(2)}, {"A": "1", "B": "1"})
+        _, session = self.probe({"A": ranged(1), "B": ranged(5)}, {"A": "1", "B": "2"})
+        self.assertEqual(session.requested, ["B"])
+        self.assertEqual(read_size_manifest(self.manifest)["B"]["content_length"], "5")
+
+    def test_failed_probes_are_retried(self):
+        self.probe({"A": FakeResponse(status_code=502)}, {"A": "1"})
+        _, session = self.probe({"A": ranged(3)}, {"A": "1"})
+        self.assertEqual(session.requested, ["A"])
+
+    def test_refresh_probes_everything(self):
+        self.probe({"A": ranged(1)}, {"A": "1"})
+        _, session = self.probe({"A": ranged(1)}, {"A": "1"}, refresh=True)
+        self.assertEqual(session.requested, ["A"])
+
+    def test_ontologies_no_longer_listed_drop_out(self):
+        self.probe({"A": ranged(1), "GONE": ranged(1)}, {"A": "1", "GONE": "1"})
+        self.probe({"A": ranged(1)}, {"A": "1"})
+        self.assertNotIn("GONE", read_size_manifest(self.manifest))
+
+
+class TestShardListSizeGate(ProbeTestCase):
+    def write_manifest(self, sizes):
+        with open(self.manifest, "w") as f:
+            f.write("id\tsubmission_id\thttp_status\tcontent_length\tcontent_type\tfilename\tprobed_at\n")
+            for acr, size in sizes.items():
+                f.write(f"{acr}\t1\t206\t{size}\t\t\t\n")
+
+    def shard(self, *args):
+        result = CliRunner().invoke(
+            main, ["shard-list", "-d", "SMALL BIG UNKNOWN", "-n", "1", *args]
+        )
+        self.assertEqual(result.exit_code, 0, result.output)
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def test_oversize_sources_are_dropped_before_sharding(self):
+        self.write_manifest({"SMALL": 1024, "BIG": 300 * 1024 * 1024, "UNKNOWN": ""})
+        shards = self.shard("--size_manifest", self.manifest, "--max_source_mb", "100")
+        self.assertEqual(shards, ["SMALL UNKNOWN"])
+
+    def test_no_manifest_no_gate(self):
+        self.assertEqual(self.shard(), ["SMALL BIG UNKNOWN"])
@@ -0,0 +1,183 @@
+"""Tests for the one-hop query service over a graph store."""
+
+import http.client
+import json
+import os
+import tempfile
+import threading
+from unittest import TestCase
+from urllib.parse import quote
+
+from kg_bioportal.graph_merge import select_artifacts
+from kg_bioportal.graph_store import GraphStore, load_store
+from kg_bioportal.query_service import NodeCache, QueryServer, one_hop
+from tests.test_graph_merge import write_artifact
+
+SUBCLASS = "biolink:subclass_of"
+PART_OF = "BFO:0000050"
+
+
+def _query(subject, object_, predicates=None):
+    edge = {"subject": "n0", "object": "n1"}
+    if predicates:
+        edge["predicates"] = predicates
+    return {"message": {"query_graph": {"nodes": {"n0": subject, "n1": object_},
+                                        "edges": {"e0": edge}}}}
+
+
+class TestNodeCache(TestCase):
+    def test_least_recently_used_goes_first(self):
+        cache = NodeCache(2)
+        loads = []
+
+        def load(node_id):
+            loads.append(node_id)
+            return None if node_id == "missing" else {"id": node_id}
+
+        cache.get("A", load)
+        cache.get("B", load)
+        cache.get("A", load)
+        cache.get("C", load)  # evicts B
+        cache.get("A", load)
+        cache.get("B", load)
+        self.assertEqual(loads, ["A", "B", "C", "B"])
+        self.assertIsNone(cache.get("missing", load))
+        self.assertIsNone(cache.get("missing", load))
+        self.assertEqual(loads.count("missing"), 1)
+        self.assertEqual(cache.stats(), {"size": 2, "hits": 3, "misses": 5})
+
+
+class TestQueryService(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls._tmp = tempfile.TemporaryDirectory()
+        directory = cls._tmp.name
+        write_artifact(
+            directory, "AAA",
+            [
+                ["BFO:1", "biolink:NamedThing", "entity", "AAA"],
+                ["AAA:1", "biolink:Disease", "a disease", "AAA"],
+                ["AAA:2", "biolink:Disease", "another disease", "AAA"],
+            ],
+            [
+                ["e1", "AAA:1", SUBCLASS, "BFO:1", "AAA"],
+                ["e2", "AAA:2", SUBCLASS, "AAA:1", "AAA"],
+                ["e3", "AAA:2", PART_OF, "BFO:1", "AAA"],
+            ],
+        )
+        write_artifact(
+            directory, "BBB",
+            [["BBB:1", "biolink:Gene", "a gene", "BBB"]],
+            [
+                ["e1", "BBB:1", SUBCLASS, "BFO:1", "BBB"],
+                ["e2", "AAA:1", SUBCLASS, "BFO:1", "BBB"],
+            ],
+        )
+        cls.db = os.path.join(directory, "kg_store.db")
+        load_store(select_artifacts(directory), cls.db, workers=1)
+        cls.server = QueryServer(("127.0.0.1", 0), cls.db, pool_size=2, max_results=3)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls._tmp.cleanup()
+
+    def request(self, method, path, body=None):
+        connection = http.client.HTTPConnection(*self.server.server_address[:2], timeout=10)
+        self.addCleanup(connection.close)
+        connection.request(method, path, body=json.dumps(body) if body is not None else None)
+        response = connection.getresponse()
+        return response.status, response.getheader("Content-Type"), response.read().decode()
+
+    def test_health(self):
+        status, _, body = self.request("GET", "/health")
+        self.assertEqual((status, json.loads(body)), (200, {"status": "ok"}))
+
+    def test_node(self):
+        status, _, body = self.request("GET", "/nodes/" + quote("AAA:1"))
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)["name"], "a disease")
+        status, _, _ = self.request("GET", "/nodes/ZZZ:1")
+        self.assertEqual(status, 404)
+
+    def test_edges_are_streamed_as_json_lines(self):
+        status, kind, body = self.request("GET", "/edges?object=BFO:1&predicate=" + SUBCLASS)
+        self.assertEqual((status, kind), (200, "application/x-ndjson"))
+        edges = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(edges), 3)
+        self.assertEqual({e["subject"] for e in edges}, {"AAA:1", "BBB:1"})
+        self.assertEqual(self.request("GET", "/edges")[0], 400)
+        self.assertEqual(self.request("GET", "/edges?subject=AAA:1&limit=x")[0], 400)
+        self.assertEqual(self.request("GET", "/edges?subject=AAA:1&limit=-1")[0], 400)
+
+    def test_one_hop(self):
+        status, _, body = self.request(
+            "POST", "/query", _query({"categories": ["biolink:Disease"]}, {"ids": ["BFO:1"]})
+        )
+        self.assertEqual(status, 200)
+        message = json.loads(body)["message"]
+        bound = sorted(
+            (r["node_bindings"]["n0"][0]["id"], r["node_bindings"]["n1"][0]["id"])
+            for r in message["results"]
+        )
+        # AAA:1 -> BFO:1 comes from both ontologies, but is one result.
+        self.assertEqual(bound, [("AAA:1", "BFO:1"), ("AAA:2", "BFO:1")])
+        kg = message["knowledge_graph"]
+        self.assertEqual(kg["nodes"]["AAA:1"]["categories"], ["biolink:Disease"])
+        shared = [e for e in kg["edges"].values() if e["subject"] == "AAA:1"]
+        self.assertEqual(len(shared), 1)
+        self.assertIn(
+            {"attribute_type_id": "biolink:provided_by", "value": "AAA|BBB"},
+            shared[0]["attributes"],
+        )
+        self.assertIn("query_graph", message)
+
+    def test_one_hop_by_predicate_and_limit(self):
+        _, _, body = self.request(
+            "POST", "/query", _query({"ids": ["AAA:2"]}, {}, predicates=[PART_OF])
+        )
+        results = json.loads(body)["message"]["results"]
+        self.assertEqual([r["node_bindings"]["n1"][0]["id"] for r in results], ["BFO:1"])
+        _, _, body = self.request("POST", "/query", _query({}, {"ids": ["BFO:1"]}))
+        self.assertEqual(len(json.loads(body)["message"]["results"]), 3)
+
+    def test_one_hop_stops_reading_once_full(self):
+        read = []
+
+        class Counted(GraphStore):
+            def edges(self, **where):
+                for edge in super().edges(**where):
+                    read.append(edge)
+                    yield edge
+
+        with Counted(self.db) as store:
+            message = _query({}, {"ids": ["BFO:1"]})["message"]
+            self.assertEqual(len(one_hop(store, NodeCache(8), message, 1)["results"]), 1)
+            # Not all four edges into BFO:1: one, then the copies of that one.
+            self.assertLess(len(read), 4)
+
+            # The copy from BBB comes after the one from AAA, but is still folded in.
+            message = _query({"ids": ["AAA:1"]}, {"ids": ["BFO:1"]})["message"]
+            (edge,) = one_hop(store, NodeCache(8), message, 1)["knowledge_graph"]["edges"].values()
+            self.assertIn(
+                {"attribute_type_id": "biolink:provided_by", "value": "AAA|BBB"},
+                edge["attributes"],
+            )
+
+    def test_bad_queries(self):
+        self.assertEqual(self.request("POST", "/query", {"message": {}})[0], 400)
+        self.assertEqual(self.request("POST", "/query", _query({}, {}))[0], 400)
+        self.assertEqual(self.request("POST", "/query", {"message": {"query_graph": []}})[0], 400)
+        self.assertEqual(self.request("POST", "/elsewhere", {})[0], 404)
+
+    def test_keep_alive(self):
+        connection = http.client.HTTPConnection(*self.server.server_address[:2], timeout=10)
+        self.addCleanup(connection.close)
+        for path in ("/health", "/nodes/BFO:1", "/edges?subject=AAA:1", "/meta"):
+            connection.request("GET", path)
+            response = connection.getresponse()
+            response.read()
+            self.assertEqual(response.status, 200)
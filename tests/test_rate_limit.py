@@ -0,0 +1,200 @@
+"""Tests for the shared, adaptive BioPortal rate limiter.
+
+The old per-request retry policy backed each request off on its own and never
+read ``Retry-After``, so parallel shards throttled together and retried
+together. These pin down the replacement: one bucket, slowed by 429s, held off
+for as long as the server asks, and counted for the download summary.
+"""
+
+import os
+import tempfile
+import threading
+from unittest import TestCase
+
+from kg_bioportal.downloader import DOWNLOAD_SUMMARY_NAME, Downloader
+from kg_bioportal.rate_limit import AdaptiveRateLimiter, parse_retry_after, shared_limiter
+from tests.test_download_outcomes import FakeResponse, FakeSession
+
+
+class FakeClock:
+    """A clock that only moves when something sleeps on it."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def limiter(clock, **kw):
+    return AdaptiveRateLimiter(clock=clock, sleep=clock.sleep, **kw)
+
+
+class TestParseRetryAfter(TestCase):
+    def test_seconds(self):
+        self.assertEqual(parse_retry_after("7"), 7.0)
+
+    def test_http_date(self):
+        self.assertAlmostEqual(
+            parse_retry_after("Wed, 21 Oct 2015 07:28:10 GMT", now=1445412480.0), 10.0
+        )
+
+    def test_missing_or_garbage_is_none(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after(""))
+        self.assertIsNone(parse_retry_after("soon"))
+
+    def test_past_dates_mean_no_wait(self):
+        self.assertEqual(parse_retry_after("Wed, 21 Oct 2015 07:28:10 GMT"), 0.0)
+
+
+class TestTokenBucket(TestCase):
+    def test_burst_goes_out_without_waiting(self):
+        clock = FakeClock()
+        rl = limiter(clock, rate=5, max_rate=5)
+        for _ in range(5):
+            rl.acquire()
+        self.assertEqual(clock.slept, [])
+
+    def test_requests_past_the_burst_are_paced_at_the_rate(self):
+        clock = FakeClock()
+        rl = limiter(clock, rate=5, max_rate=5)
+        for _ in range(15):
+            rl.acquire()
+        # 15 requests at 5/s with a 5-request burst take two seconds.
+        self.assertAlmostEqual(clock.now - 1000.0, 2.0, places=6)
+
+    def test_wait_time_is_counted(self):
+        clock = FakeClock()
+        rl = limiter(clock, rate=1, max_rate=1)
+        rl.acquire()
+        rl.acquire()
+        self.assertAlmostEqual(rl.stats()["wait_seconds"], 1.0)
+        self.assertEqual(rl.stats()["requests"], 2)
+
+
+class TestAdaptation(TestCase):
+    def test_throttle_halves_the_rate(self):
+        rl = limiter(FakeClock(), rate=8, max_rate=8)
+        rl.throttled(0)
+        self.assertEqual(rl.rate, 4)
+
+    def test_rate_never_drops_below_the_floor(self):
+        rl = limiter(FakeClock(), rate=8, min_rate=2, max_rate=8)
+        for _ in range(10):
+            rl.throttled(0)
+        self.assertEqual(rl.rate, 2)
+
+    def test_throttles_in_flight_together_halve_the_rate_once(self):
+        clock = FakeClock()
+        rl = limiter(clock, rate=8, min_rate=0.5, max_rate=8)
+        barrier = threading.Barrier(20)
+
+        def throttled():
+            barrier.wait()
+            rl.throttled(5)
+
+        workers = [threading.Thread(target=throttled) for _ in range(20)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(rl.rate, 4)
+        self.assertEqual(rl.stats()["throttles"], 20)
+
+        # Each still holds everyone off; the next halving waits for the pause to end.
+        clock.now += 3
+        rl.throttled(5)
+        self.assertEqual(rl.rate, 4)
+        clock.now += 5
+        rl.throttled(5)
+        self.assertEqual(rl.rate, 2)
+
+    def test_retry_after_holds_off_every_caller(self):
+        clock = FakeClock()
+        rl = limiter(clock, rate=100, max_rate=100)
+        rl.throttled(30)
+        rl.acquire()
+        self.assertGreaterEqual(clock.now - 1000.0, 30.0)
+
+    def test_success_recovers_the_rate_up_to_the_ceiling(self):
+        rl = limiter(FakeClock(), rate=10, min_rate=1, max_rate=10)
+        rl.throttled(0)
+        for _ in range(1000):
+            rl.succeeded()
+        self.assertEqual(rl.rate, 10)
+
+    def test_throttles_are_counted(self):
+        rl = limiter(FakeClock())
+        rl.throttled(0)
+        rl.throttled(None)
+        self.assertEqual(rl.stats()["throttles"], 2)
+
+
+class TestShared(TestCase):
+    def test_one_limiter_per_process(self):
+        self.assertIs(shared_limiter(), shared_limiter())
+
+    def test_downloaders_share_it_by_default(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            a = Downloader(output_dir=tmpdir, api_key="k")
+            b = Downloader(output_dir=tmpdir, api_key="k")
+        self.assertIs(a.rate_limiter, b.rate_limiter)
+
+
+class ThrottlingSession(FakeSession):
+    """Throttles the first ``n`` requests, then behaves."""
+
+    def __init__(self, n, retry_after="2", **kw):
+        super().__init__(**kw)
+        self.remaining = n
+        self.retry_after = retry_after
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        if self.remaining:
+            self.remaining -= 1
+            return FakeResponse(status_code=429, headers={"Retry-After": self.retry_after})
+        return super().get(url, **kwargs)
+
+
+class TestDownloaderHonoursThrottling(TestCase):
+    def run_download(self, session):
+        clock = FakeClock()
+        rl = limiter(clock, rate=100, max_rate=100)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            dl = Downloader(output_dir=tmpdir, api_key="k", rate_limiter=rl)
+            dl.requests_session = session
+            results = dl.download(["TESTONTO"])
+            with open(os.path.join(tmpdir, DOWNLOAD_SUMMARY_NAME)) as f:
+                summary = dict(line.rstrip("\n").split(": ", 1) for line in f)
+        return results[0], summary, clock
+
+    def test_429_is_resent_after_retry_after(self):
+        session = ThrottlingSession(1, download_response=FakeResponse(status_code=404))
+        result, _, clock = self.run_download(session)
+        # Metadata was throttled once, then everything went through.
+        self.assertEqual(result["reason"], "no_download_file")
+        self.assertGreaterEqual(clock.now - 1000.0, 2.0)
+
+    def test_persistent_429_gives_up_with_the_last_response(self):
+        session = ThrottlingSession(100, download_response=FakeResponse(status_code=404))
+        result, _, _ = self.run_download(session)
+        self.assertEqual(result["reason"], "metadata_http_error")
+        self.assertEqual(result["http_status"], 429)
+        self.assertEqual(session.calls, 5)
+
+    def test_summary_carries_the_limiter_counters(self):
+        session = ThrottlingSession(2, download_response=FakeResponse(status_code=404))
+        _, summary, _ = self.run_download(session)
+        self.assertEqual(summary["throttles"], "2")
+        # 2 throttled + metadata + submission + download.
+        self.assertEqual(summary["requests"], "5")
+        self.assertGreaterEqual(float(summary["wait_seconds"]), 4.0)
+        self.assertEqual(summary["errored"], "1")
@@ -0,0 +1,122 @@
+"""Tests for failure history in the index and version-skip's retry backoff.
+
+An ontology that fails the same way every month burns a shard's time every
+month. The merge counts how often in a row it has failed, and shard-list backs
+off from retrying it -- but never from trying a new submission.
+"""
+
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+import yaml
+from click.testing import CliRunner
+
+from kg_bioportal.cli import main
+from kg_bioportal.index import backoff_runs, merge_stats, read_index, retry_due
+from tests.test_merge_stats import entry
+
+
+def failed(oid, reason="transform_error", submission_id="1", **kw):
+    return entry(oid, status="Failed", reason=reason, submission_id=submission_id, **kw)
+
+
+class TestSchedule(TestCase):
+    def test_backoff_doubles_up_to_the_cap(self):
+        self.assertEqual([backoff_runs(n) for n in range(1, 7)], [1, 2, 4, 8, 12, 12])
+
+    def test_first_failure_is_retried_next_run(self):
+        self.assertTrue(retry_due(failed("X", failed_attempts=1, runs_since_attempt=0)))
+
+    def test_repeated_failure_waits(self):
+        stuck = failed("X", failed_attempts=3, runs_since_attempt=2)
+        self.assertFalse(retry_due(stuck))
+        stuck["runs_since_attempt"] = 3
+        self.assertTrue(retry_due(stuck))
+
+    def test_settled_reasons_are_never_retried(self):
+        self.assertFalse(retry_due(failed("X", reason="license_restricted"), force=True))
+        self.assertFalse(retry_due(entry("X"), force=True))
+
+    def test_entries_without_history_count_as_one_failure(self):
+        self.assertTrue(retry_due(failed("X")))
+
+
+class TestHistory(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.fragments = os.path.join(self._tmp.name, "fragments")
+        os.makedirs(os.path.join(self.fragments, "shard-1"))
+
+    def merge(self, base, fragment):
+        base_path = os.path.join(self._tmp.name, "base.yaml")
+        with open(base_path, "w") as f:
+            yaml.dump({"ontologies": base}, f)
+        with open(os.path.join(self.fragments, "shard-1", "onto_stats.yaml"), "w") as f:
+            yaml.dump({"ontologies": fragment}, f)
+        out = os.path.join(self._tmp.name, "out")
+        merge_stats(self.fragments, out, base_path=base_path, report=lambda line: None)
+        return read_index(os.path.join(out, "onto_stats.yaml"))
+
+    def test_failing_again_counts_up(self):
+        index = self.merge([failed("X", failed_attempts=2, runs_since_attempt=3)], [failed("X")])
+        self.assertEqual(index["X"]["failed_attempts"], 3)
+        self.assertEqual(index["X"]["runs_since_attempt"], 0)
+
+    def test_a_new_submission_starts_the_count_again(self):
+        index = self.merge([failed("X", failed_attempts=5)], [failed("X", submission_id="2")])
+        self.assertEqual(index["X"]["failed_attempts"], 1)
+
+    def test_success_clears_the_history(self):
+        index = self.merge([failed("X", failed_attempts=5)], [entry("X")])
+        self.assertNotIn("failed_attempts", index["X"])
+        self.assertNotIn("runs_since_attempt", index["X"])
+
+    def test_runs_without_an_attempt_are_counted(self):
+        index = self.merge([failed("X", failed_attempts=2, runs_since_attempt=1)], [entry("Y")])
+        self.assertEqual(index["X"]["runs_since_attempt"], 2)
+        self.assertEqual(index["X"]["failed_attempts"], 2)
+
+    def test_settled_failures_keep_no_history(self):
+        index = self.merge([], [failed("X", reason="license_restricted")])
+        self.assertNotIn("failed_attempts", index["X"])
+
+
+class TestShardListBackoff(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.index = os.path.join(self._tmp.name, "onto_stats.yaml")
+        with open(self.index, "w") as f:
+            yaml.dump({"ontologies": [
+                entry("DONE"),
+                failed("FLAKY", failed_attempts=1, runs_since_attempt=0),
+                failed("STUCK", failed_attempts=4, runs_since_attempt=2),
+                failed("MOVED", failed_attempts=4, runs_since_attempt=0),
+                failed("LIC", reason="license_restricted"),
+            ]}, f)
+        self.list = os.path.join(self._tmp.name, "ontologylist.tsv")
+        with open(self.list, "w") as f:
+            f.write("id\tname\tcurrent_version\tsubmission_id\n")
+            for acr in ("DONE", "FLAKY", "STUCK", "LIC"):
+                f.write(f"{acr}\t{acr}\t1\t1\n")
+            f.write("MOVED\tMOVED\t2\t2\n")
+
+    def shard(self, *args):
+        result = CliRunner().invoke(
+            main, ["shard-list", "-f", self.list, "-n", "1", "--index", self.index, *args]
+        )
+        self.assertEqual(result.exit_code, 0, result.output)
+        return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+    def test_failures_are_retried_on_their_schedule(self):
+        shards, err = self.shard()
+        self.assertEqual(shards, ["FLAKY MOVED"])
+        self.assertIn("retry-backoff: 1 failing ontologies retried, 1 held back.", err)
+
+    def test_force_retry_ignores_the_backoff(self):
+        shards, err = self.shard("--force_retry")
+        self.assertEqual(shards, ["FLAKY STUCK MOVED"])
+        self.assertIn("2 failing ontologies retried, 0 held back (--force_retry)", err)
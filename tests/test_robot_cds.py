@@ -0,0 +1,107 @@
+"""Tests for ROBOT's class-data-sharing archive.
+
+The archive is purely a start-up optimisation: where it can't be had, ROBOT
+must run exactly as it did without it, and nothing should complain.
+"""
+
+import os
+import tempfile
+from unittest import TestCase, mock
+
+import sh
+
+from kg_bioportal import robot_utils
+from kg_bioportal.robot_utils import initialize_robot, java_feature_version, robot_cds_archive
+
+JAVA_17 = 'openjdk version "17.0.10" 2024-01-16\nOpenJDK Runtime Environment Temurin-17.0.10+7'
+JAVA_11 = 'openjdk version "11.0.22" 2024-01-16'
+
+
+class CdsTestCase(TestCase):
+    fail = False
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.robot = os.path.join(self._tmp.name, "robot")
+        for name in ("robot", "robot.jar"):
+            with open(os.path.join(self._tmp.name, name), "wb") as f:
+                f.write(b"#!/bin/sh\n" if name == "robot" else b"PK jar")
+        self.runs = []
+        for patcher in (
+            mock.patch.dict(robot_utils._cds_archives, clear=True),
+            mock.patch("kg_bioportal.robot_utils.sh.Command", return_value=self.fake_robot),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def fake_robot(self, *args, _env=None, _timeout=None):
+        """Stands in for ROBOT: writes the archive it is asked to dump."""
+        self.runs.append(args)
+        if self.fail:
+            raise sh.ErrorReturnCode_1("robot", b"", b"Error: could not dump")
+        for arg in _env["ROBOT_JAVA_ARGS"].split():
+            if arg.startswith("-XX:ArchiveClassesAtExit="):
+                with open(arg.split("=", 1)[1], "wb") as f:
+                    f.write(b"archive")
+
+    def archive(self, version):
+        with mock.patch("kg_bioportal.robot_utils._java_version", return_value=version):
+            return robot_cds_archive(self.robot, {"ROBOT_JAVA_ARGS": "-Xmx2g"})
+
+
+class TestArchive(CdsTestCase):
+    def test_java_versions(self):
+        self.assertEqual(java_feature_version(JAVA_17), 17)
+        self.assertEqual(java_feature_version('java version "1.8.0_292"'), 8)
+        self.assertEqual(java_feature_version(""), 0)
+
+    def test_dumped_once_beside_robot_jar(self):
+        archive = self.archive(JAVA_17)
+        self.assertEqual(os.path.dirname(archive), self._tmp.name)
+        self.assertTrue(os.path.exists(archive))
+        self.assertEqual(self.archive(JAVA_17), archive)
+        self.assertEqual(len(self.runs), 1)
+        self.assertEqual(self.runs[0][0], "convert")
+        self.assertIn("relax", self.runs[0])
+
+    def test_an_existing_archive_is_reused(self):
+        archive = self.archive(JAVA_17)
+        robot_utils._cds_archives.clear()
+        self.assertEqual(self.archive(JAVA_17), archive)
+        self.assertEqual(len(self.runs), 1)
+
+    def test_one_archive_per_jvm_build(self):
+        first = self.archive(JAVA_17)
+        robot_utils._cds_archives.clear()
+        self.assertNotEqual(self.archive(JAVA_17.replace("17.0.10", "17.0.11")), first)
+
+    def test_older_jvms_go_without(self):
+        self.assertEqual(self.archive(JAVA_11), "")
+        self.assertEqual(self.runs, [])
+
+    def test_no_java_goes_without(self):
+        self.assertEqual(self.archive(""), "")
+
+    def test_a_failed_training_run_goes_without(self):
+        self.fail = True
+        self.assertEqual(self.archive(JAVA_17), "")
+        self.assertEqual([n for n in os.listdir(self._tmp.name) if ".jsa" in n], [])
+
+
+class TestInitializeRobot(CdsTestCase):
+    def init(self, version, **kw):
+        with mock.patch("kg_bioportal.robot_utils._java_version", return_value=version):
+            return initialize_robot(self.robot, java_args="-Xmx2g", **kw)[1]["ROBOT_JAVA_ARGS"]
+
+    def test_robot_maps_the_archive(self):
+        args = self.init(JAVA_17)
+        self.assertTrue(args.startswith("-Xmx2g -XX:SharedArchiveFile="))
+        self.assertTrue(args.endswith(".jsa -Xshare:auto"))
+
+    def test_unchanged_without_one(self):
+        self.assertEqual(self.init(JAVA_11), "-Xmx2g")
+
+    def test_can_be_turned_off(self):
+        self.assertEqual(self.init(JAVA_17, cds=False), "-Xmx2g")
+        self.assertEqual(self.runs, [])
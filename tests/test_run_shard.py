@@ -0,0 +1,176 @@
+"""Tests for run-shard, the overlapped download -> transform pipeline.
+
+The pipeline is only worth having if its outputs are indistinguishable from the
+two-step build's: finalize merges onto_stats.yaml fragments without knowing
+which command produced them.
+"""
+
+import os
+import tempfile
+import threading
+from unittest import TestCase, mock
+
+from kg_bioportal.downloader import DOWNLOAD_REPORT_NAME, Downloader
+from kg_bioportal.pipeline import run_shard
+from kg_bioportal.transformer import Transformer
+from tests.test_download_outcomes import FakeResponse, unlimited
+
+SUBMISSION = {"submissionId": 7, "version": "2.0", "released": "2026-01-01"}
+
+
+class CatalogueSession:
+    """Serves a small catalogue: each acronym maps to a download response."""
+
+    def __init__(self, downloads):
+        self.downloads = downloads
+
+    def get(self, url, **kwargs):
+        acronym = url.split("/ontologies/")[1].split("/")[0]
+        if url.endswith("/download"):
+            status, data = self.downloads[acronym]
+            headers = {"Content-Disposition": f'attachment; filename="{acronym.lower()}.owl"'}
+            return FakeResponse(status_code=status, headers=headers if status == 200 else {},
+                                chunks=[data])
+        if url.endswith("/latest_submission"):
+            return FakeResponse(payload=SUBMISSION)
+        return FakeResponse(payload={"name": f"{acronym} ontology"})
+
+
+CATALOGUE = {
+    "AAA": (200, b"<rdf:RDF/>"),
+    "BBB": (200, b"<rdf:RDF/>" * 3),
+    "LIC": (403, b""),
+    "BROKEN": (200, b"<broken/>"),
+    "CCC": (200, b"<rdf:RDF/>" * 5),
+}
+ONTOLOGIES = ["AAA", "BBB", "LIC", "NCBITAXON", "BROKEN", "CCC"]
+
+
+def fake_transform(events):
+    """Stands in for Transformer.transform: no ROBOT, no KGX."""
+
+    def transform(self, ontology_path, compress):
+        name = os.path.relpath(ontology_path, self.input_dir).split(os.sep)[0]
+        events.append(("transform", name))
+        if name == "BROKEN":
+            return False, 0, 0
+        size = os.path.getsize(ontology_path)
+        return True, size, 2 * size
+
+    return transform
+
+
+class RunShardTestCase(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+
+    def make(self, name, events):
+        raw = os.path.join(self._tmp.name, name, "raw")
+        out = os.path.join(self._tmp.name, name, "transformed")
+        dl = Downloader(output_dir=raw, api_key="k", rate_limiter=unlimited())
+        dl.requests_session = CatalogueSession(CATALOGUE)
+        real_download_one = dl.download_one
+
+        def download_one(ontology):
+            events.append(("download", ontology))
+            return real_download_one(ontology)
+
+        dl.download_one = download_one
+
+        tx = Transformer.__new__(Transformer)
+        tx.input_dir = raw
+        tx.output_dir = out
+        tx.timeout_min = 1
+        tx.timeout_sec = 60
+        tx.max_source_mb = 100
+        tx.max_source_bytes = 100 * 1024 * 1024
+        os.makedirs(out, exist_ok=True)
+        return dl, tx
+
+    def read(self, *parts):
+        with open(os.path.join(self._tmp.name, *parts)) as f:
+            return f.read()
+
+
+class TestIdenticalOutputs(RunShardTestCase):
+    def setUp(self):
+        super().setUp()
+        events = []
+        with mock.patch.object(Transformer, "transform", fake_transform(events)):
+            dl, tx = self.make("twostep", events)
+            for ontology in ONTOLOGIES:
+                dl.download_one(ontology)
+            dl.finish()
+            tx.transform_all(compress=False)
+
+            dl, tx = self.make("pipelined", events)
+            run_shard(dl, tx, ONTOLOGIES, compress=False, min_free_gb=0)
+
+    def assert_same(self, *path):
+        self.assertEqual(self.read("twostep", *path), self.read("pipelined", *path))
+
+    def test_onto_stats_match_the_two_step_build(self):
+        self.assert_same("transformed", "onto_stats.yaml")
+
+    def test_total_stats_match_the_two_step_build(self):
+        self.assert_same("transformed", "total_stats.yaml")
+
+    def test_download_reports_differ_only_in_where_the_files_went(self):
+        twostep = self.read("twostep", "raw", DOWNLOAD_REPORT_NAME)
+        pipelined = self.read("pipelined", "raw", DOWNLOAD_REPORT_NAME)
+        self.assertEqual(twostep.replace("twostep", "pipelined"), pipelined)
+
+    def test_every_outcome_is_in_the_stats(self):
+        stats = self.read("pipelined", "transformed", "onto_stats.yaml")
+        for acronym in ONTOLOGIES:
+            self.assertIn(f"id: {acronym}\n", stats)
+
+
+class TestOverlap(RunShardTestCase):
+    def test_first_transform_starts_before_the_last_download(self):
+        events = []
+        gate = threading.Event()
+
+        with mock.patch.object(Transformer, "transform", fake_transform(events)):
+            dl, tx = self.make("overlap", events)
+            real = dl.download_one
+
+            def download_one(ontology):
+                # Hold the last download until something has been transformed.
+                if ontology == ONTOLOGIES[-1]:
+                    gate.wait(timeout=10)
+                return real(ontology)
+
+            dl.download_one = download_one
+            real_transform_source = tx.transform_source
+
+            def transform_source(*args, **kwargs):
+                try:
+                    return real_transform_source(*args, **kwargs)
+                finally:
+                    gate.set()
+
+            tx.transform_source = transform_source
+            run_shard(dl, tx, ONTOLOGIES, compress=False, min_free_gb=0)
+
+        first_transform = events.index(("transform", "AAA"))
+        last_download = events.index(("download", ONTOLOGIES[-1]))
+        self.assertLess(first_transform, last_download)
+
+    def test_only_downloaded_sources_are_transformed(self):
+        events = []
+        with mock.patch.object(Transformer, "transform", fake_transform(events)):
+            dl, tx = self.make("only", events)
+            run_shard(dl, tx, ONTOLOGIES, compress=False, min_free_gb=0)
+        transformed = [name for kind, name in events if kind == "transform"]
+        self.assertEqual(transformed, ["AAA", "BBB", "BROKEN", "CCC"])
+
+
+class TestFailures(RunShardTestCase):
+    def test_a_download_crash_is_raised_not_swallowed(self):
+        events = []
+        dl, tx = self.make("crash", events)
+        dl.download_one = mock.Mock(side_effect=RuntimeError("network gone"))
+        with self.assertRaises(RuntimeError):
+            run_shard(dl, tx, ONTOLOGIES, compress=False, min_free_gb=0)
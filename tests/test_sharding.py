@@ -0,0 +1,129 @@
+"""Tests for cost-balanced shard planning.
+
+Round-robin over the alphabetical list put the slow ontologies wherever their
+names fell, so some shards finished in minutes while others hit the 6 h cap.
+"""
+
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+import yaml
+from click.testing import CliRunner
+
+from kg_bioportal.cli import main
+from kg_bioportal.sharding import (
+    PER_ONTOLOGY_OVERHEAD_SEC,
+    estimate_costs,
+    format_duration,
+    pack_shards,
+)
+
+
+class TestEstimateCosts(TestCase):
+    def test_recorded_duration_is_used_as_is(self):
+        index = {"A": {"status": "OK", "duration_sec": 500, "nodecount": 1, "edgecount": 1}}
+        self.assertEqual(estimate_costs(["A"], index)["A"], 500)
+
+    def test_counts_are_priced_at_the_rate_timed_entries_show(self):
+        index = {
+            # 1000 records took 100 s beyond the overhead: 0.1 s per record.
+            "TIMED": {"status": "OK", "duration_sec": PER_ONTOLOGY_OVERHEAD_SEC + 100,
+                      "nodecount": 400, "edgecount": 600},
+            "UNTIMED": {"status": "OK", "nodecount": 2000, "edgecount": 0},
+        }
+        costs = estimate_costs(["UNTIMED"], index)
+        self.assertAlmostEqual(costs["UNTIMED"], PER_ONTOLOGY_OVERHEAD_SEC + 200)
+
+    def test_source_size_prices_an_ontology_without_counts(self):
+        index = {"BIG": {"status": "Skipped", "source_bytes": 50_000_000},
+                 "SMALL": {"status": "Skipped", "source_bytes": 1_000}}
+        costs = estimate_costs(["BIG", "SMALL"], index)
+        self.assertGreater(costs["BIG"], costs["SMALL"])
+
+    def test_manifest_size_prices_an_ontology_the_index_has_not_seen(self):
+        costs = estimate_costs(["NEW", "OLD"], {"OLD": {"source_bytes": 1_000}},
+                               source_sizes={"NEW": 90_000_000})
+        self.assertGreater(costs["NEW"], costs["OLD"])
+
+    def test_unknown_ontologies_get_the_median(self):
+        index = {a: {"status": "OK", "duration_sec": d} for a, d in
+                 [("A", 10), ("B", 100), ("C", 1000)]}
+        costs = estimate_costs(["A", "B", "C", "NEW"], index)
+        self.assertEqual(costs["NEW"], 100)
+
+    def test_no_index_at_all_still_prices_everything(self):
+        costs = estimate_costs(["A", "B"], {})
+        self.assertEqual(costs["A"], costs["B"])
+        self.assertGreater(costs["A"], 0)
+
+
+class TestPackShards(TestCase):
+    def test_giants_are_spread_and_small_ones_fill_in(self):
+        costs = {"G1": 100, "G2": 100, **{f"S{i}": 10 for i in range(10)}}
+        packed = pack_shards(costs, 2)
+        self.assertEqual([load for load, _ in packed], [150, 150])
+        self.assertNotEqual(
+            "G1" in packed[0][1], "G2" in packed[0][1], "the giants must not share a shard"
+        )
+
+    def test_max_shard_beats_round_robin(self):
+        # Alphabetical round-robin into 2 shards would pair A/C/E: 300 vs 3.
+        costs = {"A": 100, "B": 1, "C": 100, "D": 1, "E": 100, "F": 1}
+        packed = pack_shards(costs, 2)
+        self.assertLessEqual(max(load for load, _ in packed), 201)
+
+    def test_every_ontology_is_placed_once(self):
+        costs = {f"O{i}": i + 1 for i in range(37)}
+        placed = [a for _, members in pack_shards(costs, 5) for a in members]
+        self.assertEqual(sorted(placed), sorted(costs))
+
+    def test_no_empty_shards(self):
+        self.assertEqual(len(pack_shards({"A": 1, "B": 1}, 20)), 2)
+
+    def test_plan_is_deterministic(self):
+        costs = {f"O{i}": 7 for i in range(11)}
+        self.assertEqual(pack_shards(costs, 3), pack_shards(dict(reversed(costs.items())), 3))
+
+
+class TestFormatDuration(TestCase):
+    def test_formats(self):
+        self.assertEqual(format_duration(59), "1m")
+        self.assertEqual(format_duration(3900), "1h05m")
+
+
+class TestShardListBalance(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.index = os.path.join(self._tmp.name, "onto_stats.yaml")
+        entries = [{"id": "SLOW1", "status": "OK", "duration_sec": 3600},
+                   {"id": "SLOW2", "status": "OK", "duration_sec": 3600}]
+        entries += [{"id": f"FAST{i}", "status": "OK", "duration_sec": 60} for i in range(4)]
+        with open(self.index, "w") as f:
+            yaml.dump({"ontologies": entries}, f)
+
+    def shard(self, *args):
+        names = "SLOW1 SLOW2 FAST0 FAST1 FAST2 FAST3"
+        result = CliRunner().invoke(
+            main, ["shard-list", "-d", names, "-n", "2", "--index", self.index, *args]
+        )
+        self.assertEqual(result.exit_code, 0, result.output)
+        return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+    def test_cost_mode_separates_the_slow_ones(self):
+        shards, _ = self.shard("--balance", "cost")
+        self.assertEqual(len(shards), 2)
+        for shard in shards:
+            self.assertEqual(sum(a.startswith("SLOW") for a in shard.split()), 1)
+
+    def test_predicted_load_goes_to_stderr(self):
+        _, stderr = self.shard("--balance", "cost")
+        self.assertIn("balance: shard 1: 3 ontologies, ~1h02m predicted", stderr)
+        self.assertIn("predicted max 1h02m", stderr)
+
+    def test_round_robin_is_still_the_default(self):
+        shards, stderr = self.shard()
+        self.assertEqual(shards, ["SLOW1 FAST0 FAST2", "SLOW2 FAST1 FAST3"])
+        self.assertNotIn("balance:", stderr)
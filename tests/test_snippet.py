@@ -0,0 +1,186 @@
+"""Tests for snippet downloads: the start of each source, as a usable sample.
+
+A snippet is fetched with a Range request, so for a compressed source it is a
+prefix of an archive; what reaches the transformer must be plain, readable
+lines instead.
+"""
+
+import csv
+import gzip
+import io
+import os
+import tarfile
+import tempfile
+import zipfile
+from unittest import TestCase
+
+from kg_bioportal.downloader import DOWNLOAD_REPORT_NAME, Downloader, snippet_sample
+from kg_bioportal.transformer import Transformer
+
+from tests.test_download_outcomes import FakeResponse, FakeSession, unlimited
+
+LINES = b"".join(b"<owl:Class rdf:about=\"http://example.org/T_%05d\"/>\n" % i for i in range(2000))
+
+
+def make_targz(members):
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as tar:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            if name.endswith("/"):
+                info.type = tarfile.DIRTYPE
+            else:
+                info.size = len(data)
+            tar.addfile(info, io.BytesIO(data) if data else None)
+    return buf.getvalue()
+
+
+def make_zip(members, compression=zipfile.ZIP_DEFLATED):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=compression) as z:
+        for name, data in members.items():
+            z.writestr(name, data)
+    return buf.getvalue()
+
+
+class RangeSession(FakeSession):
+    """Serves a source, honouring (or ignoring) the Range header like a server."""
+
+    def __init__(self, filename, body, honour_range=True):
+        super().__init__(None)
+        self.filename = filename
+        self.body = body
+        self.honour_range = honour_range
+        self.download_headers = None
+
+    def get(self, url, **kwargs):
+        if not url.endswith("/download"):
+            return super().get(url, **kwargs)
+        self.download_headers = kwargs.get("headers", {})
+        headers = {"Content-Disposition": f'attachment; filename="{self.filename}"'}
+        byte_range = self.download_headers.get("Range")
+        if byte_range and self.honour_range:
+            end = int(byte_range.split("-")[1])
+            part = self.body[: end + 1]
+            headers["Content-Range"] = f"bytes 0-{len(part) - 1}/{len(self.body)}"
+            headers["Content-Length"] = str(len(part))
+            return FakeResponse(206, headers, chunks=[part])
+        headers["Content-Length"] = str(len(self.body))
+        chunks = [self.body[i:i + 1024] for i in range(0, len(self.body), 1024)]
+        return FakeResponse(200, headers, chunks=chunks)
+
+
+class SnippetTestCase(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.output_dir = self._tmp.name
+
+    def snippet(self, filename, body, snippet_kb=2, **session_kwargs):
+        dl = Downloader(
+            output_dir=self.output_dir, api_key="fake-key", rate_limiter=unlimited(),
+            snippet_only=True, snippet_kb=snippet_kb,
+        )
+        self.session = dl.requests_session = RangeSession(filename, body, **session_kwargs)
+        result = dl.download(["TESTONTO"])[0]
+        with open(os.path.join(self.output_dir, DOWNLOAD_REPORT_NAME), newline="") as f:
+            self.row = next(csv.DictReader(f, delimiter="\t"))
+        return result
+
+    def sample(self, result):
+        with open(result["path"], "rb") as f:
+            return f.read()
+
+
+class TestSnippetDownload(SnippetTestCase):
+    def test_only_the_start_is_requested(self):
+        self.snippet("onto.owl", LINES)
+        self.assertEqual(self.session.download_headers["Range"], "bytes=0-2047")
+
+    def test_plain_sample_ends_on_a_complete_line(self):
+        sample = self.sample(self.snippet("onto.owl", LINES))
+        self.assertLessEqual(len(sample), 2048)
+        self.assertTrue(sample.endswith(b"\n"))
+        self.assertTrue(LINES.startswith(sample))
+
+    def test_report_marks_the_row_and_keeps_the_full_size(self):
+        result = self.snippet("onto.owl", LINES)
+        self.assertEqual(result["status"], "downloaded")
+        self.assertEqual(self.row["snippet"], "yes")
+        self.assertEqual(self.row["source_bytes"], str(len(LINES)))
+        self.assertEqual(self.row["sha256"], "")
+
+    def test_server_ignoring_the_range_is_cut_off(self):
+        sample = self.sample(self.snippet("onto.owl", LINES, honour_range=False))
+        self.assertLessEqual(len(sample), 2048)
+        self.assertTrue(LINES.startswith(sample))
+
+    def test_small_source_is_kept_whole(self):
+        body = b"<rdf:RDF>\n</rdf:RDF>"
+        self.assertEqual(self.sample(self.snippet("onto.owl", body)), body)
+
+    def test_size_gate_uses_the_total_not_the_part(self):
+        # The 206 carries 1 kB; the source behind it is 4 kB, over a 2 kB cap.
+        dl = Downloader(
+            output_dir=self.output_dir, api_key="fake-key", rate_limiter=unlimited(),
+            snippet_only=True, snippet_kb=1, max_source_mb=2 / 1024,
+        )
+        dl.requests_session = RangeSession("onto.owl", b"x" * 4096)
+        result = dl.download(["TESTONTO"])[0]
+        self.assertEqual(result["reason"], "too_large")
+        self.assertEqual(result["source_bytes"], 4096)
+
+
+class TestSnippetArchives(SnippetTestCase):
+    def test_gzip_is_unpacked_and_renamed(self):
+        result = self.snippet("ror.owl.gz", gzip.compress(LINES * 5))
+        self.assertTrue(result["path"].endswith("/ror.owl"), result["path"])
+        sample = self.sample(result)
+        self.assertGreater(len(sample), 1000)
+        self.assertTrue(LINES.startswith(sample))
+
+    def test_tarball_yields_its_first_file(self):
+        body = make_targz({"dist/": b"", "dist/._onto.owl": b"junk", "dist/onto.owl": LINES * 5})
+        result = self.snippet("onto.tar.gz", body)
+        self.assertTrue(result["path"].endswith("/onto.owl"), result["path"])
+        self.assertTrue(LINES.startswith(self.sample(result)))
+
+    def test_deflated_zip_yields_its_first_file(self):
+        body = make_zip({"__MACOSX/._x.owl": b"junk", "x.owl": LINES * 5})
+        result = self.snippet("bundle.zip", body)
+        self.assertTrue(result["path"].endswith("/x.owl"), result["path"])
+        sample = self.sample(result)
+        self.assertGreater(len(sample), 1000)
+        self.assertTrue(LINES.startswith(sample))
+
+    def test_stored_zip_yields_its_first_file(self):
+        body = make_zip({"x.owl": LINES}, compression=zipfile.ZIP_STORED)
+        self.assertTrue(LINES.startswith(self.sample(self.snippet("bundle.zip", body))))
+
+
+class TestSnippetSample(TestCase):
+    """snippet_sample on its own, with the whole archive as the 'prefix'."""
+
+    def test_complete_gzip_member_is_not_trimmed(self):
+        name, sample = snippet_sample(gzip.compress(b"a\nb"), "x.ttl.gz", 1024)
+        self.assertEqual((name, sample), ("x.ttl", b"a\nb"))
+
+    def test_sample_never_exceeds_the_limit(self):
+        _, sample = snippet_sample(gzip.compress(LINES), "x.owl.gz", 100)
+        self.assertLessEqual(len(sample), 100)
+
+    def test_garbage_gzip_gives_an_empty_sample(self):
+        self.assertEqual(snippet_sample(b"not gzip", "x.owl.gz", 1024), ("x.owl", b""))
+
+
+class TestSnippetStats(TestCase):
+    def test_transformed_snippets_are_flagged_in_the_stats(self):
+        txr = Transformer.__new__(Transformer)
+        txr.input_dir = txr.output_dir = "/nonexistent"
+        txr.timeout_sec = 0
+        txr.timeout_min = 0
+        txr.transform = lambda path, compress: (True, 3, 2)
+        entry = txr.transform_source("/nonexistent/X/1/x.owl", False, {"snippet": "yes"})
+        self.assertTrue(entry["snippet"])
+        entry = txr.transform_source("/nonexistent/X/1/x.owl", False, {"snippet": ""})
+        self.assertNotIn("snippet", entry)
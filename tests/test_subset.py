@@ -0,0 +1,167 @@
+"""Tests for subset builds from ontology profiles."""
+
+import json
+import os
+import tempfile
+import tarfile
+from unittest import TestCase
+
+import yaml
+from click.testing import CliRunner
+
+from kg_bioportal.cli import main
+from kg_bioportal.subset import build_subset, load_profile, resolve_members
+from tests.helpers import serve_directory
+from tests.test_graph_merge import read_merged, write_artifact
+
+PROFILE = {
+    "ontologies": [
+        {"name": "AAA", "test_set": True},
+        {"name": "BBB"},
+        {"name": "CCC", "test_set": True},
+        {"name": "GONE", "test_set": True},
+        "AAA",
+    ]
+}
+
+
+class TestProfile(TestCase):
+    def test_load_profile(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "profile.yaml")
+            with open(path, "w") as f:
+                yaml.safe_dump(PROFILE, f)
+            self.assertEqual(load_profile(path), ["AAA", "BBB", "CCC", "GONE"])
+            self.assertEqual(load_profile(path, "test_set"), ["AAA", "CCC", "GONE"])
+
+    def test_clinical_ontologies_profile(self):
+        path = os.path.join(
+            os.path.dirname(os.path.dirname(__file__)), "notebooks", "clinical_ontologies.yaml"
+        )
+        self.assertEqual(load_profile(path, "test_set"), ["RADLEX", "ATC"])
+
+    def test_resolve_members(self):
+        urls = {"AAA": "u/AAA", "CCC": "u/CCC"}
+        self.assertEqual(
+            resolve_members(["AAA", "GONE"], urls), ({"AAA": "u/AAA"}, {"GONE": "not in graph_urls.tsv"})
+        )
+        index = {
+            "AAA": {"status": "OK", "download_url": "i/AAA"},
+            "CCC": {"status": "Skipped", "reason": "too_large"},
+        }
+        self.assertEqual(
+            resolve_members(["AAA", "CCC", "GONE"], urls, index),
+            ({"AAA": "i/AAA"}, {"CCC": "too_large", "GONE": "not in the index"}),
+        )
+
+
+class TestBuildSubset(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.dir = self._tmp.name
+        self.release = os.path.join(self.dir, "release", "v1")
+        os.makedirs(self.release)
+        write_artifact(
+            self.release, "AAA",
+            [["BFO:1", "biolink:NamedThing", "entity", "AAA"],
+             ["AAA:1", "biolink:Disease", "a disease", "AAA"]],
+            [["e1", "AAA:1", "biolink:subclass_of", "BFO:1", "AAA"]],
+        )
+        write_artifact(
+            self.release, "BBB", [["BBB:1", "biolink:Gene", "a gene", "BBB"]], []
+        )
+        write_artifact(
+            self.release, "CCC",
+            [["BFO:1", "biolink:NamedThing", "entity (CCC)", "CCC"],
+             ["CCC:1", "biolink:Drug", "a drug", "CCC"]],
+            [["e1", "CCC:1", "biolink:related_to", "AAA:1", "CCC"]],
+        )
+        self.server = serve_directory(os.path.join(self.dir, "release"))
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.write_urls("v1")
+        self.profile = os.path.join(self.dir, "clinical.yaml")
+        with open(self.profile, "w") as f:
+            yaml.safe_dump(PROFILE, f)
+        self.cache = os.path.join(self.dir, "cache")
+        self.out = os.path.join(self.dir, "out")
+
+    def write_urls(self, tag):
+        self.urls = os.path.join(self.dir, "graph_urls.tsv")
+        with open(self.urls, "w") as f:
+            f.write("id\tdownload_url\n")
+            for acronym in ("AAA", "BBB", "CCC"):
+                f.write(f"{acronym}\t{self.server.url}/{tag}/{acronym}.tar.gz\n")
+
+    def build(self, **kwargs):
+        kwargs.setdefault("select", "test_set")
+        return build_subset(
+            self.profile, self.out, urls_source=self.urls, cache_dir=self.cache, merge_workers=1,
+            **kwargs,
+        )
+
+    def test_build(self):
+        stats = self.build()
+        self.assertEqual(stats["resolved"], ["AAA", "CCC"])
+        self.assertEqual(stats["missing"], {"GONE": "not in graph_urls.tsv"})
+        self.assertFalse(stats["cached"])
+        self.assertEqual(stats["path"], os.path.join(self.out, "clinical-test_set.tar.gz"))
+        graph = read_merged(stats["path"], "clinical-test_set")
+        self.assertEqual([n["id"] for n in graph["nodes"]], ["AAA:1", "BFO:1", "CCC:1"])
+        # Profile order decides: AAA's name for the shared node.
+        self.assertEqual(graph["nodes"][1]["name"], "entity")
+        self.assertEqual(len(graph["edges"]), 2)
+        self.assertEqual(
+            sorted(self.server.requests), ["/v1/AAA.tar.gz", "/v1/CCC.tar.gz"]
+        )
+
+    def test_unchanged_profile_is_cached(self):
+        first = self.build()
+        os.remove(first["path"])
+        fetched = len(self.server.requests)
+        second = self.build()
+        self.assertTrue(second["cached"])
+        self.assertEqual(second["key"], first["key"])
+        self.assertEqual(len(self.server.requests), fetched)
+        self.assertEqual((second["nodes"], second["edges"]), (first["nodes"], first["edges"]))
+        with tarfile.open(second["path"]) as tar:
+            self.assertIn("clinical-test_set_nodes.tsv", tar.getnames())
+
+        # Refreshing rebuilds from the artifacts already in the cache.
+        self.assertFalse(self.build(refresh=True)["cached"])
+        self.assertEqual(len(self.server.requests), fetched)
+
+    def test_a_rebuilt_member_changes_the_key(self):
+        first = self.build()
+        os.makedirs(os.path.join(self.dir, "release", "v2"))
+        write_artifact(
+            os.path.join(self.dir, "release", "v2"), "CCC",
+            [["CCC:2", "biolink:Drug", "another drug", "CCC"]], [],
+        )
+        with open(self.urls, "a") as f:
+            f.write(f"CCC\t{self.server.url}/v2/CCC.tar.gz\n")
+        second = self.build()
+        self.assertNotEqual(second["key"], first["key"])
+        self.assertFalse(second["cached"])
+        # AAA's artifact is unchanged, so only CCC's new one is fetched.
+        self.assertEqual(self.server.requests[-1], "/v2/CCC.tar.gz")
+        self.assertEqual(self.server.requests.count("/v1/AAA.tar.gz"), 1)
+
+    def test_nothing_resolves(self):
+        with open(self.urls, "w") as f:
+            f.write("id\tdownload_url\n")
+        with self.assertRaises(ValueError):
+            self.build()
+
+    def test_cli(self):
+        result = CliRunner().invoke(main, [
+            "subset", "--profile", self.profile, "--select", "test_set", "-o", self.out,
+            "--urls", self.urls, "--cache_dir", self.cache, "--name", "demo",
+        ])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("Left out GONE", result.stderr)
+        stats = json.loads(result.stdout)
+        self.assertEqual(stats["nodes"], 3)
+        self.assertTrue(os.path.exists(os.path.join(self.out, "demo.tar.gz")))
+        self.assertTrue(os.path.exists(os.path.join(self.out, "demo_dangling.tsv")))
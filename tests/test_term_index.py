@@ -0,0 +1,169 @@
+"""Tests for the cross-ontology term index."""
+
+import gzip
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from click.testing import CliRunner
+
+from kg_bioportal.bloom import write_id_filter
+from kg_bioportal.cli import build_index
+from kg_bioportal.term_index import (
+    TermIndex,
+    build_term_index,
+    curie_prefix,
+    write_term_list,
+)
+
+
+def _nodes(path, ids):
+    with open(path, "w") as f:
+        f.write("id\tcategory\tname\n")
+        for node_id in ids:
+            f.write(f"{node_id}\tbiolink:NamedThing\t{node_id} name\n")
+    return path
+
+
+class TestTermList(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.dir = self._tmp.name
+
+    def test_curie_prefix(self):
+        self.assertEqual(curie_prefix("GO:0008150"), "GO")
+        self.assertEqual(curie_prefix("obo:GO_0008150:x"), "obo")
+        self.assertEqual(
+            curie_prefix("http://purl.obolibrary.org/obo/GO_0008150"),
+            "http://purl.obolibrary.org/obo/",
+        )
+        self.assertEqual(curie_prefix("http://example.org/onto#Thing"), "http://example.org/onto#")
+        self.assertEqual(curie_prefix("plain"), "")
+
+    def test_write_term_list(self):
+        nodes = _nodes(
+            os.path.join(self.dir, "X_nodes.tsv"),
+            ["GO:2", "GO:1", "BFO:1", "GO:1", "http://example.org/a"],
+        )
+        self.assertEqual(write_term_list(nodes, self.dir, "X"), 4)
+        with gzip.open(os.path.join(self.dir, "X_terms.txt.gz"), "rt") as f:
+            self.assertEqual(f.read().split(), ["BFO:1", "GO:1", "GO:2", "http://example.org/a"])
+        with open(os.path.join(self.dir, "X_prefixes.tsv")) as f:
+            self.assertEqual(
+                f.read(),
+                "prefix\tcount\nGO\t2\nBFO\t1\nhttp://example.org/\t1\n",
+            )
+
+    def test_unchanged_ontology_gives_identical_file(self):
+        nodes = _nodes(os.path.join(self.dir, "X_nodes.tsv"), ["GO:1", "GO:2"])
+        write_term_list(nodes, self.dir, "X")
+        with open(os.path.join(self.dir, "X_terms.txt.gz"), "rb") as f:
+            first = f.read()
+        write_term_list(nodes, self.dir, "X")
+        with open(os.path.join(self.dir, "X_terms.txt.gz"), "rb") as f:
+            self.assertEqual(f.read(), first)
+
+
+class TestBuildTermIndex(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.dir = self._tmp.name
+
+    def terms(self, run, acronym, ids):
+        """Write an ontology's term list into a run's fragments directory."""
+        # A stats-<n> subdirectory, as finalize's downloaded fragments are.
+        out = os.path.join(self.dir, run, "stats-0")
+        os.makedirs(out, exist_ok=True)
+        nodes = _nodes(os.path.join(self.dir, f"{run}-{acronym}_nodes.tsv"), ids)
+        write_term_list(nodes, out, acronym)
+        write_id_filter(sorted(set(ids)), len(set(ids)), out, acronym)
+        return os.path.join(self.dir, run)
+
+    def lookup(self, db):
+        index = TermIndex(db)
+        self.addCleanup(index.close)
+        return index
+
+    def test_build_and_lookup(self):
+        run = self.terms("run1", "AGRO", ["GO:1", "AGRO:1", "AGRO:2"])
+        self.terms("run1", "GO", ["GO:1", "GO:2"])
+        db = os.path.join(self.dir, "term_index.db")
+        stats = build_term_index(run, db, report=lambda line: None)
+        self.assertEqual(stats, {"updated": 2, "dropped": 0, "ontologies": 2, "terms": 5})
+        self.assertFalse(os.path.exists(db + ".tmp"))
+
+        index = self.lookup(db)
+        self.assertEqual(index.ontologies("GO:1"), ["AGRO", "GO"])
+        self.assertEqual(index.ontologies("AGRO:2"), ["AGRO"])
+        self.assertEqual(index.ontologies("GO:3"), [])
+        self.assertEqual(index.prefix("GO"), {"GO": 2, "AGRO": 1})
+        self.assertEqual(index.prefix("NOPE"), {})
+
+    def test_incremental_over_base(self):
+        first = self.terms("run1", "AGRO", ["GO:1", "AGRO:1"])
+        self.terms("run1", "GO", ["GO:1", "GO:2"])
+        base = os.path.join(self.dir, "base.db")
+        build_term_index(first, base, report=lambda line: None)
+
+        # The second run rebuilt only AGRO, which no longer has GO:1.
+        second = self.terms("run2", "AGRO", ["AGRO:1", "AGRO:3"])
+        db = os.path.join(self.dir, "term_index.db")
+        stats = build_term_index(second, db, base_path=base, report=lambda line: None)
+        self.assertEqual(stats["updated"], 1)
+        self.assertEqual(stats["ontologies"], 2)
+
+        index = self.lookup(db)
+        self.assertEqual(index.ontologies("GO:1"), ["GO"])
+        self.assertEqual(index.ontologies("AGRO:3"), ["AGRO"])
+        self.assertEqual(index.prefix("GO"), {"GO": 2})
+        # The base is read, never written.
+        self.assertEqual(self.lookup(base).ontologies("GO:1"), ["AGRO", "GO"])
+
+    def test_index_drops_unresolved_and_records_urls(self):
+        run = self.terms("run1", "AGRO", ["AGRO:1"])
+        self.terms("run1", "GO", ["GO:1"])
+        self.terms("run1", "OLD", ["OLD:1"])
+        index = {
+            "AGRO": {"status": "OK", "download_url": "https://example.org/AGRO.tar.gz"},
+            "GO": {"status": "OK", "download_url": "https://example.org/GO.tar.gz"},
+            "OLD": {"status": "FAILED", "reason": "transform_error"},
+        }
+        db = os.path.join(self.dir, "term_index.db")
+        stats = build_term_index(run, db, index=index, report=lambda line: None)
+        self.assertEqual(stats["dropped"], 1)
+        self.assertEqual(stats["ontologies"], 2)
+
+        terms = self.lookup(db)
+        self.assertEqual(terms.ontologies("OLD:1"), [])
+        self.assertEqual(terms.download_url("GO"), "https://example.org/GO.tar.gz")
+        self.assertIsNone(terms.download_url("OLD"))
+
+    def test_base_of_another_format_is_replaced(self):
+        base = os.path.join(self.dir, "base.db")
+        with open(base, "w") as f:
+            f.write("not a database")
+        run = self.terms("run1", "GO", ["GO:1"])
+        db = os.path.join(self.dir, "term_index.db")
+        with self.assertLogs(level="WARNING"):
+            stats = build_term_index(run, db, base_path=base, report=lambda line: None)
+        self.assertEqual(stats["ontologies"], 1)
+        self.assertEqual(self.lookup(db).ontologies("GO:1"), ["GO"])
+
+    def test_missing_index_file(self):
+        with self.assertRaises(FileNotFoundError):
+            TermIndex(os.path.join(self.dir, "absent.db"))
+
+    def test_cli(self):
+        run = self.terms("run1", "GO", ["GO:1", "GO:2"])
+        db = os.path.join(self.dir, "term_index.db")
+        filters = os.path.join(self.dir, "bloom_filters.db")
+        result = CliRunner().invoke(build_index, ["-i", run, "-o", db, "--filters", filters])
+        self.assertEqual(result.exit_code, 0, result.output)
+        stats = json.loads(result.stdout)
+        self.assertEqual(stats["terms"], 2)
+        self.assertEqual(stats["filters"]["ontologies"], 1)
+        self.assertIn("Term index:", result.stderr)
+        self.assertEqual(self.lookup(db).ontologies("GO:2"), ["GO"])
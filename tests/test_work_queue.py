@@ -0,0 +1,166 @@
+"""Tests for the filesystem work queue behind queue-init / queue-work.
+
+The queue has to hand each ontology to exactly one worker even when several
+processes claim at once, and has to get an ontology back from a worker that
+died holding it.
+"""
+
+import multiprocessing
+import os
+import tempfile
+import time
+from unittest import TestCase, mock
+
+from kg_bioportal.index import merge_stats, read_index
+from kg_bioportal.pipeline import pipeline_settings, run_queue_worker
+from kg_bioportal.transformer import Transformer
+from kg_bioportal.work_queue import WorkQueue
+from tests.test_content_skip import PREV_URL, built_from
+from tests.test_pipeline import PipelineTestCase
+from tests.test_run_shard import CATALOGUE, ONTOLOGIES, fake_transform
+
+
+def drain(queue_dir, worker, results):
+    work_queue = WorkQueue(queue_dir)
+    while True:
+        lease = work_queue.claim(worker)
+        if lease is None:
+            return
+        results.put(lease.acronym)
+        lease.complete()
+
+
+class WorkQueueTestCase(TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.queue_dir = os.path.join(self._tmp.name, "queue")
+        self.queue = WorkQueue(self.queue_dir, lease_sec=60, max_attempts=2)
+
+    def age(self, lease, seconds):
+        """Make a lease look as if its last heartbeat was ``seconds`` ago."""
+        then = time.time() - seconds
+        os.utime(lease.path, (then, then))
+
+
+class TestClaims(WorkQueueTestCase):
+    def test_items_are_handed_out_in_queue_order(self):
+        self.queue.add(["GIANT", "MID", "SMALL"])
+        claimed = [self.queue.claim("w").acronym for _ in range(3)]
+        self.assertEqual(claimed, ["GIANT", "MID", "SMALL"])
+        self.assertIsNone(self.queue.claim("w"))
+
+    def test_adding_twice_queues_once(self):
+        self.assertEqual(self.queue.add(["A", "B"]), 2)
+        self.assertEqual(self.queue.add(["B", "C"]), 1)
+        self.assertEqual(self.queue.counts()["pending"], 3)
+
+    def test_acronyms_with_underscores_survive(self):
+        self.queue.add(["HP_O"])
+        self.assertEqual(self.queue.claim("w").acronym, "HP_O")
+
+    def test_concurrent_workers_never_share_an_item(self):
+        acronyms = [f"O{i}" for i in range(200)]
+        self.queue.add(acronyms)
+        results = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(target=drain, args=(self.queue_dir, f"w{i}", results))
+            for i in range(4)
+        ]
+        for w in workers:
+            w.start()
+        claimed = [results.get(timeout=30) for _ in acronyms]
+        for w in workers:
+            w.join(timeout=30)
+        self.assertEqual(sorted(claimed), sorted(acronyms))
+        self.assertEqual(self.queue.counts()["done"], len(acronyms))
+
+
+class TestLeases(WorkQueueTestCase):
+    def test_fresh_lease_is_not_reclaimed(self):
+        self.queue.add(["A"])
+        self.queue.claim("w")
+        self.assertEqual(self.queue.reclaim_expired(), [])
+        self.assertEqual(self.queue.counts()["leased"], 1)
+
+    def test_expired_lease_goes_back_on_the_queue(self):
+        self.queue.add(["A"])
+        self.age(self.queue.claim("dead"), 120)
+        self.queue.reclaim_expired()
+        lease = self.queue.claim("alive")
+        self.assertEqual(lease.acronym, "A")
+        self.assertEqual(lease.attempts, 2)
+
+    def test_heartbeat_keeps_a_lease(self):
+        self.queue.add(["A"])
+        lease = self.queue.claim("w")
+        self.age(lease, 120)
+        self.assertTrue(lease.heartbeat())
+        self.queue.reclaim_expired()
+        self.assertEqual(self.queue.counts()["leased"], 1)
+
+    def test_keep_alive_heartbeats_in_the_background(self):
+        work_queue = WorkQueue(self.queue_dir, lease_sec=0.3)
+        work_queue.add(["A"])
+        lease = work_queue.claim("w")
+        with lease.keep_alive():
+            time.sleep(0.8)
+            self.assertEqual(work_queue.reclaim_expired(), [])
+            self.assertEqual(work_queue.counts()["leased"], 1)
+
+    def test_item_that_keeps_losing_its_worker_is_given_up(self):
+        self.queue.add(["KILLER"])
+        for _ in range(2):
+            self.age(self.queue.claim("w"), 120)
+            abandoned = self.queue.reclaim_expired()
+        self.assertEqual(abandoned, ["KILLER"])
+        self.assertEqual(self.queue.counts(), {"pending": 0, "leased": 0, "done": 0, "failed": 1})
+
+    def test_a_slow_worker_finishing_late_takes_the_item_back(self):
+        self.queue.add(["A"])
+        lease = self.queue.claim("slow")
+        self.age(lease, 120)
+        self.queue.reclaim_expired()
+        self.assertFalse(lease.heartbeat())
+        lease.complete()
+        self.assertEqual(self.queue.counts(), {"pending": 0, "leased": 0, "done": 1, "failed": 0})
+
+
+class TestQueueWorker(PipelineTestCase):
+    def test_drained_queue_merges_like_any_build(self):
+        work_queue = WorkQueue(self.path("queue"), lease_sec=60)
+        work_queue.add(ONTOLOGIES)
+        with mock.patch.object(Transformer, "transform", fake_transform([])):
+            built = run_queue_worker(
+                work_queue, self.path("work"), pipeline_settings("k", compress=False), poll_sec=0
+            )
+        self.assertEqual(built, len(ONTOLOGIES))
+        self.assertFalse(work_queue.outstanding())
+        merge_stats(self.path("work", "transformed"), self.path("out"), report=lambda line: None)
+        entries = read_index(self.path("out", "onto_stats.yaml"))
+        self.assertEqual(set(entries) & set(ONTOLOGIES), set(ONTOLOGIES))
+
+    def test_given_up_ontology_is_recorded_as_failed(self):
+        work_queue = WorkQueue(self.path("queue"), lease_sec=60, max_attempts=1)
+        work_queue.add(["KILLER"])
+        lease = work_queue.claim("dead")
+        then = time.time() - 120
+        os.utime(lease.path, (then, then))
+        run_queue_worker(work_queue, self.path("work"), pipeline_settings("k"), poll_sec=0)
+        merge_stats(self.path("work", "transformed"), self.path("out"), report=lambda line: None)
+        entries = read_index(self.path("out", "onto_stats.yaml"))
+        self.assertEqual(entries["KILLER"]["status"], "Failed")
+
+    def test_unchanged_source_carries_its_graph_forward(self):
+        work_queue = WorkQueue(self.path("queue"), lease_sec=60)
+        work_queue.add(["AAA", "BBB"])
+        events = []
+        with mock.patch.object(Transformer, "transform", fake_transform(events)):
+            run_queue_worker(
+                work_queue, self.path("work"), pipeline_settings("k", compress=False),
+                poll_sec=0, index={"AAA": built_from(CATALOGUE["AAA"][1])},
+            )
+        self.assertEqual([name for kind, name in events if kind == "transform"], ["BBB"])
+        merge_stats(self.path("work", "transformed"), self.path("out"), report=lambda line: None)
+        self.assertEqual(read_index(self.path("out", "onto_stats.yaml"))["AAA"]["download_url"],
+                         PREV_URL)